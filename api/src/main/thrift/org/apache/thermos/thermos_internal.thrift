@@ -41,6 +41,7 @@ struct ProcessStatus {
   // WAITING -> FORKED
  10: i32             coordinator_pid
  11: double          fork_time
+ 12: double          launch_time     // when the runner began launching this run
 
   // FORKED -> RUNNING
   6: double          start_time
@@ -86,14 +87,15 @@ struct RunnerHeader {
   6: map<string, i64> ports
 }
 
-union RunnerCkpt {
-  1: RunnerHeader       runner_header
-  2: ProcessStatus      process_status
-  3: TaskStatus         task_status
-}
-
 struct RunnerState {
   1: RunnerHeader header
   2: list<TaskStatus> statuses
   3: map<string, list<ProcessStatus>> processes
 }
+
+union RunnerCkpt {
+  1: RunnerHeader       runner_header
+  2: ProcessStatus      process_status
+  3: TaskStatus         task_status
+  4: RunnerState        runner_state    // snapshot that begins a compacted checkpoint stream
+}
@@ -14,31 +14,50 @@
 
 import contextlib
 import os
+import threading
 from socket import timeout as SocketTimeout
 
 from twitter.common import log
 from twitter.common.lang import Compatibility
 
 if Compatibility.PY3:
-  from http.client import HTTPException
+  from http.client import BadStatusLine, HTTPConnection, HTTPException
   import urllib.request as urllib_request
-  from urllib.error import URLError, HTTPError
+  from urllib.error import HTTPError
+  from urllib.parse import urljoin, urlparse
+  _STALE_CONNECTION_ERRORS = (BadStatusLine, ConnectionError)
 else:
-  from httplib import HTTPException
+  from socket import error as SocketError
+  from httplib import BadStatusLine, HTTPConnection, HTTPException
   import urllib2 as urllib_request
-  from urllib2 import URLError, HTTPError
+  from urllib2 import HTTPError
+  from urlparse import urljoin, urlparse
+  _STALE_CONNECTION_ERRORS = (BadStatusLine, SocketError)
 
 
 class HttpSignaler(object):
-  """Simple HTTP endpoint wrapper to check health or trigger quitquitquit/abortabortabort"""
+  """Simple HTTP endpoint wrapper to check health or trigger quitquitquit/abortabortabort
+
+    Requests are made over one keep-alive connection, which is re-established whenever the server
+    closes it.  timeout_secs bounds each request, connect_timeout_secs establishing the connection.
+    Redirects are followed as urllib would: over the same connection when they stay on this
+    host and port, or by urllib itself when they lead elsewhere.
+  """
   TIMEOUT_SECS = 1.0
   FAILURE_REASON_LENGTH = 10
 
+  # Redirects followed by urllib for a GET request, and those of them it follows for a POST
+  # (as a GET), up to its limit on the number of redirects.
+  REDIRECT_CODES = frozenset([301, 302, 303, 307, 308])
+  POST_REDIRECT_CODES = frozenset([301, 302, 303])
+  MAX_REDIRECTS = 10
+
   class Error(Exception): pass
   class QueryError(Error): pass
 
-  def __init__(self, port, host='localhost', timeout_secs=None):
+  def __init__(self, port, host='localhost', timeout_secs=None, connect_timeout_secs=None):
     self._host = host
+    self._port = port
     self._url_base = 'http://%s:%d' % (host, port)
     if timeout_secs is None:
       env_timeout = os.getenv('AURORA_HTTP_SIGNALER_TIMEOUT_SECS')
@@ -51,13 +70,77 @@ class HttpSignaler(object):
     else:
       log.debug('Using timeout %s secs.' % timeout_secs)
       self._timeout_secs = timeout_secs
+    self._connect_timeout_secs = (
+        self._timeout_secs if connect_timeout_secs is None else connect_timeout_secs)
+    self._connection = None
+    self._lock = threading.Lock()
 
   def url(self, endpoint):
     return self._url_base + endpoint
 
-  @property
-  def opener(self):
-    return urllib_request.urlopen
+  def _connect(self):
+    connection = HTTPConnection(self._host, self._port, timeout=self._connect_timeout_secs)
+    try:
+      connection.connect()
+      connection.sock.settimeout(self._timeout_secs)
+    except Exception:
+      connection.close()
+      raise
+    return connection
+
+  def _request(self, endpoint, data):
+    """Make the request over the open connection, or a new one if there is none.  Returns a
+    (response, response code, redirect location) tuple."""
+    connection = self._connection = self._connection or self._connect()
+    headers = {}
+    if data is not None:
+      headers['Content-Type'] = 'application/x-www-form-urlencoded'
+    connection.request('GET' if data is None else 'POST', endpoint, body=data, headers=headers)
+    response = connection.getresponse()
+    content = response.read()
+    if response.will_close:
+      self._close_connection()
+    return content, response.status, response.getheader('Location')
+
+  def _request_or_reconnect(self, endpoint, data):
+    reused = self._connection is not None
+    try:
+      try:
+        return self._request(endpoint, data)
+      except _STALE_CONNECTION_ERRORS:
+        if not reused:
+          raise
+        # The server closed the idle connection, so retry once over a new one.
+        self._close_connection()
+        return self._request(endpoint, data)
+    except Exception:
+      self._close_connection()
+      raise
+
+  def _endpoint(self, url):
+    """The endpoint of url if it is served by this host and port, else None."""
+    parsed = urlparse(url)
+    if (parsed.scheme, parsed.hostname, parsed.port or 80) != ('http', self._host, self._port):
+      return None
+    return parsed._replace(scheme='', netloc='', fragment='').geturl() or '/'
+
+  def _follow_redirect(self, url):
+    """Request url from another host or port over a connection of its own."""
+    try:
+      with contextlib.closing(urllib_request.urlopen(url, timeout=self._timeout_secs)) as fp:
+        return (fp.read(), fp.getcode())
+    except HTTPError as e:
+      return ('', e.code)
+
+  def _close_connection(self):
+    if self._connection is not None:
+      self._connection.close()
+      self._connection = None
+
+  def close(self):
+    """Close the keep-alive connection, if there is one."""
+    with self._lock:
+      self._close_connection()
 
   def query(self, endpoint, data=None):
     """Request an HTTP endpoint with a GET request (or POST if data is not None)"""
@@ -67,22 +150,32 @@ class HttpSignaler(object):
     def raise_error(reason):
       raise self.QueryError('Failed to signal %s: %s' % (self.url(endpoint), reason))
 
-    try:
-      if isinstance(data, str):
-        data = data.encode('utf-8')
-      with contextlib.closing(
-          self.opener(url, data, timeout=self._timeout_secs)) as fp:
-        return (fp.read(), fp.getcode())
-    except (HTTPException, SocketTimeout) as e:
-      # the type of an HTTPException is typically more useful than its contents (since for example
-      # BadStatusLines are often empty). likewise with socket.timeout.
-      raise_error('Error within %s' % e.__class__.__name__)
-    except HTTPError as e:
-      return ('', e.code)
-    except URLError as e:
-      raise_error(e)
-    except Exception as e:
-      raise_error('Unexpected error: %s' % e)
+    with self._lock:
+      try:
+        if isinstance(data, str):
+          data = data.encode('utf-8')
+        content, code, location = self._request_or_reconnect(endpoint, data)
+        redirects = 0
+        while (location and redirects < self.MAX_REDIRECTS and
+               code in (self.REDIRECT_CODES if data is None else self.POST_REDIRECT_CODES)):
+          redirects += 1
+          url = urljoin(url, location)
+          redirect = self._endpoint(url)
+          if redirect is None:
+            return self._follow_redirect(url)
+          content, code, location = self._request_or_reconnect(redirect, None)
+          data = None
+        if not 200 <= code < 300:
+          return ('', code)
+        return (content, code)
+      except (HTTPException, SocketTimeout) as e:
+        # the type of an HTTPException is typically more useful than its contents (since for
+        # example BadStatusLines are often empty). likewise with socket.timeout.
+        raise_error('Error within %s' % e.__class__.__name__)
+      except (IOError, OSError) as e:
+        raise_error(e)
+      except Exception as e:
+        raise_error('Unexpected error: %s' % e)
 
   def __call__(self, endpoint, use_post_method=False, expected_response=None,
       expected_response_code=None):
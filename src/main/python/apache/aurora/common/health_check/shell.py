@@ -12,7 +12,17 @@
 # limitations under the License.
 #
 
+import binascii
+import errno
+import os
+import select
+import shlex
+import signal
 import subprocess
+import threading
+import time
+
+from twitter.common import log
 
 STDOUT = subprocess.STDOUT
 
@@ -34,13 +44,38 @@ class WrappedCalledProcessError(subprocess.CalledProcessError):
 
 
 class ShellHealthCheck(object):
+  """
+  Run a shell command line as a health check.
+
+  By default every check runs wrapped_cmd as a new process.  A persistent check instead starts
+  wrapped_cmd once as a worker shell (see worker_cmdline) and asks it to run the check over a pipe,
+  so that each check only costs the worker a fork rather than a fork and exec of the shell (and
+  of any isolator wrapping it) from the executor.
+  """
+
+  # The worker runs the command in a subshell for each token read from stdin, then writes its
+  # output followed by a line of the token, exit status and start and end times.
+  WORKER_SCRIPT = '''health_check_command=%s
+while IFS= read -r token; do
+  start=$EPOCHREALTIME
+  output=$(eval "$health_check_command" 2>&1 </dev/null)
+  rc=$?
+  printf '%%s\\n%%s %%d %%s %%s\\n' "$output" "$token" "$rc" "${start:--}" "${EPOCHREALTIME:--}"
+done
+'''
+
+  @classmethod
+  def worker_cmdline(cls, raw_cmd):
+    """Return the bash command line of a worker shell which runs raw_cmd on request."""
+    return cls.WORKER_SCRIPT % shlex.quote(raw_cmd)
 
   def __init__(
         self,
         raw_cmd,
         wrapped_cmd,
         preexec_fn=None,
-        timeout_secs=None):
+        timeout_secs=None,
+        persistent=False):
 
     """
     Initialize with the command we would like to call.
@@ -52,11 +87,17 @@ class ShellHealthCheck(object):
     :type preexec_fn: callable
     :param timeout_secs: Timeout in seconds.
     :type timeout_secs: int
+    :param persistent: Whether wrapped_cmd runs a worker shell of worker_cmdline(raw_cmd) rather
+                       than the command itself.
+    :type persistent: bool
     """
     self._raw_cmd = raw_cmd
     self._wrapped_cmd = wrapped_cmd
     self._preexec_fn = preexec_fn
     self._timeout_secs = timeout_secs
+    self._persistent = persistent
+    self._worker = None
+    self._lock = threading.Lock()
 
   def __call__(self):
     """
@@ -65,6 +106,9 @@ class ShellHealthCheck(object):
     :return: A tuple of (bool, str)
     :rtype tuple:
     """
+    if self._persistent:
+      with self._lock:
+        return self._call_worker()
     try:
       subprocess.check_output(
           self._wrapped_cmd,
@@ -81,3 +125,95 @@ class ShellHealthCheck(object):
       return False, 'OSError: %s' % e.strerror
     except ValueError:
       return False, 'Invalid commmand.'
+
+  def close(self):
+    """Stop the worker shell, if there is one."""
+    with self._lock:
+      self._stop_worker()
+
+  def _start_worker(self):
+    if self._worker is None or self._worker.poll() is not None:
+      self._worker = subprocess.Popen(
+          self._wrapped_cmd,
+          bufsize=0,
+          stdin=subprocess.PIPE,
+          stdout=subprocess.PIPE,
+          stderr=STDOUT,
+          preexec_fn=self._preexec_fn,
+          start_new_session=True)
+      log.debug('Started health check worker %d.', self._worker.pid)
+    return self._worker
+
+  def _stop_worker(self):
+    if self._worker is not None:
+      try:
+        # The worker leads its own session, so this also kills a check still in progress.
+        os.killpg(self._worker.pid, signal.SIGKILL)
+      except OSError:
+        pass
+      self._worker.stdin.close()
+      self._worker.stdout.close()
+      self._worker.wait()
+      self._worker = None
+
+  def _read_result(self, worker, token):
+    """Read the output of the check and its status line.  Returns (output, status line), or None
+    if the check timed out."""
+    deadline = None if self._timeout_secs is None else time.time() + self._timeout_secs
+    marker = b'\n' + token + b' '
+    fd = worker.stdout.fileno()
+    buf = b''
+    while True:
+      index = buf.find(marker)
+      if index >= 0 and buf.endswith(b'\n'):
+        return buf[:index], buf[index + 1:-1]
+      timeout = None if deadline is None else deadline - time.time()
+      if timeout is not None and timeout <= 0:
+        return None
+      readable, _, _ = select.select([fd], [], [], timeout)
+      if not readable:
+        return None
+      chunk = os.read(fd, 65536)
+      if not chunk:
+        raise EOFError(buf.decode('utf-8', 'replace').strip())
+      buf += chunk
+
+  def _call_worker(self):
+    token = binascii.hexlify(os.urandom(16))
+    start = time.time()
+    try:
+      worker = self._start_worker()
+      try:
+        worker.stdin.write(token + b'\n')
+      except (IOError, OSError) as e:
+        # If the worker has exited, its output is still to be read.
+        if e.errno != errno.EPIPE:
+          raise
+      result = self._read_result(worker, token)
+    except (EOFError, IOError, OSError) as e:
+      self._stop_worker()
+      if isinstance(e, EOFError):
+        return False, 'Health check worker exited: %s' % e
+      return False, 'OSError: %s' % e.strerror
+    except ValueError:
+      self._stop_worker()
+      return False, 'Invalid commmand.'
+
+    if result is None:
+      self._stop_worker()
+      return False, 'Health check timed out.'
+
+    output, status = result
+    _, returncode, started, finished = status.decode('utf-8').split()
+    try:
+      duration_secs = float(finished.replace(',', '.')) - float(started.replace(',', '.'))
+    except ValueError:
+      # bash before 5.0 has no EPOCHREALTIME, so include the round trip to the worker.
+      duration_secs = time.time() - start
+    returncode = int(returncode)
+    log.debug('Health check exited with %d in %.1fms.', returncode, 1000 * duration_secs)
+    if returncode != 0:
+      error = subprocess.CalledProcessError(
+          returncode, self._wrapped_cmd, output=output.decode('utf-8', 'replace'))
+      return False, str(WrappedCalledProcessError(self._raw_cmd, error))
+    return True, None
@@ -57,6 +57,8 @@ class HttpHealthChecker(Struct):
   endpoint                 = Default(String, '/health')
   expected_response        = Default(String, 'ok')
   expected_response_code   = Default(Integer, 0)
+  # Defaults to the timeout_secs of the HealthCheckConfig.
+  connect_timeout_secs     = Float
 
 
 class ShellHealthChecker(Struct):
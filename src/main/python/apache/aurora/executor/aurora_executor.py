@@ -217,6 +217,14 @@ class AuroraExecutor(ExecutorBase, Observable):
       log.error('Failed to stop health checkers:')
       log.error(traceback.format_exc())
 
+    # Release anything the providers share between checkers, e.g. a health check scheduler.
+    for status_provider in self._status_providers:
+      try:
+        status_provider.stop()
+      except (AttributeError, RuntimeError):
+        log.error('Failed to stop status provider:')
+        log.error(traceback.format_exc())
+
     try:
       propagate_deadline(self._runner.stop, timeout=self._stop_timeout)
     except Timeout:
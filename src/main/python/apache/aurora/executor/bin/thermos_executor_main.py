@@ -35,7 +35,7 @@ from twitter.common import app, log
 from twitter.common.exceptions import ExceptionalThread
 from twitter.common.log.options import LogOptions
 
-from apache.aurora.config.schema.base import LoggerDestination, LoggerMode
+from apache.aurora.config.schema.base import LogCompression, LoggerDestination, LoggerMode
 from apache.aurora.executor.aurora_executor import AuroraExecutor
 from apache.aurora.executor.common.announcer import DefaultAnnouncerCheckerProvider, make_zk_auth
 from apache.aurora.executor.common.executor_timeout import ExecutorTimeout
@@ -49,6 +49,7 @@ from apache.aurora.executor.thermos_task_runner import (
     UserOverrideThermosTaskRunnerProvider
 )
 from apache.thermos.common.excepthook import ExceptionTerminationHandler
+from apache.thermos.monitoring.resource import DiskCollectorProvider
 
 try:
   from pesos.executor import PesosExecutorDriver as MesosExecutorDriver
@@ -164,6 +165,33 @@ app.add_option(
     default=False)
 
 
+app.add_option(
+    '--persistent-shell-health-checks',
+    dest='persistent_shell_health_checks',
+    action='store_true',
+    help='If set, shell health checks are run by a long-lived worker shell per task rather than '
+         'a new shell for every check.',
+    default=False)
+
+
+app.add_option(
+    '--shared-health-check-scheduler',
+    dest='shared_health_check_scheduler',
+    action='store_true',
+    help='If set, health checks are run by one shared scheduler thread rather than a thread per '
+         'task.',
+    default=False)
+
+
+app.add_option(
+    '--incremental-disk-collector',
+    dest='incremental_disk_collector',
+    action='store_true',
+    help='If set, sandbox disk usage is collected by watching the sandbox with inotify and '
+         're-examining only the directories which have changed, rather than walking it with du.',
+    default=False)
+
+
 app.add_option(
     '--runner-logger-destination',
     dest='runner_logger_destination',
@@ -193,6 +221,14 @@ app.add_option(
     help='Maximum number of rotated stdout/stderr logs emitted by the thermos runner.')
 
 
+app.add_option(
+    '--runner-rotate-log-compression',
+    dest='runner_rotate_log_compression',
+    choices=LogCompression.VALUES,
+    help='The codec %r used to compress rotated stdout/stderr logs emitted by the thermos runner.'
+      % (LogCompression.VALUES,))
+
+
 app.add_option(
      "--preserve_env",
      dest="preserve_env",
@@ -226,8 +262,13 @@ def initialize(options):
   status_providers = [
       HealthCheckerProvider(
           nosetuid_health_checks=options.nosetuid_health_checks,
-          mesos_containerizer_path=options.mesos_containerizer_path),
-      ResourceManagerProvider(checkpoint_root=checkpoint_root)
+          mesos_containerizer_path=options.mesos_containerizer_path,
+          shared_scheduler=options.shared_health_check_scheduler,
+          persistent_shell_health_checks=options.persistent_shell_health_checks),
+      ResourceManagerProvider(
+          checkpoint_root=checkpoint_root,
+          disk_collector_provider=DiskCollectorProvider(
+              enable_incremental_disk_collector=options.incremental_disk_collector))
   ]
 
   if options.announcer_ensemble is not None:
@@ -250,6 +291,7 @@ def initialize(options):
       process_logger_mode=options.runner_logger_mode,
       rotate_log_size_mb=options.runner_rotate_log_size_mb,
       rotate_log_backups=options.runner_rotate_log_backups,
+      rotate_log_compression=options.runner_rotate_log_compression,
       preserve_env=options.preserve_env,
       mesos_containerizer_path=options.mesos_containerizer_path
     )
@@ -272,6 +314,7 @@ def initialize(options):
       process_logger_mode=options.runner_logger_mode,
       rotate_log_size_mb=options.runner_rotate_log_size_mb,
       rotate_log_backups=options.runner_rotate_log_backups,
+      rotate_log_compression=options.runner_rotate_log_compression,
       preserve_env=options.preserve_env,
       mesos_containerizer_path=options.mesos_containerizer_path
     )
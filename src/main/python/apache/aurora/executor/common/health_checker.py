@@ -13,12 +13,16 @@
 #
 
 import getpass
+import heapq
+import itertools
 import math
 import os
 import pwd
 import threading
 import time
 import traceback
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor
 
 from pesos.vendor.mesos.mesos_pb2 import TaskState
 from pystachio import Environment, String
@@ -61,7 +65,8 @@ class ThreadedHealthChecker(ExceptionalThread):
       grace_period_secs,
       max_consecutive_failures,
       min_consecutive_successes,
-      clock):
+      clock,
+      scheduler=None):
     """
     :param health_checker: health checker to confirm service health
     :type health_checker: function that returns (boolean, <string>)
@@ -77,8 +82,11 @@ class ThreadedHealthChecker(ExceptionalThread):
     :type min_consecutive_successes: int
     :param clock: time module available to be mocked for testing
     :type clock: time module
+    :param scheduler: shared scheduler to run the checks on, rather than a thread of their own
+    :type scheduler: HealthCheckScheduler
     """
     self.checker = health_checker
+    self.scheduler = scheduler
     self.sandbox = sandbox
     self.clock = clock
     self.current_consecutive_failures = 0
@@ -214,13 +222,103 @@ class ThreadedHealthChecker(ExceptionalThread):
       self.clock.sleep(self.interval)
 
   def start(self):
-    ExceptionalThread.start(self)
+    if self.scheduler is not None:
+      log.debug('Health checks scheduled on %s.', self.scheduler.name)
+      self.scheduler.schedule(self)
+    else:
+      ExceptionalThread.start(self)
 
   def stop(self):
     log.debug('Health checker thread stopped.')
     self.dead.set()
 
 
+class HealthCheckScheduler(ExceptionalThread):
+  """Run the periodic checks of many ThreadedHealthCheckers from one thread
+
+    Rather than each checker sleeping on a thread of its own between checks, checkers are kept in
+    a heap ordered by the time of their next check.  Due checks run on a small pool of workers so
+    that one slow check does not delay the others, and each checker is rescheduled interval_secs
+    after its check completes, as its own thread would have slept.
+  """
+
+  MAX_WORKERS = 4
+
+  def __init__(self, max_workers=MAX_WORKERS, clock=time):
+    self._clock = clock
+    self._max_workers = max_workers
+    self._pool = None
+    self._heap = []  # (time of next check, sequence number, ThreadedHealthChecker)
+    self._sequence = itertools.count()
+    self._condition = threading.Condition()
+    self._stopped = False
+    super(HealthCheckScheduler, self).__init__(name='HealthCheckScheduler')
+    self.daemon = True
+
+  def schedule(self, checker, delay_secs=0):
+    """Check checker after delay_secs, starting the scheduler if need be."""
+    with self._condition:
+      if self._pool is None:
+        self._pool = ThreadPoolExecutor(max_workers=self._max_workers)
+        self.start()
+      heapq.heappush(self._heap, (self._clock.time() + delay_secs, next(self._sequence), checker))
+      self._condition.notify()
+
+  def stop(self):
+    with self._condition:
+      self._stopped = True
+      self._condition.notify()
+
+  def _check(self, checker):
+    try:
+      checker._do_health_check()
+    except Exception:
+      log.error('Internal error in scheduled health check:')
+      log.error(traceback.format_exc())
+    finally:
+      if not checker.dead.is_set():
+        self.schedule(checker, checker.interval)
+
+  def run(self):
+    while True:
+      with self._condition:
+        while not self._stopped:
+          now = self._clock.time()
+          if self._heap and self._heap[0][0] <= now:
+            break
+          self._condition.wait(self._heap[0][0] - now if self._heap else None)
+        if self._stopped:
+          break
+        _, _, checker = heapq.heappop(self._heap)
+      if not checker.dead.is_set():
+        self._pool.submit(self._check, checker)
+    self._pool.shutdown(wait=False)
+
+
+class LatencyHistogram(object):
+  """Cumulative counts of latencies falling at or below each of a fixed set of bounds."""
+
+  BOUNDS_SECS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+  def __init__(self, bounds=BOUNDS_SECS):
+    self._bounds = bounds
+    self._counts = [0] * (len(bounds) + 1)
+
+  def add(self, latency):
+    self._counts[bisect_left(self._bounds, latency)] += 1
+
+  def count(self, index):
+    """The number of latencies at or below the index'th bound (or of all latencies, for the index
+    past the last bound)."""
+    return sum(self._counts[:index + 1])
+
+  def register(self, metrics, name):
+    """Export the histogram as the gauges <name>_le_<bound> and <name>_le_inf."""
+    for index, bound in enumerate(self._bounds + (None,)):
+      metrics.register(LambdaGauge('%s_le_%s' % (name, 'inf' if bound is None else bound),
+          lambda index=index: self.count(index)))
+
+
 class HealthChecker(StatusChecker):
   """Generic StatusChecker-conforming class which uses a thread for arbitrary periodic health checks
 
@@ -235,6 +333,8 @@ class HealthChecker(StatusChecker):
       health_checker.total_latency_secs: Total time waiting for the health checker to respond in
         seconds. To get average latency, use health_checker.total_latency / health_checker.checks.
       health_checker.checks: Total number of health checks performed.
+      health_checker.latency_secs_le_<bound>: Number of health checks which took at most <bound>
+        seconds, for bounds from 0.005 to 10, and inf.
   """
 
   def __init__(self,
@@ -244,9 +344,12 @@ class HealthChecker(StatusChecker):
                grace_period_secs=None,
                max_consecutive_failures=0,
                min_consecutive_successes=1,
-               clock=time):
+               clock=time,
+               scheduler=None):
     self._health_checks = 0
     self._total_latency = 0
+    self._latencies = LatencyHistogram()
+    self._health_checker = health_checker
     self._stats_lock = threading.Lock()
     self._clock = clock
     self.threaded_health_checker = ThreadedHealthChecker(
@@ -256,12 +359,14 @@ class HealthChecker(StatusChecker):
         grace_period_secs,
         max_consecutive_failures,
         min_consecutive_successes,
-        clock)
+        clock,
+        scheduler=scheduler)
     self.metrics.register(LambdaGauge('consecutive_failures',
         lambda: self.threaded_health_checker.current_consecutive_failures))
     self.metrics.register(LambdaGauge('snoozed', lambda: int(self.threaded_health_checker.snoozed)))
     self.metrics.register(LambdaGauge('total_latency_secs', lambda: self._total_latency))
     self.metrics.register(LambdaGauge('checks', lambda: self._health_checks))
+    self._latencies.register(self.metrics, 'latency_secs')
 
   def _timing_wrapper(self, closure):
     """A wrapper around the health check closure that times the health check duration."""
@@ -272,6 +377,7 @@ class HealthChecker(StatusChecker):
       with self._stats_lock:
         self._health_checks += 1
         self._total_latency += stop - start
+        self._latencies.add(stop - start)
       return (success, failure_reason)
     return wrapper
 
@@ -294,6 +400,9 @@ class HealthChecker(StatusChecker):
 
   def stop(self):
     self.threaded_health_checker.stop()
+    # e.g. the worker shell of a persistent ShellHealthCheck
+    if hasattr(self._health_checker, 'close'):
+      self._health_checker.close()
 
 
 class NoopHealthChecker(StatusChecker):
@@ -314,9 +423,16 @@ class NoopHealthChecker(StatusChecker):
 
 class HealthCheckerProvider(StatusCheckerProvider):
 
-  def __init__(self, nosetuid_health_checks=False, mesos_containerizer_path=None):
+  def __init__(self, nosetuid_health_checks=False, mesos_containerizer_path=None,
+      shared_scheduler=False, persistent_shell_health_checks=False):
     self._nosetuid_health_checks = nosetuid_health_checks
     self._mesos_containerizer_path = mesos_containerizer_path
+    self._persistent_shell_health_checks = persistent_shell_health_checks
+    self._scheduler = HealthCheckScheduler() if shared_scheduler else None
+
+  def stop(self):
+    if self._scheduler is not None:
+      self._scheduler.stop()
 
   @staticmethod
   def interpolate_cmd(task, cmd):
@@ -364,6 +480,12 @@ class HealthCheckerProvider(StatusCheckerProvider):
           os.setgid(pw_entry.pw_gid)
           os.setuid(pw_entry.pw_uid)
 
+      # With persistent shell health checks, a long-lived worker shell runs the command on
+      # request, and it is the worker which is wrapped and demoted.
+      shell_cmdline = interpolated_command
+      if self._persistent_shell_health_checks:
+        shell_cmdline = ShellHealthCheck.worker_cmdline(interpolated_command)
+
       # If the task is executing in an isolated filesystem we'll want to wrap the health check
       # command within a mesos-containerizer invocation so that it's executed within that
       # filesystem.
@@ -371,19 +493,20 @@ class HealthCheckerProvider(StatusCheckerProvider):
         health_check_user = (getpass.getuser() if self._nosetuid_health_checks
             else assigned_task.task.job.role)
         wrapped_cmd = wrap_with_mesos_containerizer(
-            interpolated_command,
+            shell_cmdline,
             health_check_user,
             sandbox.container_root,
             self._mesos_containerizer_path)
       else:
-        wrapped_cmd = ['/bin/bash', '-c', interpolated_command]
+        wrapped_cmd = ['/bin/bash', '-c', shell_cmdline]
 
       shell_signaler = ShellHealthCheck(
         raw_cmd=interpolated_command,
         wrapped_cmd=wrapped_cmd,
         preexec_fn=demote_to_job_role_user,
-        timeout_secs=timeout_secs)
-      a_health_checker = lambda: shell_signaler()
+        timeout_secs=timeout_secs,
+        persistent=self._persistent_shell_health_checks)
+      a_health_checker = shell_signaler
     else:
       portmap = resolve_ports(mesos_task, assigned_task.assignedPorts)
       if 'health' not in portmap:
@@ -396,7 +519,8 @@ class HealthCheckerProvider(StatusCheckerProvider):
 
       http_signaler = HttpSignaler(
         portmap['health'],
-        timeout_secs=timeout_secs)
+        timeout_secs=timeout_secs,
+        connect_timeout_secs=http_config.get('connect_timeout_secs'))
       a_health_checker = lambda: http_signaler(
         endpoint=http_endpoint,
         expected_response=http_expected_response,
@@ -409,6 +533,7 @@ class HealthCheckerProvider(StatusCheckerProvider):
       interval_secs=health_check_config.get('interval_secs'),
       grace_period_secs=health_check_config.get('initial_interval_secs'),
       max_consecutive_failures=health_check_config.get('max_consecutive_failures'),
-      min_consecutive_successes=health_check_config.get('min_consecutive_successes'))
+      min_consecutive_successes=health_check_config.get('min_consecutive_successes'),
+      scheduler=self._scheduler)
 
     return health_checker
@@ -43,20 +43,25 @@ class ResourceManager(StatusChecker):
     self._kill_reason = None
     self._kill_event = threading.Event()
 
+  @property
+  def _sample(self):
+    """ AggregateResourceResult of the latest sample, aggregated once by the ResourceMonitor """
+    return self._resource_monitor.sample()[1]
+
   @property
   def _num_procs(self):
     """ Total number of processes the task consists of (including child processes) """
-    return self._resource_monitor.sample()[1].num_procs
+    return self._sample.num_procs
 
   @property
   def _ps_sample(self):
     """ ProcessSample representing the aggregate resource consumption of the Task's processes """
-    return self._resource_monitor.sample()[1].process_sample
+    return self._sample.process_sample
 
   @property
   def _disk_sample(self):
     """ Integer in bytes representing the disk consumption in the Task's sandbox """
-    return self._resource_monitor.sample()[1].disk_usage
+    return self._sample.disk_usage
 
   @property
   def status(self):
@@ -82,6 +87,10 @@ class ResourceManager(StatusChecker):
     self.metrics.register(LambdaGauge('ram_reserved', lambda: self._max_ram))
     self.metrics.register(LambdaGauge('ram_percent',
         lambda: 1.0 * self._ps_sample.rss / self._max_ram))
+    self.metrics.register(LambdaGauge('resource_collections',
+        lambda: self._resource_monitor.collection_cost.collections))
+    self.metrics.register(LambdaGauge('resource_collection_secs',
+        lambda: self._resource_monitor.collection_cost.seconds))
 
   def start(self):
     super(ResourceManager, self).start()
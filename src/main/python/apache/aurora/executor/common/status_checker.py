@@ -87,6 +87,10 @@ class StatusCheckerProvider(Interface):
     """
     pass
 
+  def stop(self):
+    """Invoked once the status checkers of the task have been stopped.  Subclassable."""
+    pass
+
 
 class Healthy(StatusChecker):
   @property
@@ -20,6 +20,8 @@ from twitter.common.exceptions import ExceptionalThread
 from twitter.common.metrics import LambdaGauge, MutatorGauge, Observable
 from twitter.common.quantity import Amount, Time
 
+from apache.thermos.common.procfs import ProcessMemory, ProcessTable
+
 
 class ExecutorVars(Observable, ExceptionalThread):
   """
@@ -30,11 +32,18 @@ class ExecutorVars(Observable, ExceptionalThread):
   """
   MUTATOR_METRICS = ('rss', 'cpu', 'thermos_pss', 'thermos_cpu')
   COLLECTION_INTERVAL = Amount(1, Time.MINUTES)
+  # The PSS of a thermos process is re-read at most this often, as it is the costly metric.
+  MEMORY_REFRESH_INTERVAL = Amount(5, Time.MINUTES)
 
-  def __init__(self, clock=time):
+  def __init__(self, clock=time, procfs=ProcessMemory.PROCFS):
     self._clock = clock
+    self._procfs = procfs
     self._self = psutil.Process(os.getpid())
     self._orphan = False
+    # pid => psutil.Process of the thermos processes, kept so cpu_percent spans between samples.
+    self._children = {}
+    # pid => (time read, pss) of the thermos processes.
+    self._pss = {}
     self.metrics.register(LambdaGauge('orphan', lambda: int(self._orphan)))
     self._metrics = dict((metric, MutatorGauge(metric, 0)) for metric in self.MUTATOR_METRICS)
     for metric in self._metrics.values():
@@ -59,10 +68,13 @@ class ExecutorVars(Observable, ExceptionalThread):
       return
 
   @classmethod
-  def aggregate_memory(cls, process, attribute='pss'):
+  def aggregate_memory(cls, process, attribute='pss', procfs=ProcessMemory.PROCFS):
     try:
+      if ProcessTable.is_supported(procfs):
+        # smaps_rollup is summed by the kernel, rather than parsing smaps mapping by mapping.
+        return getattr(ProcessMemory.read(process.pid, procfs=procfs), attribute)
       return sum(getattr(mmap, attribute) for mmap in process.memory_maps())
-    except (OSError, psutil.Error, AttributeError):
+    except (IOError, OSError, ValueError, psutil.Error, AttributeError):
       # psutil on OS X does not support get_memory_maps
       return 0
 
@@ -72,6 +84,25 @@ class ExecutorVars(Observable, ExceptionalThread):
             process.memory_info().rss,
             cls.aggregate_memory(process, attribute='pss'))
 
+  def _thermos_children(self):
+    children = {}
+    for child in self.thermos_children(self._self):
+      cached = self._children.get(child.pid)
+      # psutil.Process equality also compares create times, so a reused pid is not mistaken.
+      children[child.pid] = cached if cached == child else child
+    self._pss = dict((pid, pss) for pid, pss in self._pss.items()
+                     if pid in children and children[pid] is self._children.get(pid))
+    self._children = children
+    return list(children.values())
+
+  def _thermos_pss(self, process):
+    now = self._clock.time()
+    read_at, pss = self._pss.get(process.pid, (None, 0))
+    if read_at is None or now - read_at >= self.MEMORY_REFRESH_INTERVAL.as_(Time.SECONDS):
+      pss = self.aggregate_memory(process, attribute='pss', procfs=self._procfs)
+      self._pss[process.pid] = (now, pss)
+    return pss
+
   def run(self):
     while True:
       self._clock.sleep(self.COLLECTION_INTERVAL.as_(Time.SECONDS))
@@ -79,17 +110,17 @@ class ExecutorVars(Observable, ExceptionalThread):
 
   def sample(self):
     try:
-      executor_cpu, executor_rss, _ = self.cpu_rss_pss(self._self)
-      self.write_metric('cpu', executor_cpu)
-      self.write_metric('rss', executor_rss)
+      self.write_metric('cpu', self._self.cpu_percent(0))
+      self.write_metric('rss', self._self.memory_info().rss)
       self._orphan = self._self.ppid() == 1
     except psutil.Error:
       return False
 
     try:
-      child_stats = map(self.cpu_rss_pss, self.thermos_children(self._self))
+      child_stats = [(child.cpu_percent(0), self._thermos_pss(child))
+                     for child in self._thermos_children()]
       self.write_metric('thermos_cpu', sum(stat[0] for stat in child_stats))
-      self.write_metric('thermos_pss', sum(stat[2] for stat in child_stats))
+      self.write_metric('thermos_pss', sum(stat[1] for stat in child_stats))
     except psutil.Error:
       pass
 
@@ -74,6 +74,8 @@ class HttpLifecycleManager(TaskRunner):
 
     for endpoint, wait_time in self._escalation_endpoints:
       handled, _ = http_signaler(endpoint, use_post_method=True)
+      # Do not hold a keep-alive connection open while the task drains its own.
+      http_signaler.close()
       log.info('Killing task, calling %s and waiting %s, handled is %s' % (
           endpoint, str(wait_time), str(handled)))
 
@@ -77,6 +77,7 @@ class ThermosTaskRunner(TaskRunner):
                process_logger_mode=None,
                rotate_log_size_mb=None,
                rotate_log_backups=None,
+               rotate_log_compression=None,
                preserve_env=False,
                mesos_containerizer_path=None):
     """
@@ -112,6 +113,7 @@ class ThermosTaskRunner(TaskRunner):
     self._process_logger_mode = process_logger_mode
     self._rotate_log_size_mb = rotate_log_size_mb
     self._rotate_log_backups = rotate_log_backups
+    self._rotate_log_compression = rotate_log_compression
     self._mesos_containerizer_path = mesos_containerizer_path
 
     # wait events
@@ -248,7 +250,8 @@ class ThermosTaskRunner(TaskRunner):
                   process_logger_destination=self._process_logger_destination,
                   process_logger_mode=self._process_logger_mode,
                   rotate_log_size_mb=self._rotate_log_size_mb,
-                  rotate_log_backups=self._rotate_log_backups)
+                  rotate_log_backups=self._rotate_log_backups,
+                  rotate_log_compression=self._rotate_log_compression)
 
     if getpass.getuser() == 'root' and self._role:
       params.update(setuid=self._role)
@@ -368,6 +371,7 @@ class DefaultThermosTaskRunnerProvider(TaskRunnerProvider):
                process_logger_mode=None,
                rotate_log_size_mb=None,
                rotate_log_backups=None,
+               rotate_log_compression=None,
                mesos_containerizer_path=None):
     self._artifact_dir = artifact_dir or safe_mkdtemp()
     self._checkpoint_root = checkpoint_root
@@ -382,6 +386,7 @@ class DefaultThermosTaskRunnerProvider(TaskRunnerProvider):
     self._process_logger_mode = process_logger_mode
     self._rotate_log_size_mb = rotate_log_size_mb
     self._rotate_log_backups = rotate_log_backups
+    self._rotate_log_compression = rotate_log_compression
     self._mesos_containerizer_path = mesos_containerizer_path
 
   def _get_role(self, assigned_task):
@@ -427,6 +432,7 @@ class DefaultThermosTaskRunnerProvider(TaskRunnerProvider):
         process_logger_mode=self._process_logger_mode,
         rotate_log_size_mb=self._rotate_log_size_mb,
         rotate_log_backups=self._rotate_log_backups,
+        rotate_log_compression=self._rotate_log_compression,
         preserve_env=self._preserve_env,
         mesos_containerizer_path=self._mesos_containerizer_path)
 
@@ -18,6 +18,7 @@ import time
 
 from twitter.common import app, log
 from twitter.common.exceptions import ExceptionalThread
+from twitter.common.http import PooledServer
 from twitter.common.log.options import LogOptions
 from twitter.common.quantity import Amount, Time
 
@@ -25,7 +26,12 @@ from apache.aurora.executor.common.path_detector import MesosPathDetector
 from apache.thermos.common.excepthook import ExceptionTerminationHandler
 from apache.thermos.monitoring.disk import DiskCollectorSettings
 from apache.thermos.monitoring.resource import TaskResourceMonitor
-from apache.thermos.observer.http.configure import configure_server
+from apache.thermos.observer.detector import InotifyObserverTaskDetector
+from apache.thermos.observer.http.configure import (
+    DEFAULT_LONG_POLL_THREADS,
+    DEFAULT_REQUEST_TIMEOUT_SECS,
+    configure_server
+)
 from apache.thermos.observer.task_observer import TaskObserver
 
 app.add_option(
@@ -52,6 +58,50 @@ app.add_option(
     help='The port on which the observer should listen.')
 
 
+app.add_option(
+    '--http_threads',
+    dest='http_threads',
+    type='int',
+    default=PooledServer.DEFAULT_THREADS,
+    help='The number of threads serving HTTP requests.')
+
+
+app.add_option(
+    '--http_max_queued_connections',
+    dest='http_max_queued_connections',
+    type='int',
+    default=PooledServer.DEFAULT_MAX_QUEUED,
+    help='The number of accepted connections which may wait for a free HTTP thread. Further '
+         'connections are dropped until the queue drains.')
+
+
+app.add_option(
+    '--http_keepalive_timeout_secs',
+    dest='http_keepalive_timeout_secs',
+    type='int',
+    default=PooledServer.DEFAULT_KEEPALIVE_TIMEOUT,
+    help='The number of seconds an idle HTTP connection is kept open.')
+
+
+app.add_option(
+    '--http_request_timeout_secs',
+    dest='http_request_timeout_secs',
+    type='int',
+    default=DEFAULT_REQUEST_TIMEOUT_SECS,
+    help='The number of seconds after which a request fails with 503 and its HTTP thread is '
+         'released. Set to 0 to disable.')
+
+
+app.add_option(
+    '--http_long_poll_threads',
+    dest='http_long_poll_threads',
+    type='int',
+    default=DEFAULT_LONG_POLL_THREADS,
+    help='The number of raw log and file requests, including those following a file, which may '
+         'be served at once. Further requests fail with 503. Keep this below --http_threads so '
+         'that followers cannot occupy every HTTP thread.')
+
+
 app.add_option(
     '--polling_interval_secs',
     dest='polling_interval_secs',
@@ -60,6 +110,25 @@ app.add_option(
     help='The number of seconds between observer refresh attempts.')
 
 
+app.add_option(
+    '--enable_inotify_detector',
+    dest='enable_inotify_detector',
+    default=False,
+    action='store_true',
+    help="Detect task transitions with inotify instead of re-scanning every checkpoint root on "
+         "each polling interval. Checkpoint roots are still re-scanned periodically to "
+         "reconcile missed events.")
+
+
+app.add_option(
+    '--detector_reconciliation_interval_secs',
+    dest='detector_reconciliation_interval_secs',
+    type='int',
+    default=int(InotifyObserverTaskDetector.RECONCILIATION_INTERVAL.as_(Time.SECONDS)),
+    help='The number of seconds between full checkpoint root scans when --enable_inotify_detector '
+         'is set.')
+
+
 app.add_option(
     '--disable_task_resource_collection',
     dest='disable_task_resource_collection',
@@ -69,6 +138,15 @@ app.add_option(
          "expensive to collect if there are hundreds of active tasks per host.")
 
 
+app.add_option(
+    '--disable_shared_resource_sampler',
+    dest='disable_shared_resource_sampler',
+    default=False,
+    action='store_true',
+    help="Run a dedicated resource collection thread per active task instead of sampling all "
+         "tasks from a single shared snapshot of /proc.")
+
+
 app.add_option(
     '--task_process_collection_interval_secs',
     dest='task_process_collection_interval_secs',
@@ -94,6 +172,16 @@ app.add_option(
          "disk isolation in Mesos-agent. This is not compatible with an authenticated agent API.")
 
 
+app.add_option(
+    '--enable_incremental_disk_collector',
+    dest='enable_incremental_disk_collector',
+    default=False,
+    action='store_true',
+    help="Collect per task disk usage by watching sandboxes with inotify and re-examining only "
+         "the directories which have changed, rather than walking each sandbox with du. Ignored "
+         "if --enable_mesos_disk_collector is set.")
+
+
 app.add_option(
     '--agent_api_url',
     dest='agent_api_url',
@@ -193,7 +281,12 @@ def initialize(options):
       disable_task_resource_collection=options.disable_task_resource_collection,
       enable_mesos_disk_collector=options.enable_mesos_disk_collector,
       disk_collector_settings=disk_collector_settings,
-      scheduler_web_url=options.scheduler_web_url)
+      scheduler_web_url=options.scheduler_web_url,
+      enable_inotify_detector=options.enable_inotify_detector,
+      detector_reconciliation_interval=Amount(
+          options.detector_reconciliation_interval_secs, Time.SECONDS),
+      enable_shared_resource_sampler=not options.disable_shared_resource_sampler,
+      enable_incremental_disk_collector=options.enable_incremental_disk_collector)
 
 
 def main(_, options):
@@ -203,7 +296,13 @@ def main(_, options):
   observer.start()
   root_server = configure_server(observer, options)
 
-  server = ExceptionalThread(target=lambda: root_server.run(options.ip, options.port, 'cherrypy'))
+  server = ExceptionalThread(target=lambda: root_server.run(
+      options.ip,
+      options.port,
+      PooledServer,
+      threads=options.http_threads,
+      max_queued=options.http_max_queued_connections,
+      keepalive_timeout=options.http_keepalive_timeout_secs))
   server.daemon = True
   server.start()
 
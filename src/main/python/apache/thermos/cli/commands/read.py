@@ -74,9 +74,10 @@ def read(args, options):
       print('  %s   runs: %s' % (process, len(process_history)))
       for k in reversed(range(len(process_history))):
         run = process_history[k]
-        print('    %2d: pid=%d, rc=%s, finish:%s, state:%s' % (
+        # Runs abbreviated by checkpoint compaction carry no pid.
+        print('    %2d: pid=%s, rc=%s, finish:%s, state:%s' % (
           k,
-          run.pid,
+          run.pid if run.pid is not None else '',
           run.return_code if run.return_code is not None else '',
           time.asctime(time.localtime(run.stop_time)) if run.stop_time else 'None',
           ProcessState._VALUES_TO_NAMES.get(run.state, 'Unknown')))
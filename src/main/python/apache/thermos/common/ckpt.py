@@ -22,8 +22,11 @@ Task state machines.
 
 """
 
+import copy
+
 from twitter.common import log
-from twitter.common.recordio import RecordIO, ThriftRecordReader
+from twitter.common.recordio import MappedRecordReader, RecordIO
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
 
 from gen.apache.thermos.ttypes import (
     ProcessState,
@@ -160,9 +163,8 @@ class CheckpointDispatcher(object):
   @classmethod
   def iter_updates(cls, filename):
     try:
-      with open(filename, 'rb') as fp:
-        rr = ThriftRecordReader(fp, RunnerCkpt)
-        for update in rr:
+      with MappedRecordReader(filename, ThriftRecordIO.ThriftCodec(RunnerCkpt)) as reader:
+        for update in reader:
           yield update
     except (IOError, OSError, RecordIO.Error) as err:
       raise cls.ErrorRecoveringState(err)
@@ -170,6 +172,9 @@ class CheckpointDispatcher(object):
   @classmethod
   def iter_statuses(cls, filename):
     for update in cls.iter_updates(filename):
+      if update.runner_state:
+        for status in update.runner_state.statuses or ():
+          yield status
       if update.task_status:
         yield update.task_status
 
@@ -188,6 +193,127 @@ class CheckpointDispatcher(object):
     except cls.Error as e:
       log.error('Failed to recover from %s: %s', filename, e)
 
+  # The process transitions that produce a run in a given state, keyed by that state and the number
+  # of sequence numbers spanned by the run.  See ProcessStateHandler.
+  RUN_TRANSITIONS = {
+    (ProcessState.WAITING, 1): (ProcessState.WAITING,),
+    (ProcessState.FORKED, 2): (ProcessState.WAITING, ProcessState.FORKED),
+    (ProcessState.RUNNING, 3): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING),
+    (ProcessState.SUCCESS, 4): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                                ProcessState.SUCCESS),
+    (ProcessState.FAILED, 2): (ProcessState.WAITING, ProcessState.FAILED),
+    (ProcessState.FAILED, 4): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                               ProcessState.FAILED),
+    (ProcessState.KILLED, 3): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.KILLED),
+    (ProcessState.KILLED, 4): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                               ProcessState.KILLED),
+    (ProcessState.LOST, 3): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.LOST),
+    (ProcessState.LOST, 4): (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                             ProcessState.LOST),
+  }
+
+  # The fields carried by the update for each process transition.
+  TRANSITION_FIELDS = {
+    ProcessState.WAITING: (),
+    ProcessState.FORKED: ('fork_time', 'coordinator_pid'),
+    ProcessState.RUNNING: ('start_time', 'pid'),
+    ProcessState.SUCCESS: ('stop_time', 'return_code'),
+    ProcessState.FAILED: ('stop_time', 'return_code'),
+    ProcessState.KILLED: ('stop_time', 'return_code'),
+    ProcessState.LOST: (),
+  }
+  # Fields which may be absent from the update, e.g. if it was written by an older runner.
+  OPTIONAL_TRANSITION_FIELDS = {
+    ProcessState.FORKED: ('launch_time',),
+  }
+
+  @classmethod
+  def expand_run(cls, process, run, previous_seq=-1):
+    """Return the process updates which, applied after a run ending at previous_seq, produce run.
+
+      Runs abbreviated by compaction carry only their sequence number and state, so their updates
+      are given placeholder (zero) times and pids.
+
+      Raises ErrorRecoveringState if run could not have been produced by process transitions.
+    """
+    transitions = cls.RUN_TRANSITIONS.get((run.state, run.seq - previous_seq))
+    if transitions is None:
+      raise cls.ErrorRecoveringState('Cannot reconstruct %s run in state %s spanning seq %s-%s' % (
+          process, ProcessState._VALUES_TO_NAMES.get(run.state), previous_seq + 1, run.seq))
+    updates = []
+    for seq, state in enumerate(transitions, start=previous_seq + 1):
+      update = ProcessStatus(seq=seq, process=process, state=state)
+      for field in cls.TRANSITION_FIELDS[state]:
+        value = getattr(run, field)
+        setattr(update, field, value if value is not None else 0)
+      for field in cls.OPTIONAL_TRANSITION_FIELDS.get(state, ()):
+        setattr(update, field, getattr(run, field))
+      updates.append(update)
+    return updates
+
+  @classmethod
+  def compact(cls, state, truncate=True):
+    """Build a RunnerCkpt snapshot of state with which to begin a compacted checkpoint stream.
+
+      If truncate, the snapshot only retains the first and latest task statuses, and only the
+      sequence number and state of all but the latest run of each process.  Run counts (and hence
+      log directories and failure limits) are preserved either way.
+
+      Only tasks which have remained ACTIVE are compacted, since replaying a snapshot dispatches
+      all task transitions before any process transitions.  Returns None if state cannot be
+      compacted.
+    """
+    if state.header is None or not state.statuses:
+      return None
+    if any(status.state != TaskState.ACTIVE for status in state.statuses):
+      return None
+    statuses = list(state.statuses)
+    if truncate and len(statuses) > 2:
+      statuses = [statuses[0], statuses[-1]]
+    processes = {}
+    for process, runs in (state.processes or {}).items():
+      previous_seq = -1
+      compacted_runs = []
+      for index, run in enumerate(runs):
+        try:
+          cls.expand_run(process, run, previous_seq)
+        except cls.ErrorRecoveringState as e:
+          log.debug('Not compacting checkpoint: %s', e)
+          return None
+        previous_seq = run.seq
+        if truncate and index < len(runs) - 1:
+          run = ProcessStatus(seq=run.seq, process=run.process, state=run.state)
+        compacted_runs.append(copy.deepcopy(run))
+      processes[process] = compacted_runs
+    return RunnerCkpt(runner_state=RunnerState(
+        header=copy.deepcopy(state.header),
+        statuses=copy.deepcopy(statuses),
+        processes=processes))
+
+  @staticmethod
+  def _snapshot_order(item):
+    # Replay processes in the order in which their latest runs were forked, which replays the
+    # processes a process depends upon before it.
+    process, runs = item
+    fork_time = runs[-1].fork_time if runs else None
+    return (fork_time is None, fork_time or 0, process)
+
+  def _dispatch_snapshot(self, state, snapshot, recovery, truncate):
+    if state.header is not None:
+      raise self.ErrorRecoveringState('Checkpoint snapshot must begin the checkpoint stream!')
+    self.dispatch(state, RunnerCkpt(runner_header=snapshot.header), recovery, truncate)
+    for status in snapshot.statuses or ():
+      self.dispatch(state, RunnerCkpt(task_status=status), recovery, truncate)
+    for process, runs in sorted((snapshot.processes or {}).items(), key=self._snapshot_order):
+      previous_seq = -1
+      for run in runs:
+        for update in self.expand_run(process, run, previous_seq):
+          self.dispatch(state, RunnerCkpt(process_status=update), recovery, truncate)
+        previous_seq = run.seq
+      # Keep the runs as recorded rather than the placeholders of abbreviated runs.
+      if runs:
+        state.processes[process] = copy.deepcopy(runs[-1:] if truncate else runs)
+
   def __init__(self):
     self._task_handlers = []
     self._process_handlers = []
@@ -259,6 +385,8 @@ class CheckpointDispatcher(object):
     elif process_state_update.state == ProcessState.FORKED:
       assert_process_state_in(ProcessState.WAITING)
       copy_fields(process_state, process_state_update, 'state', 'fork_time', 'coordinator_pid')
+      # Not recorded by older runners.
+      process_state.launch_time = process_state_update.launch_time
 
     # FORKED => RUNNING
     elif process_state_update.state == ProcessState.RUNNING:
@@ -318,6 +446,12 @@ class CheckpointDispatcher(object):
 
       Raises ErrorRecoveringState on failure.
     """
+    # case 0: runner_state
+    #   -> Snapshot at the beginning of a compacted task stream.
+    if runner_ckpt.runner_state is not None:
+      self._dispatch_snapshot(state, runner_ckpt.runner_state, recovery, truncate)
+      return
+
     # case 1: runner_header
     #   -> Initialization of the task stream.
     if runner_ckpt.runner_header is not None:
@@ -0,0 +1,165 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Compression of rotated process logs.
+
+Rotated log segments may be compressed with gzip, or with zstd when the optional zstandard package
+is installed.  A compressed segment keeps the name of the rotated file plus a codec suffix (e.g.
+stdout.1.gz), and open_log reads either form back as the uncompressed log.
+"""
+
+import gzip
+import os
+import shutil
+import struct
+
+from twitter.common.dirutil import safe_delete
+
+try:
+  import zstandard
+except ImportError:
+  zstandard = None
+
+
+class LogCodec(object):
+  """The codecs rotated logs may be compressed with.  These are the values of the LogCompression
+  Enum of RotatePolicy (see apache.thermos.config.schema_base.)"""
+
+  NONE = 'none'
+  GZIP = 'gzip'
+  ZSTD = 'zstd'
+
+  CODECS = (NONE, GZIP, ZSTD)
+
+  SUFFIXES = {
+    GZIP: '.gz',
+    ZSTD: '.zst',
+  }
+
+  @staticmethod
+  def is_valid(codec):
+    return codec in LogCodec.CODECS
+
+  @staticmethod
+  def is_available(codec):
+    return codec != LogCodec.ZSTD or zstandard is not None
+
+  @classmethod
+  def resolve(cls, codec):
+    """Returns the codec to compress with, falling back to gzip if zstd is unavailable."""
+    return codec if cls.is_available(codec) else cls.GZIP
+
+  @classmethod
+  def suffix(cls, codec):
+    return cls.SUFFIXES.get(codec, '')
+
+  @classmethod
+  def codec_of(cls, filename):
+    for codec, suffix in cls.SUFFIXES.items():
+      if filename.endswith(suffix):
+        return codec
+    return cls.NONE
+
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+COPY_BUFFER_SIZE = 1024 * 1024
+
+
+def compress_file(filename, codec):
+  """
+    Compress filename into filename + the codec suffix and remove the original.  The compressed
+    file is written under a temporary name and renamed into place, so readers never see a partial
+    segment.  Returns the name of the compressed file.
+  """
+  target = filename + LogCodec.suffix(codec)
+  scratch = target + '.tmp'
+  try:
+    with open(filename, 'rb') as src:
+      with open(scratch, 'wb') as dst:
+        if codec == LogCodec.ZSTD:
+          compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+          compressor.copy_stream(src, dst, size=os.fstat(src.fileno()).st_size,
+                                 read_size=COPY_BUFFER_SIZE, write_size=COPY_BUFFER_SIZE)
+        else:
+          with gzip.GzipFile(os.path.basename(filename), 'wb', GZIP_LEVEL, dst) as gz:
+            shutil.copyfileobj(src, gz, COPY_BUFFER_SIZE)
+    os.rename(scratch, target)
+  except Exception:
+    safe_delete(scratch)
+    raise
+  safe_delete(filename)
+  return target
+
+
+def is_compressed(filename):
+  """Returns True if filename is a compressed log segment that open_log can decompress."""
+  codec = LogCodec.codec_of(filename)
+  return codec != LogCodec.NONE and LogCodec.is_available(codec)
+
+
+# DEFLATE expands its input at most 1032-fold.
+MAX_DEFLATE_RATIO = 1032
+
+
+def _count_size(reader):
+  size = 0
+  for chunk in iter(lambda: reader.read(COPY_BUFFER_SIZE), b''):
+    size += len(chunk)
+  return size
+
+
+def _gzip_size(fp):
+  # The last four bytes of a gzip member hold the uncompressed size modulo 2^32 (ISIZE), which is
+  # the size itself only if the member is too small to have decompressed to 4GiB or more.
+  compressed_size = os.fstat(fp.fileno()).st_size
+  fp.seek(-4, os.SEEK_END)
+  size = struct.unpack('<I', fp.read(4))[0]
+  fp.seek(0)
+  if compressed_size * MAX_DEFLATE_RATIO >= 2 ** 32:
+    # Otherwise ISIZE may have wrapped around, so count the size.
+    with gzip.GzipFile(fileobj=fp, mode='rb') as reader:
+      size = _count_size(reader)
+    fp.seek(0)
+  return size
+
+
+def _zstd_size(fp):
+  size = zstandard.frame_content_size(fp.read(18))
+  fp.seek(0)
+  if size < 0:
+    # The content size is not recorded in the frame header, so count it.
+    size = _count_size(zstandard.ZstdDecompressor().stream_reader(fp, closefd=False))
+    fp.seek(0)
+  return size
+
+
+def open_log(filename):
+  """
+    Open a log file or compressed log segment for reading.  Returns a (file object, size) tuple of
+    the uncompressed log.  Decompressing file objects only seek efficiently forwards.
+  """
+  fp = open(filename, 'rb')
+  try:
+    if not is_compressed(filename) or os.fstat(fp.fileno()).st_size == 0:
+      return fp, os.fstat(fp.fileno()).st_size
+    if LogCodec.codec_of(filename) == LogCodec.ZSTD:
+      size = _zstd_size(fp)
+      return zstandard.ZstdDecompressor().stream_reader(fp, closefd=True), size
+    size = _gzip_size(fp)
+  except Exception:
+    fp.close()
+    raise
+  fp.close()
+  return gzip.open(filename, 'rb'), size
@@ -0,0 +1,263 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Incremental accounting of the disk usage under a directory
+
+A DiskUsageTree caches the aggregate size of the files in every directory under a root.  The first
+refresh walks the tree with a pool of scandir workers; after that, where inotify is available, only
+the directories which have seen changes since the previous refresh are listed again.  Without
+inotify (or after the event queue overflows) every refresh is a full parallel walk.
+
+Sizes are counted as twitter.common.dirutil.du counts them: the blocks allocated to every regular
+file, the length of every symlink which does not point at a directory, and nothing for directories
+themselves.
+"""
+
+import errno
+import os
+import stat
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from twitter.common import log
+
+from apache.thermos.common.inotify import Inotify
+
+
+class DiskUsageTree(object):
+  """The cached disk usage of every directory under a root."""
+
+  WALK_THREADS = 4
+
+  # Changes to the entries of a directory, or to the size of a file in it.
+  WATCH_MASK = (Inotify.IN_MODIFY | Inotify.IN_ATTRIB | Inotify.IN_MOVED_FROM |
+      Inotify.IN_MOVED_TO | Inotify.IN_CREATE | Inotify.IN_DELETE | Inotify.IN_ONLYDIR |
+      Inotify.IN_DONT_FOLLOW | Inotify.IN_EXCL_UNLINK)
+
+  # Writes through shared mappings raise no events, so the tree is periodically walked in full.
+  FULL_REFRESH_INTERVAL_SECS = 3600
+
+  class Directory(object):
+    __slots__ = ('size', 'subdirs', 'wd')
+
+    def __init__(self, size, subdirs, wd):
+      self.size = size
+      self.subdirs = subdirs
+      self.wd = wd
+
+  @staticmethod
+  def list_directory(path):
+    """Returns a (size of the files, names of the subdirectories) tuple for the directory at path,
+    or None if it cannot be listed."""
+    size = 0
+    subdirs = set()
+    try:
+      with os.scandir(path) as entries:
+        for entry in entries:
+          try:
+            if entry.is_dir():
+              if not entry.is_symlink():
+                subdirs.add(entry.name)
+              continue
+            st = entry.stat(follow_symlinks=False)
+          except OSError:
+            continue
+          if stat.S_ISREG(st.st_mode):
+            size += 512 * st.st_blocks
+          elif stat.S_ISLNK(st.st_mode):
+            size += st.st_size
+    except OSError:
+      return None
+    return size, subdirs
+
+  def __init__(self, root, use_inotify=True, walk_threads=WALK_THREADS,
+               full_refresh_interval=FULL_REFRESH_INTERVAL_SECS, clock=time):
+    self._root = root
+    self._use_inotify = use_inotify and Inotify.is_supported()
+    self._walk_threads = walk_threads
+    self._full_refresh_interval = full_refresh_interval
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._closed = False
+    self._inotify = None
+    self._directories = {}
+    self._paths = {}  # watch descriptor => path
+    self._total = 0
+    self._last_full_refresh = None
+
+  @property
+  def root(self):
+    return self._root
+
+  @property
+  def total(self):
+    return self._total
+
+  @property
+  def incremental(self):
+    """True if refreshes only list the directories which have changed."""
+    return self._inotify is not None
+
+  def refresh(self):
+    """Bring the tree up to date, returning the total disk usage under the root."""
+    with self._lock:
+      if self._closed:
+        return self._total
+      now = self._clock.time()
+      if (self._inotify is None or self._last_full_refresh is None or
+          now - self._last_full_refresh >= self._full_refresh_interval):
+        self._refresh_all(now)
+      else:
+        self._refresh_changed()
+      total = self._total
+    if self._closed:
+      self.close()
+    return total
+
+  def close(self):
+    """Stop watching the tree.  May be called while a refresh is in progress on another thread,
+    in which case the refresh releases the watches when it completes."""
+    self._closed = True
+    if self._lock.acquire(False):
+      try:
+        self._stop_watching()
+      finally:
+        self._lock.release()
+
+  def _stop_watching(self):
+    if self._inotify is not None:
+      self._inotify.close()
+      self._inotify = None
+    self._paths = {}
+
+  def _start_watching(self):
+    self._stop_watching()
+    if self._use_inotify:
+      try:
+        self._inotify = Inotify()
+      except (Inotify.Error, OSError) as e:
+        log.warning('DiskUsageTree: falling back to full walks of %s: %s', self._root, e)
+        self._use_inotify = False
+
+  def _watch(self, path):
+    if self._inotify is None:
+      return None
+    try:
+      wd = self._inotify.add_watch(os.fsencode(path), self.WATCH_MASK)
+    except OSError as e:
+      if e.errno in (errno.ENOSPC, errno.ENOMEM):
+        log.warning('DiskUsageTree: unable to watch %s (%s), falling back to full walks.', path, e)
+        self._stop_watching()
+      return None
+    # A directory moved within the tree keeps its watch descriptor.
+    previous = self._paths.get(wd)
+    if previous is not None and previous != path and previous in self._directories:
+      self._directories[previous].wd = None
+    self._paths[wd] = path
+    return wd
+
+  def _unwatch(self, path, directory):
+    if directory.wd is not None and self._paths.get(directory.wd) == path:
+      del self._paths[directory.wd]
+      if self._inotify is not None:
+        self._inotify.remove_watch(directory.wd)
+
+  def _refresh_all(self, now):
+    start = time.time()
+    self._start_watching()
+    self._directories = {}
+    self._total = 0
+    self._walk([self._root])
+    self._last_full_refresh = now
+    log.debug('DiskUsageTree: walked %d directories under %s in %.1fms', len(self._directories),
+        self._root, 1000.0 * (time.time() - start))
+
+  def _refresh_changed(self):
+    changed = set()
+    for event in self._inotify.read_events():
+      if event.mask & Inotify.IN_Q_OVERFLOW:
+        log.debug('DiskUsageTree: event queue overflowed for %s', self._root)
+        self._refresh_all(self._clock.time())
+        return
+      path = self._paths.get(event.wd)
+      if event.mask & Inotify.IN_IGNORED:
+        if path == self._root:
+          # The root itself has been removed.
+          self._refresh_all(self._clock.time())
+          return
+        continue
+      if path is not None:
+        changed.add(path)
+
+    added = []
+    # Parents before children, so that subtrees which have gone are not listed again.
+    for path in sorted(changed):
+      directory = self._directories.get(path)
+      if directory is None:
+        continue
+      listing = self.list_directory(path)
+      if listing is None:
+        # The directory itself has gone; its parent will drop it from the tree.
+        continue
+      size, subdirs = listing
+      self._total += size - directory.size
+      directory.size = size
+      for name in directory.subdirs - subdirs:
+        self._remove(os.path.join(path, name))
+      added.extend(os.path.join(path, name) for name in subdirs - directory.subdirs)
+      directory.subdirs = subdirs
+    if added:
+      self._walk(added)
+
+  def _remove(self, path):
+    pending = [path]
+    while pending:
+      path = pending.pop()
+      directory = self._directories.pop(path, None)
+      if directory is None:
+        continue
+      self._total -= directory.size
+      self._unwatch(path, directory)
+      pending.extend(os.path.join(path, name) for name in directory.subdirs)
+
+  def _walk(self, paths):
+    """List every directory under paths, watching each before it is listed so that no change to
+    it is missed."""
+    # Watches are added and recorded on this thread; only the listing is parallel.
+    def submit(executor, path):
+      wd = self._watch(path)
+      return executor.submit(self.list_directory, path), wd
+
+    with ThreadPoolExecutor(max_workers=self._walk_threads) as executor:
+      pending = {}
+      for path in paths:
+        future, wd = submit(executor, path)
+        pending[future] = (path, wd)
+      while pending:
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          path, wd = pending.pop(future)
+          listing = future.result()
+          if listing is None:
+            if wd is not None and self._paths.get(wd) == path:
+              del self._paths[wd]
+            continue
+          size, subdirs = listing
+          self._directories[path] = self.Directory(size, subdirs, wd)
+          self._total += size
+          for name in subdirs:
+            child = os.path.join(path, name)
+            future, wd = submit(executor, child)
+            pending[future] = (child, wd)
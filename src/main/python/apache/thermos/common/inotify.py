@@ -0,0 +1,179 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""A minimal ctypes binding to Linux inotify(7).
+
+Only the handful of calls needed to watch checkpoint and sandbox directories are exposed.  Callers
+should check Inotify.is_supported() and fall back to polling when it returns False.
+"""
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import struct
+import sys
+from collections import namedtuple
+
+InotifyEvent = namedtuple('InotifyEvent', ('wd', 'mask', 'cookie', 'name'))
+
+
+class Inotify(object):
+  class Error(Exception): pass
+
+  # Constants from <sys/inotify.h>
+  IN_ACCESS = 0x00000001
+  IN_MODIFY = 0x00000002
+  IN_ATTRIB = 0x00000004
+  IN_CLOSE_WRITE = 0x00000008
+  IN_CLOSE_NOWRITE = 0x00000010
+  IN_OPEN = 0x00000020
+  IN_MOVED_FROM = 0x00000040
+  IN_MOVED_TO = 0x00000080
+  IN_CREATE = 0x00000100
+  IN_DELETE = 0x00000200
+  IN_DELETE_SELF = 0x00000400
+  IN_MOVE_SELF = 0x00000800
+  IN_UNMOUNT = 0x00002000
+  IN_Q_OVERFLOW = 0x00004000
+  IN_IGNORED = 0x00008000
+  IN_ONLYDIR = 0x01000000
+  IN_DONT_FOLLOW = 0x02000000
+  IN_EXCL_UNLINK = 0x04000000
+  IN_ISDIR = 0x40000000
+
+  IN_NONBLOCK = os.O_NONBLOCK
+  IN_CLOEXEC = 0o2000000
+
+  EVENT_HEADER = struct.Struct('iIII')
+  READ_SIZE = 64 * 1024
+
+  _LIBC = None
+
+  @classmethod
+  def _libc(cls):
+    if cls._LIBC is None:
+      if not sys.platform.startswith('linux'):
+        raise cls.Error('inotify is only available on Linux.')
+      library_name = ctypes.util.find_library('c')
+      if library_name is None:
+        raise cls.Error('Could not find libc.')
+      libc = ctypes.CDLL(library_name, use_errno=True)
+      for name in ('inotify_init1', 'inotify_add_watch', 'inotify_rm_watch'):
+        if not hasattr(libc, name):
+          raise cls.Error('libc does not provide %s' % name)
+      libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+      libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+      cls._LIBC = libc
+    return cls._LIBC
+
+  @classmethod
+  def is_supported(cls):
+    try:
+      cls._libc()
+      return True
+    except (cls.Error, OSError, AttributeError):
+      return False
+
+  @classmethod
+  def _raise_errno(cls, message):
+    err = ctypes.get_errno()
+    raise OSError(err, '%s: %s' % (message, os.strerror(err)))
+
+  def __init__(self):
+    libc = self._libc()
+    fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+    if fd < 0:
+      self._raise_errno('inotify_init1 failed')
+    self._fd = fd
+
+  def fileno(self):
+    return self._fd
+
+  @property
+  def closed(self):
+    return self._fd is None
+
+  def add_watch(self, path, mask):
+    """Watch path for the events in mask, returning the watch descriptor.
+
+    Raises OSError on failure, e.g. ENOENT if the path does not exist or ENOSPC if the per-user
+    watch limit (fs.inotify.max_user_watches) has been exhausted.
+    """
+    if isinstance(path, str):
+      path = path.encode(sys.getfilesystemencoding())
+    wd = self._libc().inotify_add_watch(self._fd, path, mask)
+    if wd < 0:
+      self._raise_errno('inotify_add_watch(%r) failed' % path)
+    return wd
+
+  def remove_watch(self, wd):
+    if self._libc().inotify_rm_watch(self._fd, wd) < 0:
+      err = ctypes.get_errno()
+      # The kernel drops watches on its own when the watched path is deleted.
+      if err != errno.EINVAL:
+        self._raise_errno('inotify_rm_watch(%d) failed' % wd)
+
+  def wait(self, timeout=None, extra_fds=()):
+    """Block until events are pending or the timeout expires.
+
+    Returns the subset of [self] + extra_fds that became readable.
+    """
+    try:
+      readable, _, _ = select.select([self] + list(extra_fds), [], [], timeout)
+    except (select.error, OSError) as e:
+      if e.args[0] == errno.EINTR:
+        return []
+      raise
+    return readable
+
+  def read_events(self):
+    """Read all pending events without blocking, returning a list of InotifyEvents."""
+    events = []
+    while True:
+      try:
+        buf = os.read(self._fd, self.READ_SIZE)
+      except OSError as e:
+        if e.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+          break
+        if e.errno == errno.EINTR:
+          continue
+        raise
+      if not buf:
+        break
+      events.extend(self.parse_events(buf))
+    return events
+
+  @classmethod
+  def parse_events(cls, buf):
+    view = memoryview(buf)
+    offset, header_size = 0, cls.EVENT_HEADER.size
+    while offset + header_size <= len(view):
+      wd, mask, cookie, length = cls.EVENT_HEADER.unpack_from(view, offset)
+      offset += header_size
+      name = bytes(view[offset:offset + length]).rstrip(b'\0')
+      offset += length
+      yield InotifyEvent(wd, mask, cookie, os.fsdecode(name) if name else None)
+
+  def close(self):
+    if self._fd is not None:
+      os.close(self._fd)
+      self._fd = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
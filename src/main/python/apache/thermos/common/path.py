@@ -58,6 +58,8 @@ class TaskPath(object):
       'checkpoint_path': ['%(root)s', 'checkpoints', '%(task_id)s'],
       'runner_checkpoint': ['%(root)s', 'checkpoints', '%(task_id)s', 'runner'],
       'process_checkpoint': ['%(root)s', 'checkpoints', '%(task_id)s', 'coordinator.%(process)s'],
+      'process_checkpoint_index': [
+          '%(root)s', 'checkpoints', '%(task_id)s', '.coordinator.%(process)s.index'],
       'process_logbase': ['%(log_dir)s'],
       'process_logdir': ['%(log_dir)s', '%(process)s', '%(run)s']
   }
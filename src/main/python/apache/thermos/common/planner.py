@@ -21,9 +21,10 @@ TaskPlanner:
 """
 
 import copy
+import heapq
 import sys
 import time
-from collections import defaultdict, namedtuple
+from collections import defaultdict, deque, namedtuple
 from functools import partial
 
 
@@ -31,6 +32,10 @@ class Planner(object):
   """
     Given a set of process names and a graph of dependencies between them, determine
     what can run predicated upon process completions.
+
+    The dependency graph is indexed once: each process counts its unfinished dependencies and
+    knows its dependents, so state transitions update the runnable set incrementally rather than
+    each query rescanning every process and dependency.
   """
   class InvalidSchedule(Exception): pass
 
@@ -49,24 +54,35 @@ class Planner(object):
       process_set -= given
     return dependencies
 
+  @staticmethod
+  def dependents(dependencies):
+    """Invert a map of process => set of dependencies into process => set of dependents."""
+    dependents = defaultdict(set)
+    for process, process_dependencies in dependencies.items():
+      for dependency in process_dependencies:
+        dependents[dependency].add(process)
+    return dependents
+
   @classmethod
   def satisfiable(cls, processes, dependencies):
     """
       Given a set of processes and a dependency map, determine if this is a consistent
       schedule without cycles.
     """
-    processes = copy.copy(processes)
-    dependencies = copy.deepcopy(dependencies)
-
-    scheduling = True
-    while scheduling:
-      scheduling = False
-      runnables = cls.filter_runnable(processes, dependencies)
-      if runnables:
-        scheduling = True
-        processes -= runnables
-      dependencies = cls.filter_dependencies(dependencies, given=runnables)
-    return len(processes) == 0
+    # Kahn's algorithm: repeatedly schedule processes without unscheduled dependencies.
+    unscheduled = dict((process, len(dependencies.get(process, ()))) for process in processes)
+    dependents = cls.dependents(dependencies)
+    schedulable = deque(process for process, count in unscheduled.items() if count == 0)
+    scheduled = 0
+    while schedulable:
+      process = schedulable.popleft()
+      scheduled += 1
+      for dependent in dependents.get(process, ()):
+        if dependent in unscheduled:
+          unscheduled[dependent] -= 1
+          if unscheduled[dependent] == 0:
+            schedulable.append(dependent)
+    return scheduled == len(unscheduled)
 
   def __init__(self, processes, dependencies):
     self._processes = set(processes)
@@ -74,14 +90,23 @@ class Planner(object):
         for process in self._processes)
     if not self.satisfiable(self._processes, self._dependencies):
       raise self.InvalidSchedule("Cycles detected in the task schedule!")
+    self._dependents = self.dependents(self._dependencies)
+    self._unfinished_dependencies = dict(
+        (process, len(process_dependencies))
+        for process, process_dependencies in self._dependencies.items())
     self._running = set()
     self._finished = set()
     self._failed = set()
+    # Processes with no unfinished dependencies that are neither running nor terminal.
+    self._runnable = set(process for process, count in self._unfinished_dependencies.items()
+        if count == 0)
+
+  def _is_idle(self, process):
+    return not (process in self._running or process in self._finished or process in self._failed)
 
   @property
   def runnable(self):
-    return self.filter_runnable(self._processes - self._running - self._finished - self._failed,
-      self.filter_dependencies(self._dependencies, given=self._finished))
+    return set(self._runnable)
 
   @property
   def processes(self):
@@ -104,11 +129,14 @@ class Planner(object):
     assert process not in self._finished
     assert process not in self._failed
     self._running.discard(process)
+    if self._unfinished_dependencies[process] == 0:
+      self._runnable.add(process)
 
   def set_running(self, process):
     assert process not in self._failed
     assert process not in self._finished
-    assert process in self._running or process in self.runnable
+    assert process in self._running or process in self._runnable
+    self._runnable.discard(process)
     self._running.add(process)
 
   def set_finished(self, process):
@@ -116,6 +144,10 @@ class Planner(object):
     assert process not in self._failed
     self._running.discard(process)
     self._finished.add(process)
+    for dependent in self._dependents.get(process, ()):
+      self._unfinished_dependencies[dependent] -= 1
+      if self._unfinished_dependencies[dependent] == 0 and self._is_idle(dependent):
+        self._runnable.add(dependent)
 
   def set_failed(self, process):
     assert process in self._running
@@ -124,7 +156,8 @@ class Planner(object):
     self._failed.add(process)
 
   def is_complete(self):
-    return self._finished.union(self._failed) == self._processes
+    # finished and failed are disjoint subsets of processes.
+    return len(self._finished) + len(self._failed) == len(self._processes)
 
 
 TaskAttributes = namedtuple('TaskAttributes', 'min_duration is_daemon max_failures is_ephemeral')
@@ -155,6 +188,11 @@ class TaskPlanner(object):
                                       .--------.
                                       | failed |
                                       `--------'
+
+    Processes held back by the clock gate are tracked with a heap of the deadlines at which their
+    min_duration expires, so that runnable/waiting queries at a non-decreasing time only inspect
+    the processes whose deadlines have passed.  Queries about an earlier time are answered by
+    checking every runnable process.
   """
   InvalidSchedule = Planner.InvalidSchedule  # noqa
   INFINITY = sys.float_info.max
@@ -168,6 +206,9 @@ class TaskPlanner(object):
     process_map = dict((process.name().get(), process)
                         for process in filter(process_filter, task.processes()))
     processes = set(process_map)
+    # Look up the process attributes once: pystachio interpolates on every access.
+    daemons = set(name for name, process in process_map.items() if process.daemon().get())
+    ephemerals = set(name for name, process in process_map.items() if process.ephemeral().get())
     dependencies = defaultdict(set)
     if task.has_constraints():
       for constraint in task.constraints():
@@ -181,10 +222,10 @@ class TaskPlanner(object):
           continue
         for k in range(1, len(process_names)):
           pnk, pnk1 = process_names[k], process_names[k - 1]
-          if process_map[pnk1].daemon().get():
+          if pnk1 in daemons:
             raise cls.InvalidSchedule(
               'Process %s may not depend upon daemon process %s' % (pnk, pnk1))
-          if not process_map[pnk].ephemeral().get() and process_map[pnk1].ephemeral().get():
+          if pnk not in ephemerals and pnk1 in ephemerals:
             raise cls.InvalidSchedule(
               'Non-ephemeral process %s may not depend upon ephemeral process %s' % (pnk, pnk1))
           dependencies[pnk].add(pnk1)
@@ -197,12 +238,13 @@ class TaskPlanner(object):
     self._planner = Planner(*self.extract_dependencies(task, self._filter))
     self._clock = clock
     self._last_terminal = {}  # process => timestamp of last terminal state
+    self._deadlines = []  # heap of (time at which min_duration expires, process)
+    self._backing_off = set()  # processes that were waiting as of self._backoff_checked
+    self._backoff_checked = -self.INFINITY
     self._failures = defaultdict(int)
     self._successes = defaultdict(int)
     self._losses = defaultdict(int)
     self._attributes = {}
-    self._ephemerals = set(process.name().get() for process in task.processes()
-        if (self._filter is None or self._filter(process)) and process.ephemeral().get())
 
     for process in filter(self._filter, task.processes()):
       self._attributes[process.name().get()] = TaskAttributes(
@@ -210,6 +252,8 @@ class TaskPlanner(object):
         is_ephemeral=bool(process.ephemeral().get()),
         max_failures=process.max_failures().get(),
         min_duration=process.min_duration().get())
+    self._ephemerals = set(process for process, attributes in self._attributes.items()
+        if attributes.is_ephemeral)
 
   def get_wait(self, process, timestamp=None):
     now = timestamp if timestamp is not None else self._clock.time()
@@ -220,6 +264,28 @@ class TaskPlanner(object):
   def _record_termination_time(self, process, timestamp=None):
     timestamp = timestamp if timestamp is not None else self._clock.time()
     self._last_terminal[process] = timestamp
+    deadline = self._deadline(process)
+    if deadline > self._backoff_checked:
+      heapq.heappush(self._deadlines, (deadline, process))
+      self._backing_off.add(process)
+    else:
+      self._backing_off.discard(process)
+
+  def _deadline(self, process):
+    return self._last_terminal[process] + self._attributes[process].min_duration
+
+  def _check_backoff(self, timestamp):
+    """Bring the set of processes backing off up to date as of timestamp.  Returns False if
+       timestamp precedes an earlier check, in which case the set cannot be used."""
+    if timestamp < self._backoff_checked:
+      return False
+    while self._deadlines and self._deadlines[0][0] <= timestamp:
+      deadline, process = heapq.heappop(self._deadlines)
+      # Entries are superseded, rather than removed, when a process terminates again.
+      if deadline == self._deadline(process):
+        self._backing_off.discard(process)
+    self._backoff_checked = timestamp
+    return True
 
   def is_ready(self, process, timestamp=None):
     return self.get_wait(process, timestamp) <= 0
@@ -238,15 +304,20 @@ class TaskPlanner(object):
     return self.waiting_at(self._clock.time())
 
   def runnable_at(self, timestamp):
+    if self._check_backoff(timestamp):
+      return self._planner.runnable - self._backing_off
     return set(filter(partial(self.is_ready, timestamp=timestamp), self._planner.runnable))
 
   def waiting_at(self, timestamp):
+    if self._check_backoff(timestamp):
+      return self._planner.runnable & self._backing_off
     return set(filter(partial(self.is_waiting, timestamp=timestamp), self._planner.runnable))
 
   def min_wait(self, timestamp=None):
     """Return the current wait time for the next process to become runnable, 0 if something is ready
        immediately, or sys.float.max if there are no waiters."""
-    if self.runnable_at(timestamp if timestamp is not None else self._clock.time()):
+    timestamp = timestamp if timestamp is not None else self._clock.time()
+    if self.runnable_at(timestamp):
       return 0
     waits = [self.get_wait(waiter, timestamp) for waiter in self.waiting_at(timestamp)]
     return min(waits) if waits else self.INFINITY
@@ -74,6 +74,16 @@ def wrap_with_mesos_containerizer(cmdline, user, cwd, mesos_containerizer_path):
       '--command=%s' % json.dumps(command_info)]
 
 
+_LIBC = []  # the loaded libc, memoized as locating it may run ldconfig
+
+
+def _libc():
+  if not _LIBC:
+    library_name = ctypes.util.find_library('c')
+    _LIBC.append(ctypes.CDLL(library_name, use_errno=True) if library_name else None)
+  return _LIBC[0]
+
+
 def setup_child_subreaping():
   """
   This uses the prctl(2) syscall to set the `PR_SET_CHILD_SUBREAPER` flag. This
@@ -89,12 +99,11 @@ def setup_child_subreaping():
   # This constant is taken from prctl.h
   PR_SET_CHILD_SUBREAPER = 36
   try:
-    library_name = ctypes.util.find_library('c')
-    if library_name is None:
+    libc = _libc()
+    if libc is None:
       log.warning("libc is not found. Unable to call prctl!")
       log.warning("Children subreaping is disabled!")
       return
-    libc = ctypes.CDLL(library_name, use_errno=True)
     # If we are on a system where prctl doesn't exist, this will throw an
     # attribute error.
     ret = libc.prctl(PR_SET_CHILD_SUBREAPER, 1, 0, 0, 0)
@@ -0,0 +1,278 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Point-in-time snapshots of the host process table read directly from /proc
+
+A ProcessTable is built with a single pass over /proc/<pid>/stat and indexes every process on the
+host by pid and by parent pid, so that many process trees can be resolved from one snapshot
+instead of each caller re-walking /proc.
+
+ProcessMemory reads the memory of a single process from /proc/<pid>/smaps_rollup (or smaps on
+kernels without it), and CgroupMemoryStat the memory of a whole container from its memory cgroup.
+"""
+
+import errno
+import os
+import sys
+import time
+from collections import defaultdict, namedtuple
+
+
+class ProcessEntry(namedtuple('ProcessEntry',
+    'pid ppid status user system nice threads create_time vms rss')):
+  """A single process as read from /proc/<pid>/stat.
+
+    user, system: cpu time in seconds
+    create_time: process start time in seconds since the epoch
+    vms, rss: memory in bytes
+  """
+
+
+class ProcessUids(namedtuple('ProcessUids', 'real effective saved')):
+  """The uids of a process as read from /proc/<pid>/status."""
+
+
+class ProcessTable(object):
+  """An immutable snapshot of every process visible in procfs."""
+
+  PROCFS = '/proc'
+
+  # Mapping of /proc/<pid>/stat state codes to the names psutil uses for Process.status().
+  STATUS_NAMES = {
+    'R': 'running',
+    'S': 'sleeping',
+    'D': 'disk-sleep',
+    'T': 'stopped',
+    't': 'tracing-stop',
+    'Z': 'zombie',
+    'X': 'dead',
+    'x': 'dead',
+    'K': 'wake-kill',
+    'W': 'waking',
+    'P': 'parked',
+    'I': 'idle',
+  }
+
+  _CLOCK_TICKS = None
+  _PAGE_SIZE = None
+  _BOOT_TIME = None
+
+  @classmethod
+  def is_supported(cls, procfs=PROCFS):
+    return sys.platform.startswith('linux') and os.path.isdir(os.path.join(procfs, 'self'))
+
+  @classmethod
+  def _constants(cls, procfs):
+    if cls._BOOT_TIME is None:
+      cls._CLOCK_TICKS = float(os.sysconf('SC_CLK_TCK'))
+      cls._PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+      boot_time = 0.0
+      with open(os.path.join(procfs, 'stat')) as fp:
+        for line in fp:
+          if line.startswith('btime'):
+            boot_time = float(line.split()[1])
+            break
+      cls._BOOT_TIME = boot_time
+    return cls._CLOCK_TICKS, cls._PAGE_SIZE, cls._BOOT_TIME
+
+  @classmethod
+  def parse_stat(cls, pid, data, clock_ticks, page_size, boot_time):
+    """Parse the contents of /proc/<pid>/stat into a ProcessEntry."""
+    # The command name is parenthesized and may itself contain spaces or parentheses.
+    fields = data[data.rindex(')') + 2:].split()
+    return ProcessEntry(
+        pid=pid,
+        ppid=int(fields[1]),
+        status=cls.STATUS_NAMES.get(fields[0], fields[0]),
+        user=int(fields[11]) / clock_ticks,
+        system=int(fields[12]) / clock_ticks,
+        nice=int(fields[16]),
+        threads=int(fields[17]),
+        create_time=boot_time + int(fields[19]) / clock_ticks,
+        vms=int(fields[20]),
+        rss=int(fields[21]) * page_size)
+
+  @classmethod
+  def snapshot(cls, procfs=PROCFS):
+    """Read every /proc/<pid>/stat once and return a ProcessTable."""
+    clock_ticks, page_size, boot_time = cls._constants(procfs)
+    entries = {}
+    for name in os.listdir(procfs):
+      if not name.isdigit():
+        continue
+      pid = int(name)
+      try:
+        with open(os.path.join(procfs, name, 'stat')) as fp:
+          data = fp.read()
+        entries[pid] = cls.parse_stat(pid, data, clock_ticks, page_size, boot_time)
+      except (IOError, OSError, ValueError, IndexError):
+        # The process exited between listdir and open, or the stat line was unparseable.
+        continue
+    return cls(entries, procfs=procfs)
+
+  def __init__(self, entries, timestamp=None, procfs=PROCFS):
+    self._entries = entries
+    self._procfs = procfs
+    self._uids = {}
+    self._children = defaultdict(list)
+    for entry in entries.values():
+      self._children[entry.ppid].append(entry.pid)
+    self._timestamp = time.time() if timestamp is None else timestamp
+
+  @property
+  def timestamp(self):
+    return self._timestamp
+
+  def get(self, pid):
+    return self._entries.get(pid)
+
+  def __contains__(self, pid):
+    return pid in self._entries
+
+  def __getitem__(self, pid):
+    return self._entries[pid]
+
+  def __len__(self):
+    return len(self._entries)
+
+  def __iter__(self):
+    return iter(self._entries.values())
+
+  def uids(self, pid):
+    """
+      Return the ProcessUids of pid, or None if it is not in the snapshot or has since exited.
+      Uids are not part of /proc/<pid>/stat, so they are read on demand and cached.
+    """
+    if pid not in self._uids:
+      self._uids[pid] = self._read_uids(pid) if pid in self._entries else None
+    return self._uids[pid]
+
+  def _read_uids(self, pid):
+    try:
+      with open(os.path.join(self._procfs, str(pid), 'status')) as fp:
+        for line in fp:
+          if line.startswith('Uid:'):
+            return ProcessUids(*(int(uid) for uid in line.split()[1:4]))
+    except (IOError, OSError, ValueError, TypeError):
+      pass
+    return None
+
+  def children(self, pid):
+    """Return the pids of the direct children of pid."""
+    return list(self._children.get(pid, ()))
+
+  def descendants(self, pid):
+    """Return the pids of every process in the tree rooted at pid, excluding pid itself."""
+    result, stack, seen = [], list(self._children.get(pid, ())), set([pid])
+    while stack:
+      child = stack.pop()
+      if child in seen:
+        continue
+      seen.add(child)
+      result.append(child)
+      stack.extend(self._children.get(child, ()))
+    return result
+
+
+class ProcessMemory(namedtuple('ProcessMemory', 'rss pss uss swap')):
+  """The memory of a single process summed over all of its mappings, in bytes.
+
+    uss: memory private to the process (clean and dirty)
+  """
+
+  PROCFS = '/proc'
+
+  # smaps field => index of the ProcessMemory field it is summed into
+  SMAPS_FIELDS = {
+    b'Rss': 0,
+    b'Pss': 1,
+    b'Private_Clean': 2,
+    b'Private_Dirty': 2,
+    b'Swap': 3,
+  }
+
+  _HAS_ROLLUP = [True]  # cleared once smaps_rollup is found to be missing (before Linux 4.14)
+
+  @classmethod
+  def parse_smaps(cls, data):
+    """Sum the fields of the contents of /proc/<pid>/smaps or smaps_rollup (as bytes)."""
+    totals = [0, 0, 0, 0]
+    fields = cls.SMAPS_FIELDS
+    for line in data.splitlines():
+      key, _, value = line.partition(b':')
+      index = fields.get(key)
+      if index is not None:
+        totals[index] += int(value.split()[0])
+    return cls(*(total * 1024 for total in totals))
+
+  @classmethod
+  def read(cls, pid, procfs=PROCFS):
+    """Read the memory of pid.  Raises IOError/OSError if the process cannot be read, e.g. because
+    it has exited."""
+    path = os.path.join(procfs, str(pid))
+    if cls._HAS_ROLLUP[0]:
+      try:
+        with open(os.path.join(path, 'smaps_rollup'), 'rb') as fp:
+          return cls.parse_smaps(fp.read())
+      except (IOError, OSError) as e:
+        if e.errno != errno.ENOENT or not os.path.exists(path):
+          raise
+        cls._HAS_ROLLUP[0] = False
+    with open(os.path.join(path, 'smaps'), 'rb') as fp:
+      return cls.parse_smaps(fp.read())
+
+
+class CgroupMemoryStat(namedtuple('CgroupMemoryStat', 'rss cache swap')):
+  """The memory of every process in a memory cgroup and its descendants, in bytes, as read from
+  its memory.stat.  swap is only reported by cgroup v1 hierarchies with swap accounting."""
+
+  PROCFS = '/proc'
+  CGROUPFS = '/sys/fs/cgroup'
+
+  @classmethod
+  def locate(cls, pid='self', procfs=PROCFS, cgroupfs=CGROUPFS):
+    """Return the path of the memory.stat of the memory cgroup of pid, or None if there is none."""
+    candidates = []
+    try:
+      with open(os.path.join(procfs, str(pid), 'cgroup')) as fp:
+        for line in fp:
+          hierarchy, controllers, path = line.rstrip('\n').split(':', 2)
+          if 'memory' in controllers.split(','):
+            candidates.insert(0, os.path.join(cgroupfs, 'memory', path.lstrip('/'), 'memory.stat'))
+          elif hierarchy == '0' and not controllers:
+            candidates.append(os.path.join(cgroupfs, path.lstrip('/'), 'memory.stat'))
+    except (IOError, OSError, ValueError):
+      return None
+    for candidate in candidates:
+      if os.path.exists(candidate):
+        return candidate
+    return None
+
+  @classmethod
+  def parse(cls, data):
+    """Parse the contents of a cgroup v1 or v2 memory.stat."""
+    stats = {}
+    for line in data.splitlines():
+      fields = line.split()
+      if len(fields) == 2:
+        stats[fields[0]] = int(fields[1])
+    if 'total_rss' in stats:
+      return cls(rss=stats['total_rss'], cache=stats.get('total_cache', 0),
+                 swap=stats.get('total_swap', 0))
+    return cls(rss=stats.get('anon', 0), cache=stats.get('file', 0), swap=0)
+
+  @classmethod
+  def read(cls, path):
+    with open(path) as fp:
+      return cls.parse(fp.read())
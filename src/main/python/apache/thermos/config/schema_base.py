@@ -58,9 +58,13 @@ class Constraint(Struct):
   order = List(String)
 
 
+LogCompression = Enum('none', 'gzip', 'zstd')
+
+
 class RotatePolicy(Struct):
   log_size = Default(Integer, 100*MB)
   backups = Default(Integer, 5)
+  compression = Default(LogCompression, LogCompression('none'))
 
 
 LoggerDestination = Enum('file', 'console', 'both', 'none')
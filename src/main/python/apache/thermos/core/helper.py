@@ -14,22 +14,53 @@
 
 import errno
 import os
+import pwd
 import signal
 import time
 from contextlib import closing
 
 import psutil
 from twitter.common import log
-from twitter.common.dirutil import lock_file, safe_mkdir
+from twitter.common.dirutil import lock_file, safe_delete, safe_mkdir
 from twitter.common.quantity import Amount, Time
 from twitter.common.recordio import ThriftRecordWriter
 
 from apache.thermos.common.ckpt import CheckpointDispatcher
 from apache.thermos.common.path import TaskPath
+from apache.thermos.common.procfs import ProcessTable
 
 from gen.apache.thermos.ttypes import ProcessState, ProcessStatus, RunnerCkpt, TaskState, TaskStatus
 
 
+class _TableProcess(object):
+  """
+    The subset of psutil.Process used by TaskRunnerHelper, answered from a ProcessTable snapshot
+    rather than by reading /proc for each call.
+  """
+
+  def __init__(self, table, pid):
+    if pid not in table:
+      raise psutil.NoSuchProcess(pid)
+    self._table = table
+    self.pid = pid
+
+  def create_time(self):
+    return self._table[self.pid].create_time
+
+  def uids(self):
+    uids = self._table.uids(self.pid)
+    if uids is None:
+      raise psutil.NoSuchProcess(self.pid)
+    return uids
+
+  def username(self):
+    return pwd.getpwuid(self.uids().real).pw_name
+
+  def children(self, recursive=False):
+    pids = self._table.descendants(self.pid) if recursive else self._table.children(self.pid)
+    return [_TableProcess(self._table, pid) for pid in pids]
+
+
 class TaskRunnerHelper(object):
   """
     TaskRunner helper methods that can be operated directly upon checkpoint
@@ -52,13 +83,26 @@ class TaskRunnerHelper(object):
 
   @staticmethod
   def get_actual_user():
-    import getpass, pwd
+    import getpass
     try:
       pwd_entry = pwd.getpwuid(os.getuid())
     except KeyError:
       return getpass.getuser()
     return pwd_entry[0]
 
+  @staticmethod
+  def process_table():
+    """
+      Snapshot the process table of the host, or return None if /proc is unavailable.  The
+      snapshot may be passed as the table to the scan, terminate and kill methods in order to
+      share a single pass over /proc between them.
+    """
+    return ProcessTable.snapshot() if ProcessTable.is_supported() else None
+
+  @staticmethod
+  def _process(pid, table=None):
+    return psutil.Process(pid) if table is None else _TableProcess(table, pid)
+
   @staticmethod
   def process_from_name(task, process_name):
     if task.has_processes():
@@ -128,12 +172,13 @@ class TaskRunnerHelper(object):
     return False
 
   @classmethod
-  def scan_process(cls, state, process_name):
+  def scan_process(cls, state, process_name, table=None):
     """
       Given a RunnerState and a process_name, return the following:
         (coordinator pid, process pid, process tree)
         (int or None, int or None, set)
 
+      If a ProcessTable is supplied, processes are looked up in it instead of in /proc.
     """
     process_run = state.processes[process_name][-1]
     user, uid = state.header.user, state.header.uid
@@ -145,7 +190,7 @@ class TaskRunnerHelper(object):
 
     if process_run.coordinator_pid:
       try:
-        coordinator_process = psutil.Process(process_run.coordinator_pid)
+        coordinator_process = cls._process(process_run.coordinator_pid, table)
         if cls.this_is_really_our_pid(coordinator_process, uid, user, process_run.fork_time):
           coordinator_pid = process_run.coordinator_pid
       except psutil.NoSuchProcess:
@@ -157,7 +202,7 @@ class TaskRunnerHelper(object):
 
     if process_run.pid:
       try:
-        process = psutil.Process(process_run.pid)
+        process = cls._process(process_run.pid, table)
         if cls.this_is_really_our_pid(process, uid, user, process_run.start_time):
           pid = process.pid
       except psutil.NoSuchProcess:
@@ -174,7 +219,7 @@ class TaskRunnerHelper(object):
     return (coordinator_pid, pid, tree)
 
   @classmethod
-  def scan_tree(cls, state):
+  def scan_tree(cls, state, table=None):
     """
       Scan the process tree associated with the provided task state.
 
@@ -183,7 +228,9 @@ class TaskRunnerHelper(object):
       forked process is no longer active, pid will be None and its children will be
       an empty set.
     """
-    return dict((process_name, cls.scan_process(state, process_name))
+    if table is None:
+      table = cls.process_table()
+    return dict((process_name, cls.scan_process(state, process_name, table))
                 for process_name in state.processes)
 
   @classmethod
@@ -209,9 +256,9 @@ class TaskRunnerHelper(object):
     cls.safe_signal(-pgrp, signal.SIGKILL)
 
   @classmethod
-  def _get_process_tuple(cls, state, process_name):
+  def _get_process_tuple(cls, state, process_name, table=None):
     assert process_name in state.processes and len(state.processes[process_name]) > 0
-    return cls.scan_process(state, process_name)
+    return cls.scan_process(state, process_name, table)
 
   @classmethod
   def _get_coordinator_group(cls, state, process_name):
@@ -219,17 +266,19 @@ class TaskRunnerHelper(object):
     return state.processes[process_name][-1].coordinator_pid
 
   @classmethod
-  def terminate_orphans(cls, state):
+  def terminate_orphans(cls, state, table=None):
     """
     Given the state, send SIGTERM to children that are orphaned processes.
 
     The direct children of the runner will always be coordinators or orphans.
     """
     log.debug('TaskRunnerHelper.terminate_orphans()')
-    process_tree = cls.scan_tree(state)
+    if table is None:
+      table = cls.process_table()
+    process_tree = cls.scan_tree(state, table)
 
     coordinator_pids = {p[0] for p in process_tree.values() if p[0]}
-    children_pids = {c.pid for c in psutil.Process().children()}
+    children_pids = {c.pid for c in cls._process(os.getpid(), table).children()}
     orphaned_pids = children_pids - coordinator_pids
 
     if len(orphaned_pids) > 0:
@@ -239,19 +288,19 @@ class TaskRunnerHelper(object):
         cls.terminate_pid(p)
 
   @classmethod
-  def terminate_process(cls, state, process_name):
+  def terminate_process(cls, state, process_name, table=None):
     log.debug('TaskRunnerHelper.terminate_process(%s)', process_name)
-    _, pid, _ = cls._get_process_tuple(state, process_name)
+    _, pid, _ = cls._get_process_tuple(state, process_name, table)
     if pid:
       log.debug('   => SIGTERM pid %s', pid)
       cls.terminate_pid(pid)
     return bool(pid)
 
   @classmethod
-  def kill_process(cls, state, process_name):
+  def kill_process(cls, state, process_name, table=None):
     log.debug('TaskRunnerHelper.kill_process(%s)', process_name)
     coordinator_pgid = cls._get_coordinator_group(state, process_name)
-    coordinator_pid, pid, tree = cls._get_process_tuple(state, process_name)
+    coordinator_pid, pid, tree = cls._get_process_tuple(state, process_name, table)
     # This is super dangerous.  TODO(wickman)  Add a heuristic that determines
     # that 1) there are processes that currently belong to this process group
     #  and 2) those processes have inherited the coordinator checkpoint filehandle
@@ -290,13 +339,61 @@ class TaskRunnerHelper(object):
         return True
       raise
 
+  @classmethod
+  def _lock_checkpoint(cls, filename, blocking=False):
+    """
+      Lock the checkpoint stream at filename.  The runner holding the lock may replace the stream
+      (see compact_checkpoint), in which case the lock on the replaced stream is worthless and the
+      new stream is locked instead.
+    """
+    while True:
+      fp = lock_file(filename, "ab+", blocking=blocking)
+      if fp in (None, False):
+        return fp
+      try:
+        if os.fstat(fp.fileno()).st_ino == os.stat(filename).st_ino:
+          return fp
+      except OSError:
+        pass
+      log.debug('Checkpoint %s was replaced while locking it, retrying.', filename)
+      fp.close()
+
+  @classmethod
+  def compact_checkpoint(cls, filename, snapshot):
+    """
+      Atomically replace the locked checkpoint stream at filename with a stream containing only
+      the RunnerCkpt snapshot.  The replacement is locked before it is moved into place.
+
+      Returns a checkpoint writer for the replacement stream, or None on failure (in which case
+      the existing stream is left untouched.)
+    """
+    compacted_filename = filename + '.compacting'
+    fp = lock_file(compacted_filename, "wb+")
+    if fp in (None, False):
+      log.error('Could not lock %s for checkpoint compaction.', compacted_filename)
+      return None
+    ckpt = ThriftRecordWriter(fp)
+    try:
+      if not ckpt.write(snapshot):
+        raise IOError('Failed to write checkpoint snapshot.')
+      fp.flush()
+      os.fsync(fp.fileno())
+      os.rename(compacted_filename, filename)
+    except (IOError, OSError) as e:
+      log.error('Failed to compact checkpoint %s: %s', filename, e)
+      fp.close()
+      safe_delete(compacted_filename)
+      return None
+    ckpt.set_sync(True)
+    return ckpt
+
   @classmethod
   def open_checkpoint(cls, filename, force=False, state=None):
     """
       Acquire a locked checkpoint stream.
     """
     safe_mkdir(os.path.dirname(filename))
-    fp = lock_file(filename, "ab+")
+    fp = cls._lock_checkpoint(filename)
     if fp in (None, False):
       if force:
         log.info('Found existing runner, forcing leadership forfeit.')
@@ -306,7 +403,7 @@ class TaskRunnerHelper(object):
           # TODO(wickman)  Blocking may not be the best idea here.  Perhaps block up to
           # a maximum timeout.  But blocking is necessary because os.kill does not immediately
           # release the lock if we're in force mode.
-          fp = lock_file(filename, "ab+", blocking=True)
+          fp = cls._lock_checkpoint(filename, blocking=True)
       else:
         log.error('Found existing runner, cannot take control.')
     if fp in (None, False):
@@ -356,10 +453,11 @@ class TaskRunnerHelper(object):
 
     with closing(ckpt):
       write_task_state(TaskState.ACTIVE)
+      table = cls.process_table()
       for process, history in state.processes.items():
         process_status = history[-1]
         if not cls.is_process_terminal(process_status.state):
-          if cls.kill_process(state, process):
+          if cls.kill_process(state, process, table):
             write_process_status(ProcessStatus(process=process,
               state=ProcessState.KILLED, seq=process_status.seq + 1, return_code=-9,
               stop_time=clock.time()))
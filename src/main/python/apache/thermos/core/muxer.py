@@ -13,28 +13,161 @@
 #
 
 import errno
+import glob
 import os
+import select
+import time
 
 from twitter.common import log
-from twitter.common.recordio import ThriftRecordReader
+from twitter.common.dirutil import safe_delete
+from twitter.common.recordio import MappedRecordReader, RecordIndex, RecordIO, ThriftRecordReader
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
+
+from apache.thermos.common.inotify import Inotify
 
 from gen.apache.thermos.ttypes import RunnerCkpt
 
 
 class ProcessMuxer(object):
+  """
+    Multiplexes the checkpoint streams written by the process coordinators of a task.
+
+    Where inotify(7) is available, the muxer watches the process checkpoint directory so that
+    wait() returns as soon as a coordinator appends to its checkpoint.  Where pidfds are available,
+    wait() also returns as soon as a coordinator registered with watch_exit() exits.  Otherwise
+    (or if the directory cannot be watched) wait() falls back to sleeping on the supplied clock.
+  """
+
   class Error(Exception): pass
   class ProcessExists(Error): pass
   class ProcessNotFound(Error): pass
   class CorruptCheckpoint(Error): pass
 
-  def __init__(self, pathspec):
+  COORDINATOR_PREFIX = 'coordinator.'
+  WATCH_MASK = (Inotify.IN_MODIFY | Inotify.IN_CLOSE_WRITE | Inotify.IN_CREATE |
+                Inotify.IN_MOVED_TO | Inotify.IN_ONLYDIR)
+
+  def __init__(self, pathspec, clock=time, enable_inotify=True):
     self._processes = {}  # process_name => fp
     self._watermarks = {}  # process_name => sequence high watermark
     self._pathspec = pathspec
+    self._clock = clock
+    self._inotify = None
+    self._watch = None
+    self._pidfds = {}  # process_name => pidfd of its coordinator
+    self._exited = set()  # process names whose coordinators exited since the last exited()
+    if enable_inotify and Inotify.is_supported():
+      try:
+        self._inotify = Inotify()
+      except OSError as e:
+        log.warning('Unable to initialize inotify, polling process checkpoints: %s', e)
 
   def __del__(self):
     for fp in filter(None, self._processes.values()):
       fp.close()
+    self.close()
+
+  def close(self):
+    for process_name in list(self._pidfds):
+      self.unwatch_exit(process_name)
+    if self._inotify is not None:
+      self._inotify.close()
+      self._inotify = None
+      self._watch = None
+
+  @property
+  def event_driven(self):
+    """True if wait() is woken up by checkpoint writes rather than merely sleeping."""
+    return self._watch is not None
+
+  def _ensure_watch(self):
+    if self._inotify is None or self._watch is not None:
+      return
+    ckpt_dir = os.path.dirname(
+        self._pathspec.given(process='_').getpath('process_checkpoint'))
+    try:
+      self._watch = self._inotify.add_watch(ckpt_dir, self.WATCH_MASK)
+      log.debug('ProcessMuxer watching %s', ckpt_dir)
+    except OSError as e:
+      if e.errno != errno.ENOENT:
+        log.warning('Unable to watch %s, polling process checkpoints: %s', ckpt_dir, e)
+        self.close()
+
+  def watch_exit(self, process_name, pid):
+    """Wake up wait() when the coordinator pid of process_name exits.  A no-op without pidfds."""
+    self.unwatch_exit(process_name)
+    if not hasattr(os, 'pidfd_open'):
+      return
+    try:
+      self._pidfds[process_name] = os.pidfd_open(pid)
+    except OSError as e:
+      if e.errno == errno.ESRCH:
+        self._exited.add(process_name)
+      else:
+        log.debug('Unable to watch coordinator of %s [pid: %s]: %s', process_name, pid, e)
+
+  def unwatch_exit(self, process_name):
+    pidfd = self._pidfds.pop(process_name, None)
+    if pidfd is not None:
+      os.close(pidfd)
+
+  def exited(self):
+    """Return the names of the processes whose coordinators exited since the last call."""
+    exited, self._exited = self._exited, set()
+    return exited
+
+  def _reap_pidfds(self, readable):
+    for process_name, pidfd in list(self._pidfds.items()):
+      if pidfd in readable:
+        log.debug('Coordinator of %s exited.', process_name)
+        self.unwatch_exit(process_name)
+        self._exited.add(process_name)
+
+  def _is_coordinator_event(self, event):
+    if event.mask & (Inotify.IN_Q_OVERFLOW | Inotify.IN_IGNORED):
+      if event.mask & Inotify.IN_IGNORED:
+        # The checkpoint directory went away; watch it again once it is recreated.
+        self._watch = None
+      return True
+    return event.name is not None and event.name.startswith(self.COORDINATOR_PREFIX)
+
+  def wait(self, timeout):
+    """
+      Wait up to timeout seconds for a coordinator to write to its checkpoint stream or exit.
+      Writes which happened after the last select() wake up the muxer immediately.  Returns the
+      number of seconds waited.
+    """
+    self._ensure_watch()
+    if self._exited:
+      return 0
+    if self._watch is None and not self._pidfds:
+      self._clock.sleep(timeout)
+      return timeout
+    start = self._clock.time()
+    remaining = timeout
+    while remaining > 0:
+      pidfds = list(self._pidfds.values())
+      if self._watch is not None:
+        readable = self._inotify.wait(remaining, extra_fds=pidfds)
+      else:
+        try:
+          readable, _, _ = select.select(pidfds, [], [], remaining)
+        except (select.error, OSError) as e:
+          if e.args[0] != errno.EINTR:
+            raise
+          readable = []
+      if not readable:
+        # Timed out (or interrupted, in which case the caller waits again).
+        break
+      self._reap_pidfds(readable)
+      if self._exited:
+        break
+      if self._inotify is not None and self._inotify in readable:
+        # Ignore the writes to the runner checkpoint that share the directory.
+        if any([self._is_coordinator_event(event) for event in self._inotify.read_events()]):
+          break
+      remaining = timeout - (self._clock.time() - start)
+    return self._clock.time() - start
 
   def register(self, process_name, watermark=0):
     log.debug('registering %s', process_name)
@@ -60,31 +193,65 @@ class ProcessMuxer(object):
           log.error("Unexpected inability to open %s! %s", process_ckpt, e)
         self._fast_forward_stream(process_name)
 
+  @staticmethod
+  def _record_seq(record):
+    return record.process_status.seq
+
+  def _load_index(self, process_name, reader):
+    """Load and extend the persisted sequence index of a process checkpoint.  Returns the index
+       (which is empty if the checkpoint could not be indexed)."""
+    index_path = self._pathspec.given(process=process_name).getpath('process_checkpoint_index')
+    index = RecordIndex.load(index_path, key=self._record_seq)
+    try:
+      if index.update(reader):
+        index.save(index_path)
+    except (AttributeError, ValueError, RecordIO.Error) as e:
+      log.warning('Unable to index checkpoint of %s: %s', process_name, e)
+      return RecordIndex()
+    except (IOError, OSError) as e:
+      log.debug('Unable to save checkpoint index of %s: %s', process_name, e)
+    return index
+
+  def remove_indexes(self):
+    """Remove the persisted sequence indexes of every process checkpoint of the task.  Indexes
+       only speed up the replay of a restarted runner, so they are removed once the task is
+       terminal."""
+    index_path = self._pathspec.given(process='*').getpath('process_checkpoint_index')
+    pattern = os.path.join(glob.escape(os.path.dirname(index_path)), os.path.basename(index_path))
+    for index_path in glob.glob(pattern):
+      log.debug('Removing checkpoint index %s', index_path)
+      safe_delete(index_path)
+
   def _fast_forward_stream(self, process_name):
     log.debug('Fast forwarding %s stream to seq=%s', process_name,
       self._watermarks[process_name])
     assert self._processes.get(process_name) is not None
     fp = self._processes[process_name]
-    rr = ThriftRecordReader(fp, RunnerCkpt)
+    watermark = self._watermarks[process_name]
     current_watermark = -1
     records = 0
-    while current_watermark < self._watermarks[process_name]:
-      last_pos = fp.tell()
-      record = rr.try_read()
-      if record is None:
-        break
-      new_watermark = record.process_status.seq
-      if new_watermark > self._watermarks[process_name]:
-        log.debug('Over-seeked %s [watermark = %s, high watermark = %s], rewinding.',
-          process_name, new_watermark, self._watermarks[process_name])
-        fp.seek(last_pos)
-        break
-      current_watermark = new_watermark
-      records += 1
+    with MappedRecordReader(fp, ThriftRecordIO.ThriftCodec(RunnerCkpt)) as reader:
+      # Only records after the last indexed record preceding the watermark need to be decoded.
+      offset = self._load_index(process_name, reader).lookup(watermark) if watermark > 0 else 0
+      try:
+        for record_offset, payload in reader.frames(offset, strict=False):
+          new_watermark = self._record_seq(reader.decode(payload))
+          if new_watermark > watermark:
+            log.debug('Over-seeked %s [watermark = %s, high watermark = %s], rewinding.',
+              process_name, new_watermark, watermark)
+            break
+          current_watermark = new_watermark
+          offset = record_offset + RecordIO.RECORD_HEADER_SIZE + len(payload)
+          records += 1
+          if current_watermark >= watermark:
+            break
+      except RecordIO.PrematureEndOfStream:
+        pass
+    fp.seek(offset)
 
-    if current_watermark < self._watermarks[process_name]:
+    if current_watermark < watermark:
       log.warning('Only able to fast forward to %s@sequence=%s, high watermark is %s',
-         process_name, current_watermark, self._watermarks[process_name])
+         process_name, current_watermark, watermark)
 
     if records:
       log.debug('Fast forwarded %s %s record(s) to seq=%s.', process_name, records,
@@ -96,6 +263,7 @@ class ProcessMuxer(object):
       raise self.ProcessNotFound("No trace of process: %s", process_name)
     else:
       self._watermarks.pop(process_name)
+      self.unwatch_exit(process_name)
       fp = self._processes.pop(process_name)
       if fp is not None:
         fp.close()
@@ -133,6 +301,8 @@ class ProcessMuxer(object):
       Returns a list of RunnerCkpt objects that were successfully read, or an empty
       list if none were read.
     """
+    # Watch before reading so that writes racing with this select() still wake up wait().
+    self._ensure_watch()
     self._bind_processes()
     updates = []
     for handle in filter(None, self._processes.values()):
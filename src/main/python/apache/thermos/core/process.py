@@ -21,6 +21,7 @@ commandline in a subprocess of its own.
 """
 
 import errno
+import fcntl
 import grp
 import os
 import pwd
@@ -28,6 +29,7 @@ import select
 import signal
 import subprocess
 import sys
+import threading
 import time
 from abc import abstractmethod
 from copy import deepcopy
@@ -38,6 +40,7 @@ from twitter.common.lang import Interface
 from twitter.common.quantity import Amount, Data, Time
 from twitter.common.recordio import ThriftRecordReader, ThriftRecordWriter
 
+from apache.thermos.common.compression import LogCodec, compress_file
 from apache.thermos.common.process_util import setup_child_subreaping, wrap_with_mesos_containerizer
 
 from gen.apache.aurora.api.constants import TASK_FILESYSTEM_MOUNT_POINT
@@ -93,13 +96,14 @@ class ProcessBase(object):
   class CheckpointError(Error): pass
   class UnspecifiedSandbox(Error): pass
   class PermissionError(Error): pass
+  class ForkError(Error): pass
 
-  CONTROL_WAIT_CHECK_INTERVAL = Amount(100, Time.MILLISECONDS)
   MAXIMUM_CONTROL_WAIT = Amount(1, Time.MINUTES)
+  HANDOFF = b'\x01'
 
   def __init__(self, name, cmdline, sequence, pathspec, sandbox_dir, user=None, platform=None,
                logger_destination=LoggerDestination.FILE, logger_mode=LoggerMode.STANDARD,
-               rotate_log_size=None, rotate_log_backups=None):
+               rotate_log_size=None, rotate_log_backups=None, rotate_log_compression=None):
     """
       required:
         name        = name of the process
@@ -117,6 +121,7 @@ class ProcessBase(object):
         logger_mode        = The type of logger to use for the process.
         rotate_log_size    = The maximum size of the rotated stdout/stderr logs.
         rotate_log_backups = The maximum number of rotated stdout/stderr log backups.
+        rotate_log_compression = The codec used to compress rotated stdout/stderr log backups.
     """
     self._name = name
     self._cmdline = cmdline
@@ -127,6 +132,9 @@ class ProcessBase(object):
       safe_mkdir(self._sandbox)
     self._pid = None
     self._fork_time = None
+    self._launch_time = None
+    self._handoff_reader = None
+    self._handoff_writer = None
     self._user = user
     self._ckpt = None
     self._ckpt_head = -1
@@ -137,6 +145,7 @@ class ProcessBase(object):
     self._logger_mode = logger_mode
     self._rotate_log_size = rotate_log_size
     self._rotate_log_backups = rotate_log_backups
+    self._rotate_log_compression = rotate_log_compression or LogCodec.NONE
 
     if not LoggerDestination.is_valid(self._logger_destination):
       raise ValueError("Logger destination %s is invalid." % self._logger_destination)
@@ -149,6 +158,8 @@ class ProcessBase(object):
         raise ValueError('Log size cannot be less than one byte.')
       if self._rotate_log_backups <= 0:
         raise ValueError('Log backups cannot be less than one.')
+      if not LogCodec.is_valid(self._rotate_log_compression):
+        raise ValueError('Log compression %s is invalid.' % self._rotate_log_compression)
 
   def _log(self, msg, exc_info=None):
     log.debug('[process:%5s=%s]: %s', self._pid, self.name(), msg,
@@ -183,7 +194,8 @@ class ProcessBase(object):
   def _write_initial_update(self):
     self._write_process_update(state=ProcessState.FORKED,
                                fork_time=self._fork_time,
-                               coordinator_pid=self._pid)
+                               coordinator_pid=self._pid,
+                               launch_time=self._launch_time)
 
   def cmdline(self):
     return self._cmdline
@@ -222,70 +234,124 @@ class ProcessBase(object):
     if self._ckpt is None:
       self._setup_ckpt()
 
+  def _wait_for_handoff(self):
+    """Wait for the parent to hand off the checkpoint stream: must be run in the child.  Returns
+       False if the parent gave up (or died) without handing it off, or the wait timed out."""
+    try:
+      readable, _, _ = select.select([self._handoff_reader], [], [],
+                                     self.MAXIMUM_CONTROL_WAIT.as_(Time.SECONDS))
+      return bool(readable) and os.read(self._handoff_reader, 1) == self.HANDOFF
+    finally:
+      os.close(self._handoff_reader)
+      self._handoff_reader = None
+
   def _wait_for_control(self):
     """Wait for control of the checkpoint stream: must be run in the child."""
-    total_wait_time = Amount(0, Time.SECONDS)
+    if not self._wait_for_handoff():
+      # The parent may still have checkpointed the fork before giving up.
+      self._log('Checkpoint stream was not handed off, checking for it anyway.')
 
     with open(self.ckpt_file(), 'rb') as fp:
       fp.seek(self._ckpt_head)
-      rr = ThriftRecordReader(fp, RunnerCkpt)
-      while total_wait_time < self.MAXIMUM_CONTROL_WAIT:
-        ckpt_tail = os.path.getsize(self.ckpt_file())
-        if ckpt_tail == self._ckpt_head:
-          self._platform.clock().sleep(self.CONTROL_WAIT_CHECK_INTERVAL.as_(Time.SECONDS))
-          total_wait_time += self.CONTROL_WAIT_CHECK_INTERVAL
-          continue
-        checkpoint = rr.try_read()
-        if checkpoint:
-          if not checkpoint.process_status:
-            raise self.CheckpointError('No process status in checkpoint!')
-          if (checkpoint.process_status.process != self.name() or
-              checkpoint.process_status.state != ProcessState.FORKED or
-              checkpoint.process_status.fork_time != self._fork_time or
-              checkpoint.process_status.coordinator_pid != self._pid):
-            self._log('Losing control of the checkpoint stream:')
-            self._log('   fork_time [%s] vs self._fork_time [%s]' % (
-                checkpoint.process_status.fork_time, self._fork_time))
-            self._log('   coordinator_pid [%s] vs self._pid [%s]' % (
-                checkpoint.process_status.coordinator_pid, self._pid))
-            raise self.CheckpointError('Lost control of the checkpoint stream!')
-          self._log('Taking control of the checkpoint stream at record: %s' %
-            checkpoint.process_status)
-          self._seq = checkpoint.process_status.seq + 1
-          return True
-    raise self.CheckpointError('Timed out waiting for checkpoint stream!')
+      checkpoint = ThriftRecordReader(fp, RunnerCkpt).try_read()
+      if not checkpoint:
+        raise self.CheckpointError('Checkpoint stream was not handed off!')
+      if not checkpoint.process_status:
+        raise self.CheckpointError('No process status in checkpoint!')
+      if (checkpoint.process_status.process != self.name() or
+          checkpoint.process_status.state != ProcessState.FORKED or
+          checkpoint.process_status.fork_time != self._fork_time or
+          checkpoint.process_status.coordinator_pid != self._pid):
+        self._log('Losing control of the checkpoint stream:')
+        self._log('   fork_time [%s] vs self._fork_time [%s]' % (
+            checkpoint.process_status.fork_time, self._fork_time))
+        self._log('   coordinator_pid [%s] vs self._pid [%s]' % (
+            checkpoint.process_status.coordinator_pid, self._pid))
+        raise self.CheckpointError('Lost control of the checkpoint stream!')
+      self._log('Taking control of the checkpoint stream at record: %s' %
+        checkpoint.process_status)
+      self._seq = checkpoint.process_status.seq + 1
+      return True
 
   def _prepare_fork(self):
     user, current_user = self._getpwuid()
     if self._user:
       if user != current_user and os.geteuid() != 0:
         raise self.PermissionError('Must be root to run processes as other users!')
-    self._fork_time = self._platform.clock().time()
     self._setup_ckpt()
     # Since the forked process is responsible for creating log files, it needs to own the log dir.
     safe_mkdir(self.process_logdir())
     os.chown(self.process_logdir(), user.pw_uid, user.pw_gid)
+    self._handoff_reader, self._handoff_writer = os.pipe()
+
+  def _release_fork(self):
+    """Release the resources held between preparing and forking."""
+    if self._ckpt is not None:
+      self._ckpt.close()
+      self._ckpt = None
+    for fd in (self._handoff_reader, self._handoff_writer):
+      if fd is not None:
+        os.close(fd)
+    self._handoff_reader = self._handoff_writer = None
 
   def _finalize_fork(self):
-    self._write_initial_update()
-    self._ckpt.close()
-    self._ckpt = None
+    try:
+      self._write_initial_update()
+      self._ckpt.close()
+      self._ckpt = None
+      # The checkpoint is flushed, so the coordinator may take control of it.
+      os.write(self._handoff_writer, self.HANDOFF)
+    finally:
+      self._release_fork()
+
+  def prepare(self, launch_time=None):
+    """
+      Prepare to fork the co-ordinator: take the lock on the process checkpoint and set up the log
+      directory.  Must be followed by fork(), or by abandon() should the launch be called off.
 
-  def start(self):
+      launch_time is recorded in the checkpoint as the time at which the launch of this process
+      began, and defaults to now.
     """
-      This is the main call point from the runner, and forks a co-ordinator process to run the
-      target process (i.e. self.cmdline())
+    self._launch_time = launch_time if launch_time is not None else self._platform.clock().time()
+    try:
+      self._prepare_fork()  # calls _setup_ckpt which can raise CheckpointError
+                            # calls _getpwuid which can raise:
+                            #    UnknownUserError
+                            #    PermissionError
+    except Exception:
+      self._release_fork()
+      raise
+
+  def abandon(self):
+    """Release a prepared process without forking it."""
+    self._release_fork()
+
+  def fork(self, pending=()):
+    """
+      Fork the co-ordinator of a prepared process.
 
-      The parent returns immediately and populates information about the pid of the co-ordinator.
-      The child (co-ordinator) will launch the target process in a subprocess.
+      pending are the other prepared processes of the same launch, yet to be forked.  The
+      co-ordinator releases their checkpoint locks and handoff pipes rather than holding them.
+
+      The parent returns once it has checkpointed the fork and handed off the checkpoint stream to
+      the co-ordinator.  The child (co-ordinator) will launch the target process in a subprocess.
     """
-    self._prepare_fork()  # calls _setup_ckpt which can raise CheckpointError
-                          # calls _getpwuid which can raise:
-                          #    UnknownUserError
-                          #    PermissionError
-    self._pid = self._platform.fork()
+    self._fork_time = self._platform.clock().time()
+    try:
+      self._pid = self._platform.fork()
+    except OSError as e:
+      self._release_fork()
+      raise self.ForkError('Failed to fork co-ordinator: %s' % e)
+    except Exception:
+      self._release_fork()
+      raise
     if self._pid == 0:
       self._pid = self._platform.getpid()
+      for process in pending:
+        if process is not self:
+          process._release_fork()
+      os.close(self._handoff_writer)
+      self._handoff_writer = None
       self._wait_for_control()  # can raise CheckpointError
       try:
         self.execute()
@@ -298,6 +364,17 @@ class ProcessBase(object):
     else:
       self._finalize_fork()  # can raise CheckpointError
 
+  def start(self):
+    """
+      This is the main call point from the runner, and forks a co-ordinator process to run the
+      target process (i.e. self.cmdline())
+
+      The parent returns immediately and populates information about the pid of the co-ordinator.
+      The child (co-ordinator) will launch the target process in a subprocess.
+    """
+    self.prepare()
+    self.fork()
+
   def execute(self):
     raise NotImplementedError
 
@@ -466,7 +543,8 @@ class Process(ProcessBase):
         destination=self._logger_destination,
         mode=self._logger_mode,
         rotate_log_size=self._rotate_log_size,
-        rotate_log_backups=self._rotate_log_backups)
+        rotate_log_backups=self._rotate_log_backups,
+        rotate_log_compression=self._rotate_log_compression)
     stdout, stderr, handlers_are_files = log_destination_resolver.get_handlers()
     if handlers_are_files:
       executor = SubprocessExecutor(stdout=stdout, stderr=stderr, **subprocess_args)
@@ -567,9 +645,21 @@ class PipedSubprocessExecutor(SubprocessExecutorBase):
   """
   Implementation of SubprocessExecutorBase that uses pipes to poll the pipes to output streams and
   copies them to the specified destinations.
+
+  Reads start at READ_BUFFER_SIZE and double (up to MAX_READ_BUFFER_SIZE) whenever a read fills
+  the buffer.  Writes to the destinations are buffered and flushed once FLUSH_BUFFER_SIZE bytes are
+  pending or the oldest pending write is FLUSH_INTERVAL old.  Destinations that support it (see
+  RotatingFileHandler.splice_from) are fed with splice(2) instead, which moves output from the
+  pipe to the log file without copying it through the coordinator.
   """
 
   READ_BUFFER_SIZE = 2 ** 16
+  MAX_READ_BUFFER_SIZE = 2 ** 20
+  PIPE_BUFFER_SIZE = 2 ** 20
+  FLUSH_BUFFER_SIZE = 2 ** 20
+  FLUSH_INTERVAL = Amount(100, Time.MILLISECONDS)
+  POLL_INTERVAL = Amount(1, Time.SECONDS)
+  USE_SPLICE = hasattr(os, 'splice')
 
   def __init__(self, args, close_fds, cwd, env, pathspec, stdout=None, stderr=None):
     """
@@ -587,6 +677,26 @@ class PipedSubprocessExecutor(SubprocessExecutorBase):
     self._popen = self._start_subprocess(subprocess.PIPE, subprocess.PIPE)
     return self._popen.pid
 
+  @classmethod
+  def _grow_pipe(cls, fd):
+    # Larger pipes let verbose processes run ahead of the coordinator, and batch more output
+    # per read.  Best effort: the size is capped by /proc/sys/fs/pipe-max-size.
+    if hasattr(fcntl, 'F_SETPIPE_SZ'):
+      try:
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, cls.PIPE_BUFFER_SIZE)
+      except (IOError, OSError):
+        pass
+
+  def _transfer(self, fd, handler, size, splice):
+    """Move up to size bytes from fd to handler.  Returns the number of bytes moved and whether
+       they were written to (and remain buffered by) the handler."""
+    if splice:
+      return handler.splice_from(fd, size), False
+    buf = os.read(fd, size)
+    if buf:
+      handler.write(buf)
+    return len(buf), True
+
   def wait(self):
     stdout = self._popen.stdout.fileno()
     stderr = self._popen.stderr.fileno()
@@ -594,21 +704,60 @@ class PipedSubprocessExecutor(SubprocessExecutorBase):
       stderr: self._stderr,
       stdout: self._stdout
     }
+    read_sizes = dict((fd, self.READ_BUFFER_SIZE) for fd in pipes)
+    splice = dict((fd, self.USE_SPLICE and hasattr(handler, 'splice_from'))
+                  for fd, handler in pipes.items())
+    for fd in pipes:
+      self._grow_pipe(fd)
+
+    buffered = set()  # handlers with unflushed writes
+    buffered_bytes, flush_deadline = 0, None
+    flush_interval = self.FLUSH_INTERVAL.as_(Time.SECONDS)
+    poll_interval = self.POLL_INTERVAL.as_(Time.SECONDS)
 
     rc = None
     # Read until there is a return code AND both of the pipes have reached EOF.
     while rc is None or pipes:
       rc = self._popen.poll()
 
-      read_results, _, _ = select.select(pipes.keys(), [], [], 1)
+      timeout = poll_interval
+      if flush_deadline is not None:
+        timeout = max(0, min(timeout, flush_deadline - time.time()))
+      read_results, _, _ = select.select(list(pipes), [], [], timeout)
       for fd in read_results:
         handler = pipes[fd]
-        buf = os.read(fd, self.READ_BUFFER_SIZE)
+        try:
+          count, is_buffered = self._transfer(fd, handler, read_sizes[fd], splice[fd])
+        except OSError as e:
+          if not splice[fd] or e.errno not in (errno.EINVAL, errno.ENOSYS):
+            raise
+          log.debug('Unable to splice output to %s, copying it instead: %s', handler, e)
+          splice[fd] = False
+          continue
 
-        if len(buf) == 0:
+        if count == 0:
           del pipes[fd]
-        else:
-          handler.write(buf)
+          continue
+        if count == read_sizes[fd]:
+          read_sizes[fd] = min(2 * count, self.MAX_READ_BUFFER_SIZE)
+        if is_buffered:
+          buffered.add(handler)
+          buffered_bytes += count
+          if flush_deadline is None:
+            flush_deadline = time.time() + flush_interval
+
+      if buffered and (buffered_bytes >= self.FLUSH_BUFFER_SIZE or not pipes or
+                       time.time() >= flush_deadline):
+        for handler in buffered:
+          handler.flush()
+        buffered.clear()
+        buffered_bytes, flush_deadline = 0, None
+
+    # Close the logs before the coordinator reports that the process has finished.  The last
+    # rotated backup may still be compressing, which must not hold up the checkpoint of the exit.
+    for handler in (self._stdout, self._stderr):
+      if handler is not None:
+        handler.close()
 
     return rc
 
@@ -622,19 +771,21 @@ class LogDestinationResolver(object):
   STDERR = 'stderr'
 
   def __init__(self, pathspec, destination=LoggerDestination.FILE, mode=LoggerMode.STANDARD,
-               rotate_log_size=None, rotate_log_backups=None):
+               rotate_log_size=None, rotate_log_backups=None, rotate_log_compression=None):
     """
     pathspec           = TaskPath object for synthesizing path names.
     destination        = Log destination.
     logger_mode        = The type of logger to use for the process.
     rotate_log_size    = The maximum size of the rotated stdout/stderr logs.
     rotate_log_backups = The maximum number of rotated stdout/stderr log backups.
+    rotate_log_compression = The codec used to compress rotated stdout/stderr log backups.
     """
     self._pathspec = pathspec
     self._destination = destination
     self._mode = mode
     self._rotate_log_size = rotate_log_size
     self._rotate_log_backups = rotate_log_backups
+    self._rotate_log_compression = rotate_log_compression
 
     if not LoggerDestination.is_valid(self._destination):
       raise ValueError("Logger destination %s is invalid." % self._destination)
@@ -684,7 +835,8 @@ class LogDestinationResolver(object):
       log_size = int(self._rotate_log_size.as_(Data.BYTES))
       return RotatingFileHandler(self._get_log_path(name),
                                  log_size,
-                                 self._rotate_log_backups)
+                                 self._rotate_log_backups,
+                                 compression=self._rotate_log_compression)
 
   def _get_stream(self, name):
     """
@@ -702,9 +854,15 @@ class LogDestinationResolver(object):
 class RotatingFileHandler(object):
   """
   File handler that implements max size/rotation.
+
+  Rotated files may be compressed, in which case each backup is compressed by a background thread
+  once it has been rotated out, and becomes <filename>.<index><codec suffix>.  Only one backup is
+  compressed at a time: a rollover waits for the previous backup to finish compressing.  Closing
+  the handler does not wait for it: the compressing thread is not a daemon, so an exiting
+  coordinator still finishes the backup.
   """
 
-  def __init__(self, filename, max_bytes, max_backups, mode='wb'):
+  def __init__(self, filename, max_bytes, max_backups, mode='wb', compression=None):
     """
       required:
         filename    = The file name.
@@ -712,16 +870,25 @@ class RotatingFileHandler(object):
         max_backups = The maximum number of log file backups to create.
 
       optional:
-        mode = Mode to open the file in.
+        mode        = Mode to open the file in.
+        compression = The LogCodec to compress backups with.  zstd falls back to gzip if it is
+                      unavailable.
     """
     if max_bytes > 0 and max_backups <= 0:
       raise ValueError('A positive value for max_backups must be specified if max_bytes > 0.')
+    compression = compression or LogCodec.NONE
+    if not LogCodec.is_valid(compression):
+      raise ValueError('Log compression %s is invalid.' % compression)
     self._max_bytes = max_bytes
     self._max_backups = max_backups
+    self._compression = LogCodec.resolve(compression)
+    self._compressor = None
     self.file = safe_open(filename, mode=mode)
     self.filename = filename
     self.mode = mode
     self.closed = False
+    # Bytes in the current file, accounted for on write rather than by querying the file.
+    self._size = os.fstat(self.file.fileno()).st_size
 
   def close(self):
     if not self.closed:
@@ -729,10 +896,37 @@ class RotatingFileHandler(object):
       self.closed = True
 
   def write(self, b):
-    self.file.write(b)
+    data = memoryview(b)
+    while data:
+      # Split writes at the rollover size, so that rotated files are exactly max_bytes long.
+      count = len(data)
+      if self._max_bytes > 0 and self._max_backups > 0:
+        count = min(count, max(self._max_bytes - self._size, 0))
+      self.file.write(data[:count])
+      self._size += count
+      data = data[count:]
+      if self.should_rollover():
+        self.rollover()
+
+  def flush(self):
+    if not self.closed:
+      self.file.flush()
+
+  def splice_from(self, fd, count):
+    """
+      Move up to count bytes from the pipe fd into the file with splice(2), never past the
+      rollover size.  Returns the number of bytes moved (0 at EOF.)
+    """
     self.file.flush()
     if self.should_rollover():
       self.rollover()
+    if self._max_bytes > 0 and self._max_backups > 0:
+      count = min(count, self._max_bytes - self._size)
+    moved = os.splice(fd, self.file.fileno(), count)
+    self._size += moved
+    if self.should_rollover():
+      self.rollover()
+    return moved
 
   def swap_files(self, src, tgt):
     if os.path.exists(tgt):
@@ -747,11 +941,35 @@ class RotatingFileHandler(object):
   def make_indexed_filename(self, index):
     return '%s.%d' % (self.filename, index)
 
+  def _shift_backup(self, index):
+    """Move backup index, whichever codec it was compressed with (if any), to index + 1."""
+    suffixes = set([''] + list(LogCodec.SUFFIXES.values()))
+    src = self.make_indexed_filename(index)
+    tgt = self.make_indexed_filename(index + 1)
+    for suffix in suffixes:
+      if os.path.exists(src + suffix):
+        # Never leave two forms of the same backup behind.
+        for other in suffixes - set([suffix]):
+          safe_delete(tgt + other)
+        self.swap_files(src + suffix, tgt + suffix)
+
+  def _compress(self, filename):
+    try:
+      compress_file(filename, self._compression)
+    except (IOError, OSError) as e:
+      log.error('Failed to compress %s: %s', filename, e)
+
+  def wait_for_compression(self):
+    """Wait for the most recently rotated backup to finish compressing."""
+    if self._compressor is not None:
+      self._compressor.join()
+      self._compressor = None
+
   def should_rollover(self):
     if self._max_bytes <= 0 or self._max_backups <= 0:
       return False
 
-    if self.file.tell() >= self._max_bytes:
+    if self._size >= self._max_bytes:
       return True
 
     return False
@@ -761,14 +979,20 @@ class RotatingFileHandler(object):
     Perform the rollover of the log.
     """
     self.file.close()
+    self.wait_for_compression()
     for i in range(self._max_backups - 1, 0, -1):
-      src = self.make_indexed_filename(i)
-      tgt = self.make_indexed_filename(i + 1)
-      if os.path.exists(src):
-        self.swap_files(src, tgt)
+      self._shift_backup(i)
 
-    self.swap_files(self.filename, self.make_indexed_filename(1))
+    backup = self.make_indexed_filename(1)
+    self.swap_files(self.filename, backup)
     self.file = safe_open(self.filename, mode='wb')
+    self._size = 0
+
+    if self._compression != LogCodec.NONE:
+      # Not a daemon, so that an exiting coordinator finishes compressing its last backup.
+      self._compressor = threading.Thread(target=self._compress, args=(backup,),
+                                          name='LogCompressor[%s]' % backup)
+      self._compressor.start()
 
 
 class StreamHandler(object):
@@ -786,6 +1010,8 @@ class StreamHandler(object):
 
   def write(self, b):
     self._stream.write(b)
+
+  def flush(self):
     self._stream.flush()
 
   def close(self):
@@ -811,6 +1037,10 @@ class TeeHandler(object):
     self._first.write(b)
     self._second.write(b)
 
+  def flush(self):
+    self._first.flush()
+    self._second.flush()
+
   def close(self):
     self._first.close()
     self._second.close()
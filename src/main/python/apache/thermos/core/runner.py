@@ -51,7 +51,8 @@ from pystachio import Empty, Environment
 from twitter.common import log
 from twitter.common.dirutil import safe_mkdir
 from twitter.common.quantity import Amount, Data, Time
-from twitter.common.recordio import ThriftRecordReader
+from twitter.common.recordio import MappedRecordReader
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
 
 from apache.thermos.common.ckpt import (
     CheckpointDispatcher,
@@ -110,15 +111,21 @@ class TaskRunnerProcessHandler(ProcessStateHandler):
     log.debug('Process on_forked %s', process_update)
     task_process = self._runner._task_processes[process_update.process]
     task_process.rebind(process_update.coordinator_pid, process_update.fork_time)
+    self._runner._watcher.watch_exit(process_update.process, process_update.coordinator_pid)
     self._runner._plan.set_running(process_update.process)
 
   def on_running(self, process_update):
     log.debug('Process on_running %s', process_update)
+    current_run = self._runner._current_process_run(process_update.process)
+    if not self._runner._recovery and current_run and current_run.launch_time:
+      log.info('Process(%s) running %.1fms after launch', process_update.process,
+        1000.0 * (process_update.start_time - current_run.launch_time))
     self._runner._plan.set_running(process_update.process)
 
   def _cleanup(self, process_update):
     if not self._runner._recovery:
-      TaskRunnerHelper.kill_process(self._runner.state, process_update.process)
+      TaskRunnerHelper.kill_process(self._runner.state, process_update.process,
+          self._runner.process_table)
 
   def on_success(self, process_update):
     log.debug('Process on_success %s', process_update)
@@ -139,6 +146,9 @@ class TaskRunnerProcessHandler(ProcessStateHandler):
     log.info('Process(%s) failed [rc=%s]', process_update.process, process_update.return_code)
     self._cleanup(process_update)
     self._on_abnormal(process_update)
+    # A process that failed to launch was never marked running by a FORKED update.
+    if process_update.process not in self._runner._plan.running:
+      self._runner._plan.set_running(process_update.process)
     self._runner._plan.add_failure(process_update.process)
     if process_update.process in self._runner._plan.failed:
       log.info('Process %s reached maximum failures, marking process run failed.',
@@ -282,13 +292,12 @@ class TaskRunnerStage_ACTIVE(TaskRunnerStage):  # noqa
     Run the regular plan (i.e. normal, non-finalizing processes.)
   """
   MAX_ITERATION_WAIT = Amount(15, Time.SECONDS)
-  MIN_ITERATION_WAIT = Amount(1, Time.SECONDS)
 
   def __init__(self, runner):
     super(TaskRunnerStage_ACTIVE, self).__init__(runner)
 
   def run(self):
-    launched = self.runner._run_plan(self.runner._regular_plan)
+    self.runner._run_plan(self.runner._regular_plan)
 
     # Have we terminated?
     terminal_state = None
@@ -302,12 +311,10 @@ class TaskRunnerStage_ACTIVE(TaskRunnerStage):  # noqa
     if terminal_state:
       # No more work to do
       return None
-    elif launched > 0:
-      # We want to run ASAP after updates have been collected
-      return max(self.MIN_ITERATION_WAIT.as_(Time.SECONDS), self.runner._regular_plan.min_wait())
-    else:
-      # We want to run as soon as something is available to run or after a prescribed timeout.
-      return min(self.MAX_ITERATION_WAIT.as_(Time.SECONDS), self.runner._regular_plan.min_wait())
+    # We want to run as soon as the plan needs attention (process updates and coordinator exits
+    # wake the runner up earlier) or after a prescribed timeout.
+    return min(self.MAX_ITERATION_WAIT.as_(Time.SECONDS),
+               self.runner._plan_wait(self.runner._regular_plan))
 
   def transition_to(self):
     return TaskState.CLEANING
@@ -350,7 +357,8 @@ class TaskRunnerStage_FINALIZING(TaskRunnerStage):  # noqa
       log.warning('Finalizing plan deadlocked.')
       return None
     if self.runner._finalization_remaining() > 0 and not self.runner._finalizing_plan.is_complete():
-      return min(self.runner._finalization_remaining(), self.MAX_ITERATION_WAIT.as_(Time.SECONDS))
+      return min(self.runner._finalization_remaining(), self.MAX_ITERATION_WAIT.as_(Time.SECONDS),
+                 self.runner._plan_wait(self.runner._finalizing_plan))
 
   def transition_to(self):
     if self.runner._finalization_remaining() <= 0:
@@ -376,13 +384,22 @@ class TaskRunner(object):
   # before doing housecleaning (checking for LOST tasks, dead PIDs.)
   MAX_ITERATION_TIME = Amount(10, Time.SECONDS)
 
-  # Minimum amount of time we wait between polls for updates on coordinator checkpoints.
+  # Maximum amount of time we wait between polls for updates on coordinator checkpoints.  Where
+  # inotify is available, the ProcessMuxer wakes us up as soon as a coordinator checkpoints.
   COORDINATOR_INTERVAL_SLEEP = Amount(1, Time.SECONDS)
 
   # Amount of time we're willing to wait after forking before we expect the runner to have
   # exec'ed the child process.
   LOST_TIMEOUT = Amount(60, Time.SECONDS)
 
+  # Minimum amount of time between touches of an otherwise idle checkpoint stream, which mark
+  # the runner as alive.
+  CHECKPOINT_TOUCH_INTERVAL = Amount(30, Time.SECONDS)
+
+  # Maximum number of processes prepared for launch at once.  Each holds its checkpoint lock and
+  # a handoff pipe open until its coordinator is forked.
+  MAX_LAUNCH_BATCH = 64
+
   # Active task stages
   STAGES = {
     TaskState.ACTIVE: TaskRunnerStage_ACTIVE,
@@ -420,8 +437,9 @@ class TaskRunner(object):
                task_id=None, portmap=None, user=None, chroot=False, clock=time,
                universal_handler=None, planner_class=TaskPlanner, hostname=None,
                process_logger_destination=None, process_logger_mode=None,
-               rotate_log_size_mb=None, rotate_log_backups=None,
-               preserve_env=False, mesos_containerizer_path=None, container_sandbox=None):
+               rotate_log_size_mb=None, rotate_log_backups=None, rotate_log_compression=None,
+               preserve_env=False, mesos_containerizer_path=None, container_sandbox=None,
+               checkpoint_compaction_size_mb=None):
     """
       required:
         task (config.Task) = the task to run
@@ -447,12 +465,17 @@ class TaskRunner(object):
         process_logger_mode (string) = The mode of logger to use for all processes.
         rotate_log_size_mb (integer) = The maximum size of the rotated stdout/stderr logs in MiB.
         rotate_log_backups (integer) = The maximum number of rotated stdout/stderr log backups.
+        rotate_log_compression (string) = The codec (gzip or zstd) used to compress rotated
+                            stdout/stderr log backups in the background.
         preserve_env (boolean) = whether or not env variables for the runner should be in the
                                  env for the task being run
         mesos_containerizer_path = the path to the mesos-containerizer executable that will be used
                                    to isolate the task's filesystem (if using a filesystem image).
         container_sandbox = the path within the isolated filesystem where the task's sandbox is
                             mounted.
+        checkpoint_compaction_size_mb (integer) = The size in MiB beyond which the checkpoint of a
+                            long-lived (ACTIVE) task is compacted into a snapshot of its state.
+                            Compaction is disabled if not specified.
     """
     if not issubclass(planner_class, TaskPlanner):
       raise TypeError('planner_class must be a TaskPlanner.')
@@ -479,6 +502,7 @@ class TaskRunner(object):
     self._process_logger_mode = process_logger_mode
     self._rotate_log_size_mb = rotate_log_size_mb
     self._rotate_log_backups = rotate_log_backups
+    self._rotate_log_compression = rotate_log_compression
     self._pathspec = TaskPath(root=checkpoint_root, task_id=self._task_id, log_dir=self._log_dir)
     self._hostname = hostname or socket.gethostname()
     try:
@@ -513,10 +537,16 @@ class TaskRunner(object):
     self._stages = dict((state, stage(self)) for state, stage in self.STAGES.items())
     self._finalization_start = None
     self._preemption_deadline = None
-    self._watcher = ProcessMuxer(self._pathspec)
+    self._watcher = ProcessMuxer(self._pathspec, clock=clock)
     self._state = RunnerState(processes={})
     self._preserve_env = preserve_env
     self._mesos_containerizer_path = mesos_containerizer_path
+    self._checkpoint_compaction_size = (
+        None if checkpoint_compaction_size_mb is None
+        else Amount(checkpoint_compaction_size_mb, Data.MB).as_(Data.BYTES))
+    self._compacted_ckpt_size = 0
+    self._process_table = None
+    self._ckpt_touched = None
 
     # create runner state
     universal_handler = universal_handler or TaskRunnerUniversalHandler
@@ -545,6 +575,21 @@ class TaskRunner(object):
   def processes(self):
     return self._task_processes
 
+  @property
+  def process_table(self):
+    """
+      The ProcessTable snapshot shared by the process scans of this iteration of the run loop
+      (or None if /proc is unavailable.)  It is taken on first use and discarded at the start of
+      each iteration, whenever process updates are collected and once the runner has forked or
+      signalled processes.
+    """
+    if self._process_table is None:
+      self._process_table = TaskRunnerHelper.process_table()
+    return self._process_table
+
+  def _invalidate_process_table(self):
+    self._process_table = None
+
   def task_state(self):
     return self._state.statuses[-1].state if self._state.statuses else TaskState.ACTIVE
 
@@ -595,6 +640,49 @@ class TaskRunner(object):
     """
     if not self._recovery:
       self._ckpt.write(record)
+      self._ckpt_touched = self._clock.time()
+
+  @contextmanager
+  def _deferred_checkpoint_sync(self):
+    """Write checkpoint records without syncing each one, and sync them all on exit."""
+    ckpt = self._ckpt
+    if ckpt is None or self._recovery:
+      yield
+      return
+    ckpt.set_sync(False)
+    try:
+      yield
+    finally:
+      ckpt.set_sync(True)
+      ckpt.flush()
+
+  def _maybe_compact_checkpoint(self):
+    """
+      Replace the checkpoint stream with a snapshot of the runner state once it has outgrown the
+      compaction threshold and doubled in size since it was last compacted.
+    """
+    if self._checkpoint_compaction_size is None or self._recovery:
+      return
+    ckpt_file = self._pathspec.getpath('runner_checkpoint')
+    try:
+      ckpt_size = os.path.getsize(ckpt_file)
+    except OSError:
+      return
+    if ckpt_size < max(self._checkpoint_compaction_size, 2 * self._compacted_ckpt_size):
+      return
+    snapshot = self._dispatcher.compact(self._state)
+    if snapshot is None:
+      return
+    ckpt = TaskRunnerHelper.compact_checkpoint(ckpt_file, snapshot)
+    if ckpt is None:
+      # Back off until the checkpoint has doubled in size again.
+      self._compacted_ckpt_size = ckpt_size
+      return
+    self._ckpt.close()
+    self._ckpt = ckpt
+    self._compacted_ckpt_size = os.path.getsize(ckpt_file)
+    log.info('Compacted runner checkpoint from %d to %d bytes.', ckpt_size,
+        self._compacted_ckpt_size)
 
   def _replay(self, checkpoints):
     """
@@ -609,8 +697,7 @@ class TaskRunner(object):
     """
     ckpt_file = self._pathspec.getpath('runner_checkpoint')
     if os.path.exists(ckpt_file):
-      with open(ckpt_file, 'rb') as fp:
-        ckpt_recover = ThriftRecordReader(fp, RunnerCkpt)
+      with MappedRecordReader(ckpt_file, ThriftRecordIO.ThriftCodec(RunnerCkpt)) as ckpt_recover:
         for record in ckpt_recover:
           log.debug('Replaying runner checkpoint record: %s', record)
           self._dispatcher.dispatch(self._state, record, recovery=True)
@@ -711,7 +798,8 @@ class TaskRunner(object):
     (logger_destination,
      logger_mode,
      rotate_log_size,
-     rotate_log_backups) = self._build_process_logger_args(process)
+     rotate_log_backups,
+     rotate_log_compression) = self._build_process_logger_args(process)
 
     return Process(
       process.name().get(),
@@ -726,6 +814,7 @@ class TaskRunner(object):
       logger_mode=logger_mode,
       rotate_log_size=rotate_log_size,
       rotate_log_backups=rotate_log_backups,
+      rotate_log_compression=rotate_log_compression,
       preserve_env=self._preserve_env,
       mesos_containerizer_path=self._mesos_containerizer_path,
       container_sandbox=self._container_sandbox)
@@ -742,10 +831,11 @@ class TaskRunner(object):
       "standard" mode.
     """
 
-    destination, mode, size, backups = (self._DEFAULT_LOGGER.destination().get(),
-                                        self._DEFAULT_LOGGER.mode().get(),
-                                        None,
-                                        None)
+    destination, mode, size, backups, compression = (self._DEFAULT_LOGGER.destination().get(),
+                                                     self._DEFAULT_LOGGER.mode().get(),
+                                                     None,
+                                                     None,
+                                                     None)
 
     logger = process.logger()
     if logger is Empty:
@@ -760,18 +850,22 @@ class TaskRunner(object):
     if mode == LoggerMode.ROTATE:
       size = Amount(self._DEFAULT_ROTATION.log_size().get(), Data.BYTES)
       backups = self._DEFAULT_ROTATION.backups().get()
+      compression = self._DEFAULT_ROTATION.compression().get()
       if logger is Empty:
         if self._rotate_log_size_mb:
           size = Amount(self._rotate_log_size_mb, Data.MB)
         if self._rotate_log_backups:
           backups = self._rotate_log_backups
+        if self._rotate_log_compression:
+          compression = self._rotate_log_compression
       else:
         rotate = logger.rotate()
         if rotate is not Empty:
           size = Amount(rotate.log_size().get(), Data.BYTES)
           backups = rotate.backups().get()
+          compression = rotate.compression().get()
 
-    return destination, mode, size, backups
+    return destination, mode, size, backups, compression
 
   def deadlocked(self, plan=None):
     """Check whether a plan is deadlocked, i.e. there are no running/runnable processes, and the
@@ -809,12 +903,13 @@ class TaskRunner(object):
 
     def forked_but_never_came_up():
       return current_run.state == ProcessState.FORKED and (
-        self._clock.time() - current_run.fork_time > self.LOST_TIMEOUT.as_(Time.SECONDS))
+        self._clock.time() - current_run.fork_time >= self.LOST_TIMEOUT.as_(Time.SECONDS))
 
     def running_but_coordinator_died():
       if current_run.state != ProcessState.RUNNING:
         return False
-      coordinator_pid, _, _ = TaskRunnerHelper.scan_process(self.state, process_name)
+      coordinator_pid, _, _ = TaskRunnerHelper.scan_process(
+          self.state, process_name, self.process_table)
       if coordinator_pid is not None:
         return False
       elif self._watcher.has_data(process_name):
@@ -854,37 +949,99 @@ class TaskRunner(object):
       num_to_pick = max(self._task.max_concurrency().get() - len(running), 0)
       return process_list[:num_to_pick]
 
-    for process_name in pick_processes(runnable):
-      tp = self._task_processes.get(process_name)
-      if tp:
-        current_run = self._current_process_run(process_name)
-        assert current_run.state == ProcessState.WAITING
-      else:
-        self._set_process_status(process_name, ProcessState.WAITING)
-        tp = self._task_processes[process_name]
-      log.info('Forking Process(%s)', process_name)
-      try:
-        tp.start()
-        launched.append(tp)
-      except Process.Error as e:
-        log.error('Failed to launch process: %s', e)
-        self._set_process_status(process_name, ProcessState.FAILED)
+    launch_time = self._clock.time()
+    picked = pick_processes(runnable)
+    for offset in range(0, len(picked), self.MAX_LAUNCH_BATCH):
+      launched.extend(self._launch(picked[offset:offset + self.MAX_LAUNCH_BATCH], launch_time))
 
     return len(launched) > 0
 
+  def _launch(self, process_names, launch_time):
+    """
+      Launch a batch of processes.  All of them are prepared (checkpointed as WAITING, their
+      checkpoints locked and log directories created) before their coordinators are forked back to
+      back, each taking control of its checkpoint as soon as the fork is recorded.  Returns the
+      launched processes.
+    """
+    prepared = []
+    # The WAITING records must be on disk before the coordinators checkpoint their forks.
+    with self._deferred_checkpoint_sync():
+      for process_name in process_names:
+        tp = self._task_processes.get(process_name)
+        if tp:
+          current_run = self._current_process_run(process_name)
+          assert current_run.state == ProcessState.WAITING
+        else:
+          self._set_process_status(process_name, ProcessState.WAITING)
+          tp = self._task_processes[process_name]
+        try:
+          tp.prepare(launch_time)
+          prepared.append(tp)
+        except Process.Error as e:
+          log.error('Failed to launch process: %s', e)
+          self._set_process_status(process_name, ProcessState.FAILED)
+
+    launched = []
+    try:
+      while prepared:
+        tp = prepared.pop(0)
+        log.info('Forking Process(%s)', tp.name())
+        try:
+          tp.fork(pending=prepared)
+          launched.append(tp)
+        except Process.Error as e:
+          log.error('Failed to launch process: %s', e)
+          self._set_process_status(tp.name(), ProcessState.FAILED)
+    finally:
+      for tp in prepared:
+        tp.abandon()
+      if launched:
+        self._invalidate_process_table()
+    return launched
+
   def _terminate_plan(self, plan):
-    TaskRunnerHelper.terminate_orphans(self.state)
+    TaskRunnerHelper.terminate_orphans(self.state, self.process_table)
 
     for process in plan.running:
       last_run = self._current_process_run(process)
       if last_run and last_run.state in (ProcessState.FORKED, ProcessState.RUNNING):
-        TaskRunnerHelper.terminate_process(self.state, process)
+        TaskRunnerHelper.terminate_process(self.state, process, self.process_table)
+    self._invalidate_process_table()
+
+  def _plan_wait(self, plan):
+    """
+      Return the number of seconds until the plan needs attention in the absence of process
+      updates, i.e. until a waiting process becomes runnable or a forked process would be LOST.
+      Runnable processes held back by max_concurrency are only launched once running processes
+      finish, which wakes up the runner anyway.
+    """
+    now = self._clock.time()
+    waits = []
+    max_concurrency = self._task.max_concurrency().get()
+    if max_concurrency == 0 or len(plan.running) < max_concurrency:
+      waits.append(plan.min_wait(now))
+    for process_name in plan.running:
+      current_run = self._current_process_run(process_name)
+      if current_run and current_run.state == ProcessState.FORKED:
+        waits.append(current_run.fork_time + self.LOST_TIMEOUT.as_(Time.SECONDS) - now)
+    return max(0, min(waits)) if waits else plan.INFINITY
+
+  def _touch_checkpoint(self):
+    """Mark the runner as alive (preventing garbage collection) if it has not checkpointed in a
+       while."""
+    now = self._clock.time()
+    if (self._ckpt_touched is not None and
+        now - self._ckpt_touched < self.CHECKPOINT_TOUCH_INTERVAL.as_(Time.SECONDS)):
+      return
+    log.debug('Run loop: No recent checkpoints, touching checkpoint.')
+    os.utime(self._pathspec.getpath('runner_checkpoint'), None)
+    self._ckpt_touched = now
 
   def has_running_processes(self):
     """
       Returns True if any processes associated with this task have active pids.
     """
-    process_tree = TaskRunnerHelper.scan_tree(self.state)
+    process_tree = TaskRunnerHelper.scan_tree(self.state, self.process_table)
     return any(any(process_set) for process_set in process_tree.values())
 
   def has_active_processes(self):
@@ -897,7 +1054,8 @@ class TaskRunner(object):
   def collect_updates(self, timeout=None):
     """
       Collects and applies updates from process checkpoint streams.  Returns the number
-      of applied process checkpoints.
+      of applied process checkpoints, or 0 if the timeout expires or a coordinator exits
+      without further updates.
     """
     if not self.has_active_processes():
       return 0
@@ -907,14 +1065,26 @@ class TaskRunner(object):
 
     while True:
       process_updates = self._watcher.select()
-      for process_update in process_updates:
-        self._dispatcher.dispatch(self._state, process_update, self._recovery)
+      if process_updates:
+        # Processes may have exited or forked since the process table was taken.
+        self._invalidate_process_table()
+      # The updates are already on disk in the process checkpoints, so sync them once.
+      with self._deferred_checkpoint_sync():
+        for process_update in process_updates:
+          self._dispatcher.dispatch(self._state, process_update, self._recovery)
       if process_updates:
         return len(process_updates)
+      if self._watcher.exited():
+        # The coordinator may have died without checkpointing; let the plan check for LOST
+        # processes.
+        self._invalidate_process_table()
+        return 0
       if timeout is not None and total_time >= timeout:
         return 0
-      total_time += sleep_interval
-      self._clock.sleep(sleep_interval)
+      wait_interval = sleep_interval
+      if timeout is not None:
+        wait_interval = min(sleep_interval, timeout - total_time)
+      total_time += self._watcher.wait(wait_interval)
 
   def is_terminal(self):
     return TaskRunnerHelper.is_task_terminal(self.task_state())
@@ -939,7 +1109,7 @@ class TaskRunner(object):
 
   def _run(self):
     while not self.is_terminal():
-      start = self._clock.time()
+      self._invalidate_process_table()
       # step 1: execute stage corresponding to the state we're currently in
       runner = self._stages[self.task_state()]
       iteration_wait = runner.run()
@@ -949,19 +1119,22 @@ class TaskRunner(object):
         self._set_task_status(runner.transition_to())
         continue
       log.debug('Run loop: Work to be done within %.1fs', iteration_wait)
-      # step 2: check child process checkpoint streams for updates
-      if not self.collect_updates(iteration_wait):
-        # If we don't collect any updates, at least 'touch' the checkpoint stream
-        # so as to prevent garbage collection.
-        elapsed = self._clock.time() - start
-        if elapsed < iteration_wait:
-          log.debug('Update collection only took %.1fs, idling %.1fs',
-              elapsed, iteration_wait - elapsed)
-          self._clock.sleep(iteration_wait - elapsed)
-        log.debug('Run loop: No updates collected, touching checkpoint.')
-        os.utime(self._pathspec.getpath('runner_checkpoint'), None)
+      # step 2: wait for updates to the child process checkpoint streams (or coordinator exits)
+      # until the next deadline.
+      if self.has_active_processes():
+        self.collect_updates(iteration_wait)
+      else:
+        log.debug('Run loop: No active processes, idling %.1fs', iteration_wait)
+        self._clock.sleep(iteration_wait)
+      # If we haven't checkpointed in a while, at least 'touch' the checkpoint stream so as to
+      # prevent garbage collection.
+      self._touch_checkpoint()
       # step 3: reap any zombie child processes
       TaskRunnerHelper.reap_children()
+      # step 4: compact the checkpoint stream of long-lived tasks
+      self._maybe_compact_checkpoint()
+    # The task will not be resumed, so its checkpoints need no replay indexes.
+    self._watcher.remove_indexes()
 
   def kill(self, force=False, terminal_status=TaskState.KILLED,
            preemption_wait=Amount(1, Time.MINUTES)):
@@ -989,7 +1162,7 @@ class TaskRunner(object):
     self.kill(force, preemption_wait=Amount(0, Time.SECONDS), terminal_status=TaskState.LOST)
 
   def _kill(self):
-    processes = TaskRunnerHelper.scan_tree(self._state)
+    processes = TaskRunnerHelper.scan_tree(self._state, self.process_table)
     for process, pid_tuple in processes.items():
       current_run = self._current_process_run(process)
       coordinator_pid, pid, tree = pid_tuple
@@ -999,7 +1172,7 @@ class TaskRunner(object):
           log.warning('  coordinator_pid: %s', coordinator_pid)
           log.warning('              pid: %s', pid)
           log.warning('             tree: %s', tree)
-        TaskRunnerHelper.kill_process(self.state, process)
+        TaskRunnerHelper.kill_process(self.state, process, self.process_table)
       else:
         if coordinator_pid or pid or tree:
           log.info('Transitioning %s to KILLED', process)
@@ -1009,3 +1182,4 @@ class TaskRunner(object):
           log.info('Transitioning %s to LOST', process)
           if current_run.state != ProcessState.WAITING:
             self._set_process_status(process, ProcessState.LOST)
+    self._invalidate_process_table()
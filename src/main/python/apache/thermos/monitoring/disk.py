@@ -29,6 +29,8 @@ from twitter.common.exceptions import ExceptionalThread
 from twitter.common.lang import AbstractClass, Lockable
 from twitter.common.quantity import Amount, Time
 
+from apache.thermos.common.disk_usage import DiskUsageTree
+
 
 class AbstractDiskCollector(Lockable, AbstractClass):
   def __init__(self, root, settings=None):
@@ -57,6 +59,9 @@ class AbstractDiskCollector(Lockable, AbstractClass):
     else:
       return threading.Event()
 
+  def close(self):
+    """ Release any resources held between collections """
+
 
 class DuDiskCollectorThread(ExceptionalThread):
   """ Thread to calculate aggregate disk usage under a given path using a simple algorithm """
@@ -90,6 +95,46 @@ class DuDiskCollector(AbstractDiskCollector):
       self._thread.start()
 
 
+class IncrementalDiskCollectorThread(ExceptionalThread):
+  """ Thread to bring a DiskUsageTree up to date """
+
+  def __init__(self, tree):
+    self.value = None
+    self.event = threading.Event()
+    self._tree = tree
+    super(IncrementalDiskCollectorThread, self).__init__()
+    self.daemon = True
+
+  def run(self):
+    start = time.time()
+    self.value = self._tree.refresh()
+    log.debug("IncrementalDiskCollectorThread: finished collection of %s in %.1fms",
+              self._tree.root, 1000.0 * (time.time() - start))
+    self.event.set()
+
+  def finished(self):
+    return self.event.is_set()
+
+
+class IncrementalDiskCollector(AbstractDiskCollector):
+  """ Spawn a background thread to sample disk usage, only re-examining the directories which
+  have changed since the previous sample """
+
+  def __init__(self, root, settings=None):
+    super(IncrementalDiskCollector, self).__init__(root, settings=settings)
+    self._tree = DiskUsageTree(root)
+
+  @Lockable.sync
+  def sample(self):
+    """ Trigger collection of sample, if not already begun """
+    if self._thread is None:
+      self._thread = IncrementalDiskCollectorThread(self._tree)
+      self._thread.start()
+
+  def close(self):
+    self._tree.close()
+
+
 class MesosDiskCollectorClient(ExceptionalThread):
   """ Thread to lookup disk usage under a given path from Mesos agent """
 
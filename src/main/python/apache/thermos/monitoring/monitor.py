@@ -28,7 +28,8 @@ import os
 import threading
 
 from twitter.common import log
-from twitter.common.recordio import ThriftRecordReader
+from twitter.common.recordio import MappedRecordReader, RecordIO
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
 
 from apache.thermos.common.ckpt import CheckpointDispatcher
 from apache.thermos.common.path import TaskPath
@@ -55,36 +56,55 @@ class TaskMonitor(object):
     self._active_file, self._finished_file = (pathspec.given(state=state).getpath('task_path')
         for state in ('active', 'finished'))
     self._ckpt_head = 0
+    self._ckpt_ino = None
+    self._version = 0
+    self._snapshot = None
     self._apply_states()
     self._lock = threading.Lock()
 
+  def _apply_records(self, fp):
+    """Dispatch the complete records after the current head of the checkpoint fp."""
+    new_ckpt_head = self._ckpt_head
+    with MappedRecordReader(fp, ThriftRecordIO.ThriftCodec(RunnerCkpt)) as rr:
+      try:
+        for offset, payload in rr.frames(self._ckpt_head, strict=False):
+          new_ckpt_head = offset + RecordIO.RECORD_HEADER_SIZE + len(payload)
+          try:
+            self._dispatcher.dispatch(self._runnerstate, rr.decode(payload))
+          except CheckpointDispatcher.InvalidSequenceNumber as e:
+            log.error('Checkpoint stream is corrupt: %s', e)
+            break
+      except RecordIO.PrematureEndOfStream:
+        # A record which could not be decoded; retry from it on the next refresh.
+        new_ckpt_head = offset
+    updated = self._ckpt_head != new_ckpt_head
+    self._ckpt_head = new_ckpt_head
+    return updated
+
   def _apply_states(self):
     """
       os.stat() the corresponding checkpoint stream of this task and determine if there are new ckpt
       records.  Attempt to read those records and update the high watermark for that stream.
       Returns True if new states were applied, False otherwise.
     """
-    ckpt_offset = None
     try:
-      ckpt_offset = os.stat(self._runner_ckpt).st_size
-
-      updated = False
-      if self._ckpt_head < ckpt_offset:
-        with open(self._runner_ckpt, 'rb') as fp:
-          fp.seek(self._ckpt_head)
-          rr = ThriftRecordReader(fp, RunnerCkpt)
-          while True:
-            runner_update = rr.try_read()
-            if not runner_update:
-              break
-            try:
-              self._dispatcher.dispatch(self._runnerstate, runner_update)
-            except CheckpointDispatcher.InvalidSequenceNumber as e:
-              log.error('Checkpoint stream is corrupt: %s', e)
-              break
-          new_ckpt_head = fp.tell()
-          updated = self._ckpt_head != new_ckpt_head
-          self._ckpt_head = new_ckpt_head
+      with open(self._runner_ckpt, 'rb') as fp:
+        ckpt_stat = os.fstat(fp.fileno())
+        updated = False
+        if ckpt_stat.st_ino != self._ckpt_ino or ckpt_stat.st_size < self._ckpt_head:
+          if self._ckpt_ino is not None:
+            # The runner compacted (i.e. atomically replaced) its checkpoint; replay it afresh.
+            log.debug('Checkpoint %s was replaced, replaying.', self._runner_ckpt)
+            self._runnerstate = RunnerState(processes={})
+            self._ckpt_head = 0
+            updated = True
+          self._ckpt_ino = ckpt_stat.st_ino
+        if self._ckpt_head < ckpt_stat.st_size:
+          updated = self._apply_records(fp) or updated
+      if updated:
+        # Readers hold on to the previous snapshot; the next get_state() builds a fresh one.
+        self._version += 1
+        self._snapshot = None
       return updated
     except OSError as e:
       if e.errno == errno.ENOENT:
@@ -108,11 +128,27 @@ class TaskMonitor(object):
     if state.header:
       return state.header.sandbox
 
+  @property
+  def version(self):
+    """A counter that is incremented every time new checkpoint records are applied."""
+    return self._version
+
+  @property
+  def ckpt_head(self):
+    """The offset into the runner checkpoint up to which records have been applied."""
+    return self._ckpt_head
+
   def get_state(self):
-    """Get the latest state of this Task."""
+    """Get the latest state of this Task.
+
+    The returned RunnerState is a snapshot shared by all callers until new checkpoint records are
+    applied, so it must be treated as read-only.
+    """
     with self._lock:
       self._apply_states()
-      return copy.deepcopy(self._runnerstate)
+      if self._snapshot is None:
+        self._snapshot = copy.deepcopy(self._runnerstate)
+      return self._snapshot
 
   def task_state(self):
     state = self.get_state()
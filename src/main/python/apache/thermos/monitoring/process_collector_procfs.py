@@ -0,0 +1,89 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+""" Sample resource consumption statistics for process trees from a shared ProcessTable """
+
+from operator import attrgetter
+
+from twitter.common import log
+
+from .process import ProcessSample
+
+
+def entry_to_sample(entry):
+  """ Given a procfs ProcessEntry, return a ProcessSample """
+  return ProcessSample(
+      rate=0.0,
+      user=entry.user,
+      system=entry.system,
+      rss=entry.rss,
+      vms=entry.vms,
+      nice=entry.nice,
+      status=entry.status,
+      threads=entry.threads)
+
+
+class ProcessTableTreeCollector(object):
+  """ Collect resource consumption statistics for a process and its children from snapshots of
+      the host process table.  This mirrors ProcessTreeCollector, but never touches /proc itself:
+      callers pass in the ProcessTable to sample from.
+  """
+
+  def __init__(self, pid):
+    self._pid = pid
+    self._create_time = None
+    self._sampled_tree = {}  # pid => ProcessSample
+    self._sample = ProcessSample.empty()
+    self._stamp = None
+    self._rate = 0.0
+
+  def sample(self, table):
+    """ Collate and aggregate ProcessSamples for process and children found in table
+        Returns None: result is stored in self.value
+    """
+    entry = table.get(self._pid)
+    if entry is not None and self._create_time is None:
+      self._create_time = entry.create_time
+    if entry is None or entry.create_time != self._create_time:
+      log.debug('Error during process sampling: pid=%s no longer exists', self._pid)
+      self._sample = ProcessSample.empty()
+      self._rate = 0.0
+      return
+
+    new_samples = dict((pid, entry_to_sample(table[pid])) for pid in table.descendants(self._pid))
+    new_samples[self._pid] = entry_to_sample(entry)
+
+    last_stamp = self._stamp
+    self._stamp = table.timestamp
+    self._sample = sum(new_samples.values(), ProcessSample.empty())
+    # As with ProcessTreeCollector, processes that were not present in the previous sample are
+    # compared against an empty sample when calculating the cpu rate.
+    if self._sampled_tree and last_stamp and self._stamp > last_stamp:
+      new = new_samples.values()
+      old = [self._sampled_tree.get(pid, ProcessSample.empty()) for pid in new_samples.keys()]
+      new_user_sys = sum(map(attrgetter('user'), new)) + sum(map(attrgetter('system'), new))
+      old_user_sys = sum(map(attrgetter('user'), old)) + sum(map(attrgetter('system'), old))
+      self._rate = (new_user_sys - old_user_sys) / (self._stamp - last_stamp)
+      log.debug("Calculated rate for pid=%s and children: %s", self._pid, self._rate)
+    self._sampled_tree = new_samples
+
+  @property
+  def value(self):
+    """ Aggregated ProcessSample representing resource consumption of the tree """
+    return self._sample._replace(rate=self._rate)
+
+  @property
+  def procs(self):
+    """ Number of active processes in the tree """
+    return len(self._sampled_tree)
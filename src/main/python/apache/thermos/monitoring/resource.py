@@ -25,24 +25,35 @@ canonical/reference implementation of a ResourceMonitor is the TaskResourceMonit
 actively monitors resources for a particular task by periodically polling process information and
 disk consumption and retaining a limited (FIFO) in-memory history of this data.
 
+When many tasks are monitored on the same host (e.g. by the observer), SharedTaskResourceMonitors
+driven by a single SharedResourceSampler thread avoid running one collection thread per task.
+
 """
 
 import threading
 import time
 from abc import abstractmethod
+from array import array
 from bisect import bisect_left
 from collections import namedtuple
 from operator import attrgetter
 
 from twitter.common import log
-from twitter.common.collections import RingBuffer
 from twitter.common.concurrent import EventMuxer
 from twitter.common.exceptions import ExceptionalThread
 from twitter.common.lang import Interface
 from twitter.common.quantity import Amount, Time
 
-from .disk import DiskCollectorSettings, DuDiskCollector, MesosDiskCollector
+from apache.thermos.common.procfs import ProcessTable
+
+from .disk import (
+    DiskCollectorSettings,
+    DuDiskCollector,
+    IncrementalDiskCollector,
+    MesosDiskCollector
+)
 from .process import ProcessSample
+from .process_collector_procfs import ProcessTableTreeCollector
 
 try:
   from .process_collector_psutil import ProcessTreeCollector
@@ -91,6 +102,12 @@ class ResourceMonitorBase(Interface):
         num_procs: total number of pids initiated by the process
     """
 
+  class CollectionCost(namedtuple('CollectionCost', 'collections seconds')):
+    """ Class representing the cumulative cost of resource collection:
+        collections: number of samples collected
+        seconds: total time spent collecting them
+    """
+
   @abstractmethod
   def sample(self):
     """ Return a sample of the resource consumption of the task right now
@@ -112,31 +129,297 @@ class ResourceMonitorBase(Interface):
     Returns a ProcessSample
     """
 
+  @property
+  def collection_cost(self):
+    """ Return the CollectionCost of the samples collected so far """
+    return self.CollectionCost(0, 0.0)
+
+
+class ResourceColumns(object):
+  """ A fixed-capacity ring of resource samples stored as parallel arrays of fixed-width numbers.
+
+      Each row holds a timestamp, the sandbox disk usage and, for every process of the task, the
+      fields of its ProcResourceResult.  Per-process columns are allocated when a process name is
+      first seen and released once no row in the ring references it any more.  Rows are only
+      materialized back into FullResourceResult namedtuples when they are read.
+
+      Rows are appended by the collection thread and read by others (e.g. HTTP observer threads),
+      so appends and reads are serialized by a lock.  Lookups which must see a consistent ring
+      (bisecting the timestamps, then reading the rows found) are done in a single call.
+  """
+
+  PROCESS_COLUMNS = (
+    ('rate', 'd'),
+    ('user', 'd'),
+    ('system', 'd'),
+    ('rss', 'q'),
+    ('vms', 'q'),
+    ('nice', 'h'),
+    ('status', 'h'),
+    ('threads', 'i'),
+    ('num_procs', 'i'),
+  )
+  ABSENT = -1  # num_procs of a process that is not part of a row
+  NO_NICE = -32768
+
+  class Timestamps(object):
+    """ Sequence view of the timestamp column in logical (oldest first) order, for bisect.  Only
+        for use with the ResourceColumns lock held. """
+
+    def __init__(self, columns):
+      self._columns = columns
+
+    def __len__(self):
+      return len(self._columns)
+
+    def __getitem__(self, index):
+      return self._columns._timestamps[self._columns._physical(index)]
+
+  def __init__(self, maxlen):
+    if not maxlen >= 1:
+      raise ValueError("maxlen must be greater than 0")
+    self._maxlen = maxlen
+    self._start = 0
+    self._len = 0
+    self._timestamps = array('d', [0.0]) * maxlen
+    self._disk = array('q', [0]) * maxlen
+    self._processes = {}  # process_name => {column name => array}
+    self._present = {}  # process_name => number of rows the process is present in
+    self._statuses = [None]
+    self._status_codes = {None: 0}
+    self._timestamp_view = self.Timestamps(self)
+    self._lock = threading.Lock()
+
+  def __len__(self):
+    return self._len
+
+  @property
+  def oldest(self):
+    """The timestamp of the oldest row, or None if there are no rows."""
+    with self._lock:
+      return self._timestamps[self._start] if self._len else None
+
+  @property
+  def newest(self):
+    """The timestamp of the newest row, or None if there are no rows."""
+    with self._lock:
+      return self._timestamps[self._physical(-1)] if self._len else None
+
+  def _physical(self, index):
+    if index < 0:
+      index += self._len
+    if not 0 <= index < self._len:
+      raise IndexError('ResourceColumns index out of range')
+    return (self._start + index) % self._maxlen
+
+  def _process_columns(self, process_name):
+    columns = self._processes.get(process_name)
+    if columns is None:
+      columns = dict((name, array(code, [0]) * self._maxlen) for name, code in self.PROCESS_COLUMNS)
+      columns['num_procs'] = array('i', [self.ABSENT]) * self._maxlen
+      self._processes[process_name] = columns
+      self._present[process_name] = 0
+    return columns
+
+  def _status_code(self, status):
+    code = self._status_codes.get(status)
+    if code is None:
+      code = self._status_codes[status] = len(self._statuses)
+      self._statuses.append(status)
+    return code
+
+  def append(self, timestamp, value):
+    """Append a FullResourceResult, evicting the oldest row if the ring is full."""
+    with self._lock:
+      self._append(timestamp, value)
+
+  def _append(self, timestamp, value):
+    if self._len < self._maxlen:
+      index = (self._start + self._len) % self._maxlen
+      self._len += 1
+    else:
+      index = self._start
+      self._start = (self._start + 1) % self._maxlen
+
+    self._timestamps[index] = timestamp
+    self._disk[index] = int(value.disk_usage or 0)
+
+    for process_name, columns in list(self._processes.items()):
+      if columns['num_procs'][index] != self.ABSENT:
+        self._present[process_name] -= 1
+        columns['num_procs'][index] = self.ABSENT
+
+    for process_name, result in value.proc_usage.items():
+      columns = self._process_columns(process_name)
+      sample = result.process_sample
+      columns['rate'][index] = sample.rate
+      columns['user'][index] = sample.user
+      columns['system'][index] = sample.system
+      columns['rss'][index] = int(sample.rss)
+      columns['vms'][index] = int(sample.vms)
+      columns['nice'][index] = self.NO_NICE if sample.nice is None else sample.nice
+      columns['status'][index] = self._status_code(sample.status)
+      columns['threads'][index] = sample.threads
+      columns['num_procs'][index] = result.num_procs
+      self._present[process_name] += 1
+
+    for process_name in [name for name, count in self._present.items() if count == 0]:
+      self._processes.pop(process_name)
+      self._present.pop(process_name)
+
+  def __getitem__(self, index):
+    """Return the (timestamp, FullResourceResult) stored at logical index."""
+    with self._lock:
+      return self._row(self._physical(index))
+
+  def __iter__(self):
+    with self._lock:
+      rows = [self._row(self._physical(index)) for index in range(self._len)]
+    return iter(rows)
+
+  def at_or_after(self, timestamp):
+    """Return the oldest row with a timestamp >= timestamp, or None if there is none."""
+    with self._lock:
+      index = bisect_left(self._timestamp_view, timestamp)
+      return self._row(self._physical(index)) if index < self._len else None
+
+  def nearest(self, timestamp):
+    """Return the oldest row with a timestamp >= timestamp, or the newest row if there is none."""
+    with self._lock:
+      index = min(bisect_left(self._timestamp_view, timestamp), self._len - 1)
+      return self._row(self._physical(index))
+
+  def between(self, start, end, before=None):
+    """Return the rows with start <= timestamp <= end (and timestamp < before, if given), oldest
+    first."""
+    rows = []
+    with self._lock:
+      for index in range(bisect_left(self._timestamp_view, start), self._len):
+        physical = self._physical(index)
+        timestamp = self._timestamps[physical]
+        if timestamp > end or (before is not None and timestamp >= before):
+          break
+        rows.append(self._row(physical))
+    return rows
+
+  def _row(self, index):
+    proc_usage = {}
+    for process_name, columns in self._processes.items():
+      num_procs = columns['num_procs'][index]
+      if num_procs == self.ABSENT:
+        continue
+      nice = columns['nice'][index]
+      sample = ProcessSample(
+          rate=columns['rate'][index],
+          user=columns['user'][index],
+          system=columns['system'][index],
+          rss=columns['rss'][index],
+          vms=columns['vms'][index],
+          nice=None if nice == self.NO_NICE else nice,
+          status=self._statuses[columns['status'][index]],
+          threads=columns['threads'][index])
+      proc_usage[process_name] = ResourceMonitorBase.ProcResourceResult(sample, num_procs)
+    return self._timestamps[index], ResourceMonitorBase.FullResourceResult(
+        proc_usage, self._disk[index])
+
+
+class ResourceRollup(object):
+  """ Accumulates the samples falling into one rollup interval and averages them.
+
+      Gauges (cpu rate, memory, threads, process counts and disk usage) are averaged over the
+      samples in which each process was present; cumulative cpu times, nice and status are taken
+      from the latest sample.
+  """
+
+  def __init__(self, bucket):
+    self.bucket = bucket
+    self._timestamp = None
+    self._count = 0
+    self._disk = 0
+    self._processes = {}  # process_name => [count, rate, rss, vms, threads, num_procs, latest]
+
+  def add(self, timestamp, value):
+    self._timestamp = timestamp
+    self._count += 1
+    self._disk += value.disk_usage or 0
+    for process_name, result in value.proc_usage.items():
+      sample = result.process_sample
+      totals = self._processes.setdefault(process_name, [0, 0.0, 0, 0, 0, 0, None])
+      totals[0] += 1
+      totals[1] += sample.rate
+      totals[2] += sample.rss
+      totals[3] += sample.vms
+      totals[4] += sample.threads
+      totals[5] += result.num_procs
+      totals[6] = sample
+
+  def result(self):
+    """Return the averaged (timestamp, FullResourceResult), or None if nothing was added."""
+    if not self._count:
+      return None
+    proc_usage = {}
+    for process_name, (count, rate, rss, vms, threads, num_procs, latest) in (
+        self._processes.items()):
+      sample = latest._replace(
+          rate=rate / count, rss=rss // count, vms=vms // count, threads=threads // count)
+      proc_usage[process_name] = ResourceMonitorBase.ProcResourceResult(
+          sample, int(round(float(num_procs) / count)))
+    return self._timestamp, ResourceMonitorBase.FullResourceResult(
+        proc_usage, self._disk // self._count)
+
 
 class ResourceHistory(object):
-  """ Simple class to contain a RingBuffer (fixed-length FIFO) history of resource samples, with the
-      mapping:
+  """ Fixed-length history of resource samples, with the mapping:
       timestamp => ({process_status => (process_sample, number_of_procs)}, disk_usage_in_bytes)
+
+      Samples are stored column-wise in fixed-width arrays (see ResourceColumns).  Optionally, a
+      second, coarser tier keeps averages over rollup_interval for rollup_maxlen intervals so that
+      longer windows can be served without retaining every raw sample.
   """
 
-  def __init__(self, maxlen, initialize=True):
+  def __init__(self, maxlen, initialize=True, rollup_interval=None, rollup_maxlen=0):
     if not maxlen >= 1:
       raise ValueError("maxlen must be greater than 0")
     self._maxlen = maxlen
-    self._values = RingBuffer(maxlen, None)
+    self._values = ResourceColumns(maxlen)
+    self._rollup_interval = rollup_interval.as_(Time.SECONDS) if rollup_interval else None
+    self._rollups = ResourceColumns(rollup_maxlen) if rollup_interval and rollup_maxlen else None
+    self._rollup = None
     if initialize:
       self.add(time.time(), ResourceMonitorBase.FullResourceResult({}, 0))
 
   def add(self, timestamp, value):
     """Store a new resource sample corresponding to the given timestamp"""
-    if self._values and not timestamp >= self._values[-1][0]:
+    if self._values and not timestamp >= self._values.newest:
       raise ValueError("Refusing to add timestamp in the past!")
-    self._values.append((timestamp, value))
+    self._values.append(timestamp, value)
+    if self._rollups is not None:
+      bucket = int(timestamp // self._rollup_interval)
+      if self._rollup is not None and self._rollup.bucket != bucket:
+        self._rollups.append(*self._rollup.result())
+        self._rollup = None
+      if self._rollup is None:
+        self._rollup = ResourceRollup(bucket)
+      self._rollup.add(timestamp, value)
 
   def get(self, timestamp):
-    """Get the resource sample nearest to the given timestamp"""
-    closest = min(bisect_left(self._values, (timestamp, None)), len(self) - 1)
-    return self._values[closest]
+    """Get the resource sample nearest to the given timestamp.  Timestamps older than the raw
+    history are served from the rollup tier, if there is one."""
+    oldest = self._values.oldest
+    if self._rollups and oldest is not None and timestamp < oldest:
+      rollup = self._rollups.at_or_after(timestamp)
+      if rollup is not None:
+        return rollup
+    return self._values.nearest(timestamp)
+
+  def query(self, start, end):
+    """Return the samples with start <= timestamp <= end, oldest first.  Periods covered only by
+    the rollup tier are returned at rollup resolution."""
+    samples = []
+    if self._rollups:
+      samples.extend(self._rollups.between(start, end, before=self._values.oldest))
+    samples.extend(self._values.between(start, end))
+    return samples
 
   def __iter__(self):
     return iter(self._values)
@@ -150,13 +433,27 @@ class ResourceHistory(object):
 
 class HistoryProvider(object):
   MAX_HISTORY = 10000  # magic number
+  ROLLUP_INTERVAL = Amount(5, Time.MINUTES)
+  ROLLUP_HISTORY_TIME = Amount(24, Time.HOURS)
+
+  def __init__(self, rollup_interval=ROLLUP_INTERVAL, rollup_history_time=ROLLUP_HISTORY_TIME):
+    self._rollup_interval = rollup_interval
+    self._rollup_history_time = rollup_history_time
 
   def provides(self, history_time, min_collection_interval):
     history_length = int(history_time.as_(Time.SECONDS) / min_collection_interval)
     if history_length > self.MAX_HISTORY:
       raise ValueError("Requested history length too large")
-    log.debug("Initialising ResourceHistory of length %s", history_length)
-    return ResourceHistory(history_length)
+    rollup_length = 0
+    if self._rollup_interval and self._rollup_history_time:
+      rollup_length = int(self._rollup_history_time.as_(Time.SECONDS) /
+                          self._rollup_interval.as_(Time.SECONDS))
+      if rollup_length > self.MAX_HISTORY:
+        raise ValueError("Requested rollup history length too large")
+    log.debug("Initialising ResourceHistory of length %s (%s rollups)",
+              history_length, rollup_length)
+    return ResourceHistory(
+        history_length, rollup_interval=self._rollup_interval, rollup_maxlen=rollup_length)
 
 
 class DiskCollectorProvider(object):
@@ -165,12 +462,15 @@ class DiskCollectorProvider(object):
   def __init__(
       self,
       enable_mesos_disk_collector=False,
-      settings=DiskCollectorSettings()):
+      settings=DiskCollectorSettings(),
+      enable_incremental_disk_collector=False):
 
     self.settings = settings
     self.disk_collector_class = self.DEFAULT_DISK_COLLECTOR_CLASS
     if enable_mesos_disk_collector:
       self.disk_collector_class = MesosDiskCollector
+    elif enable_incremental_disk_collector:
+      self.disk_collector_class = IncrementalDiskCollector
 
   def provides(self, sandbox):
     return self.disk_collector_class(sandbox, settings=self.settings)
@@ -211,6 +511,9 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
     self._disk_collection_interval = disk_collection_interval.as_(Time.SECONDS)
     min_collection_interval = min(self._process_collection_interval, self._disk_collection_interval)
     self._history = history_provider.provides(history_time, min_collection_interval)
+    # The (timestamp, AggregateResourceResult) of the latest sample, aggregated once when recorded.
+    self._latest = None
+    self._collection_cost = self.CollectionCost(0, 0.0)
     self._kill_signal = threading.Event()
     ExceptionalThread.__init__(self, name='%s[%s]' % (self.__class__.__name__, task_id))
     self.daemon = True
@@ -221,13 +524,24 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
     return self.sample_at(time.time())
 
   def sample_at(self, timestamp):
+    latest = self._latest
+    if latest is not None and timestamp >= latest[0]:
+      return latest
     _timestamp, full_resources = self._history.get(timestamp)
+    return _timestamp, self._aggregate(full_resources)
+
+  def sample_range(self, start, end):
+    """ Return the samples recorded between start and end, oldest first, as a list of
+    (timestamp, AggregateResourceResult) tuples """
+    return [(timestamp, self._aggregate(full_resources))
+            for timestamp, full_resources in self._history.query(start, end)]
 
+  def _aggregate(self, full_resources):
     aggregated_procs = sum(map(attrgetter('num_procs'), full_resources.proc_usage.values()))
     aggregated_sample = sum(map(attrgetter('process_sample'), full_resources.proc_usage.values()),
         ProcessSample.empty())
 
-    return _timestamp, self.AggregateResourceResult(
+    return self.AggregateResourceResult(
         aggregated_procs, aggregated_sample, full_resources.disk_usage)
 
   def sample_by_process(self, process_name):
@@ -239,7 +553,7 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
     else:
       # Since this might be called out of band (before the main loop is aware of the process)
       if process.process not in self._process_collectors:
-        self._process_collectors[process.process] = ProcessTreeCollector(process.pid)
+        self._process_collectors[process.process] = self._new_process_collector(process.pid)
 
       # The sample obtained from history is tuple of (timestamp, FullResourceResult), and per
       # process sample can be lookup up from FullResourceResult
@@ -247,9 +561,15 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
       if process.process in full_resources.proc_usage:
         return full_resources.proc_usage[process.process].process_sample
 
-      self._process_collectors[process.process].sample()
+      self._sample_process_collector(self._process_collectors[process.process])
       return self._process_collectors[process.process].value
 
+  def _new_process_collector(self, pid):
+    return ProcessTreeCollector(pid)
+
+  def _sample_process_collector(self, collector):
+    collector.sample()
+
   def _get_active_processes(self):
     """Get a list of ProcessStatus objects representing currently-running processes in the task"""
     return [process for process, _ in self._task_monitor.get_active_processes()]
@@ -258,6 +578,54 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
     """Signal that the thread should cease collecting resources and terminate"""
     self._kill_signal.set()
 
+  def _collect_processes(self):
+    actives = {p.process: p for p in self._get_active_processes()}
+    current = set(self._process_collectors)
+    for process_name in current - set(actives):
+      self._process_collectors.pop(process_name)
+    for process_name in set(actives) - current:
+      self._process_collectors[process_name] = self._new_process_collector(
+          actives[process_name].pid)
+    for process_name, collector in self._process_collectors.items():
+      self._sample_process_collector(collector)
+
+  def _collect_disk(self):
+    if not self._disk_collector:
+      sandbox = self._task_monitor.get_sandbox()
+      if sandbox:
+        self._disk_collector = self._disk_collector_provider.provides(sandbox)
+    if self._disk_collector:
+      self._disk_collector.sample()
+    else:
+      log.debug('No sandbox detected yet for %s', self._task_id)
+
+  def _close_disk_collector(self):
+    if self._disk_collector:
+      self._disk_collector.close()
+
+  def _record_sample(self, now):
+    try:
+      disk_usage = self._disk_collector.value if self._disk_collector else 0
+
+      proc_usage_dict = dict()
+      for process_name, collector in self._process_collectors.items():
+        proc_usage_dict.update({process_name: self.ProcResourceResult(collector.value,
+            collector.procs)})
+
+      full_resources = self.FullResourceResult(proc_usage_dict, disk_usage)
+      self._history.add(now, full_resources)
+      self._latest = (now, self._aggregate(full_resources))
+    except ValueError as err:
+      log.warning("Error recording resource sample: %s", err)
+
+  @property
+  def collection_cost(self):
+    return self._collection_cost
+
+  def _add_collection_cost(self, seconds):
+    self._collection_cost = self.CollectionCost(
+        self._collection_cost.collections + 1, self._collection_cost.seconds + seconds)
+
   def run(self):
     """Thread entrypoint. Loop indefinitely, polling collectors at self._collection_interval and
     collating samples."""
@@ -271,40 +639,18 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
 
       if now > next_process_collection:
         next_process_collection = now + self._process_collection_interval
-        actives = {p.process: p for p in self._get_active_processes()}
-        current = set(self._process_collectors)
-        for process_name in current - set(actives):
-          self._process_collectors.pop(process_name)
-        for process_name in set(actives) - current:
-          self._process_collectors[process_name] = ProcessTreeCollector(actives[process_name].pid)
-        for process_name, collector in self._process_collectors.items():
-          collector.sample()
+        self._collect_processes()
 
       if now > next_disk_collection:
         next_disk_collection = now + self._disk_collection_interval
-        if not self._disk_collector:
-          sandbox = self._task_monitor.get_sandbox()
-          if sandbox:
-            self._disk_collector = self._disk_collector_provider.provides(sandbox)
-        if self._disk_collector:
-          self._disk_collector.sample()
-        else:
-          log.debug('No sandbox detected yet for %s', self._task_id)
+        self._collect_disk()
 
-      try:
-        disk_usage = self._disk_collector.value if self._disk_collector else 0
-
-        proc_usage_dict = dict()
-        for process_name, collector in self._process_collectors.items():
-          proc_usage_dict.update({process_name: self.ProcResourceResult(collector.value,
-              collector.procs)})
-
-        self._history.add(now, self.FullResourceResult(proc_usage_dict, disk_usage))
-      except ValueError as err:
-        log.warning("Error recording resource sample: %s", err)
+      self._record_sample(now)
 
+      elapsed = time.time() - now
+      self._add_collection_cost(elapsed)
       log.debug("TaskResourceMonitor: finished collection of %s in %.2fs",
-          self._task_id, (time.time() - now))
+          self._task_id, elapsed)
 
       # Sleep until any of the following conditions are met:
       # - it's time for the next disk collection
@@ -326,6 +672,143 @@ class TaskResourceMonitor(ResourceMonitorBase, ExceptionalThread):
                     'process_collection_interval and disk_collection_interval.')
 
     log.debug('Stopping resource monitoring for task "%s"', self._task_id)
+    self._close_disk_collector()
+
+
+class SharedResourceSampler(ExceptionalThread):
+  """ A single thread that samples the processes of many tasks at once.
+
+      Rather than one TaskResourceMonitor thread per task each walking /proc for its own process
+      trees, the SharedResourceSampler reads the host process table once per interval and hands
+      the snapshot to every registered SharedTaskResourceMonitor, which attributes it to the
+      task's process trees.
+  """
+
+  PROCESS_COLLECTION_INTERVAL = TaskResourceMonitor.PROCESS_COLLECTION_INTERVAL
+
+  @classmethod
+  def is_supported(cls):
+    return ProcessTable.is_supported()
+
+  def __init__(self, process_collection_interval=PROCESS_COLLECTION_INTERVAL):
+    self._process_collection_interval = process_collection_interval
+    self._monitors = set()
+    self._monitors_lock = threading.Lock()
+    self._table = ProcessTable({})
+    self._kill_signal = threading.Event()
+    self._wakeup = threading.Event()
+    ExceptionalThread.__init__(self, name=self.__class__.__name__)
+    self.daemon = True
+
+  @property
+  def process_collection_interval(self):
+    return self._process_collection_interval
+
+  @property
+  def table(self):
+    """The most recent ProcessTable snapshot."""
+    return self._table
+
+  def register(self, monitor):
+    with self._monitors_lock:
+      self._monitors.add(monitor)
+    # Collect immediately so that new tasks do not wait a full interval for their first sample.
+    self._wakeup.set()
+
+  def unregister(self, monitor):
+    with self._monitors_lock:
+      self._monitors.discard(monitor)
+
+  def is_registered(self, monitor):
+    with self._monitors_lock:
+      return monitor in self._monitors
+
+  def kill(self):
+    self._kill_signal.set()
+    self._wakeup.set()
+
+  def collect(self):
+    """Snapshot the process table and distribute it to every registered monitor."""
+    start = time.time()
+    self._table = table = ProcessTable.snapshot()
+    with self._monitors_lock:
+      monitors = list(self._monitors)
+    for monitor in monitors:
+      try:
+        monitor.collect(table)
+      except Exception as e:
+        log.error('Error collecting resources for %s: %s', monitor, e)
+    log.debug('SharedResourceSampler: sampled %d processes for %d tasks in %.2fs',
+        len(table), len(monitors), time.time() - start)
+
+  def run(self):
+    interval = self._process_collection_interval.as_(Time.SECONDS)
+    while not self._kill_signal.is_set():
+      self._wakeup.clear()
+      next_collection = time.time() + interval
+      self.collect()
+      self._wakeup.wait(timeout=max(0, next_collection - time.time()))
+
+
+class SharedTaskResourceMonitor(TaskResourceMonitor):
+  """ A TaskResourceMonitor driven by a SharedResourceSampler instead of its own thread.
+
+      start() and kill() register and unregister the monitor with the sampler; sample(),
+      sample_at() and sample_by_process() behave exactly as for TaskResourceMonitor.
+  """
+
+  def __init__(
+      self,
+      task_id,
+      task_monitor,
+      sampler,
+      disk_collector_provider=DiskCollectorProvider(),
+      disk_collection_interval=DiskCollectorSettings.DISK_COLLECTION_INTERVAL,
+      history_time=TaskResourceMonitor.HISTORY_TIME,
+      history_provider=HistoryProvider()):
+    self._sampler = sampler
+    self._next_disk_collection = 0
+    super(SharedTaskResourceMonitor, self).__init__(
+        task_id,
+        task_monitor,
+        disk_collector_provider=disk_collector_provider,
+        process_collection_interval=sampler.process_collection_interval,
+        disk_collection_interval=disk_collection_interval,
+        history_time=history_time,
+        history_provider=history_provider)
+
+  def __repr__(self):
+    return '%s(%s)' % (self.__class__.__name__, self._task_id)
+
+  def _new_process_collector(self, pid):
+    return ProcessTableTreeCollector(pid)
+
+  def _sample_process_collector(self, collector):
+    collector.sample(self._sampler.table)
+
+  def collect(self, table):
+    """Attribute the processes in table to this task and record a sample.  Called by the
+    SharedResourceSampler once per collection interval."""
+    start = time.time()
+    now = table.timestamp
+    self._collect_processes()
+    if now > self._next_disk_collection:
+      self._next_disk_collection = now + self._disk_collection_interval
+      self._collect_disk()
+    self._record_sample(now)
+    self._add_collection_cost(time.time() - start)
+
+  def is_alive(self):
+    return self._sampler.is_registered(self)
+
+  def start(self):
+    log.debug('Commencing shared resource monitoring for task "%s"', self._task_id)
+    self._sampler.register(self)
+
+  def kill(self):
+    log.debug('Stopping shared resource monitoring for task "%s"', self._task_id)
+    self._sampler.unregister(self)
+    self._close_disk_collector()
 
 
 class NullTaskResourceMonitor(ResourceMonitorBase):
@@ -343,6 +826,9 @@ class NullTaskResourceMonitor(ResourceMonitorBase):
   def sample_by_process(self, process_name):
     return ProcessSample.empty()
 
+  def sample_range(self, start, end):
+    return []
+
   def start(self):
     pass
 
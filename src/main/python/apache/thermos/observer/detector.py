@@ -13,8 +13,16 @@
 #
 
 
-from collections import namedtuple
+import os
+import threading
+import time
+from collections import defaultdict, namedtuple
 
+from twitter.common import log
+from twitter.common.quantity import Amount, Time
+
+from apache.thermos.common.inotify import Inotify
+from apache.thermos.common.path import TaskPath
 from apache.thermos.monitoring.detector import PathDetector, TaskDetector
 
 RootedTask = namedtuple('RootedTask', ('root task_id'))
@@ -45,6 +53,7 @@ class ObserverTaskDetector(object):
     self._on_active = self.maybe_callback(on_active)
     self._on_finished = self.maybe_callback(on_finished)
     self._on_removed = self.maybe_callback(on_removed)
+    self._wakeup_event = threading.Event()
 
   @property
   def active_tasks(self):
@@ -55,6 +64,7 @@ class ObserverTaskDetector(object):
     return self._finished_tasks.copy()
 
   def _refresh_detectors(self):
+    """Refresh the set of checkpoint roots, returning the (added, removed) roots."""
     new_paths = set(self._path_detector.get_paths())
     old_paths = set(self._detectors)
 
@@ -64,52 +74,286 @@ class ObserverTaskDetector(object):
     for path in new_paths - old_paths:
       self._detectors[path] = TaskDetector(root=path)
 
+    return new_paths - old_paths, old_paths - new_paths
+
   def iter_tasks(self):
     # returns an iterator of root, task_id, active/finished
     for root, detector in self._detectors.items():
       for status, task_id in detector.get_task_ids():
         yield (root, task_id, status)
 
+  def _update(self, task, status):
+    """Transition a single task to status ('active', 'finished' or None if it is gone)."""
+    if status == 'active':
+      if task in self._active_tasks:
+        return
+      elif task in self._finished_tasks:
+        assert False, 'Unexpected state.'
+      else:
+        self._active_tasks.add(task)
+        self._on_active(task.root, task.task_id)
+    elif status == 'finished':
+      if task in self._active_tasks:
+        self._active_tasks.remove(task)
+        self._finished_tasks.add(task)
+        self._on_finished(task.root, task.task_id)
+      elif task in self._finished_tasks:
+        return
+      else:
+        self._finished_tasks.add(task)
+        self._on_active(task.root, task.task_id)
+        self._on_finished(task.root, task.task_id)
+    elif status is None:
+      if task in self._active_tasks:
+        self._active_tasks.remove(task)
+        self._on_finished(task.root, task.task_id)
+        self._on_removed(task.root, task.task_id)
+      elif task in self._finished_tasks:
+        self._finished_tasks.remove(task)
+        self._on_removed(task.root, task.task_id)
+    else:
+      assert False, 'Unknown state.'
+
+  def _reconcile(self, tasks, known_active, known_finished):
+    """Apply the (root, task_id, status) scan results in tasks, removing any known tasks that
+       were not seen in the scan."""
+    seen = set()
+    for root, task_id, status in tasks:
+      task = RootedTask(root, task_id)
+      seen.add(task)
+      self._update(task, status)
+    for task in known_active - seen:
+      self._update(task, None)
+    for task in known_finished - seen:
+      self._update(task, None)
+
   def refresh(self):
     self._refresh_detectors()
+    self._reconcile(self.iter_tasks(), self.active_tasks, self.finished_tasks)
 
-    all_active, all_finished = set(), set()
+  def wait(self, timeout):
+    """Wait up to timeout seconds for the next refresh or until wakeup() is called."""
+    self._wakeup_event.wait(timeout)
+    self._wakeup_event.clear()
 
-    for root, task_id, status in self.iter_tasks():
-      task = RootedTask(root, task_id)
+  def wakeup(self):
+    self._wakeup_event.set()
 
-      if status == 'active':
-        all_active.add(task)
-        if task in self._active_tasks:
-          continue
-        elif task in self._finished_tasks:
-          assert False, 'Unexpected state.'
-        else:
-          self._active_tasks.add(task)
-          self._on_active(root, task_id)
-      elif status == 'finished':
-        all_finished.add(task)
-        if task in self._active_tasks:
-          self._active_tasks.remove(task)
-          self._finished_tasks.add(task)
-          self._on_finished(root, task_id)
-        elif task in self._finished_tasks:
-          continue
-        else:
-          self._finished_tasks.add(task)
-          self._on_active(root, task_id)
-          self._on_finished(root, task_id)
-      else:
-        assert False, 'Unknown state.'
+  def close(self):
+    pass
+
+
+class InotifyObserverTaskDetector(ObserverTaskDetector):
+  """An ObserverTaskDetector that follows task transitions with inotify(7).
+
+  Rather than re-globbing every checkpoint root on each refresh, the detector watches the
+  tasks/active and tasks/finished directories of every root and only inspects the tasks named by
+  filesystem events.  Checkpoint roots themselves are still discovered through the PathDetector
+  (at most once per path_refresh_interval), and a full glob-based reconciliation runs every
+  reconciliation_interval to recover from missed events.  Roots that cannot be watched (e.g. once
+  fs.inotify.max_user_watches is exhausted) are polled on every refresh instead.
+  """
+
+  PATH_REFRESH_INTERVAL = Amount(5, Time.SECONDS)
+  RECONCILIATION_INTERVAL = Amount(5, Time.MINUTES)
+
+  ROOT_MASK = Inotify.IN_CREATE | Inotify.IN_MOVED_TO | Inotify.IN_ONLYDIR
+  TASK_DIR_MASK = (Inotify.IN_CLOSE_WRITE | Inotify.IN_MOVED_TO | Inotify.IN_MOVED_FROM |
+                   Inotify.IN_DELETE | Inotify.IN_ONLYDIR)
+  STATES = ('active', 'finished')
+  TASKS_DIR = TaskPath.DIR_TEMPLATE['task_path'][1]
+
+  def __init__(self,
+               path_detector,
+               on_active=None,
+               on_finished=None,
+               on_removed=None,
+               path_refresh_interval=PATH_REFRESH_INTERVAL,
+               reconciliation_interval=RECONCILIATION_INTERVAL,
+               clock=time):
+    super(InotifyObserverTaskDetector, self).__init__(
+        path_detector, on_active, on_finished, on_removed)
+    self._inotify = Inotify()
+    try:
+      self._wakeup_read, self._wakeup_write = os.pipe()
+    except OSError:
+      self._inotify.close()
+      raise
+    for fd in (self._wakeup_read, self._wakeup_write):
+      os.set_blocking(fd, False)
+    self._path_refresh_interval = path_refresh_interval.as_(Time.SECONDS)
+    self._reconciliation_interval = reconciliation_interval.as_(Time.SECONDS)
+    self._clock = clock
+    self._last_path_refresh = None
+    self._last_reconciliation = None
+    self._watches = {}  # wd => (root, kind), kind in ('root', 'tasks', 'active', 'finished')
+    self._root_watches = defaultdict(set)  # root => set(wd)
+    self._unwatched_roots = set()  # roots that fell back to polling
+    self._root_tasks = defaultdict(set)  # root => set(RootedTask)
+    self._pathspec = TaskPath()
+
+  def _update(self, task, status):
+    super(InotifyObserverTaskDetector, self)._update(task, status)
+    if status is None:
+      root_tasks = self._root_tasks.get(task.root)
+      if root_tasks is not None:
+        root_tasks.discard(task)
+        if not root_tasks:
+          self._root_tasks.pop(task.root)
+    else:
+      self._root_tasks[task.root].add(task)
+
+  def _known_root_tasks(self, root):
+    root_tasks = self._root_tasks.get(root, set())
+    return root_tasks & self._active_tasks, root_tasks & self._finished_tasks
+
+  def _state_dir(self, root, state):
+    return os.path.dirname(
+        self._pathspec.given(root=root, state=state, task_id='_').getpath('task_path'))
+
+  def _watch_paths(self, root):
+    yield 'root', root, self.ROOT_MASK
+    yield 'tasks', os.path.dirname(self._state_dir(root, self.STATES[0])), self.ROOT_MASK
+    for state in self.STATES:
+      yield state, self._state_dir(root, state), self.TASK_DIR_MASK
+
+  def _watch_root(self, root):
+    """Add (or refresh) the watches for a root.  Directories that do not exist yet are picked up
+       through the creation events of their parents."""
+    if root in self._unwatched_roots:
+      return
+    for kind, path, mask in self._watch_paths(root):
+      try:
+        wd = self._inotify.add_watch(path, mask)
+      except OSError as e:
+        if os.path.isdir(path):
+          log.warning('Unable to watch %s (%s), falling back to polling %s', path, e, root)
+          self._unwatch_root(root)
+          self._unwatched_roots.add(root)
+          return
+        continue
+      self._watches[wd] = (root, kind)
+      self._root_watches[root].add(wd)
+
+  def _unwatch_root(self, root):
+    self._unwatched_roots.discard(root)
+    for wd in self._root_watches.pop(root, ()):
+      self._watches.pop(wd, None)
+      try:
+        self._inotify.remove_watch(wd)
+      except OSError as e:
+        log.debug('Failed to remove watch %d for %s: %s', wd, root, e)
+
+  def _rescan_root(self, root):
+    detector = self._detectors.get(root)
+    known_active, known_finished = self._known_root_tasks(root)
+    if detector is None:
+      tasks = ()
+    else:
+      tasks = ((root, task_id, status) for status, task_id in detector.get_task_ids())
+    self._reconcile(tasks, known_active, known_finished)
+
+  def _task_status(self, task):
+    # Prefer 'finished' in case the rename from active to finished is observed mid-flight.
+    for state in reversed(self.STATES):
+      path = self._pathspec.given(root=task.root, state=state, task_id=task.task_id)
+      if os.path.exists(path.getpath('task_path')):
+        return state
+    return None
+
+  def _refresh_paths(self):
+    added, removed = self._refresh_detectors()
+    for root in removed:
+      self._unwatch_root(root)
+      self._rescan_root(root)
+    for root in added:
+      self._watch_root(root)
+      self._rescan_root(root)
+
+  def _reconcile_all(self):
+    start = self._clock.time()
+    _, removed = self._refresh_detectors()
+    for root in removed:
+      self._unwatch_root(root)
+    for root in self._detectors:
+      self._watch_root(root)
+    # Events observed up to this point are subsumed by the full scan.
+    self._inotify.read_events()
+    self._reconcile(self.iter_tasks(), self.active_tasks, self.finished_tasks)
+    self._last_reconciliation = self._last_path_refresh = self._clock.time()
+    log.debug('InotifyObserverTaskDetector: full reconciliation of %d roots in %.2fs',
+              len(self._detectors), self._last_reconciliation - start)
+
+  def _process_events(self):
+    dirty_roots, touched_tasks = set(), set()
+    for event in self._inotify.read_events():
+      if event.mask & Inotify.IN_Q_OVERFLOW:
+        log.warning('inotify event queue overflowed, performing full reconciliation.')
+        self._reconcile_all()
+        return
+      watch = self._watches.get(event.wd)
+      if watch is None:
+        continue
+      root, kind = watch
+      if event.mask & Inotify.IN_IGNORED:
+        # The watched directory went away; drop the watch and rescan the root.
+        self._watches.pop(event.wd, None)
+        self._root_watches[root].discard(event.wd)
+        dirty_roots.add(root)
+      elif kind in self.STATES:
+        if event.name is not None:
+          touched_tasks.add(RootedTask(root, event.name))
+      elif ((kind == 'root' and event.name == self.TASKS_DIR) or
+            (kind == 'tasks' and event.name in self.STATES)):
+        # A root or tasks directory grew a child that needs watching.
+        dirty_roots.add(root)
+
+    for root in dirty_roots:
+      if root in self._detectors:
+        self._watch_root(root)
+      self._rescan_root(root)
+
+    for task in touched_tasks:
+      if task.root not in dirty_roots and task.root in self._detectors:
+        self._update(task, self._task_status(task))
+
+  def refresh(self):
+    now = self._clock.time()
+
+    if (self._last_reconciliation is None or
+        now - self._last_reconciliation >= self._reconciliation_interval):
+      self._reconcile_all()
+      return
+
+    if now - self._last_path_refresh >= self._path_refresh_interval:
+      self._refresh_paths()
+      self._last_path_refresh = now
+
+    self._process_events()
 
-    all_tasks = all_active | all_finished
+    for root in list(self._unwatched_roots):
+      self._rescan_root(root)
 
-    for task in self.active_tasks - all_tasks:
-      self._on_finished(task.root, task.task_id)
-      self._on_removed(task.root, task.task_id)
+  def wait(self, timeout):
+    """Wait until filesystem events arrive, wakeup() is called or timeout seconds elapse."""
+    readable = self._inotify.wait(timeout, [self._wakeup_read])
+    if self._wakeup_read in readable:
+      try:
+        while os.read(self._wakeup_read, 4096):
+          pass
+      except OSError:
+        pass
 
-    for task in self.finished_tasks - all_tasks:
-      self._on_removed(task.root, task.task_id)
+  def wakeup(self):
+    try:
+      os.write(self._wakeup_write, b'\0')
+    except OSError:
+      pass
 
-    self._active_tasks = all_active
-    self._finished_tasks = all_finished
+  def close(self):
+    self._inotify.close()
+    for fd in (self._wakeup_read, self._wakeup_write):
+      try:
+        os.close(fd)
+      except OSError:
+        pass
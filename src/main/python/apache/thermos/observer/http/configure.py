@@ -15,16 +15,28 @@
 import sys
 import types
 
-from twitter.common.http import HttpServer
+from twitter.common.http import (
+    CallbackPool,
+    GzipPlugin,
+    HttpServer,
+    PooledServer,
+    RequestMetrics,
+    RequestTimeout
+)
 from twitter.common.http import server as http_server
 from twitter.common.http.diagnostics import DiagnosticsEndpoints
 from twitter.common.metrics import RootMetrics
 
 from .diagnostics import register_build_properties, register_diagnostics
+from .file_browser import LONG_POLL_POOL
 from .http_observer import BottleObserver
 from .vars_endpoint import VarsEndpoint
 
 
+DEFAULT_REQUEST_TIMEOUT_SECS = 30
+DEFAULT_LONG_POLL_THREADS = 4
+
+
 def configure_server(task_observer, options=None):
   if sys.version_info[0] >= 3:
     def _bind_method_py3(self, class_instance, method_name):
@@ -42,6 +54,20 @@ def configure_server(task_observer, options=None):
     http_server.HttpServer._bind_method = _bind_method_py3
 
   bottle_wrapper = BottleObserver(task_observer, options=options)
+  request_metrics = RequestMetrics()
+  # Followers of logs and files wait on their own pool, and fail with 503 once it is full rather
+  # than queueing for it.
+  long_poll_threads = getattr(options, 'http_long_poll_threads', DEFAULT_LONG_POLL_THREADS)
+  long_poll_pool = CallbackPool(long_poll_threads, max_pending=long_poll_threads)
+  # Time every observer request, including those rejected by authentication or timed out.
+  bottle_wrapper.plugins[0:0] = [
+    request_metrics,
+    GzipPlugin(),
+    RequestTimeout(
+        getattr(options, 'http_request_timeout_secs', DEFAULT_REQUEST_TIMEOUT_SECS),
+        threads=getattr(options, 'http_threads', PooledServer.DEFAULT_THREADS),
+        pools={LONG_POLL_POOL: long_poll_pool}),
+  ]
   root_metrics = RootMetrics()
   server = HttpServer()
   server.mount_routes(bottle_wrapper)
@@ -49,5 +75,7 @@ def configure_server(task_observer, options=None):
   server.mount_routes(VarsEndpoint())
   register_build_properties(root_metrics)
   register_diagnostics(root_metrics)
+  root_metrics.register_observable('observer', task_observer)
+  root_metrics.register_observable('observer_http', request_metrics)
   server._bottle_observer = bottle_wrapper
   return server
@@ -13,20 +13,33 @@
 #
 
 import os
+import time
 from xml.sax.saxutils import escape
 
 import bottle
 from twitter.common import log
 from twitter.common.http import HttpServer
 
+from apache.thermos.common.compression import is_compressed, open_log
+from apache.thermos.common.inotify import Inotify
+
 from .templating import HttpTemplate
 
 MB = 1024 * 1024
 DEFAULT_CHUNK_LENGTH = MB
 MAX_CHUNK_LENGTH = 16 * MB
 
+DEFAULT_FOLLOW_TIMEOUT = 30
+MAX_FOLLOW_TIMEOUT = 60
+FOLLOW_POLL_INTERVAL = 0.5
+
+# The RequestTimeout pool on which raw (possibly long-polling) requests are served, so that
+# followers cannot occupy the threads serving every other route.
+LONG_POLL_POOL = 'long_poll'
+
 
 def _read_chunk(filename, offset=None, length=None):
+  """Read a chunk of filename for the browser.  Compressed log segments are read decompressed."""
   offset = offset or -1
   length = length or -1
 
@@ -40,22 +53,22 @@ def _read_chunk(filename, offset=None, length=None):
     return {}
 
   try:
-    fstat = os.stat(filename)
+    fp, size = open_log(filename)
   except Exception as e:
     log.error('Could not read from %s: %s', filename, e)
     return {}
 
   if offset == -1:
-    offset = fstat.st_size
+    offset = size
 
   if length == -1:
-    length = fstat.st_size - offset
+    length = size - offset
 
-  with open(filename, "rb") as fp:
-    fp.seek(offset)
+  with fp:
     try:
+      fp.seek(offset)
       data = fp.read(length)
-    except IOError as e:
+    except (IOError, EOFError) as e:
       log.error('Failed to read %s: %s', filename, e, exc_info=True)
       return {}
 
@@ -65,6 +78,165 @@ def _read_chunk(filename, offset=None, length=None):
   return dict(offset=offset, length=0)
 
 
+class RangeNotSatisfiable(Exception): pass
+
+
+def _parse_range(header, size):
+  """Return the inclusive (start, end) byte range requested by a single-range Range header, or
+  None if there is no usable Range header and the whole file should be served."""
+  if not header or not header.startswith('bytes='):
+    return None
+  spec = header[len('bytes='):].strip()
+  if ',' in spec:
+    # Multiple ranges are not supported, and servers are free to ignore the Range header.
+    return None
+  start, sep, end = spec.partition('-')
+  try:
+    start = int(start) if start.strip() else None
+    end = int(end) if end.strip() else None
+  except ValueError:
+    return None
+  if not sep or (start is None and end is None):
+    return None
+  if start is None:
+    # Suffix range: the last `end` bytes of the file.
+    if end == 0 or size == 0:
+      raise RangeNotSatisfiable()
+    return max(size - end, 0), size - 1
+  if start >= size or (end is not None and end < start):
+    raise RangeNotSatisfiable()
+  return start, size - 1 if end is None else min(end, size - 1)
+
+
+def _parse_open_range(header):
+  """Return N from an open-ended Range header of the form bytes=N-."""
+  if not header.startswith('bytes='):
+    raise RangeNotSatisfiable()
+  start, sep, end = header[len('bytes='):].partition('-')
+  if not sep or end.strip() or not start.strip().isdigit():
+    raise RangeNotSatisfiable()
+  return int(start)
+
+
+class StreamRange(object):
+  """A read-only file-like object limited to length bytes of fp starting at offset.
+
+  It is read in bounded chunks, and is never decoded or escaped.  It has no fileno(), so it is also
+  suitable for decompressing file objects whose descriptor holds different bytes.
+  """
+
+  def __init__(self, fp, offset, length):
+    self._fp = fp
+    self._fp.seek(offset)
+    self._remaining = length
+
+  def tell(self):
+    return self._fp.tell()
+
+  def read(self, size=-1):
+    if size is None or size < 0 or size > self._remaining:
+      size = self._remaining
+    data = self._fp.read(size) if size else b''
+    self._remaining -= len(data)
+    return data
+
+  def close(self):
+    self._fp.close()
+
+
+class FileRange(StreamRange):
+  """A StreamRange of a plain file.
+
+  Bottle hands file-like response bodies to the server's wsgi.file_wrapper when there is one, so
+  servers which implement it with sendfile(2) stream the range without copying it through the
+  observer.
+  """
+
+  def fileno(self):
+    return self._fp.fileno()
+
+
+def _wait_for_growth(filename, fp, offset, timeout):
+  """Wait up to timeout seconds for the file open as fp to grow beyond offset bytes.  Returns the
+  size of the file."""
+  deadline = time.time() + timeout
+  size = os.fstat(fp.fileno()).st_size
+  if size > offset:
+    return size
+  watcher = None
+  if Inotify.is_supported():
+    try:
+      watcher = Inotify()
+      watcher.add_watch(filename, Inotify.IN_MODIFY | Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF)
+    except OSError as e:
+      # e.g. fs.inotify.max_user_instances is exhausted, so poll instead.
+      log.debug('Unable to watch %s, polling instead: %s', filename, e)
+      if watcher:
+        watcher.close()
+      watcher = None
+  try:
+    while size <= offset:
+      remaining = deadline - time.time()
+      if remaining <= 0:
+        break
+      if watcher:
+        if watcher.wait(remaining):
+          watcher.read_events()
+      else:
+        time.sleep(min(FOLLOW_POLL_INTERVAL, remaining))
+      size = os.fstat(fp.fileno()).st_size
+  finally:
+    if watcher:
+      watcher.close()
+  return size
+
+
+def _serve_raw(filename, range_header=None, follow=False, timeout=None):
+  """Serve the raw bytes of filename, honoring single-range Range requests.
+
+  In follow mode the request is long-polled: the range must be open-ended (bytes=N-, or absent to
+  start at the current end of the file) and the response is delayed until there are bytes beyond N
+  or the timeout expires, in which case it is empty (204).  Clients follow a file by requesting
+  bytes=<offset of the end of the previous response + 1>- in a loop.
+
+  Compressed log segments are served decompressed.  They never grow, so are not waited upon.
+  """
+  compressed = is_compressed(filename)
+  try:
+    fp, size = open_log(filename)
+  except (IOError, OSError):
+    bottle.abort(404, 'No such file')
+  body_class = StreamRange if compressed else FileRange
+  try:
+    if follow:
+      start = size if not range_header else _parse_open_range(range_header)
+      timeout = DEFAULT_FOLLOW_TIMEOUT if timeout is None else min(timeout, MAX_FOLLOW_TIMEOUT)
+      if not compressed:
+        size = _wait_for_growth(filename, fp, start, timeout)
+      if start >= size:
+        fp.close()
+        return bottle.HTTPResponse(status=204, headers={'Content-Range': 'bytes */%d' % size})
+      byte_range = (start, size - 1)
+    else:
+      byte_range = _parse_range(range_header, size)
+  except RangeNotSatisfiable:
+    fp.close()
+    return bottle.HTTPResponse(status=416, headers={'Content-Range': 'bytes */%d' % size})
+  except Exception:
+    fp.close()
+    raise
+
+  headers = {'Accept-Ranges': 'bytes', 'Content-Type': 'application/octet-stream'}
+  if byte_range is None:
+    headers['Content-Length'] = str(size)
+    return bottle.HTTPResponse(body=body_class(fp, 0, size), status=200, headers=headers)
+  start, end = byte_range
+  headers['Content-Length'] = str(end - start + 1)
+  headers['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+  return bottle.HTTPResponse(
+      body=body_class(fp, start, end - start + 1), status=206, headers=headers)
+
+
 class TaskObserverFileBrowser(object):
   """
     Mixin for Thermos observer File browser.
@@ -99,6 +271,29 @@ class TaskObserverFileBrowser(object):
     chroot, path = types[logtype]
     return _read_chunk(os.path.join(chroot, path), offset, length)
 
+  def _raw_request(self):
+    """Return the (Range header, follow, timeout) of a raw data request."""
+    follow = self.Request.GET.get('follow', '') in ('true', '1')
+    try:
+      timeout = float(self.Request.GET.get('timeout', DEFAULT_FOLLOW_TIMEOUT))
+    except ValueError:
+      bottle.abort(400, 'Invalid timeout')
+    return self.Request.headers.get('Range'), follow, timeout
+
+  # Long-polling requests may legitimately wait for up to MAX_FOLLOW_TIMEOUT seconds.
+  @HttpServer.route("/lograw/:task_id/:process/:run/:logtype", timeout=MAX_FOLLOW_TIMEOUT + 10,
+                    pool=LONG_POLL_POOL)
+  def handle_lograw(self, task_id, process, run, logtype):
+    """
+      Serve the raw bytes of a process log.  Supports Range requests, and long-polling for appended
+      bytes with ?follow=1[&timeout=secs].
+    """
+    types = self._observer.logs(task_id, process, int(run))
+    if logtype not in types:
+      bottle.abort(404, "No such log type: %s" % logtype)
+    chroot, path = types[logtype]
+    return _serve_raw(os.path.join(chroot, path), *self._raw_request())
+
   @HttpServer.route("/file/:task_id/:path#.+#")
   @HttpServer.mako_view(HttpTemplate.load('filebrowse'))
   def handle_file(self, task_id, path):
@@ -120,6 +315,18 @@ class TaskObserverFileBrowser(object):
       return {}
     return _read_chunk(os.path.join(chroot, path), offset, length)
 
+  @HttpServer.route("/fileraw/:task_id/:path#.+#", timeout=MAX_FOLLOW_TIMEOUT + 10,
+                    pool=LONG_POLL_POOL)
+  def handle_fileraw(self, task_id, path):
+    """
+      Serve the raw bytes of a file in the sandbox.  Supports Range requests, and long-polling for
+      appended bytes with ?follow=1[&timeout=secs].
+    """
+    chroot, path = self._observer.valid_file(task_id, path)
+    if chroot is None or path is None:
+      bottle.abort(404, "No such file")
+    return _serve_raw(os.path.join(chroot, path), *self._raw_request())
+
   @HttpServer.route("/browse/:task_id")
   @HttpServer.route("/browse/:task_id/:path#.*#")
   @HttpServer.mako_view(HttpTemplate.load('filelist'))
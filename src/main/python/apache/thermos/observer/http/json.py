@@ -12,7 +12,7 @@
 # limitations under the License.
 #
 
-import urllib
+from urllib.parse import unquote
 
 from twitter.common.http import HttpServer
 
@@ -44,7 +44,7 @@ class TaskObserverJSONBindings(object):
     """
     task_ids = HttpServer.Request.GET.get('task_id', [])
     if task_ids:
-      task_ids = urllib.unquote(task_ids).split(',')
+      task_ids = unquote(task_ids).split(',')
     return self._observer.tasks(task_ids)
 
   @HttpServer.route("/j/task/:task_id")
@@ -65,5 +65,41 @@ class TaskObserverJSONBindings(object):
     """
     task_ids = HttpServer.Request.GET.get('task_id', [])
     if task_ids:
-      task_ids = urllib.unquote(task_ids).split(',')
+      task_ids = unquote(task_ids).split(',')
     return self._observer.processes(task_ids)
+
+  @HttpServer.route("/j/task_rows", method=['GET', 'POST'])
+  def handle_json_task_rows(self):
+    """
+      Additional parameters:
+        task_id = comma separated list of task_ids [default: all task_ids of the given type]
+        type = (all|active|finished) if task_id is unspecified [default: all]
+        fields = comma separated list of row fields [default: the fields of /j/task_ids rows]
+
+      Supports conditional requests: the response carries an ETag which changes when any of the
+      requested tasks' checkpoints (or, if requested, resource samples) advance.
+    """
+    params = HttpServer.Request.params
+    task_ids = params.get('task_id')
+    if task_ids:
+      task_ids = [task_id for task_id in unquote(task_ids).split(',') if task_id]
+    else:
+      which = params.get('type', 'all')
+      if which not in ('all', 'active', 'finished'):
+        HttpServer.abort(400, 'Invalid task type: %s' % which)
+      task_ids = self._observer.task_ids(which)
+    fields = params.get('fields')
+    if fields:
+      fields = [field for field in unquote(fields).split(',') if field]
+    try:
+      etag, rows = self._observer.task_rows(
+          task_ids,
+          fields=fields or None,
+          if_none_match=HttpServer.Request.headers.get('If-None-Match'))
+    except ValueError as e:
+      HttpServer.abort(400, str(e))
+    HttpServer.Response.set_header('ETag', etag)
+    if rows is None:
+      HttpServer.Response.status = 304
+      return ''
+    return dict(tasks=rows)
@@ -12,7 +12,6 @@
 # limitations under the License.
 #
 
-import copy
 import os
 from abc import abstractproperty
 
@@ -107,7 +106,8 @@ class ObservedTask(AbstractClass):
 
   @abstractproperty
   def state(self):
-    """Return state of task (gen.apache.thermos.ttypes.RunnerState)"""
+    """Return state of task (gen.apache.thermos.ttypes.RunnerState).  The returned state may be
+    shared with other callers and must not be modified."""
 
 
 class ActiveObservedTask(ObservedTask):
@@ -151,8 +151,11 @@ class FinishedObservedTask(ObservedTask):
 
   @property
   def state(self):
-    """Return final state of Task (RunnerState, read from disk and cached for future access)"""
+    """Return final state of Task (RunnerState, read from disk and cached for future access).
+
+    The cached RunnerState is shared by all callers and must be treated as read-only.
+    """
     if self._state is None:
       path = self._pathspec.getpath('runner_checkpoint')
       self._state = CheckpointDispatcher.from_file(path)
-    return copy.deepcopy(self._state) if self._state else RunnerState(processes={})
+    return self._state if self._state else RunnerState(processes={})
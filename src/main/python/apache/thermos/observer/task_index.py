@@ -0,0 +1,213 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Indexes used by the observer to list tasks cheaply
+
+Summarizing a finished task requires replaying its entire runner checkpoint and parsing its task
+JSON.  Since neither changes once a task has finished, the observer records a small summary of each
+finished task in an index file stored alongside the tasks in every checkpoint root, so that after a
+restart finished tasks can be listed without replaying their checkpoints.
+
+The TaskListIndex keeps observed task ids in listing order so that pages of the task listing do not
+require sorting every observed task.
+"""
+
+import bisect
+import json
+import os
+import tempfile
+import threading
+
+from twitter.common import log
+
+
+class TaskSummary(dict):
+  """The summary of a finished task, as rendered in task listings.
+
+    {
+      name: string,
+      user: string,
+      launch_timestamp: seconds,
+      state: string,
+      state_timestamp: seconds,
+      ports: { name1: port1, ... },
+      processes: { waiting: [], running: [], success: [], failed: [], killed: [] }
+    }
+  """
+
+  FIELDS = ('name', 'user', 'launch_timestamp', 'state', 'state_timestamp', 'ports', 'processes')
+
+  @classmethod
+  def from_task(cls, task):
+    """Build a summary from the TaskObserver._task() representation of a task."""
+    return cls((field, task[field]) for field in cls.FIELDS)
+
+  @property
+  def process_counts(self):
+    return dict((state, len(names)) for state, names in self['processes'].items())
+
+
+class RootTaskIndex(object):
+  """The index of finished task summaries for a single checkpoint root."""
+
+  FILENAME = 'finished_tasks.json'
+  VERSION = 1
+
+  def __init__(self, root):
+    self._path = os.path.join(root, self.FILENAME)
+    self._summaries = None
+    self._dirty = False
+
+  @property
+  def path(self):
+    return self._path
+
+  def _load(self):
+    if self._summaries is not None:
+      return self._summaries
+    self._summaries = {}
+    try:
+      with open(self._path) as fp:
+        content = json.load(fp)
+      if content.get('version') == self.VERSION:
+        self._summaries = dict(
+            (task_id, TaskSummary(summary)) for task_id, summary in content['tasks'].items())
+    except (IOError, OSError):
+      pass
+    except (ValueError, KeyError, AttributeError) as e:
+      log.warning('Ignoring corrupt task index %s: %s', self._path, e)
+    return self._summaries
+
+  def get(self, task_id):
+    return self._load().get(task_id)
+
+  def put(self, task_id, summary):
+    self._load()[task_id] = summary
+    self._dirty = True
+
+  def remove(self, task_id):
+    if self._load().pop(task_id, None) is not None:
+      self._dirty = True
+
+  def __len__(self):
+    return len(self._load())
+
+  def flush(self):
+    """Atomically rewrite the index file if it has changed.  Returns False if it could not be
+    written (e.g. the observer does not have write access to the checkpoint root)."""
+    if not self._dirty:
+      return True
+    root = os.path.dirname(self._path)
+    if not self._summaries:
+      try:
+        os.unlink(self._path)
+      except OSError:
+        pass
+      self._dirty = False
+      return True
+    try:
+      fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % self.FILENAME, dir=root)
+      try:
+        with os.fdopen(fd, 'w') as fp:
+          json.dump(dict(version=self.VERSION, tasks=self._summaries), fp)
+        os.rename(tmp_path, self._path)
+      except Exception:
+        os.unlink(tmp_path)
+        raise
+    except (IOError, OSError) as e:
+      log.debug('Unable to write task index %s: %s', self._path, e)
+      return False
+    self._dirty = False
+    return True
+
+
+class FinishedTaskIndex(object):
+  """Finished task summaries across all checkpoint roots, loaded lazily per root."""
+
+  def __init__(self):
+    self._roots = {}
+    self._lock = threading.Lock()
+
+  def _root_index(self, root):
+    index = self._roots.get(root)
+    if index is None:
+      index = self._roots[root] = RootTaskIndex(root)
+    return index
+
+  def get(self, root, task_id):
+    with self._lock:
+      return self._root_index(root).get(task_id)
+
+  def put(self, root, task_id, summary):
+    with self._lock:
+      self._root_index(root).put(task_id, TaskSummary(summary))
+
+  def remove(self, root, task_id):
+    with self._lock:
+      index = self._root_index(root)
+      index.remove(task_id)
+      if not len(index):
+        index.flush()
+        self._roots.pop(root, None)
+
+  def flush(self):
+    with self._lock:
+      for index in self._roots.values():
+        index.flush()
+
+
+class TaskListIndex(object):
+  """Observed task ids ordered by descending mtime, maintained incrementally per task type so that
+  a page of the task listing can be sliced out without sorting every observed task."""
+
+  TYPES = ('active', 'finished', 'all')
+
+  def __init__(self):
+    self._keys = dict((type, []) for type in self.TYPES)  # type => sorted [(-mtime, task_id)]
+    self._entries = {}  # task_id => (type, key)
+
+  def add(self, task_id, type, mtime):
+    """Add or move task_id to the given type ('active' or 'finished')."""
+    self.remove(task_id)
+    key = (-(mtime or 0), task_id)
+    for keys in (self._keys[type], self._keys['all']):
+      bisect.insort(keys, key)
+    self._entries[task_id] = (type, key)
+
+  def remove(self, task_id):
+    entry = self._entries.pop(task_id, None)
+    if entry is None:
+      return
+    type, key = entry
+    for keys in (self._keys[type], self._keys['all']):
+      index = bisect.bisect_left(keys, key)
+      if index < len(keys) and keys[index] == key:
+        del keys[index]
+
+  def __contains__(self, task_id):
+    return task_id in self._entries
+
+  def copy(self):
+    other = TaskListIndex()
+    other._keys = dict((type, list(keys)) for type, keys in self._keys.items())
+    other._entries = dict(self._entries)
+    return other
+
+  def count(self, type):
+    return len(self._keys[type])
+
+  def slice(self, type, offset, num):
+    """Return up to num task ids of the given type, most recently modified first, starting at
+    offset."""
+    return [task_id for _, task_id in self._keys[type][offset:offset + num]]
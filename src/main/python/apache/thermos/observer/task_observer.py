@@ -18,17 +18,23 @@ This module provides a number of classes for exposing information about running
 finished Thermos tasks on a system. The primary entry point is the TaskObserver, a thread which
 polls a designated Thermos checkpoint root and collates information about all tasks it discovers.
 
+The set of observed tasks is published as an immutable ObserverState which the refresh thread
+replaces wholesale whenever tasks come and go, so that readers (i.e. the HTTP observer) never wait
+on a checkpoint refresh in progress.
+
 """
+import hashlib
 import os
 import threading
 import time
-from operator import attrgetter
 
 from twitter.common import log
 from twitter.common.exceptions import ExceptionalThread
 from twitter.common.lang import Lockable
+from twitter.common.metrics import LambdaGauge, Observable
 from twitter.common.quantity import Amount, Time
 
+from apache.thermos.common.inotify import Inotify
 from apache.thermos.common.path import TaskPath
 from apache.thermos.monitoring.disk import DiskCollectorSettings
 from apache.thermos.monitoring.monitor import TaskMonitor
@@ -36,20 +42,49 @@ from apache.thermos.monitoring.process import ProcessSample
 from apache.thermos.monitoring.resource import (
   DiskCollectorProvider,
   NullTaskResourceMonitor,
+  SharedResourceSampler,
+  SharedTaskResourceMonitor,
   TaskResourceMonitor
 )
-from .detector import ObserverTaskDetector
+from .detector import InotifyObserverTaskDetector, ObserverTaskDetector
 from .observed_task import ActiveObservedTask, FinishedObservedTask
+from .task_index import FinishedTaskIndex, TaskListIndex, TaskSummary
 
 from gen.apache.thermos.ttypes import ProcessState, TaskState
 
 
-class TaskObserver(ExceptionalThread, Lockable):
+class ObserverState(object):
+  """
+    An immutable snapshot of the tasks known to the TaskObserver.  The refresh
+    thread never modifies a published ObserverState, it copies it and publishes
+    the copy once the refresh is complete.
+  """
+
+  def __init__(self, active_tasks=None, finished_tasks=None, task_list=None):
+    self.active_tasks = active_tasks if active_tasks is not None else {}
+    self.finished_tasks = finished_tasks if finished_tasks is not None else {}
+    self.task_list = task_list if task_list is not None else TaskListIndex()
+
+  def copy(self):
+    return ObserverState(dict(self.active_tasks), dict(self.finished_tasks), self.task_list.copy())
+
+  def get(self, task_id):
+    """Return the ObservedTask for task_id, or None if unknown."""
+    observed_task = self.finished_tasks.get(task_id)
+    if observed_task is None:
+      observed_task = self.active_tasks.get(task_id)
+    return observed_task
+
+
+class TaskObserver(ExceptionalThread, Lockable, Observable):
   """
     The TaskObserver monitors the thermos checkpoint root for active/finished
     tasks.  It is used to be the oracle of the state of all thermos tasks on
     a machine.
 
+    Only the refresh thread takes the observer lock.  All other methods read
+    the most recently published ObserverState and do not block on refreshes.
+
     It currently returns JSON, but really should just return objects.  We should
     then build an object->json translator.
   """
@@ -58,6 +93,21 @@ class TaskObserver(ExceptionalThread, Lockable):
 
   POLLING_INTERVAL = Amount(5, Time.SECONDS)
 
+  # Row field => TaskSummary field, for the task rows returned by main() and task_rows().
+  SUMMARY_ROW_FIELDS = {
+    'name': 'name',
+    'role': 'user',
+    'launch_timestamp': 'launch_timestamp',
+    'state': 'state',
+    'state_timestamp': 'state_timestamp',
+    'ports': 'ports',
+    'processes': 'processes',
+  }
+  RESOURCE_ROW_FIELDS = tuple(sorted(ProcessSample.empty().to_dict())) + ('disk',)
+  ROW_FIELDS = frozenset(SUMMARY_ROW_FIELDS) | frozenset(RESOURCE_ROW_FIELDS)
+  DEFAULT_ROW_FIELDS = (
+    'name', 'role', 'launch_timestamp', 'state', 'state_timestamp', 'ports') + RESOURCE_ROW_FIELDS
+
   def __init__(
       self,
       path_detector,
@@ -66,35 +116,79 @@ class TaskObserver(ExceptionalThread, Lockable):
       disable_task_resource_collection=False,
       enable_mesos_disk_collector=False,
       disk_collector_settings=DiskCollectorSettings(),
-      scheduler_web_url='http://localhost:28080'):
-
-    self._detector = ObserverTaskDetector(
-        path_detector,
-        self.__on_active,
-        self.__on_finished,
-        self.__on_removed)
+      scheduler_web_url='http://localhost:28080',
+      enable_inotify_detector=False,
+      detector_reconciliation_interval=InotifyObserverTaskDetector.RECONCILIATION_INTERVAL,
+      enable_shared_resource_sampler=True,
+      enable_incremental_disk_collector=False):
+
+    if enable_inotify_detector and not Inotify.is_supported():
+      log.warning('inotify is not supported on this platform, falling back to polling.')
+      enable_inotify_detector = False
+
+    self._detector = None
+    if enable_inotify_detector:
+      try:
+        self._detector = InotifyObserverTaskDetector(
+            path_detector,
+            self.__on_active,
+            self.__on_finished,
+            self.__on_removed,
+            path_refresh_interval=interval,
+            reconciliation_interval=detector_reconciliation_interval)
+      except (Inotify.Error, OSError) as e:
+        # e.g. EMFILE once fs.inotify.max_user_instances is reached.
+        log.warning('Unable to create an inotify detector (%s), falling back to polling.', e)
+    if self._detector is None:
+      self._detector = ObserverTaskDetector(
+          path_detector,
+          self.__on_active,
+          self.__on_finished,
+          self.__on_removed)
     self._interval = interval
     self._task_process_collection_interval = task_process_collection_interval
     self._enable_mesos_disk_collector = enable_mesos_disk_collector
+    self._enable_incremental_disk_collector = enable_incremental_disk_collector
     self._disable_task_resource_collection = disable_task_resource_collection
     self._disk_collector_settings = disk_collector_settings
+    self._resource_sampler = None
+    if (enable_shared_resource_sampler and not disable_task_resource_collection and
+        SharedResourceSampler.is_supported()):
+      self._resource_sampler = SharedResourceSampler(task_process_collection_interval)
     self._scheduler_web_url = scheduler_web_url
-    self._active_tasks = {}    # task_id => ActiveObservedTask
-    self._finished_tasks = {}  # task_id => FinishedObservedTask
+    self._state = ObserverState()
+    self._pending_state = None  # copy of self._state being modified by the refresh thread
+    self._task_index = FinishedTaskIndex()
+    # task_id => (TaskMonitor version, task row without resources).  Filled in by HTTP threads
+    # and pruned by the refresh thread, so only accessed with _row_cache_lock held.
+    self._row_cache = {}
+    self._row_cache_lock = threading.Lock()
     self._stop_event = threading.Event()
+    self._refreshes = 0
+    self._refresh_latency = 0.0
+    self._lock_wait = 0.0
+    self._last_refresh = None
     ExceptionalThread.__init__(self)
     Lockable.__init__(self)
     self.daemon = True
+    self.metrics.register(LambdaGauge('refreshes', lambda: self._refreshes))
+    self.metrics.register(LambdaGauge('refresh_latency_secs', lambda: self._refresh_latency))
+    self.metrics.register(LambdaGauge('refresh_lock_wait_secs', lambda: self._lock_wait))
+    self.metrics.register(LambdaGauge('last_refresh_age_secs', self._last_refresh_age))
+    self.metrics.register(LambdaGauge('resource_collections',
+        lambda: sum(cost.collections for cost in self._collection_costs())))
+    self.metrics.register(LambdaGauge('resource_collection_secs',
+        lambda: sum(cost.seconds for cost in self._collection_costs())))
 
   @property
   def active_tasks(self):
     """Return a dictionary of active Tasks"""
-    return self._active_tasks
+    return self._state.active_tasks
 
   @property
   def finished_tasks(self):
     """Return a dictionary of finished Tasks"""
-    return self._finished_tasks
+    return self._state.finished_tasks
 
   @property
   def all_tasks(self):
@@ -103,17 +197,56 @@ class TaskObserver(ExceptionalThread, Lockable):
     res.update(self.finished_tasks)
     return res
 
+  def _observed_task(self, task_id, observer_state=None):
+    """Return the ObservedTask for task_id without copying all_tasks, or None if unknown.  Reads
+    the published ObserverState unless given another."""
+    return (observer_state or self._state).get(task_id)
+
+  def _last_refresh_age(self):
+    return time.time() - self._last_refresh if self._last_refresh else 0
+
+  def _collection_costs(self):
+    """The CollectionCosts of the resource monitors of the active tasks."""
+    return [task.resource_monitor.collection_cost for task in list(self.active_tasks.values())]
+
+  def _writable_state(self):
+    """Return the unpublished ObserverState that detector callbacks should modify."""
+    if self._pending_state is None:
+      self._pending_state = self._state.copy()
+    return self._pending_state
+
+  def _publish_state(self):
+    """Make the changes made by detector callbacks visible to readers."""
+    if self._pending_state is None:
+      return
+    self._state, self._pending_state = self._pending_state, None
+    with self._row_cache_lock:
+      for task_id in list(self._row_cache):
+        if task_id not in self._state.active_tasks:
+          self._row_cache.pop(task_id)
+
   def stop(self):
     self._stop_event.set()
+    self._detector.wakeup()
+    if self._resource_sampler:
+      self._resource_sampler.kill()
 
   def start(self):
+    if self._resource_sampler:
+      self._resource_sampler.start()
     ExceptionalThread.start(self)
 
   def __on_active(self, root, task_id):
     log.debug('on_active(%r, %r)', root, task_id)
-    if task_id in self.finished_tasks:
+    state = self._writable_state()
+    if task_id in state.finished_tasks:
       log.error('Found an active task (%s) in finished tasks?', task_id)
       return
+    if os.path.exists(TaskPath(root=root, task_id=task_id, state='finished').getpath('task_path')):
+      # The task was discovered after it finished (e.g. on observer startup) and on_finished will
+      # follow immediately, so skip replaying its checkpoint and starting resource collection.
+      log.debug('Task %s is already finished, not monitoring it.', task_id)
+      return
     task_monitor = TaskMonitor(root, task_id)
 
     if self._disable_task_resource_collection:
@@ -122,59 +255,115 @@ class TaskObserver(ExceptionalThread, Lockable):
     else:
       disk_collector_provider = DiskCollectorProvider(
         self._enable_mesos_disk_collector,
-        self._disk_collector_settings)
-
-      resource_monitor = TaskResourceMonitor(
-          task_id,
-          task_monitor,
-          disk_collector_provider=disk_collector_provider,
-          process_collection_interval=self._task_process_collection_interval,
-          disk_collection_interval=self._disk_collector_settings.disk_collection_interval)
+        self._disk_collector_settings,
+        enable_incremental_disk_collector=self._enable_incremental_disk_collector)
+
+      if self._resource_sampler:
+        resource_monitor = SharedTaskResourceMonitor(
+            task_id,
+            task_monitor,
+            self._resource_sampler,
+            disk_collector_provider=disk_collector_provider,
+            disk_collection_interval=self._disk_collector_settings.disk_collection_interval)
+      else:
+        resource_monitor = TaskResourceMonitor(
+            task_id,
+            task_monitor,
+            disk_collector_provider=disk_collector_provider,
+            process_collection_interval=self._task_process_collection_interval,
+            disk_collection_interval=self._disk_collector_settings.disk_collection_interval)
 
     resource_monitor.start()
-    self._active_tasks[task_id] = ActiveObservedTask(
+    active_task = state.active_tasks[task_id] = ActiveObservedTask(
         root,
         task_id,
         task_monitor,
         resource_monitor)
+    state.task_list.add(task_id, 'active', active_task.mtime)
 
   def __on_finished(self, root, task_id):
     log.debug('on_finished(%r, %r)', root, task_id)
-    active_task = self._active_tasks.pop(task_id, None)
+    state = self._writable_state()
+    if task_id in state.active_tasks:
+      # The active TaskMonitor has already replayed the checkpoint, so index the task now.
+      self._index_finished_task(root, task_id, state)
+    active_task = state.active_tasks.pop(task_id, None)
     if active_task:
       active_task.resource_monitor.kill()
-    self._finished_tasks[task_id] = FinishedObservedTask(root, task_id)
+    finished_task = state.finished_tasks[task_id] = FinishedObservedTask(root, task_id)
+    state.task_list.add(task_id, 'finished', finished_task.mtime)
 
   def __on_removed(self, root, task_id):
     log.debug('on_removed(%r, %r)', root, task_id)
-    active_task = self._active_tasks.pop(task_id, None)
+    state = self._writable_state()
+    active_task = state.active_tasks.pop(task_id, None)
     if active_task:
       active_task.resource_monitor.kill()
-    self._finished_tasks.pop(task_id, None)
+    state.finished_tasks.pop(task_id, None)
+    state.task_list.remove(task_id)
+    self._task_index.remove(root, task_id)
+
+  def _index_finished_task(self, root, task_id, observer_state=None):
+    """Record the summary of a finished task in the task index, returning it."""
+    try:
+      task = self._task(task_id, observer_state)
+    except Exception as e:
+      log.warning('Unable to summarize task %s: %s', task_id, e)
+      return None
+    if not task:
+      return None
+    summary = TaskSummary.from_task(task)
+    self._task_index.put(root, task_id, summary)
+    return summary
+
+  def _finished_task_summary(self, observed_task):
+    summary = self._task_index.get(observed_task.root, observed_task.task_id)
+    if summary is None:
+      summary = self._index_finished_task(observed_task.root, observed_task.task_id)
+    return summary
 
   def run(self):
     """
       The internal thread for the observer.  This periodically polls the
       checkpoint root for new tasks, or transitions of tasks from active to
-      finished state.
+      finished state.  With an event-driven detector, refreshes also happen
+      as soon as the detector observes filesystem changes.
     """
-    while not self._stop_event.is_set():
-      self._stop_event.wait(self._interval.as_(Time.SECONDS))
-      with self.lock:
-        start = time.time()
+    try:
+      while not self._stop_event.is_set():
+        self._detector.wait(self._interval.as_(Time.SECONDS))
+        if self._stop_event.is_set():
+          break
+        self._refresh()
+        self._task_index.flush()
+    finally:
+      self._detector.close()
+
+  def _refresh(self):
+    """Refresh the detector and publish the resulting ObserverState."""
+    start = time.time()
+    with self.lock:
+      acquired = time.time()
+      try:
         self._detector.refresh()
-        log.debug("TaskObserver: finished checkpoint refresh in %.2fs", time.time() - start)
+      finally:
+        self._publish_state()
+    finish = time.time()
+    self._refreshes += 1
+    self._lock_wait += acquired - start
+    self._refresh_latency += finish - acquired
+    self._last_refresh = finish
+    log.debug("TaskObserver: finished checkpoint refresh in %.2fs", finish - acquired)
 
-  @Lockable.sync
   def process_from_name(self, task_id, process_id):
-    if task_id in self.all_tasks:
-      task = self.all_tasks[task_id].task
+    observed_task = self._observed_task(task_id)
+    if observed_task:
+      task = observed_task.task
       if task:
         for process in task.processes():
           if process.name().get() == process_id:
             return process
 
-  @Lockable.sync
   def task_count(self):
     """
       Return the count of tasks that could be ready properly from disk.
@@ -183,31 +372,15 @@ class TaskObserver(ExceptionalThread, Lockable):
     return dict(
       active=len(self.active_tasks),
       finished=len(self.finished_tasks),
-      all=len(self.all_tasks),
+      all=len(self.active_tasks) + len(self.finished_tasks),
     )
 
-  @Lockable.sync
   def task_id_count(self):
     """Return the raw count of active and finished task_ids."""
     num_active = len(self._detector.active_tasks)
     num_finished = len(self._detector.finished_tasks)
     return dict(active=num_active, finished=num_finished, all=num_active + num_finished)
 
-  def _get_tasks_of_type(self, type):
-    """Convenience function to return all tasks of a given type"""
-    tasks = {
-      'active': self.active_tasks,
-      'finished': self.finished_tasks,
-      'all': self.all_tasks,
-    }.get(type, None)
-
-    if tasks is None:
-      log.error('Unknown task type %s', type)
-      return {}
-
-    return tasks
-
-  @Lockable.sync
   def state(self, task_id):
     """Return a dict containing mapped information about a task's state"""
     real_state = self.raw_state(task_id)
@@ -222,27 +395,26 @@ class TaskObserver(ExceptionalThread, Lockable):
         user=real_state.header.user
       )
 
-  @Lockable.sync
-  def raw_state(self, task_id):
+  def raw_state(self, task_id, observer_state=None):
     """
       Return the current runner state (thrift blob: gen.apache.thermos.ttypes.RunnerState)
-      of a given task id
+      of a given task id.  The returned state is shared and must not be modified.
     """
-    if task_id not in self.all_tasks:
+    observed_task = self._observed_task(task_id, observer_state)
+    if observed_task is None:
       return None
-    return self.all_tasks[task_id].state
+    return observed_task.state
 
-  @Lockable.sync
-  def _task_processes(self, task_id):
+  def _task_processes(self, task_id, observer_state=None):
     """
       Return the processes of a task given its task_id.
 
       Returns a map from state to processes in that state, where possible
       states are: waiting, running, success, failed.
     """
-    if task_id not in self.all_tasks:
+    if self._observed_task(task_id, observer_state) is None:
       return {}
-    state = self.raw_state(task_id)
+    state = self.raw_state(task_id, observer_state)
     if state is None or state.header is None:
       return {}
 
@@ -269,7 +441,6 @@ class TaskObserver(ExceptionalThread, Lockable):
 
     return dict(waiting=waiting, running=running, success=success, failed=failed, killed=killed)
 
-  @Lockable.sync
   def main(self, type=None, offset=None, num=None):
     """Return a set of information about tasks, optionally filtered
 
@@ -294,54 +465,138 @@ class TaskObserver(ExceptionalThread, Lockable):
     type = type or 'all'
     offset = offset or 0
     num = num or 20
+    state = self._state
 
-    # Get a list of all ObservedTasks of requested type
-    tasks = sorted((task for task in self._get_tasks_of_type(type).values()),
-                   key=attrgetter('mtime'), reverse=True)
-
-    # Filter by requested offset + number of results
-    end = num
-    if offset < 0:
-      offset = offset % len(tasks) if len(tasks) > abs(offset) else 0
-    end += offset
-    tasks = tasks[offset:end]
-
-    def task_row(observed_task):
-      """Generate an output row for a Task"""
-      task = self._task(observed_task.task_id)
-      # tasks include those which could not be found properly and are hence empty {}
-      if task:
-        return dict(
-            task_id=observed_task.task_id,
-            name=task['name'],
-            role=task['user'],
-            launch_timestamp=task['launch_timestamp'],
-            state=task['state'],
-            state_timestamp=task['state_timestamp'],
-            ports=task['ports'],
-            **task['resource_consumption'])
+    if type not in TaskListIndex.TYPES:
+      log.error('Unknown task type %s', type)
+      task_ids, task_count = [], 0
+    else:
+      # Filter by requested offset + number of results
+      task_count = state.task_list.count(type)
+      if offset < 0:
+        offset = offset % task_count if task_count > abs(offset) else 0
+      task_ids = state.task_list.slice(type, offset, num)
 
     return dict(
-      tasks=filter(None, map(task_row, tasks)),
+      tasks=[row for row in (self._task_row(state, task_id) for task_id in task_ids) if row],
       type=type,
       offset=offset,
       num=num,
-      task_count=self.task_count()[type],
+      task_count=task_count,
       scheduler_web_url=self._scheduler_web_url,
     )
 
-  def _sample(self, task_id):
-    if task_id not in self.active_tasks:
+  def task_ids(self, type='all'):
+    """Return the task_ids of the given type (all|active|finished), most recently modified first."""
+    task_list = self._state.task_list
+    return task_list.slice(type, 0, task_list.count(type))
+
+  def task_rows(self, task_ids, fields=None, if_none_match=None):
+    """Return rows for many tasks at once, restricted to the requested fields.
+
+      Args:
+        task_ids = iterable of task_ids; unknown task_ids are omitted from the result
+        fields = iterable of row fields (see ROW_FIELDS) [default: the fields of main()]
+        if_none_match = the If-None-Match header of a conditional request, i.e. etags previously
+                        returned by task_rows
+
+      Rows are built from the task summaries rather than the full task, so this is much cheaper
+      than tasks() for large numbers of tasks.  Resources are only sampled if a resource field is
+      requested.
+
+      Returns (etag, rows), where rows is None if etag matches if_none_match and otherwise
+        {
+          task_id1: { task_id: task_id1, field1: value1, ... },
+          ...
+        }
+    """
+    fields = self.DEFAULT_ROW_FIELDS if fields is None else tuple(fields)
+    unknown = set(fields) - self.ROW_FIELDS
+    if unknown:
+      raise ValueError('Unknown task row fields: %s' % ', '.join(sorted(unknown)))
+    state = self._state
+    etag = self._task_rows_etag(state, task_ids, fields)
+    if if_none_match and etag in [tag.strip() for tag in if_none_match.split(',')]:
+      return etag, None
+    rows = {}
+    for task_id in task_ids:
+      row = self._task_row(state, task_id, fields)
+      if row:
+        rows[task_id] = row
+    return etag, rows
+
+  def _task_rows_etag(self, state, task_ids, fields):
+    """Compute an etag for task_rows, keyed on how far each task's checkpoint has been read (and
+    on the time of each task's latest resource sample, if resources were requested)."""
+    with_resources = any(field in self.RESOURCE_ROW_FIELDS for field in fields)
+    versions = []
+    for task_id in task_ids:
+      observed_task = state.get(task_id)
+      if observed_task is None:
+        versions.append((task_id, None))
+      elif task_id in state.finished_tasks:
+        versions.append((task_id, 'finished', observed_task.mtime))
+      else:
+        observed_task.task_monitor.refresh()
+        task_monitor = observed_task.task_monitor
+        version = (task_id, 'active', task_monitor.version, task_monitor.ckpt_head)
+        if with_resources:
+          version += (observed_task.resource_monitor.sample()[0],)
+        versions.append(version)
+    digest = hashlib.sha1(repr((sorted(fields), versions)).encode('utf-8')).hexdigest()
+    return '"%s"' % digest
+
+  def _task_row(self, state, task_id, fields=DEFAULT_ROW_FIELDS):
+    """Generate an output row for a Task, or None if it could not be found properly"""
+    observed_task = state.get(task_id)
+    if observed_task is None:
+      return None
+    if task_id in state.finished_tasks:
+      # Finished tasks are listed from their indexed summary rather than their checkpoint.
+      summary = self._finished_task_summary(observed_task)
+    else:
+      summary = self._active_task_summary(observed_task)
+    if not summary:
+      return None
+    row = dict(task_id=task_id)
+    for field in fields:
+      if field in self.SUMMARY_ROW_FIELDS:
+        row[field] = summary[self.SUMMARY_ROW_FIELDS[field]]
+    if any(field in self.RESOURCE_ROW_FIELDS for field in fields):
+      sample = self._sample(task_id)
+      row.update((field, sample[field]) for field in fields if field in sample)
+    return row
+
+  def _active_task_summary(self, observed_task):
+    """Return the TaskSummary of an active task, cached until its checkpoint advances."""
+    task_monitor = observed_task.task_monitor
+    task_monitor.refresh()
+    version = task_monitor.version
+    with self._row_cache_lock:
+      cached = self._row_cache.get(observed_task.task_id)
+    if cached is not None and cached[0] == version:
+      return cached[1]
+    task = self._task(observed_task.task_id)
+    summary = TaskSummary.from_task(task) if task else None
+    if summary is not None:
+      with self._row_cache_lock:
+        # Do not resurrect the row of a task pruned by a refresh published in the meantime.
+        if observed_task.task_id in self._state.active_tasks:
+          self._row_cache[observed_task.task_id] = (version, summary)
+    return summary
+
+  def _sample(self, task_id, observer_state=None):
+    active_task = (observer_state or self._state).active_tasks.get(task_id)
+    if active_task is None:
       sample = ProcessSample.empty().to_dict()
       sample['disk'] = 0
     else:
-      resource_sample = self.active_tasks[task_id].resource_monitor.sample()[1]
+      resource_sample = active_task.resource_monitor.sample()[1]
       sample = resource_sample.process_sample.to_dict()
       sample['disk'] = resource_sample.disk_usage
       log.debug("Got sample for task %s: %s", task_id, sample)
     return sample
 
-  @Lockable.sync
   def task_statuses(self, task_id):
     """
       Return the sequence of task states.
@@ -350,10 +605,7 @@ class TaskObserver(ExceptionalThread, Lockable):
     """
 
     # Unknown task_id.
-    if task_id not in self.all_tasks:
-      return []
-
-    task = self.all_tasks[task_id]
+    task = self._observed_task(task_id)
     if task is None:
       return []
 
@@ -366,7 +618,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       (TaskState._VALUES_TO_NAMES.get(st.state, 'UNKNOWN'), st.timestamp_ms / 1000)
       for st in state.statuses]
 
-  @Lockable.sync
   def tasks(self, task_ids):
     """
       Return information about an iterable of tasks [task_id1, task_id2, ...]
@@ -386,8 +637,7 @@ class TaskObserver(ExceptionalThread, Lockable):
       res[task_id] = d
     return res
 
-  @Lockable.sync
-  def _task(self, task_id):
+  def _task(self, task_id, observer_state=None):
     """
       Return composite information about a particular task task_id, given the below
       schema.
@@ -409,16 +659,17 @@ class TaskObserver(ExceptionalThread, Lockable):
       }
     """
     # Unknown task_id.
-    if task_id not in self.all_tasks:
+    observed_task = self._observed_task(task_id, observer_state)
+    if observed_task is None:
       return {}
 
-    task = self.all_tasks[task_id].task
+    task = observed_task.task
     if task is None:
       # TODO(wickman)  Can this happen?
       log.error('Could not find task: %s', task_id)
       return {}
 
-    state = self.raw_state(task_id)
+    state = self.raw_state(task_id, observer_state)
     if state is None or state.header is None:
       # TODO(wickman)  Can this happen?
       return {}
@@ -439,21 +690,20 @@ class TaskObserver(ExceptionalThread, Lockable):
        state=TaskState._VALUES_TO_NAMES[state.statuses[-1].state],
        state_timestamp=state_timestamp,
        user=state.header.user,
-       resource_consumption=self._sample(task_id),
+       resource_consumption=self._sample(task_id, observer_state),
        ports=state.header.ports,
-       processes=self._task_processes(task_id),
+       processes=self._task_processes(task_id, observer_state),
        task_struct=task,
     )
 
-  @Lockable.sync
   def _get_process_resource_consumption(self, task_id, process_name):
-    if task_id not in self.active_tasks:
+    active_task = self.active_tasks.get(task_id)
+    if active_task is None:
       return ProcessSample.empty().to_dict()
-    sample = self.active_tasks[task_id].resource_monitor.sample_by_process(process_name).to_dict()
+    sample = active_task.resource_monitor.sample_by_process(process_name).to_dict()
     log.debug('Resource consumption (%s, %s) => %s', task_id, process_name, sample)
     return sample
 
-  @Lockable.sync
   def _get_process_tuple(self, history, run):
     """
       Return the basic description of a process run if it exists, otherwise
@@ -488,7 +738,6 @@ class TaskObserver(ExceptionalThread, Lockable):
         d.update(return_code=process_run.return_code)
       return d
 
-  @Lockable.sync
   def process(self, task_id, process, run=None):
     """
       Returns a process run, where the schema is given below:
@@ -518,7 +767,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       tup.update(used=self._get_process_resource_consumption(task_id, process))
     return tup
 
-  @Lockable.sync
   def _processes(self, task_id):
     """
       Return
@@ -533,7 +781,7 @@ class TaskObserver(ExceptionalThread, Lockable):
       defined by process().
     """
 
-    if task_id not in self.all_tasks:
+    if self._observed_task(task_id) is None:
       return {}
     state = self.raw_state(task_id)
     if state is None or state.header is None:
@@ -546,7 +794,6 @@ class TaskObserver(ExceptionalThread, Lockable):
         d[process_name] = self.process(task_id, process_name)
     return d
 
-  @Lockable.sync
   def processes(self, task_ids):
     """
       Given a list of task_ids, returns a map of task_id => processes, where processes
@@ -556,7 +803,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       return {}
     return dict((task_id, self._processes(task_id)) for task_id in task_ids)
 
-  @Lockable.sync
   def get_run_number(self, runner_state, process, run=None):
     if runner_state is not None and runner_state.processes is not None:
       run = run if run is not None else -1
@@ -564,7 +810,6 @@ class TaskObserver(ExceptionalThread, Lockable):
         if len(runner_state.processes[process]) > 0:
           return run % len(runner_state.processes[process])
 
-  @Lockable.sync
   def logs(self, task_id, process, run=None):
     """
       Given a task_id and a process and (optional) run number, return a dict:
@@ -583,7 +828,7 @@ class TaskObserver(ExceptionalThread, Lockable):
     run = self.get_run_number(runner_state, process, run)
     if run is None:
       return {}
-    observed_task = self.all_tasks.get(task_id, None)
+    observed_task = self._observed_task(task_id)
     if not observed_task:
       return {}
 
@@ -614,7 +859,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       return (normalized_base, os.path.relpath(normalized, normalized_base))
     return (None, None)
 
-  @Lockable.sync
   def valid_file(self, task_id, path):
     """
       Like valid_path, but also verify the given path is a file
@@ -624,7 +868,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       return chroot, path
     return None, None
 
-  @Lockable.sync
   def valid_path(self, task_id, path):
     """
       Given a task_id and a path within that task_id's sandbox, verify:
@@ -644,7 +887,6 @@ class TaskObserver(ExceptionalThread, Lockable):
       return chroot, path
     return None, None
 
-  @Lockable.sync
   def files(self, task_id, path=None):
     """
       Returns dictionary
@@ -23,6 +23,7 @@ import traceback
 from twitter.common import app, log
 from twitter.common.log.options import LogOptions
 
+from apache.thermos.common.compression import LogCodec
 from apache.thermos.common.excepthook import ExceptionTerminationHandler
 from apache.thermos.common.options import add_port_to
 from apache.thermos.common.planner import TaskPlanner
@@ -162,6 +163,25 @@ app.add_option(
     help='Maximum number of rotated stdout/stderr logs emitted by the thermos runner.')
 
 
+app.add_option(
+    '--rotate_log_compression',
+    dest='rotate_log_compression',
+    choices=LogCodec.CODECS,
+    default=None,
+    help='Compress rotated stdout/stderr logs emitted by the thermos runner in the background with '
+         'this codec %r.  zstd falls back to gzip if it is unavailable.' % (LogCodec.CODECS,))
+
+
+app.add_option(
+    '--checkpoint_compaction_threshold_mb',
+    dest='checkpoint_compaction_threshold_mb',
+    type=int,
+    default=None,
+    help='Compact the runner checkpoint of a long-lived task into a snapshot of its state once the '
+         'checkpoint exceeds this size in MiB.  Compacted checkpoints cannot be read by older '
+         'observers and executors.  Disabled by default.')
+
+
 def get_task_from_options(opts):
   tasks = ThermosConfigLoader.load_json(opts.thermos_json)
   if len(tasks.tasks()) == 0:
@@ -231,9 +251,11 @@ def proxy_main(args, opts):
       process_logger_mode=opts.process_logger_mode,
       rotate_log_size_mb=opts.rotate_log_size_mb,
       rotate_log_backups=opts.rotate_log_backups,
+      rotate_log_compression=opts.rotate_log_compression,
       preserve_env=opts.preserve_env,
       mesos_containerizer_path=opts.mesos_containerizer_path,
-      container_sandbox=opts.container_sandbox)
+      container_sandbox=opts.container_sandbox,
+      checkpoint_compaction_size_mb=opts.checkpoint_compaction_threshold_mb)
 
   for sig in (signal.SIGUSR1, signal.SIGUSR2):
     signal.signal(sig, functools.partial(runner_teardown, task_runner))
@@ -16,3 +16,4 @@
 
 from .plugin import Plugin
 from .server import *
+from .serving import CallbackPool, GzipPlugin, PooledServer, RequestMetrics, RequestTimeout
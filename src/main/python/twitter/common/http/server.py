@@ -253,13 +253,14 @@ class HttpServer(object):
   def port(self):
     return self._port
 
-  def run(self, hostname, port, server='wsgiref'):
+  def run(self, hostname, port, server='wsgiref', **options):
     """
-      Start a webserver on hostname & port.
+      Start a webserver on hostname & port.  Additional options are passed to the server adapter,
+      e.g. the worker pool settings of twitter.common.http.serving.PooledServer.
     """
     self._hostname = hostname
     self._port = port
-    self._app.run(host=hostname, port=port, server=server)
+    self._app.run(host=hostname, port=port, server=server, **options)
 
   def __str__(self):
     return 'HttpServer(%s, mixins: %s)' % (
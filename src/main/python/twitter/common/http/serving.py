@@ -0,0 +1,264 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""
+  Production serving for HttpServer applications.
+
+  PooledServer is a Bottle server adapter with a tunable worker pool and connection queue, and the
+  plugins below bound the time spent on each request, compress JSON responses and export request
+  latencies as metrics:
+
+    server.plugins = [RequestMetrics(), GzipPlugin(), RequestTimeout(30)]
+    server.run('0.0.0.0', 8888, server=PooledServer, threads=16, max_queued=128)
+
+  Routes which wait on purpose (e.g. long-polls) should run on their own CallbackPool, so that they
+  cannot take every thread from the other routes:
+
+    RequestTimeout(30, threads=16, pools={'long_poll': CallbackPool(4, max_pending=4)})
+
+    @HttpServer.route('/tail', timeout=90, pool='long_poll')
+"""
+
+import bisect
+import gzip
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from functools import partial
+
+import bottle
+from twitter.common.metrics import LambdaGauge, Observable
+
+from .plugin import Plugin
+
+
+class PooledServer(bottle.ServerAdapter):
+  """
+    Serve using the CherryPy WSGI server with a fixed pool of worker threads.  HTTP/1.1
+    connections are kept alive between requests.
+
+    Options:
+      threads: the number of worker threads.
+      max_queued: the number of accepted connections which may wait for a free worker.  Once the
+                  queue is full, new connections are dropped rather than queued indefinitely.
+      queue_timeout: seconds to wait for room in a full queue before dropping a connection.
+      keepalive_timeout: seconds before an idle (kept-alive) connection is closed.
+      backlog: the listen(2) backlog of the server socket.
+  """
+
+  DEFAULT_THREADS = 10
+  DEFAULT_MAX_QUEUED = 100
+  DEFAULT_QUEUE_TIMEOUT = 1
+  DEFAULT_KEEPALIVE_TIMEOUT = 10
+  DEFAULT_BACKLOG = 64
+
+  def run(self, handler):
+    try:
+      from cheroot.wsgi import Server as WSGIServer
+    except ImportError:
+      # CherryPy < 9 bundles the server as cherrypy.wsgiserver.
+      from cherrypy.wsgiserver import CherryPyWSGIServer as WSGIServer
+
+    server = WSGIServer(
+        (self.host, self.port),
+        handler,
+        numthreads=self.options.get('threads', self.DEFAULT_THREADS),
+        request_queue_size=self.options.get('backlog', self.DEFAULT_BACKLOG),
+        timeout=self.options.get('keepalive_timeout', self.DEFAULT_KEEPALIVE_TIMEOUT),
+        accepted_queue_size=self.options.get('max_queued', self.DEFAULT_MAX_QUEUED),
+        accepted_queue_timeout=self.options.get('queue_timeout', self.DEFAULT_QUEUE_TIMEOUT))
+    try:
+      server.start()
+    finally:
+      server.stop()
+
+
+class CallbackPool(object):
+  """
+    A bounded pool of threads on which RequestTimeout runs route callbacks.  At most max_pending
+    callbacks (running or waiting for a thread, by default twice the number of threads) may be
+    outstanding at once.
+  """
+
+  def __init__(self, threads, max_pending=None):
+    self._executor = ThreadPoolExecutor(max_workers=threads)
+    self._max_pending = max_pending if max_pending is not None else 2 * threads
+    self._pending = 0
+    self._lock = threading.Lock()
+
+  @property
+  def pending(self):
+    return self._pending
+
+  def submit(self, fn, *args):
+    """Run fn(*args) on the pool, returning a Future, or None if the pool is saturated."""
+    with self._lock:
+      if self._pending >= self._max_pending:
+        return None
+      self._pending += 1
+    return self._executor.submit(self._run, fn, *args)
+
+  def _run(self, fn, *args):
+    try:
+      return fn(*args)
+    finally:
+      with self._lock:
+        self._pending -= 1
+
+  def shutdown(self):
+    self._executor.shutdown(wait=False)
+
+
+class RequestTimeout(Plugin):
+  """
+    Bound the time a server worker spends on a request.
+
+    Route callbacks run on a separate bounded CallbackPool.  If a callback does not complete
+    within the timeout of its route (the 'timeout' route option in seconds, or the default passed to
+    the plugin), the request fails with 503 and the server worker is released to serve other
+    requests.  Python cannot interrupt the callback itself, so it runs to completion in the
+    background; while the pool is saturated new requests fail with 503 immediately.
+
+      @HttpServer.route('/slow', timeout=120)
+
+    pools maps names to additional CallbackPools, selected by the 'pool' route option.  Routes
+    naming a pool which has not been configured run on the default pool.
+  """
+
+  name = 'request_timeout'
+
+  def __init__(self, timeout, threads=10, max_pending=None, pools=None):
+    self._timeout = timeout
+    self._pool = CallbackPool(threads, max_pending)
+    self._pools = dict(pools or {})
+
+  @staticmethod
+  def _call(environ, callback, args, kwargs):
+    bottle.request.bind(environ)
+    bottle.response.bind()
+    result = callback(*args, **kwargs)
+    return result, bottle.response.copy()
+
+  def apply(self, callback, route):
+    config = route.config if route is not None else {}
+    timeout = config.get('timeout', self._timeout)
+    if not timeout:
+      return callback
+    pool = self._pools.get(config.get('pool'), self._pool)
+
+    def wrap(*args, **kwargs):
+      future = pool.submit(self._call, bottle.request.environ, callback, args, kwargs)
+      if future is None:
+        raise bottle.HTTPError(503, 'Server is busy.')
+      try:
+        result, response = future.result(timeout)
+      except FutureTimeoutError:
+        raise bottle.HTTPError(503, 'Request timed out.')
+      # Carry over the status and headers set by the callback on its thread's response.
+      bottle.response.status = response.status_line
+      for name, value in response.headerlist:
+        bottle.response.add_header(name, value)
+      return result
+    return wrap
+
+  def close(self):
+    for pool in [self._pool] + list(self._pools.values()):
+      pool.shutdown()
+
+
+class GzipPlugin(Plugin):
+  """
+    Serialize dict results as JSON and gzip them for clients which accept gzip encoding.  Results
+    smaller than min_length bytes, and all other responses, are passed through unchanged.
+  """
+
+  name = 'gzip'
+
+  def __init__(self, min_length=1024, compresslevel=6, dumps=json.dumps):
+    self._min_length = min_length
+    self._compresslevel = compresslevel
+    self._dumps = dumps
+
+  def apply(self, callback, route):
+    def wrap(*args, **kwargs):
+      result = callback(*args, **kwargs)
+      if not isinstance(result, dict):
+        return result
+      if 'gzip' not in bottle.request.headers.get('Accept-Encoding', ''):
+        return result
+      body = self._dumps(result).encode('utf-8')
+      bottle.response.content_type = 'application/json'
+      bottle.response.set_header('Vary', 'Accept-Encoding')
+      if len(body) < self._min_length:
+        return body
+      bottle.response.set_header('Content-Encoding', 'gzip')
+      return gzip.compress(body, self._compresslevel)
+    return wrap
+
+
+class RequestMetrics(Plugin, Observable):
+  """
+    Export the number of requests served, the number of server errors, and a histogram of request
+    latencies.  latency_ms_le_N is the number of requests which completed within N milliseconds.
+  """
+
+  name = 'request_metrics'
+
+  LATENCY_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+  def __init__(self, clock=time):
+    self._clock = clock
+    self._lock = threading.Lock()
+    self._requests = 0
+    self._errors = 0
+    self._total_latency = 0.0
+    self._buckets = [0] * len(self.LATENCY_BUCKETS_MS)
+    self.metrics.register(LambdaGauge('requests', lambda: self._requests))
+    self.metrics.register(LambdaGauge('errors', lambda: self._errors))
+    self.metrics.register(LambdaGauge('total_latency_secs', lambda: self._total_latency))
+    for index, bound in enumerate(self.LATENCY_BUCKETS_MS):
+      self.metrics.register(LambdaGauge('latency_ms_le_%d' % bound, partial(self._bucket, index)))
+
+  def _bucket(self, index):
+    with self._lock:
+      return sum(self._buckets[:index + 1])
+
+  def record(self, latency, error=False):
+    index = bisect.bisect_left(self.LATENCY_BUCKETS_MS, latency * 1000.0)
+    with self._lock:
+      self._requests += 1
+      self._errors += int(error)
+      self._total_latency += latency
+      if index < len(self._buckets):
+        self._buckets[index] += 1
+
+  def apply(self, callback, route):
+    def wrap(*args, **kwargs):
+      start = self._clock.time()
+      error = True
+      try:
+        result = callback(*args, **kwargs)
+        error = False
+        return result
+      except bottle.HTTPResponse as response:
+        # Aborts with client errors (e.g. unknown resources) are not failures of the server.
+        error = response.status_code >= 500
+        raise
+      finally:
+        self.record(self._clock.time() - start, error=error)
+    return wrap
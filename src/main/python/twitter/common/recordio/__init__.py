@@ -17,8 +17,11 @@
 __author__ = 'Brian Wickman'
 
 from .recordio import *
+from .mapped import MappedRecordReader, RecordIndex
 
 __all__ = [
+  'MappedRecordReader',
+  'RecordIndex',
   'RecordIO',
   'RecordWriter',
   'RecordReader',
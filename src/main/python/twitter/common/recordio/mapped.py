@@ -0,0 +1,263 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Bulk, memory-mapped reading of RecordIO streams.
+
+RecordIO.Reader issues two reads and an unpack per record, which dominates the cost of replaying
+long streams.  The MappedRecordReader maps the whole stream instead and walks the frame headers
+in place, handing out payloads as memoryviews:
+
+  with MappedRecordReader('runner', ThriftRecordIO.ThriftCodec(RunnerCkpt)) as reader:
+    for record in reader:
+      ...
+
+A RecordIndex records the offset of every Nth record (optionally keyed by a value derived from
+the record, such as a sequence number) so that readers can seek close to a record rather than
+scanning the stream from the beginning.  Indexes can be saved alongside the stream and updated
+incrementally as the stream grows.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from .recordio import RecordIO
+
+_HEADER = struct.Struct('>L')
+
+
+class MappedRecordReader(object):
+  """
+    Read the complete records of a RecordIO stream through a read-only memory map.
+
+    The stream may be supplied as a filename or an open file object; in the latter case the
+    file position is not used or modified.  Only the stream as it was when the reader was
+    constructed (or last refreshed) is visible.
+  """
+
+  def __init__(self, fp, codec):
+    if not isinstance(codec, RecordIO.Codec):
+      raise RecordIO.InvalidCodec("Codec must be subclass of RecordIO.Codec")
+    self._codec = codec
+    self._decode_buffers = getattr(codec, 'ACCEPTS_BUFFERS', False)
+    self._owned_fp = None
+    if isinstance(fp, str):
+      fp = self._owned_fp = open(fp, 'rb')
+    self._fp = fp
+    self._map = None
+    self._view = None
+    self._identity = None
+    self.refresh()
+
+  def refresh(self):
+    """Remap the stream if it has grown.  Returns the size of the mapped stream."""
+    st = os.fstat(self._fp.fileno())
+    self._identity = [st.st_dev, st.st_ino]
+    size = st.st_size
+    if self._view is not None and size == len(self._view):
+      return size
+    self._unmap()
+    if size:
+      self._map = mmap.mmap(self._fp.fileno(), size, access=mmap.ACCESS_READ)
+      self._view = memoryview(self._map)
+    else:
+      self._view = memoryview(b'')
+    return size
+
+  @property
+  def size(self):
+    return len(self._view)
+
+  @property
+  def identity(self):
+    """The [device, inode] of the stream, which distinguishes it from a stream replacing it."""
+    return self._identity
+
+  def _unmap(self):
+    if self._view is not None:
+      self._view.release()
+      self._view = None
+    if self._map is not None:
+      try:
+        self._map.close()
+      except BufferError:
+        # Payloads handed out by frames() are still referenced; the mapping is released once
+        # they are garbage collected.
+        pass
+      self._map = None
+
+  def close(self):
+    self._unmap()
+    if self._owned_fp is not None:
+      self._owned_fp.close()
+      self._owned_fp = None
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, exc_type, exc_value, traceback):
+    self.close()
+
+  def frames(self, offset=0, strict=True):
+    """
+      Yield (offset, payload) for each complete record starting at byte offset, where offset is
+      the offset of the record header and payload is a memoryview of the encoded record.
+      Payloads are only valid until the reader is refreshed or closed.
+
+      A truncated record at the end of the stream (e.g. one still being written) raises
+      RecordIO.PrematureEndOfStream if strict, and otherwise ends the iteration.
+    """
+    view, size = self._view, len(self._view)
+    unpack_from, header_size = _HEADER.unpack_from, _HEADER.size
+    while offset < size:
+      if offset + header_size > size:
+        if strict:
+          raise RecordIO.PrematureEndOfStream(
+              'Expected %d bytes in header, got %d' % (header_size, size - offset))
+        return
+      length, = unpack_from(view, offset)
+      if length > RecordIO.MAXIMUM_RECORD_SIZE:
+        raise RecordIO.RecordSizeExceeded("Record exceeds maximum allowable size")
+      start = offset + header_size
+      end = start + length
+      if end > size:
+        if strict:
+          raise RecordIO.PrematureEndOfStream(
+              'Expected %d bytes in frame, got %d' % (length, size - start))
+        return
+      yield offset, view[start:end]
+      offset = end
+
+  def decode(self, payload):
+    return self._codec.decode(payload if self._decode_buffers else payload.tobytes())
+
+  def records(self, offset=0, strict=True):
+    """Yield (offset, record) for each complete record starting at byte offset."""
+    for record_offset, payload in self.frames(offset, strict=strict):
+      yield record_offset, self.decode(payload)
+
+  def end(self, offset=0):
+    """Return the offset just past the last complete record, scanning from offset."""
+    for record_offset, payload in self.frames(offset, strict=False):
+      offset = record_offset + _HEADER.size + len(payload)
+    return offset
+
+  def __iter__(self):
+    for _, record in self.records():
+      yield record
+
+
+class RecordIndex(object):
+  """
+    A sparse index from record number or key to the offset of records in a RecordIO stream.
+
+    Every stride-th record is indexed.  If a key function is supplied, entries are keyed by
+    key(record), which must not decrease along the stream (e.g. a sequence number); otherwise
+    entries are keyed by the record number.
+
+    An index belongs to one stream: if the stream is found to have been truncated or replaced
+    by another file, the index is cleared and rebuilt.
+  """
+
+  VERSION = 2
+
+  def __init__(self, stride=64, key=None):
+    if stride < 1:
+      raise ValueError('stride must be positive, got %r' % stride)
+    self._stride = stride
+    self._key = key
+    self._keys = []
+    self._offsets = []
+    self._count = 0  # number of records indexed
+    self._end = 0  # offset just past the last record indexed
+    self._identity = None  # the identity of the stream indexed
+
+  @property
+  def count(self):
+    return self._count
+
+  @property
+  def end(self):
+    return self._end
+
+  def __len__(self):
+    return len(self._keys)
+
+  def update(self, reader):
+    """Index the records of the MappedRecordReader appended since the last update.  Returns the
+       number of records indexed."""
+    if reader.size < self._end or (self._identity is not None and
+                                   reader.identity != self._identity):
+      # The stream was truncated or replaced; start over.
+      self.clear()
+    self._identity = reader.identity
+    count = self._count
+    for offset, payload in reader.frames(self._end, strict=False):
+      if self._count % self._stride == 0:
+        key = self._key(reader.decode(payload)) if self._key else self._count
+        if self._keys and key < self._keys[-1]:
+          raise ValueError('Index keys must not decrease: %r follows %r' % (key, self._keys[-1]))
+        self._keys.append(key)
+        self._offsets.append(offset)
+      self._count += 1
+      self._end = offset + _HEADER.size + len(payload)
+    return self._count - count
+
+  def clear(self):
+    self._keys, self._offsets = [], []
+    self._count = self._end = 0
+    self._identity = None
+
+  def lookup(self, key):
+    """Return the offset of the last indexed record whose key is less than key, or 0.  Reading
+       from this offset reaches the first record with the given key within stride records."""
+    index = bisect.bisect_left(self._keys, key) - 1
+    return self._offsets[index] if index >= 0 else 0
+
+  def save(self, filename):
+    """Atomically write the index to filename."""
+    content = dict(version=self.VERSION, stride=self._stride, count=self._count, end=self._end,
+                   identity=self._identity, keys=self._keys, offsets=self._offsets)
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % os.path.basename(filename),
+                                    dir=os.path.dirname(filename) or '.')
+    try:
+      with os.fdopen(fd, 'w') as fp:
+        json.dump(content, fp)
+      os.rename(tmp_path, filename)
+    except Exception:
+      os.unlink(tmp_path)
+      raise
+
+  @classmethod
+  def load(cls, filename, key=None):
+    """Load an index saved with save().  Returns an empty index if it is missing or invalid."""
+    try:
+      with open(filename) as fp:
+        content = json.load(fp)
+      if content.get('version') != cls.VERSION:
+        return cls(key=key)
+      index = cls(stride=content['stride'], key=key)
+      index._keys, index._offsets = content['keys'], content['offsets']
+      index._count, index._end = content['count'], content['end']
+      index._identity = content['identity']
+      if len(index._keys) != len(index._offsets):
+        return cls(key=key)
+      return index
+    except (IOError, OSError, ValueError, KeyError, TypeError, AttributeError):
+      return cls(key=key)
@@ -51,7 +51,12 @@ class RecordIO(object):
   class Codec(Interface):
     """
       An encoder/decoder interface for bespoke RecordReader/Writers.
+
+      Codecs which can decode any buffer (e.g. a memoryview) rather than only bytes set
+      ACCEPTS_BUFFERS, which allows bulk readers to avoid copying record payloads.
     """
+    ACCEPTS_BUFFERS = False
+
     @abstractmethod
     def encode(self, blob):
       """
@@ -202,6 +207,12 @@ class RecordIO(object):
     def set_sync(self, value):
       self._sync = bool(value)
 
+    def flush(self):
+      """
+        Flush the records written so far to the filesystem, as writes do when sync is set.
+      """
+      self._fp.flush()
+
     @staticmethod
     def do_write(fp, record, codec, sync=False):
       """
@@ -20,20 +20,28 @@ import sys
 import inspect
 
 from .recordio import RecordIO
+from .thrift_binary import DecodeError, StructDecoder
 
 try:
   import thrift.TSerialization as _SER
+  from thrift.protocol.TBinaryProtocol import TBinaryProtocolAcceleratedFactory
   _HAS_THRIFT = True
 except ImportError:
   _SER = None
   _HAS_THRIFT = False
   print("WARNING: Unable to load thrift in thrift_recordio", file=sys.stderr)
 
+try:
+  from thrift.protocol import fastbinary as _FASTBINARY
+except ImportError:
+  _FASTBINARY = None
+
 
 class ThriftRecordIO(object):
   class ThriftUnavailableException(RecordIO.Error): pass
   class ThriftUnsuppliedException(RecordIO.Error): pass
   class InvalidThriftException(RecordIO.InvalidTypeException): pass
+  class ThriftDecodeException(RecordIO.Error): pass
 
   @staticmethod
   def assert_has_thrift():
@@ -47,15 +55,30 @@ class ThriftRecordIO(object):
 
       If no thrift_base is supplied, this codec may be used correctly in
       encode-only mode (i.e. for RecordWriters.)
+
+      Records are serialized with TBinaryProtocol.  The accelerated (C) protocol is used when
+      thrift was built with it; otherwise records are decoded with the pure-Python
+      StructDecoder, which is considerably faster than TBinaryProtocol.  All of these produce
+      and accept the same bytes.
     """
 
-    def __init__(self, thrift_base=None):
+    ACCEPTS_BUFFERS = True
+
+    def __init__(self, thrift_base=None, accelerated=True):
       self._base = thrift_base
       if self._base is not None and not inspect.isclass(self._base):
         raise ThriftRecordIO.InvalidThriftException(
           "ThriftCodec initialized with invalid Thrift base class")
+      self._protocol_factory = None
+      self._decoder = None
+      if accelerated and _HAS_THRIFT and _FASTBINARY is not None:
+        self._protocol_factory = TBinaryProtocolAcceleratedFactory()
+      elif accelerated and self._base is not None and StructDecoder.supports(self._base):
+        self._decoder = StructDecoder.for_class(self._base)
 
     def encode(self, input):
+      if self._protocol_factory is not None:
+        return _SER.serialize(input, protocol_factory=self._protocol_factory)
       return _SER.serialize(input)
 
     def decode(self, input):
@@ -63,11 +86,18 @@ class ThriftRecordIO(object):
         raise ThriftRecordIO.ThriftUnsuppliedException(
           "ThriftCodec cannot deserialize because no thrift_base supplied!")
 
-      base = self._base()
       try:
-        _SER.deserialize(base, input)
+        if self._decoder is not None:
+          return self._decoder.decode(input)
+        base = self._base()
+        if self._protocol_factory is not None:
+          _SER.deserialize(base, input, protocol_factory=self._protocol_factory)
+        else:
+          _SER.deserialize(base, input)
       except EOFError:
         raise RecordIO.PrematureEndOfStream("Reached EOF while decoding frame")
+      except DecodeError as e:
+        raise ThriftRecordIO.ThriftDecodeException("Failed to decode frame: %s" % e)
       return base
 
 
@@ -12,90 +12,160 @@
 # limitations under the License.
 #
 
+import socket
+import threading
 import unittest
-from socket import timeout as SocketTimeout
-from unittest import mock
+
 from twitter.common.lang import Compatibility
 
 from apache.aurora.common.health_check.http_signaler import HttpSignaler
 
 if Compatibility.PY3:
-  import urllib.request as urllib_request
-  from urllib.error import HTTPError
+  from http.server import BaseHTTPRequestHandler, HTTPServer
 else:
-  import urllib2 as urllib_request  # pants: no-infer-dep
-  from urllib2 import HTTPError  # pants: no-infer-dep
+  from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer  # pants: no-infer-dep
 
 
-class OpenedURL(object):
-  def __init__(self, content, code=200):
-    self.content = content
-    self.code = code
+class ScriptedServer(HTTPServer):
+  """Serves the scripted (content, code[, location]) responses in order, recording each
+     request."""
 
-  def read(self):
-    return self.content
+  def __init__(self, responses):
+    self.responses = list(responses)
+    self.requests = []
+    self.connections = 0
+    HTTPServer.__init__(self, ('localhost', 0), ScriptedHandler)
 
-  def close(self):
-    pass
+  def get_request(self):
+    self.connections += 1
+    return HTTPServer.get_request(self)
 
-  def getcode(self):
-    return self.code
 
+class ScriptedHandler(BaseHTTPRequestHandler):
+  protocol_version = 'HTTP/1.1'
 
-class TestHttpSignaler(unittest.TestCase):
-  PORT = 12345
+  def respond(self):
+    length = int(self.headers.get('Content-Length') or 0)
+    if length:
+      self.rfile.read(length)
+    self.server.requests.append((self.command, self.path))
+    response = self.server.responses.pop(0)
+    content, code = response[:2]
+    content = content.encode('utf-8')
+    self.send_response(code)
+    if len(response) > 2:
+      self.send_header('Location', response[2])
+    self.send_header('Content-Length', str(len(content)))
+    self.end_headers()
+    self.wfile.write(content)
 
-  def test_all_calls_ok(self):
-    with mock.patch.object(urllib_request, 'urlopen') as urlopen:
-      urlopen.side_effect = [OpenedURL(''), OpenedURL('')]
+  do_GET = do_POST = respond
+
+  def log_message(self, *args):
+    pass
 
-      signaler = HttpSignaler(self.PORT)
-      assert signaler('/quitquitquit', use_post_method=True) == (True, None)
-      assert signaler('/abortabortabort', use_post_method=True) == (True, None)
 
-      urlopen.assert_has_calls([
-        mock.call('http://localhost:%s/quitquitquit' % self.PORT, b'', timeout=1.0),
-        mock.call('http://localhost:%s/abortabortabort' % self.PORT, b'', timeout=1.0),
-      ])
+class TestHttpSignaler(unittest.TestCase):
+  def serve(self, *responses):
+    server = ScriptedServer(responses)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    self.addCleanup(server.server_close)
+    self.addCleanup(server.shutdown)
+    return server
+
+  def test_all_calls_ok(self):
+    server = self.serve(('', 200), ('', 200))
+    signaler = HttpSignaler(server.server_port)
+    assert signaler('/quitquitquit', use_post_method=True) == (True, None)
+    assert signaler('/abortabortabort', use_post_method=True) == (True, None)
+    signaler.close()
+    assert server.requests == [('POST', '/quitquitquit'), ('POST', '/abortabortabort')]
 
   def test_health_checks(self):
-    with mock.patch.object(urllib_request, 'urlopen') as urlopen:
-      urlopen.side_effect = [
-        OpenedURL('ok'),
-        OpenedURL('not ok'),
-        OpenedURL('not ok', code=200),
-        OpenedURL('ok', code=400),
-        HTTPError('', 501, '', None, None),
-        OpenedURL('ok', code=200),
-        OpenedURL('ok'),
-      ]
-
-      signaler = HttpSignaler(self.PORT)
-      assert signaler('/health', expected_response='ok') == (True, None)
-      assert signaler('/health', expected_response='ok') == (
-          False, 'Response differs from expected response (expected "ok", got "not ok")')
-      assert signaler('/health', expected_response_code=200) == (True, None)
-      assert signaler('/health', expected_response_code=200) == (
-          False, 'Response code differs from expected response (expected 200, got 400)')
-      assert signaler('/health', expected_response_code=200) == (
-          False, 'Response code differs from expected response (expected 200, got 501)')
-      assert signaler('/health', expected_response='ok', expected_response_code=200) == (True, None)
-      assert signaler('/random/endpoint', expected_response='ok') == (True, None)
-
-      urlopen.assert_has_calls([
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/health' % self.PORT, None, timeout=1.0),
-        mock.call('http://localhost:%s/random/endpoint' % self.PORT, None, timeout=1.0),
-      ])
+    server = self.serve(
+        ('ok', 200),
+        ('not ok', 200),
+        ('not ok', 200),
+        ('ok', 400),
+        ('', 501),
+        ('ok', 200),
+        ('ok', 200))
+    signaler = HttpSignaler(server.server_port)
+    assert signaler('/health', expected_response='ok') == (True, None)
+    assert signaler('/health', expected_response='ok') == (
+        False, 'Response differs from expected response (expected "ok", got "not ok")')
+    assert signaler('/health', expected_response_code=200) == (True, None)
+    assert signaler('/health', expected_response_code=200) == (
+        False, 'Response code differs from expected response (expected 200, got 400)')
+    assert signaler('/health', expected_response_code=200) == (
+        False, 'Response code differs from expected response (expected 200, got 501)')
+    assert signaler('/health', expected_response='ok', expected_response_code=200) == (True, None)
+    assert signaler('/random/endpoint', expected_response='ok') == (True, None)
+    signaler.close()
+    assert server.requests == [('GET', '/health')] * 6 + [('GET', '/random/endpoint')]
+    assert server.connections == 1
+
+  def test_reconnect(self):
+    server = self.serve(('ok', 200), ('ok', 200))
+    signaler = HttpSignaler(server.server_port)
+    assert signaler('/health', expected_response='ok') == (True, None)
+    # Break the idle connection, as a server closing it after its keep-alive timeout would.
+    signaler._connection.sock.shutdown(socket.SHUT_RDWR)
+    assert signaler('/health', expected_response='ok') == (True, None)
+    signaler.close()
+    assert server.connections == 2
+
+  def test_redirects(self):
+    other = self.serve(('ok', 200))
+    server = self.serve(
+        ('', 302, '/ok'),
+        ('ok', 200),
+        ('', 301, 'http://localhost:%d/elsewhere' % other.server_port),
+        ('', 307, '/missing'),
+        ('', 404),
+        ('', 303, '/done'),
+        ('', 200),
+        ('', 307, '/again'),
+        ('ok', 200))
+    signaler = HttpSignaler(server.server_port)
+    assert signaler('/health', expected_response='ok') == (True, None)
+    assert signaler('/health', expected_response='ok') == (True, None)
+    assert signaler('/health', expected_response_code=200) == (
+        False, 'Response code differs from expected response (expected 200, got 404)')
+    # A POST is redirected as a GET, except by a 307 or 308.
+    assert signaler('/quitquitquit', use_post_method=True) == (True, None)
+    assert signaler('/quitquitquit', use_post_method=True, expected_response_code=200) == (
+        False, 'Response code differs from expected response (expected 200, got 307)')
+    assert signaler('/health', expected_response='ok') == (True, None)
+    signaler.close()
+    assert server.requests == [
+        ('GET', '/health'), ('GET', '/ok'),
+        ('GET', '/health'),
+        ('GET', '/health'), ('GET', '/missing'),
+        ('POST', '/quitquitquit'), ('GET', '/done'),
+        ('POST', '/quitquitquit'),
+        ('GET', '/health')]
+    assert other.requests == [('GET', '/elsewhere')]
+
+  def test_redirect_loop(self):
+    server = self.serve(*[('', 302, '/loop')] * (HttpSignaler.MAX_REDIRECTS + 1))
+    signaler = HttpSignaler(server.server_port)
+    assert signaler.query('/loop') == ('', 302)
+    signaler.close()
+    assert len(server.requests) == HttpSignaler.MAX_REDIRECTS + 1
 
   def test_exception(self):
-    with mock.patch.object(urllib_request, 'urlopen') as urlopen:
-      urlopen.side_effect = SocketTimeout('Timed out')
-
-      assert not HttpSignaler(self.PORT)('/health', expected_response='ok')[0]
-      urlopen.assert_called_once_with(
-          'http://localhost:%s/health' % self.PORT, None, timeout=1.0)
+    listener = socket.socket()
+    listener.bind(('localhost', 0))
+    listener.listen(1)
+    self.addCleanup(listener.close)
+    signaler = HttpSignaler(listener.getsockname()[1], timeout_secs=0.1)
+    healthy, reason = signaler('/health', expected_response='ok')
+    assert not healthy
+    assert 'timeout' in reason.lower()
+
+    port = listener.getsockname()[1]
+    listener.close()
+    assert not HttpSignaler(port)('/health', expected_response='ok')[0]
@@ -83,3 +83,50 @@ class TestHealthChecker(unittest.TestCase):
       'wrapped-cmd', timeout=timeout, preexec_fn=mock.ANY, stderr=STDOUT)
     self.assertFalse(success)
     self.assertEqual(msg, 'Invalid commmand.')
+
+
+class TestPersistentShellHealthCheck(unittest.TestCase):
+
+  def health_check(self, cmd, timeout_secs=5):
+    shell = ShellHealthCheck(
+        raw_cmd=cmd,
+        wrapped_cmd=['/bin/bash', '-c', ShellHealthCheck.worker_cmdline(cmd)],
+        timeout_secs=timeout_secs,
+        persistent=True)
+    self.addCleanup(shell.close)
+    return shell
+
+  def test_health_check_ok(self):
+    shell = self.health_check('cd / && test -z "$checked" && checked=1 && echo ok')
+    assert shell() == (True, None)
+    worker = shell._worker.pid
+    # Each check runs in a subshell of the same worker, so state does not carry over.
+    assert shell() == (True, None)
+    assert shell._worker.pid == worker
+
+  def test_health_check_failed(self):
+    shell = self.health_check("echo 'No file.' >&2; exit 3")
+    self.assertEqual(
+        shell(), (False, "Command 'echo 'No file.' >&2; exit 3' returned non-zero exit status 3 "
+                         "with output 'No file.'"))
+    worker = shell._worker.pid
+    assert not shell()[0]
+    assert shell._worker.pid == worker
+
+  def test_health_check_timeout(self):
+    shell = self.health_check('sleep 10', timeout_secs=0.1)
+    assert shell() == (False, 'Health check timed out.')
+    assert shell._worker is None
+
+  def test_worker_restart(self):
+    shell = self.health_check('true')
+    assert shell() == (True, None)
+    shell._worker.kill()
+    shell._worker.wait()
+    assert shell() == (True, None)
+
+  def test_worker_exited(self):
+    shell = ShellHealthCheck(
+        raw_cmd='true', wrapped_cmd=['/bin/bash', '-c', 'echo broken'], persistent=True)
+    self.addCleanup(shell.close)
+    assert shell() == (False, 'Health check worker exited: broken')
@@ -0,0 +1,193 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+import unittest
+from unittest import mock
+
+from pesos.vendor.mesos import mesos_pb2
+from twitter.common.metrics import RootMetrics
+
+from apache.aurora.executor.aurora_executor import AuroraExecutor
+from apache.aurora.executor.common.health_checker import (
+    HealthCheckerProvider,
+    HealthCheckScheduler,
+    LatencyHistogram,
+    ThreadedHealthChecker
+)
+from apache.aurora.executor.common.status_checker import StatusResult
+from apache.aurora.executor.common.task_runner import TaskRunnerProvider
+
+
+class FakeClock(object):
+  def __init__(self, now=1000.0):
+    self.now = now
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+class RecordingCheck(object):
+  """A health check recording the threads it is called from."""
+
+  def __init__(self):
+    self.threads = []
+    self.called = threading.Event()
+
+  def __call__(self):
+    self.threads.append(threading.current_thread())
+    self.called.set()
+    return True, None
+
+  def wait_for(self, calls, timeout=10):
+    deadline = time.time() + timeout
+    while len(self.threads) < calls and time.time() < deadline:
+      time.sleep(0.01)
+    return len(self.threads) >= calls
+
+
+def threaded_checker(check, scheduler, interval_secs=0.05):
+  return ThreadedHealthChecker(check, None, interval_secs, None, 0, 1, time, scheduler=scheduler)
+
+
+class TestHealthCheckScheduler(unittest.TestCase):
+  def scheduler(self, **kw):
+    scheduler = HealthCheckScheduler(**kw)
+    self.addCleanup(scheduler.stop)
+    return scheduler
+
+  def test_shared_checks(self):
+    scheduler = self.scheduler(max_workers=2)
+    checks = [RecordingCheck() for _ in range(3)]
+    checkers = [threaded_checker(check, scheduler) for check in checks]
+    for checker in checkers:
+      checker.start()
+    for check in checks:
+      assert check.wait_for(3)
+    # Every check ran on the scheduler's workers rather than on a thread of its own checker.
+    for checker, check in zip(checkers, checks):
+      assert not checker.is_alive()
+      assert checker not in check.threads
+    workers = set(thread for check in checks for thread in check.threads)
+    assert 0 < len(workers) <= 2
+    assert scheduler.is_alive()
+
+  def test_stopped_checker_is_not_rescheduled(self):
+    scheduler = self.scheduler()
+    stopped, running = RecordingCheck(), RecordingCheck()
+    stopped_checker = threaded_checker(stopped, scheduler)
+    stopped_checker.start()
+    threaded_checker(running, scheduler).start()
+    assert stopped.wait_for(1)
+    stopped_checker.stop()
+    calls = len(stopped.threads)
+    assert running.wait_for(len(running.threads) + 3)
+    # At most a check already under way completes after stop().
+    assert len(stopped.threads) <= calls + 1
+
+  def test_stop(self):
+    scheduler = self.scheduler()
+    check = RecordingCheck()
+    threaded_checker(check, scheduler).start()
+    assert check.wait_for(1)
+    scheduler.stop()
+    scheduler.join(10)
+    assert not scheduler.is_alive()
+    calls = len(check.threads)
+    time.sleep(0.2)
+    assert len(check.threads) <= calls + 1
+
+  def test_stop_unstarted(self):
+    scheduler = self.scheduler()
+    scheduler.stop()
+    assert not scheduler.is_alive()
+
+  def test_delay(self):
+    clock = FakeClock()
+    scheduler = self.scheduler(clock=clock)
+    check = RecordingCheck()
+    scheduler.schedule(threaded_checker(check, scheduler, interval_secs=30), delay_secs=5)
+    # The check is not due until the clock reaches it.
+    assert not check.called.wait(0.2)
+    clock.sleep(5)
+    with scheduler._condition:
+      scheduler._condition.notify()
+    assert check.called.wait(10)
+
+
+class TestHealthCheckerProvider(unittest.TestCase):
+  def test_stop(self):
+    provider = HealthCheckerProvider(shared_scheduler=True)
+    scheduler = provider._scheduler
+    check = RecordingCheck()
+    threaded_checker(check, scheduler).start()
+    assert check.wait_for(1)
+    provider.stop()
+    scheduler.join(10)
+    assert not scheduler.is_alive()
+
+  def test_stop_without_scheduler(self):
+    provider = HealthCheckerProvider()
+    assert provider._scheduler is None
+    provider.stop()
+
+  def test_executor_shutdown(self):
+    provider = HealthCheckerProvider(shared_scheduler=True)
+    scheduler = provider._scheduler
+    check = RecordingCheck()
+    threaded_checker(check, scheduler).start()
+    assert check.wait_for(1)
+
+    executor = AuroraExecutor(mock.create_autospec(TaskRunnerProvider, instance=True),
+                              status_providers=[provider])
+    executor._runner = mock.Mock(status=None)
+    executor._chained_checker = mock.Mock()
+    executor._driver = mock.Mock()
+    executor._task_id = 'hello_world'
+    with mock.patch.object(executor, 'send_update'):
+      with mock.patch('apache.aurora.executor.aurora_executor.defer'):
+        executor._shutdown(StatusResult('Finished.', mesos_pb2.TASK_FINISHED))
+    executor._chained_checker.stop.assert_called_once_with()
+    scheduler.join(10)
+    assert not scheduler.is_alive()
+
+
+class TestLatencyHistogram(unittest.TestCase):
+  def test_buckets(self):
+    histogram = LatencyHistogram(bounds=(0.01, 0.1, 1.0))
+    for latency in (0.001, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 50.0):
+      histogram.add(latency)
+    # Latencies equal to a bound count towards it.
+    assert [histogram.count(index) for index in range(4)] == [2, 4, 6, 8]
+
+  def test_empty(self):
+    histogram = LatencyHistogram()
+    assert [histogram.count(index) for index in range(len(LatencyHistogram.BOUNDS_SECS) + 1)] == (
+        [0] * (len(LatencyHistogram.BOUNDS_SECS) + 1))
+
+  def test_register(self):
+    metrics = RootMetrics().scope('test_latency_histogram')
+    histogram = LatencyHistogram(bounds=(0.5, 2.5))
+    histogram.register(metrics, 'latency_secs')
+    histogram.add(1.0)
+    histogram.add(3.0)
+    assert metrics.sample() == {
+        'latency_secs_le_0.5': 0,
+        'latency_secs_le_2.5': 1,
+        'latency_secs_le_inf': 2,
+    }
@@ -0,0 +1,148 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import safe_mkdir
+from twitter.common.quantity import Time
+
+from apache.aurora.executor.executor_vars import ExecutorVars
+from apache.thermos.common.procfs import ProcessMemory
+
+MemoryInfo = namedtuple('MemoryInfo', 'rss vms')
+
+
+class FakeClock(object):
+  def __init__(self, now=1000.0):
+    self.now = now
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+class FakeProcess(object):
+  """The subset of psutil.Process used by ExecutorVars."""
+
+  def __init__(self, pid, children=(), cpu=0.0, rss=0, ppid=100):
+    self.pid = pid
+    self.child_processes = list(children)
+    self.cpu = cpu
+    self.rss = rss
+    self.parent = ppid
+
+  def children(self):
+    return list(self.child_processes)
+
+  def cpu_percent(self, interval):
+    return self.cpu
+
+  def memory_info(self):
+    return MemoryInfo(rss=self.rss, vms=0)
+
+  def ppid(self):
+    return self.parent
+
+
+def smaps(rss_kb, pss_kb):
+  return ('Rss:            %8d kB\nPss:            %8d kB\nPrivate_Clean:         0 kB\n'
+          'Private_Dirty:         4 kB\nSwap:                  0 kB\n' % (rss_kb, pss_kb))
+
+
+class TestExecutorVars(unittest.TestCase):
+  EXECUTOR, RUNNER, COORDINATOR = 100, 200, 300
+
+  def setUp(self):
+    self.procfs = self.enter(temporary_dir())
+    safe_mkdir(os.path.join(self.procfs, 'self'))
+    self.enter(mock.patch.object(ProcessMemory, '_HAS_ROLLUP', [True]))
+    self.clock = FakeClock()
+    self.coordinator = FakeProcess(self.COORDINATOR, cpu=2.0)
+    self.runner = FakeProcess(self.RUNNER, children=[self.coordinator], cpu=1.0)
+    self.executor = FakeProcess(self.EXECUTOR, children=[self.runner], cpu=5.0, rss=4096)
+    self.vars = ExecutorVars(clock=self.clock, procfs=self.procfs)
+    self.vars._self = self.executor
+    self.write_smaps(self.RUNNER, pss_kb=10)
+    self.write_smaps(self.COORDINATOR, pss_kb=20)
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def write_smaps(self, pid, pss_kb, filename='smaps_rollup'):
+    safe_mkdir(os.path.join(self.procfs, str(pid)))
+    with open(os.path.join(self.procfs, str(pid), filename), 'w') as fp:
+      fp.write(smaps(rss_kb=2 * pss_kb, pss_kb=pss_kb))
+
+  def sample(self):
+    assert self.vars.sample()
+    return self.vars.metrics.sample()
+
+  def test_sample(self):
+    assert self.sample() == {
+        'orphan': 0,
+        'cpu': 5.0,
+        'rss': 4096,
+        'thermos_cpu': 3.0,
+        'thermos_pss': 30 * 1024,
+    }
+    self.executor.parent = 1
+    assert self.sample()['orphan'] == 1
+
+  def test_pss_refresh(self):
+    assert self.sample()['thermos_pss'] == 30 * 1024
+    self.write_smaps(self.RUNNER, pss_kb=40)
+    self.runner.cpu = 3.0
+    # Only the cpu of the thermos processes is sampled every time.
+    self.clock.sleep(ExecutorVars.COLLECTION_INTERVAL.as_(Time.SECONDS))
+    metrics = self.sample()
+    assert metrics['thermos_cpu'] == 5.0
+    assert metrics['thermos_pss'] == 30 * 1024
+    self.clock.sleep(ExecutorVars.MEMORY_REFRESH_INTERVAL.as_(Time.SECONDS))
+    assert self.sample()['thermos_pss'] == 60 * 1024
+
+  def test_new_processes(self):
+    self.sample()
+    # A coordinator exits, and its pid is reused by a new one; another is forked.
+    self.write_smaps(self.COORDINATOR, pss_kb=50)
+    self.write_smaps(400, pss_kb=5)
+    self.runner.child_processes = [FakeProcess(self.COORDINATOR), FakeProcess(400)]
+    assert self.sample()['thermos_pss'] == (10 + 50 + 5) * 1024
+    assert sorted(self.vars._pss) == [self.RUNNER, self.COORDINATOR, 400]
+
+    self.runner.child_processes = []
+    assert self.sample()['thermos_pss'] == 10 * 1024
+    assert sorted(self.vars._pss) == [self.RUNNER]
+
+  def test_smaps_fallback(self):
+    for pid in (self.RUNNER, self.COORDINATOR):
+      os.remove(os.path.join(self.procfs, str(pid), 'smaps_rollup'))
+    # Without smaps_rollup, the mappings of smaps are summed.
+    self.write_smaps(self.RUNNER, pss_kb=10, filename='smaps')
+    with open(os.path.join(self.procfs, str(self.COORDINATOR), 'smaps'), 'w') as fp:
+      fp.write(smaps(rss_kb=8, pss_kb=4) + smaps(rss_kb=16, pss_kb=16))
+    assert self.sample()['thermos_pss'] == 30 * 1024
+
+  def test_exited_process(self):
+    os.remove(os.path.join(self.procfs, str(self.COORDINATOR), 'smaps_rollup'))
+    os.rmdir(os.path.join(self.procfs, str(self.COORDINATOR)))
+    assert ExecutorVars.aggregate_memory(self.coordinator, procfs=self.procfs) == 0
+    assert self.sample()['thermos_pss'] == 10 * 1024
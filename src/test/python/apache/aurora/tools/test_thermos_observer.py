@@ -58,6 +58,14 @@ class _FakeExceptionalThread:
 
 _stub('twitter.common.exceptions', ExceptionalThread=_FakeExceptionalThread)
 
+# --- twitter.common.http ---
+class _FakePooledServer:
+    DEFAULT_THREADS = 10
+    DEFAULT_MAX_QUEUED = 100
+    DEFAULT_KEEPALIVE_TIMEOUT = 10
+
+_stub('twitter.common.http', PooledServer=_FakePooledServer)
+
 # --- twitter.common.quantity ---
 class _FakeAmount:
     def __init__(self, value, unit):
@@ -92,13 +100,17 @@ _stub('apache.thermos.monitoring.disk',
 _stub('apache.thermos.monitoring.resource',
       TaskResourceMonitor=MagicMock())
 _stub('apache.thermos.observer')
+_stub('apache.thermos.observer.detector', InotifyObserverTaskDetector=MagicMock())
 
 _fake_task_observer_cls = MagicMock()
 _stub('apache.thermos.observer.task_observer', TaskObserver=_fake_task_observer_cls)
 
 _stub('apache.thermos.observer.http')
 _fake_configure_server = MagicMock()
-_stub('apache.thermos.observer.http.configure', configure_server=_fake_configure_server)
+_stub('apache.thermos.observer.http.configure',
+      configure_server=_fake_configure_server,
+      DEFAULT_LONG_POLL_THREADS=4,
+      DEFAULT_REQUEST_TIMEOUT_SECS=30)
 
 
 # ---------------------------------------------------------------------------
@@ -137,10 +149,19 @@ def _options(**kwargs):
         task_disk_collection_interval_secs=60,
         disable_task_resource_collection=False,
         enable_mesos_disk_collector=False,
+        enable_incremental_disk_collector=False,
         agent_api_url='http://localhost:5051/containers',
         executor_id_json_path='[].executor_id',
         disk_usage_json_path='[].statistics.disk_limit_bytes',
         scheduler_web_url='http://localhost:28080',
+        enable_inotify_detector=False,
+        detector_reconciliation_interval_secs=300,
+        disable_shared_resource_sampler=False,
+        http_threads=10,
+        http_max_queued_connections=100,
+        http_keepalive_timeout_secs=10,
+        http_request_timeout_secs=30,
+        http_long_poll_threads=4,
         enable_authentication=None,
         oidc_issuer=None,
         oidc_userinfo_url=None,
@@ -301,6 +322,30 @@ class TestInitialize(unittest.TestCase):
         _, kwargs = _fake_task_observer_cls.call_args
         self.assertTrue(kwargs.get('enable_mesos_disk_collector'))
 
+    def test_initialize_passes_enable_incremental_disk_collector(self):
+        initialize(_options())
+        _, kwargs = _fake_task_observer_cls.call_args
+        self.assertFalse(kwargs.get('enable_incremental_disk_collector'))
+        initialize(_options(enable_incremental_disk_collector=True))
+        _, kwargs = _fake_task_observer_cls.call_args
+        self.assertTrue(kwargs.get('enable_incremental_disk_collector'))
+
+    def test_initialize_passes_enable_inotify_detector(self):
+        opts = _options(enable_inotify_detector=True, detector_reconciliation_interval_secs=120)
+        initialize(opts)
+        _, kwargs = _fake_task_observer_cls.call_args
+        self.assertTrue(kwargs.get('enable_inotify_detector'))
+        self.assertEqual(120, kwargs.get('detector_reconciliation_interval').value)
+
+    def test_initialize_passes_shared_resource_sampler(self):
+        initialize(_options())
+        _, kwargs = _fake_task_observer_cls.call_args
+        self.assertTrue(kwargs.get('enable_shared_resource_sampler'))
+
+        initialize(_options(disable_shared_resource_sampler=True))
+        _, kwargs = _fake_task_observer_cls.call_args
+        self.assertFalse(kwargs.get('enable_shared_resource_sampler'))
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,150 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Measure how TaskPlanner scheduling passes scale with the number of processes.
+
+  python planner_benchmark.py [--processes N [N ...]] [--fanin N] [--concurrency N] [--repeat N]
+
+A task of N processes with ordering constraints on up to --fanin earlier processes each is planned
+and then driven to completion the way the runner drives it: every pass queries the runnable and
+waiting processes and the minimum wait, launches up to --concurrency processes and completes the
+longest running one, with every third completion failing once and backing off.  Both the previous
+rescanning planner and the incremental planner are timed.
+"""
+
+import argparse
+import copy
+import random
+import time
+from functools import partial
+
+from apache.thermos.common.planner import Planner, TaskPlanner
+from apache.thermos.config.schema import Process, Resources, Task, order
+
+
+class LegacyPlanner(Planner):
+  """The previous planner: rescan every process and dependency on each query."""
+
+  @classmethod
+  def satisfiable(cls, processes, dependencies):
+    processes = copy.copy(processes)
+    dependencies = copy.deepcopy(dependencies)
+
+    scheduling = True
+    while scheduling:
+      scheduling = False
+      runnables = cls.filter_runnable(processes, dependencies)
+      if runnables:
+        scheduling = True
+        processes -= runnables
+      dependencies = cls.filter_dependencies(dependencies, given=runnables)
+    return len(processes) == 0
+
+  @property
+  def runnable(self):
+    return self.filter_runnable(self._processes - self._running - self._finished - self._failed,
+      self.filter_dependencies(self._dependencies, given=self._finished))
+
+  def set_running(self, process):
+    assert process in self._running or process in self.runnable
+    self._running.add(process)
+
+
+class LegacyTaskPlanner(TaskPlanner):
+  """The previous task planner: filter the runnable processes by their wait on each query."""
+
+  def __init__(self, task, clock=time, process_filter=None):
+    super(LegacyTaskPlanner, self).__init__(task, clock=clock, process_filter=process_filter)
+    self._planner = LegacyPlanner(*self.extract_dependencies(task, self._filter))
+
+  def runnable_at(self, timestamp):
+    return set(filter(partial(self.is_ready, timestamp=timestamp), self._planner.runnable))
+
+  def waiting_at(self, timestamp):
+    return set(filter(partial(self.is_waiting, timestamp=timestamp), self._planner.runnable))
+
+
+class FakeClock(object):
+  def __init__(self):
+    self._time = 0.0
+
+  def time(self):
+    return self._time
+
+  def tick(self, seconds):
+    self._time += seconds
+
+
+def generate_task(count, fanin, seed=1):
+  rng = random.Random(seed)
+  processes = [Process(name='process_%d' % k, cmdline='true', min_duration=5, max_failures=2)
+               for k in range(count)]
+  constraints = []
+  for k in range(1, count):
+    for dependency in rng.sample(range(k), min(k, rng.randint(0, fanin))):
+      constraints.extend(order('process_%d' % dependency, 'process_%d' % k))
+  return Task(name='generated', processes=processes, constraints=constraints,
+              resources=Resources(cpu=1, ram=1, disk=1))
+
+
+def drive(planner, clock, concurrency):
+  """Run the task to completion, returning the number of scheduling passes."""
+  passes, completions = 0, 0
+  running = []
+  while not planner.is_complete():
+    passes += 1
+    now = clock.time()
+    runnable = sorted(planner.runnable_at(now))
+    planner.waiting_at(now)
+    planner.min_wait(now)
+    for process in runnable[:max(concurrency - len(running), 0)]:
+      planner.set_running(process)
+      running.append(process)
+    clock.tick(1)
+    if running:
+      process = running.pop(0)
+      completions += 1
+      if completions % 3 == 0 and planner._failures[process] == 0:
+        planner.add_failure(process, clock.time())
+      else:
+        planner.add_success(process, clock.time())
+  return passes
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--processes', type=int, nargs='+', default=[100, 300, 1000])
+  parser.add_argument('--fanin', type=int, default=3)
+  parser.add_argument('--concurrency', type=int, default=16)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  for count in args.processes:
+    task = generate_task(count, args.fanin)
+    for name, planner_class in (('rescanning', LegacyTaskPlanner), ('incremental', TaskPlanner)):
+      build_time = run_time = float('inf')
+      for _ in range(args.repeat):
+        clock = FakeClock()
+        start = time.time()
+        planner = planner_class(task, clock=clock)
+        build_time = min(build_time, time.time() - start)
+        start = time.time()
+        passes = drive(planner, clock, args.concurrency)
+        run_time = min(run_time, time.time() - start)
+      print('%5d processes %-12s plan %8.2f ms   %6d passes %10.1f us/pass' % (
+          count, name, build_time * 1000, passes, run_time * 1e6 / passes))
+
+
+if __name__ == '__main__':
+  main()
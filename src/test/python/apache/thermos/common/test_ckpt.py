@@ -0,0 +1,229 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import copy
+import unittest
+
+import pytest
+
+from apache.thermos.common.ckpt import CheckpointDispatcher, UniversalStateHandler
+
+from gen.apache.thermos.ttypes import (
+    ProcessState,
+    ProcessStatus,
+    RunnerCkpt,
+    RunnerHeader,
+    RunnerState,
+    TaskState,
+    TaskStatus
+)
+
+
+def run_updates(process, seq, states, fork_time, pid):
+  """The process updates written by a runner for a run of process beginning at seq."""
+  updates = []
+  for state in states:
+    update = ProcessStatus(seq=seq, process=process, state=state)
+    if state == ProcessState.FORKED:
+      update.fork_time, update.launch_time, update.coordinator_pid = fork_time, fork_time, pid - 1
+    elif state == ProcessState.RUNNING:
+      update.start_time, update.pid = fork_time + 1, pid
+    elif state in (ProcessState.SUCCESS, ProcessState.FAILED, ProcessState.KILLED):
+      update.stop_time = fork_time + 2
+      update.return_code = 0 if state == ProcessState.SUCCESS else 1
+    updates.append(RunnerCkpt(process_status=update))
+    seq += 1
+  return updates
+
+
+W, F, R, S, X, L = (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                    ProcessState.SUCCESS, ProcessState.FAILED, ProcessState.LOST)
+
+
+def task_status(state, timestamp_ms):
+  return RunnerCkpt(task_status=TaskStatus(
+      state=state, timestamp_ms=timestamp_ms, runner_pid=10, runner_uid=0))
+
+
+def checkpoint():
+  """The checkpoint of a long-running task whose runner was restarted twice."""
+  return (
+      [RunnerCkpt(runner_header=RunnerHeader(
+          task_id='hello_world', launch_time_ms=1000, sandbox='/sandbox', hostname='localhost',
+          user='nobody', ports={'http': 8080}))] +
+      [task_status(TaskState.ACTIVE, 1000)] +
+      run_updates('setup', 0, (W, F, R, S), 100.0, 1001) +
+      run_updates('server', 0, (W, F, R, X), 200.0, 2001) +
+      [task_status(TaskState.ACTIVE, 2000)] +
+      run_updates('sidecar', 0, (W, F, L), 250.0, 3001) +
+      run_updates('server', 4, (W, F, R), 300.0, 2002) +
+      run_updates('sidecar', 3, (W,), None, None) +
+      [task_status(TaskState.ACTIVE, 3000)])
+
+
+class RecordingHandler(UniversalStateHandler):
+  def __init__(self):
+    self.headers = []
+    self.tasks = []
+    self.processes = []
+
+  def on_initialization(self, header):
+    self.headers.append(header.task_id)
+
+  def on_task_transition(self, state, task_update):
+    self.tasks.append(state)
+
+  def on_process_transition(self, state, process_update):
+    self.processes.append((process_update.process, process_update.seq, state))
+
+
+def replay(records, truncate=False, handler=None):
+  dispatcher = CheckpointDispatcher()
+  if handler is not None:
+    dispatcher.register_handler(handler)
+  state = RunnerState(processes={})
+  for record in records:
+    dispatcher.dispatch(state, record, truncate=truncate)
+  return state
+
+
+class TestExpandRun(unittest.TestCase):
+  def test_all_transitions(self):
+    for (run_state, span), transitions in CheckpointDispatcher.RUN_TRANSITIONS.items():
+      run = ProcessStatus(seq=2 + span, process='p', state=run_state)
+      updates = CheckpointDispatcher.expand_run('p', run, previous_seq=2)
+      assert [update.seq for update in updates] == list(range(3, 3 + span))
+      assert tuple(update.state for update in updates) == transitions
+      for update in updates:
+        assert update.process == 'p'
+        # An abbreviated run is given placeholder times and pids.
+        for field in CheckpointDispatcher.TRANSITION_FIELDS[update.state]:
+          assert getattr(update, field) == 0
+
+      run = ProcessStatus(seq=span - 1, process='p', state=run_state)
+      state = replay(RunnerCkpt(process_status=update)
+                     for update in CheckpointDispatcher.expand_run('p', run))
+      assert state.processes['p'][-1].state == run_state
+      assert state.processes['p'][-1].seq == span - 1
+
+  def test_reproduces_run(self):
+    state = replay(checkpoint())
+    for process, runs in state.processes.items():
+      previous_seq = -1
+      expanded = []
+      for run in runs:
+        expanded.extend(CheckpointDispatcher.expand_run(process, run, previous_seq))
+        previous_seq = run.seq
+      assert replay([RunnerCkpt(process_status=update) for update in expanded]).processes == {
+          process: runs}
+
+  def test_invalid(self):
+    for run, previous_seq in (
+        (ProcessStatus(seq=5, state=ProcessState.RUNNING), -1),
+        (ProcessStatus(seq=3, state=ProcessState.RUNNING), 1),
+        (ProcessStatus(seq=0, state=ProcessState.FORKED), -1),
+        (ProcessStatus(seq=1, state=None), -1)):
+      with pytest.raises(CheckpointDispatcher.ErrorRecoveringState):
+        CheckpointDispatcher.expand_run('p', run, previous_seq)
+
+
+class TestCompact(unittest.TestCase):
+  def test_untruncated(self):
+    state = replay(checkpoint())
+    snapshot = CheckpointDispatcher.compact(state, truncate=False)
+    assert snapshot.runner_state.statuses == state.statuses
+    assert snapshot.runner_state.processes == state.processes
+    assert replay([snapshot]) == state
+
+  def test_truncated(self):
+    state = replay(checkpoint())
+    snapshot = CheckpointDispatcher.compact(state).runner_state
+    assert snapshot.header == state.header
+    assert snapshot.statuses == [state.statuses[0], state.statuses[-1]]
+    assert snapshot.processes['setup'] == state.processes['setup']
+    # All but the latest run of a process are abbreviated to their seq and state.
+    assert snapshot.processes['server'] == [
+        ProcessStatus(seq=3, process='server', state=ProcessState.FAILED),
+        state.processes['server'][-1]]
+    assert snapshot.processes['sidecar'] == [
+        ProcessStatus(seq=2, process='sidecar', state=ProcessState.LOST),
+        state.processes['sidecar'][-1]]
+
+  def test_copies(self):
+    state = replay(checkpoint())
+    original = copy.deepcopy(state)
+    snapshot = CheckpointDispatcher.compact(state).runner_state
+    snapshot.header.user = 'root'
+    snapshot.statuses[0].runner_pid = 11
+    snapshot.processes['server'][-1].pid = 1
+    assert state == original
+
+  def test_not_compactable(self):
+    assert CheckpointDispatcher.compact(RunnerState(processes={})) is None
+    assert CheckpointDispatcher.compact(replay(checkpoint()[:1])) is None
+    finished = replay(checkpoint() + [task_status(TaskState.SUCCESS, 4000)])
+    assert CheckpointDispatcher.compact(finished) is None
+    broken = replay(checkpoint())
+    broken.processes['server'][0].seq = 5
+    assert CheckpointDispatcher.compact(broken) is None
+
+
+class TestDispatchSnapshot(unittest.TestCase):
+  def test_replay(self):
+    state = replay(checkpoint())
+    snapshot = CheckpointDispatcher.compact(state)
+    handler = RecordingHandler()
+    replayed = replay([snapshot], handler=handler)
+    assert replayed.header == state.header
+    assert replayed.statuses == snapshot.runner_state.statuses
+    assert replayed.processes == snapshot.runner_state.processes
+    # Run counts, and hence run numbers and failure counts, are preserved.
+    assert dict((process, len(runs)) for process, runs in replayed.processes.items()) == {
+        'setup': 1, 'server': 2, 'sidecar': 2}
+    # Abbreviated runs carry no pids.
+    assert replayed.processes['server'][0].pid is None
+
+    assert handler.headers == ['hello_world']
+    assert handler.tasks == [TaskState.ACTIVE, TaskState.ACTIVE]
+    # Every transition is dispatched, processes in the order in which they were last forked.
+    assert handler.processes == (
+        [('setup', seq, state) for seq, state in enumerate((W, F, R, S))] +
+        [('server', seq, state) for seq, state in enumerate((W, F, R, X, W, F, R))] +
+        [('sidecar', seq, state) for seq, state in enumerate((W, F, L, W))])
+
+  def test_continues_stream(self):
+    records = checkpoint()
+    continued = [
+        RunnerCkpt(process_status=ProcessStatus(
+            seq=7, process='server', state=ProcessState.KILLED, stop_time=302.0, return_code=-9))
+    ] + run_updates('server', 8, (W,), None, None) + run_updates('sidecar', 4, (F, R), 400.0, 3002)
+    expected = replay(records + continued)
+    snapshot = CheckpointDispatcher.compact(replay(records), truncate=False)
+    assert replay([snapshot] + continued) == expected
+
+    compacted = replay([CheckpointDispatcher.compact(replay(records))] + continued)
+    for process, runs in expected.processes.items():
+      assert len(compacted.processes[process]) == len(runs)
+      assert compacted.processes[process][-1] == runs[-1]
+
+  def test_truncate(self):
+    state = replay([CheckpointDispatcher.compact(replay(checkpoint()))], truncate=True)
+    assert dict((process, len(runs)) for process, runs in state.processes.items()) == {
+        'setup': 1, 'server': 1, 'sidecar': 1}
+    assert state.processes['server'][0].pid == 2002
+
+  def test_must_begin_stream(self):
+    snapshot = CheckpointDispatcher.compact(replay(checkpoint()))
+    with pytest.raises(CheckpointDispatcher.ErrorRecoveringState):
+      replay(checkpoint()[:1] + [snapshot])
@@ -0,0 +1,67 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import unittest
+from unittest import mock
+
+from twitter.common.contextutil import temporary_dir
+
+from apache.thermos.common import compression
+from apache.thermos.common.compression import LogCodec, compress_file, open_log
+
+DATA = b'hello world\n' * 10000
+
+
+class TestOpenLog(unittest.TestCase):
+  def setUp(self):
+    self.td = self.enter(temporary_dir())
+    self.filename = os.path.join(self.td, 'stdout.1')
+    with open(self.filename, 'wb') as fp:
+      fp.write(DATA)
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def open_log(self, filename):
+    fp, size = open_log(filename)
+    with fp:
+      return fp.read(), size
+
+  def test_uncompressed(self):
+    assert self.open_log(self.filename) == (DATA, len(DATA))
+
+  def test_gzip(self):
+    target = compress_file(self.filename, LogCodec.GZIP)
+    assert target == self.filename + '.gz'
+    assert not os.path.exists(self.filename)
+    with mock.patch.object(compression, '_count_size', wraps=compression._count_size) as count:
+      assert self.open_log(target) == (DATA, len(DATA))
+      # The segment is too small to have wrapped ISIZE around, so it is not decompressed to size it.
+      assert count.call_count == 0
+
+  def test_gzip_size_counted(self):
+    target = compress_file(self.filename, LogCodec.GZIP)
+    # Segments that may have decompressed to 4GiB or more are counted rather than trusting ISIZE.
+    with mock.patch.object(compression, 'MAX_DEFLATE_RATIO', 2 ** 32):
+      with mock.patch.object(compression, '_count_size', wraps=compression._count_size) as count:
+        assert self.open_log(target) == (DATA, len(DATA))
+        assert count.call_count == 1
+
+  def test_empty_segment(self):
+    target = self.filename + '.gz'
+    open(target, 'wb').close()
+    assert self.open_log(target) == (b'', 0)
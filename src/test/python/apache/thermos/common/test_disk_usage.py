@@ -0,0 +1,91 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import unittest
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import du, safe_mkdir, touch
+
+from apache.thermos.common.disk_usage import DiskUsageTree
+from apache.thermos.common.inotify import Inotify
+
+
+def write(path, size):
+  safe_mkdir(os.path.dirname(path))
+  with open(path, 'ab') as fp:
+    fp.write(b'x' * size)
+
+
+def populate(root):
+  write(os.path.join(root, 'a', 'one'), 10000)
+  write(os.path.join(root, 'a', 'b', 'two'), 20000)
+  write(os.path.join(root, 'a', 'b', 'c', 'three'), 30000)
+  touch(os.path.join(root, 'empty'))
+  safe_mkdir(os.path.join(root, 'd'))
+  os.symlink(os.path.join(root, 'a', 'one'), os.path.join(root, 'link_to_file'))
+  os.symlink(os.path.join(root, 'a', 'b'), os.path.join(root, 'link_to_dir'))
+  os.symlink('nowhere', os.path.join(root, 'dangling'))
+
+
+def mutate(root):
+  write(os.path.join(root, 'a', 'one'), 50000)
+  write(os.path.join(root, 'd', 'e', 'f', 'four'), 40000)
+  os.rename(os.path.join(root, 'a', 'b'), os.path.join(root, 'd', 'b'))
+  write(os.path.join(root, 'd', 'b', 'c', 'three'), 10000)
+  os.unlink(os.path.join(root, 'empty'))
+
+
+class TestDiskUsageTree(unittest.TestCase):
+  def test_matches_du(self):
+    with temporary_dir() as root:
+      populate(root)
+      for use_inotify in (False, True):
+        tree = DiskUsageTree(root, use_inotify=use_inotify)
+        try:
+          assert tree.refresh() == du(root)
+          mutate(root)
+          assert tree.refresh() == du(root)
+        finally:
+          tree.close()
+        shutil.rmtree(root)
+        safe_mkdir(root)
+        populate(root)
+
+  @unittest.skipUnless(Inotify.is_supported(), 'inotify is not available.')
+  def test_incremental(self):
+    with temporary_dir() as root:
+      populate(root)
+      tree = DiskUsageTree(root)
+      try:
+        assert tree.refresh() == du(root)
+        assert tree.incremental
+        assert tree.refresh() == du(root)
+        mutate(root)
+        assert tree.refresh() == du(root)
+        shutil.rmtree(os.path.join(root, 'd'))
+        assert tree.refresh() == du(root)
+        shutil.rmtree(root)
+        assert tree.refresh() == 0
+      finally:
+        tree.close()
+      assert not tree.incremental
+
+  def test_missing_root(self):
+    with temporary_dir() as root:
+      tree = DiskUsageTree(os.path.join(root, 'missing'))
+      assert tree.refresh() == 0
+      tree.close()
+      assert tree.refresh() == 0
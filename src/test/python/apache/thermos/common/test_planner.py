@@ -0,0 +1,353 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import random
+import unittest
+from functools import partial
+from unittest import mock
+
+import pytest
+
+from apache.thermos.common.planner import Planner, TaskPlanner
+from apache.thermos.config.schema import Process, Resources, Task, order
+
+
+def process(name, **kw):
+  kw.setdefault('min_duration', 0)
+  return Process(name=name, cmdline='echo %s' % name, **kw)
+
+
+def task(processes, constraints=(), **kw):
+  return Task(name='task', processes=processes, constraints=list(constraints),
+              resources=Resources(cpu=1, ram=1, disk=1), **kw)
+
+
+class FakeClock(object):
+  def __init__(self, now=0.0):
+    self.now = now
+
+  def time(self):
+    return self.now
+
+
+class TestPlanner(unittest.TestCase):
+  def test_empty(self):
+    planner = Planner(set(), {})
+    assert planner.runnable == set()
+    assert planner.is_complete()
+
+  def test_ordering(self):
+    planner = Planner(set('abc'), {'b': set('a'), 'c': set('b')})
+    for process in 'abc':
+      assert planner.runnable == set(process)
+      planner.set_running(process)
+      assert planner.runnable == set()
+      assert not planner.is_complete()
+      planner.set_finished(process)
+    assert planner.finished == set('abc')
+    assert planner.is_complete()
+
+  def test_dependencies(self):
+    # a and b both precede c, which precedes d; e is independent.
+    planner = Planner(set('abcde'), {'c': set('ab'), 'd': set('c')})
+    assert planner.runnable == set('abe')
+    planner.set_running('a')
+    planner.set_finished('a')
+    assert planner.runnable == set('be')
+    planner.set_running('b')
+    planner.set_finished('b')
+    assert planner.runnable == set('ce')
+    planner.set_running('c')
+    # A process which is reset returns to the runnable set; its dependents stay blocked.
+    planner.reset('c')
+    assert planner.runnable == set('ce')
+    planner.set_running('c')
+    planner.set_finished('c')
+    assert planner.runnable == set('de')
+
+  def test_failure(self):
+    planner = Planner(set('abc'), {'b': set('a')})
+    planner.set_running('a')
+    planner.set_failed('a')
+    # The dependents of a failed process never become runnable.
+    assert planner.runnable == set('c')
+    assert planner.failed == set('a')
+    planner.set_running('c')
+    planner.set_finished('c')
+    assert not planner.is_complete()
+    with pytest.raises(AssertionError):
+      planner.set_running('b')
+
+  def test_cycles(self):
+    assert Planner.satisfiable(set('abc'), {'b': set('a'), 'c': set('b')})
+    assert not Planner.satisfiable(set('abc'), {'a': set('c'), 'b': set('a'), 'c': set('b')})
+    assert not Planner.satisfiable(set('a'), {'a': set('a')})
+    with pytest.raises(Planner.InvalidSchedule):
+      Planner(set('abcd'), {'b': set('a'), 'c': set('bd'), 'd': set('c')})
+
+  def test_queries_are_copies(self):
+    planner = Planner(set('ab'), {})
+    planner.runnable.clear()
+    planner.processes.clear()
+    assert planner.runnable == set('ab')
+    assert planner.processes == set('ab')
+
+
+class TestTaskPlanner(unittest.TestCase):
+  def test_extract_dependencies(self):
+    processes = [process(name) for name in 'abcd']
+    processes, dependencies = TaskPlanner.extract_dependencies(
+        task(processes, order('a', 'b', 'c') + order('a', 'd')))
+    assert processes == set('abcd')
+    assert dict(dependencies) == {'b': set('a'), 'c': set('b'), 'd': set('a')}
+
+  def test_invalid_schedules(self):
+    for processes, constraints in (
+        # Cycles.
+        ([process('a'), process('b')], order('a', 'b') + order('b', 'a')),
+        # Constraints on unknown processes.
+        ([process('a'), process('b')], order('a', 'c')),
+        # Nothing may depend upon a daemon.
+        ([process('a', daemon=True), process('b')], order('a', 'b')),
+        # Non-ephemeral processes may not depend upon ephemeral processes.
+        ([process('a', ephemeral=True), process('b')], order('a', 'b'))):
+      with pytest.raises(TaskPlanner.InvalidSchedule):
+        TaskPlanner(task(processes, constraints))
+
+  def test_ordering(self):
+    planner = TaskPlanner(task([process(name) for name in 'abc'], order('a', 'b', 'c')),
+                          clock=FakeClock())
+    for process_name in 'abc':
+      assert planner.runnable == set(process_name)
+      planner.set_running(process_name)
+      planner.add_success(process_name)
+    assert planner.finished == set('abc')
+    assert planner.is_complete()
+
+  def test_max_failures(self):
+    clock = FakeClock()
+    planner = TaskPlanner(task([process('a', max_failures=3), process('b')], order('a', 'b')),
+                          clock=clock)
+    for _ in range(2):
+      planner.set_running('a')
+      planner.add_failure('a')
+      assert planner.runnable == set('a')
+    planner.set_running('a')
+    planner.add_failure('a')
+    assert planner.failed == set('a')
+    assert planner.runnable == set()
+    assert not planner.is_complete()
+
+  def test_unlimited_failures(self):
+    planner = TaskPlanner(task([process('a', max_failures=0)]), clock=FakeClock())
+    for _ in range(100):
+      planner.set_running('a')
+      planner.add_failure('a')
+    assert planner.runnable == set('a')
+    assert planner.failed == set()
+
+  def test_daemon(self):
+    planner = TaskPlanner(task([process('a', daemon=True)]), clock=FakeClock())
+    for _ in range(3):
+      planner.set_running('a')
+      planner.add_success('a')
+      assert planner.runnable == set('a')
+    assert not planner.is_complete()
+
+  def test_ephemeral(self):
+    planner = TaskPlanner(task([process('a'), process('b', ephemeral=True, daemon=True)]),
+                          clock=FakeClock())
+    planner.set_running('a')
+    planner.set_running('b')
+    planner.add_success('a')
+    # Ephemeral processes do not hold up the completion of the task.
+    assert planner.running == set('b')
+    assert planner.is_complete()
+
+  def test_ephemeral_failure(self):
+    planner = TaskPlanner(task([process('a', ephemeral=True)]), clock=FakeClock())
+    planner.set_running('a')
+    planner.add_failure('a')
+    # Ephemeral processes which exhaust their failures are finished rather than failed.
+    assert planner.finished == set('a')
+    assert planner.failed == set()
+
+  def test_lost(self):
+    planner = TaskPlanner(task([process('a', max_failures=1)]), clock=FakeClock())
+    for _ in range(5):
+      planner.set_running('a')
+      planner.lost('a')
+      assert planner.runnable == set('a')
+    assert planner.failed == set()
+
+  def test_run_limit(self):
+    with mock.patch.object(TaskPlanner, 'TOTAL_RUN_LIMIT', 3):
+      planner = TaskPlanner(task([process('a', daemon=True, max_failures=0)]), clock=FakeClock())
+      planner.set_running('a')
+      planner.add_success('a')
+      planner.set_running('a')
+      planner.lost('a')
+      planner.set_running('a')
+      planner.add_failure('a')
+      assert planner.failed == set('a')
+
+  def test_min_duration(self):
+    clock = FakeClock(100)
+    planner = TaskPlanner(task([process('a', min_duration=10, max_failures=0),
+                                process('b', min_duration=5, max_failures=0)]), clock=clock)
+    assert planner.runnable == set('ab')
+    planner.set_running('a')
+    planner.set_running('b')
+    planner.add_failure('a', 100)
+    planner.add_failure('b', 102)
+    assert planner.runnable_at(103) == set()
+    assert planner.waiting_at(103) == set('ab')
+    assert planner.min_wait(103) == 4
+    assert planner.runnable_at(107) == set('b')
+    assert planner.waiting_at(107) == set('a')
+    assert planner.min_wait(107) == 0
+    # Queries about an earlier time are still answered correctly.
+    assert planner.runnable_at(101) == set()
+    assert planner.waiting_at(101) == set('ab')
+    assert planner.runnable_at(110) == set('ab')
+
+    # Terminating again supersedes the earlier deadline.
+    planner.set_running('a')
+    planner.add_failure('a', 111)
+    assert planner.runnable_at(115) == set('b')
+    assert planner.runnable_at(121) == set('ab')
+    clock.now = 121
+    assert planner.runnable == set('ab')
+    assert planner.waiting == set()
+    assert planner.min_wait() == 0
+
+  def test_min_wait_without_waiters(self):
+    planner = TaskPlanner(task([process('a')]), clock=FakeClock())
+    planner.set_running('a')
+    assert planner.min_wait() == TaskPlanner.INFINITY
+
+  def test_finalizing(self):
+    # As the runner does: the regular and finalizing processes are planned separately.
+    processes = [process('a'), process('b'), process('c', final=True), process('d', final=True)]
+    constraints = order('a', 'b') + order('c', 'd')
+    regular = TaskPlanner(task(processes, constraints), clock=FakeClock(),
+                          process_filter=lambda proc: proc.final().get() is False)
+    finalizing = TaskPlanner(task(processes, constraints), clock=FakeClock(),
+                             process_filter=lambda proc: proc.final().get() is True)
+    assert regular.runnable == set('a')
+    assert finalizing.runnable == set('c')
+    for process_name in 'ab':
+      regular.set_running(process_name)
+      regular.add_success(process_name)
+    assert regular.is_complete()
+    assert not finalizing.is_complete()
+    for process_name in 'cd':
+      finalizing.set_running(process_name)
+      finalizing.add_success(process_name)
+    assert finalizing.is_complete()
+
+    # Constraints may not span the regular and finalizing processes.
+    with pytest.raises(TaskPlanner.InvalidSchedule):
+      TaskPlanner(task(processes, order('b', 'c')),
+                  process_filter=lambda proc: proc.final().get() is False)
+
+
+class RescanningPlanner(Planner):
+  """The straightforward planner: rescan every process and dependency on each query."""
+
+  @property
+  def runnable(self):
+    idle = self._processes - self._running - self._finished - self._failed
+    return set(process for process in idle if self._dependencies[process] <= self._finished)
+
+  def set_running(self, process):
+    assert process in self._running or process in self.runnable
+    self._running.add(process)
+
+
+class RescanningTaskPlanner(TaskPlanner):
+  """The straightforward task planner: filter the runnable processes by their wait."""
+
+  def __init__(self, task, clock, process_filter=None):
+    super(RescanningTaskPlanner, self).__init__(task, clock=clock, process_filter=process_filter)
+    self._planner = RescanningPlanner(*self.extract_dependencies(task, self._filter))
+
+  def runnable_at(self, timestamp):
+    return set(filter(partial(self.is_ready, timestamp=timestamp), self._planner.runnable))
+
+  def waiting_at(self, timestamp):
+    return set(filter(partial(self.is_waiting, timestamp=timestamp), self._planner.runnable))
+
+
+def random_task(rng, count):
+  processes, constraints = [], []
+  for k in range(count):
+    daemon, ephemeral = rng.random() < 0.2, rng.random() < 0.2
+    processes.append(process(
+        'p%d' % k, daemon=daemon, ephemeral=ephemeral, min_duration=rng.randint(0, 5),
+        max_failures=rng.randint(0, 3)))
+    candidates = [j for j in range(k) if not processes[j].daemon().get() and
+                  (ephemeral or not processes[j].ephemeral().get())]
+    for j in rng.sample(candidates, min(len(candidates), rng.randint(0, 3))):
+      constraints.extend(order('p%d' % j, 'p%d' % k))
+  return task(processes, constraints)
+
+
+class TestTaskPlannerDifferential(unittest.TestCase):
+  """Drive the planner the way the runner does, comparing it against the rescanning planner."""
+
+  def assert_same(self, planner, reference, timestamp):
+    assert planner.runnable_at(timestamp) == reference.runnable_at(timestamp)
+    assert planner.waiting_at(timestamp) == reference.waiting_at(timestamp)
+    assert planner.min_wait(timestamp) == reference.min_wait(timestamp)
+    assert planner.running == reference.running
+    assert planner.finished == reference.finished
+    assert planner.failed == reference.failed
+    assert planner.is_complete() == reference.is_complete()
+
+  def drive(self, seed, count, max_concurrency):
+    rng = random.Random(seed)
+    clock = FakeClock()
+    generated = random_task(rng, count)
+    planner = TaskPlanner(generated, clock=clock)
+    reference = RescanningTaskPlanner(generated, clock=clock)
+    for _ in range(150):
+      if planner.is_complete():
+        break
+      now = clock.time()
+      self.assert_same(planner, reference, now)
+      # Queries about an earlier time, e.g. by the observer or a slow scheduling pass.
+      self.assert_same(planner, reference, now - rng.randint(1, 5))
+
+      runnable = sorted(planner.runnable_at(now))
+      if max_concurrency:
+        runnable = runnable[:max(max_concurrency - len(planner.running), 0)]
+      for process_name in runnable:
+        planner.set_running(process_name)
+        reference.set_running(process_name)
+      if max_concurrency:
+        assert len(planner.running) <= max_concurrency
+
+      clock.now += rng.randint(0, 3)
+      for process_name in sorted(planner.running):
+        if rng.random() < 0.5:
+          continue
+        outcome = rng.choice(('add_success', 'add_failure', 'lost'))
+        getattr(planner, outcome)(process_name, clock.time())
+        getattr(reference, outcome)(process_name, clock.time())
+    self.assert_same(planner, reference, clock.time())
+
+  def test_differential(self):
+    for seed in range(30):
+      self.drive(seed, count=random.Random(seed).randint(1, 25), max_concurrency=seed % 4)
@@ -0,0 +1,138 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import subprocess
+import unittest
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import safe_mkdir
+
+from apache.thermos.common.procfs import (
+    CgroupMemoryStat,
+    ProcessEntry,
+    ProcessMemory,
+    ProcessTable
+)
+
+
+def entry(pid, ppid):
+  return ProcessEntry(pid=pid, ppid=ppid, status='sleeping', user=0, system=0, nice=0, threads=1,
+                      create_time=0, vms=0, rss=0)
+
+
+class TestProcessTable(unittest.TestCase):
+  def test_parse_stat(self):
+    data = ('1234 (my (odd) proc) S 1 1234 1234 0 -1 4194560 100 0 0 0 250 50 0 0 20 5 3 0 '
+            '1000 8192000 300 18446744073709551615 1 1 0 0 0 0 0 0 0 0 0 0 17 0 0 0 0 0 0\n')
+    parsed = ProcessTable.parse_stat(1234, data, 100.0, 4096, 1000.0)
+    assert parsed.pid == 1234
+    assert parsed.ppid == 1
+    assert parsed.status == 'sleeping'
+    assert parsed.user == 2.5
+    assert parsed.system == 0.5
+    assert parsed.nice == 5
+    assert parsed.threads == 3
+    assert parsed.create_time == 1010.0
+    assert parsed.vms == 8192000
+    assert parsed.rss == 300 * 4096
+
+  def test_descendants(self):
+    table = ProcessTable(dict((e.pid, e) for e in (
+        entry(1, 0), entry(2, 1), entry(3, 2), entry(4, 2), entry(5, 1), entry(6, 99))))
+    assert sorted(table.descendants(1)) == [2, 3, 4, 5]
+    assert sorted(table.descendants(2)) == [3, 4]
+    assert table.descendants(6) == []
+    assert sorted(table.children(1)) == [2, 5]
+    assert 6 in table
+    assert table.get(7) is None
+
+  @unittest.skipUnless(ProcessTable.is_supported(), 'procfs is not available.')
+  def test_snapshot(self):
+    child = subprocess.Popen(['sleep', '10'])
+    try:
+      table = ProcessTable.snapshot()
+      assert table[os.getpid()].pid == os.getpid()
+      assert child.pid in table.descendants(os.getpid())
+    finally:
+      child.kill()
+      child.wait()
+
+  @unittest.skipUnless(ProcessTable.is_supported(), 'procfs is not available.')
+  def test_uids(self):
+    table = ProcessTable.snapshot()
+    uids = table.uids(os.getpid())
+    assert uids.real == os.getuid()
+    assert uids.effective == os.geteuid()
+    assert table.uids(-1) is None
+
+
+SMAPS = b"""00400000-00452000 r-xp 00000000 08:02 173521      /usr/bin/dbus-daemon
+Size:                328 kB
+Rss:                 300 kB
+Pss:                 150 kB
+Private_Clean:        20 kB
+Private_Dirty:        10 kB
+Swap:                  0 kB
+SwapPss:               0 kB
+7ffd5a1b2000-7ffd5a1d3000 rw-p 00000000 00:00 0          [stack]
+Size:                132 kB
+Rss:                  12 kB
+Pss:                  12 kB
+Private_Clean:         0 kB
+Private_Dirty:        12 kB
+Swap:                  4 kB
+SwapPss:               4 kB
+"""
+
+
+class TestProcessMemory(unittest.TestCase):
+  def test_parse_smaps(self):
+    memory = ProcessMemory.parse_smaps(SMAPS)
+    assert memory.rss == 312 * 1024
+    assert memory.pss == 162 * 1024
+    assert memory.uss == 42 * 1024
+    assert memory.swap == 4 * 1024
+
+  @unittest.skipUnless(ProcessTable.is_supported(), 'procfs is not available.')
+  def test_read(self):
+    memory = ProcessMemory.read(os.getpid())
+    assert 0 < memory.pss <= memory.rss
+    with self.assertRaises((IOError, OSError)):
+      ProcessMemory.read(-1)
+
+
+class TestCgroupMemoryStat(unittest.TestCase):
+  def test_parse(self):
+    v1 = 'cache 1\nrss 2\ntotal_cache 4096\ntotal_rss 8192\ntotal_swap 512\n'
+    assert CgroupMemoryStat.parse(v1) == CgroupMemoryStat(rss=8192, cache=4096, swap=512)
+    v2 = 'anon 8192\nfile 4096\nkernel_stack 16\n'
+    assert CgroupMemoryStat.parse(v2) == CgroupMemoryStat(rss=8192, cache=4096, swap=0)
+
+  def test_locate(self):
+    with temporary_dir() as root:
+      procfs, cgroupfs = os.path.join(root, 'proc'), os.path.join(root, 'cgroup')
+      safe_mkdir(os.path.join(procfs, '1'))
+      with open(os.path.join(procfs, '1', 'cgroup'), 'w') as fp:
+        fp.write('5:cpu,cpuacct:/task\n4:memory:/task\n0::/task\n')
+      assert CgroupMemoryStat.locate(1, procfs=procfs, cgroupfs=cgroupfs) is None
+      v2 = os.path.join(cgroupfs, 'task', 'memory.stat')
+      safe_mkdir(os.path.dirname(v2))
+      open(v2, 'w').close()
+      assert CgroupMemoryStat.locate(1, procfs=procfs, cgroupfs=cgroupfs) == v2
+      v1 = os.path.join(cgroupfs, 'memory', 'task', 'memory.stat')
+      safe_mkdir(os.path.dirname(v1))
+      open(v1, 'w').close()
+      assert CgroupMemoryStat.locate(1, procfs=procfs, cgroupfs=cgroupfs) == v1
+      assert CgroupMemoryStat.locate(2, procfs=procfs, cgroupfs=cgroupfs) is None
@@ -0,0 +1,118 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Measure the throughput of piping process output into rotated logs.
+
+  python process_logging_benchmark.py [--megabytes N] [--rotate-megabytes N] [--repeat N]
+
+A verbose process (yes(1) piped through head(1)) is run through the PipedSubprocessExecutor with
+RotatingFileHandlers for stdout and stderr, using the previous per-chunk flushing pipeline, the
+buffered pipeline and (where available) the splice(2) pipeline.
+"""
+
+import argparse
+import os
+import select
+import shutil
+import tempfile
+import time
+
+from apache.thermos.common.path import TaskPath
+from apache.thermos.core.process import PipedSubprocessExecutor, RotatingFileHandler
+
+
+class LegacyRotatingFileHandler(RotatingFileHandler):
+  """The previous handler: flush every chunk and check the file position for rollover."""
+
+  def write(self, b):
+    self.file.write(b)
+    self.file.flush()
+    if self._max_bytes > 0 and self._max_backups > 0 and self.file.tell() >= self._max_bytes:
+      self.rollover()
+
+
+class LegacyPipedSubprocessExecutor(PipedSubprocessExecutor):
+  """The previous executor: fixed size reads from a one second select() loop."""
+
+  def wait(self):
+    pipes = {
+      self._popen.stderr.fileno(): self._stderr,
+      self._popen.stdout.fileno(): self._stdout,
+    }
+    rc = None
+    while rc is None or pipes:
+      rc = self._popen.poll()
+      read_results, _, _ = select.select(list(pipes), [], [], 1)
+      for fd in read_results:
+        buf = os.read(fd, self.READ_BUFFER_SIZE)
+        if len(buf) == 0:
+          del pipes[fd]
+        else:
+          pipes[fd].write(buf)
+    return rc
+
+
+class CopyingPipedSubprocessExecutor(PipedSubprocessExecutor):
+  USE_SPLICE = False
+
+
+def pipelines():
+  yield 'per-chunk flush', LegacyPipedSubprocessExecutor, LegacyRotatingFileHandler
+  yield 'buffered', CopyingPipedSubprocessExecutor, RotatingFileHandler
+  if PipedSubprocessExecutor.USE_SPLICE:
+    yield 'splice', PipedSubprocessExecutor, RotatingFileHandler
+
+
+def run_once(executor_class, handler_class, command, rotate_bytes):
+  log_dir = tempfile.mkdtemp(prefix='thermos_logs.')
+  try:
+    handlers = [handler_class(os.path.join(log_dir, name), rotate_bytes, 5)
+                for name in ('stdout', 'stderr')]
+    executor = executor_class(
+        args=command,
+        close_fds=True,
+        cwd=log_dir,
+        env=dict(PATH=os.environ['PATH']),
+        pathspec=TaskPath(root=log_dir),
+        stdout=handlers[0],
+        stderr=handlers[1])
+    start = time.time()
+    executor.start()
+    rc = executor.wait()
+    elapsed = time.time() - start
+    for handler in handlers:
+      handler.close()
+    assert rc == 0, 'Benchmark process failed with %s' % rc
+    return elapsed
+  finally:
+    shutil.rmtree(log_dir)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--megabytes', type=int, default=1024)
+  parser.add_argument('--rotate-megabytes', type=int, default=100)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  size = args.megabytes * 2 ** 20
+  command = ['sh', '-c', 'yes "thermos benchmark log line" | head -c %d' % size]
+  for name, executor_class, handler_class in pipelines():
+    elapsed = min(run_once(executor_class, handler_class, command, args.rotate_megabytes * 2 ** 20)
+                  for _ in range(args.repeat))
+    print('%-16s %8.1f MiB/s' % (name, args.megabytes / elapsed))
+
+
+if __name__ == '__main__':
+  main()
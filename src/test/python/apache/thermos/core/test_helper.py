@@ -0,0 +1,125 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import subprocess
+import sys
+import time
+import unittest
+
+import psutil
+import pytest
+
+from apache.thermos.common.procfs import ProcessTable
+from apache.thermos.core.helper import TaskRunnerHelper, _TableProcess
+
+from gen.apache.thermos.ttypes import ProcessState, ProcessStatus, RunnerHeader, RunnerState
+
+# Forks a grandchild, reports its pid and then waits for it.
+SPAWN_TREE = """
+import subprocess, sys
+child = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+sys.stdout.write('%d\\n' % child.pid)
+sys.stdout.flush()
+child.wait()
+"""
+
+
+@unittest.skipUnless(ProcessTable.is_supported(), '/proc is unavailable.')
+class TestProcessTableScans(unittest.TestCase):
+  def spawn(self, *args):
+    process = subprocess.Popen([sys.executable] + list(args), stdout=subprocess.PIPE)
+    self.addCleanup(process.wait)
+    self.addCleanup(process.kill)
+    return process
+
+  def setUp(self):
+    self.coordinator = self.spawn('-c', 'import time; time.sleep(60)')
+    self.process = self.spawn('-c', SPAWN_TREE)
+    self.grandchild = int(self.process.stdout.readline())
+    self.addCleanup(TaskRunnerHelper.kill_pid, self.grandchild)
+
+  def state(self, uid=os.getuid(), fork_time=None, start_time=None):
+    user = TaskRunnerHelper.get_actual_user()
+    fork_time = fork_time or psutil.Process(self.coordinator.pid).create_time()
+    start_time = start_time or psutil.Process(self.process.pid).create_time()
+    return RunnerState(
+        header=RunnerHeader(user=user, uid=uid),
+        processes={
+            'hello': [ProcessStatus(
+                seq=2, process='hello', state=ProcessState.RUNNING,
+                coordinator_pid=self.coordinator.pid, fork_time=fork_time,
+                pid=self.process.pid, start_time=start_time)],
+            'world': [ProcessStatus(seq=0, process='world', state=ProcessState.WAITING)],
+        })
+
+  def assert_scans(self, state, expected):
+    # Without a table the scans look processes up through psutil.
+    scanned = dict((process, TaskRunnerHelper.scan_process(state, process))
+                   for process in state.processes)
+    assert scanned == expected
+    assert TaskRunnerHelper.scan_tree(state, ProcessTable.snapshot()) == expected
+    assert TaskRunnerHelper.scan_tree(state) == expected
+
+  def test_scan(self):
+    self.assert_scans(self.state(), {
+        'hello': (self.coordinator.pid, self.process.pid, set([self.grandchild])),
+        'world': (None, None, set()),
+    })
+
+  def test_scan_legacy_checkpoint(self):
+    # Checkpoints without a uid fall back to the username.
+    self.assert_scans(self.state(uid=None), {
+        'hello': (self.coordinator.pid, self.process.pid, set([self.grandchild])),
+        'world': (None, None, set()),
+    })
+
+  def test_scan_wrong_uid(self):
+    uid = os.getuid() + 1
+    self.assert_scans(self.state(uid=uid), {
+        'hello': (None, None, set()),
+        'world': (None, None, set()),
+    })
+
+  def test_scan_reused_pids(self):
+    # Processes started well apart from their checkpointed times are not ours.
+    long_ago = time.time() - 3600
+    self.assert_scans(self.state(fork_time=long_ago, start_time=long_ago), {
+        'hello': (None, None, set()),
+        'world': (None, None, set()),
+    })
+
+  def test_scan_exited(self):
+    state = self.state()
+    for process in (self.coordinator, self.process):
+      process.kill()
+      process.wait()
+    TaskRunnerHelper.kill_pid(self.grandchild)
+    self.assert_scans(state, {
+        'hello': (None, None, set()),
+        'world': (None, None, set()),
+    })
+
+  def test_table_process(self):
+    table = ProcessTable.snapshot()
+    process = _TableProcess(table, self.process.pid)
+    expected = psutil.Process(self.process.pid)
+    assert abs(process.create_time() - expected.create_time()) < 1
+    assert process.uids().real == expected.uids().real
+    assert process.username() == expected.username()
+    assert [child.pid for child in process.children()] == [self.grandchild]
+    assert self.grandchild in [
+        child.pid for child in _TableProcess(table, os.getpid()).children(recursive=True)]
+    with pytest.raises(psutil.NoSuchProcess):
+      _TableProcess(table, max(entry.pid for entry in table) + 1)
@@ -0,0 +1,287 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import safe_mkdir
+from twitter.common.recordio import ThriftRecordWriter
+
+from apache.thermos.common.inotify import Inotify
+from apache.thermos.common.path import TaskPath
+from apache.thermos.core.muxer import ProcessMuxer
+
+from gen.apache.thermos.ttypes import ProcessState, ProcessStatus, RunnerCkpt
+
+
+class FakeClock(object):
+  def __init__(self, now=1000.0):
+    self.now = now
+    self.slept = []
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.slept.append(seconds)
+    self.now += seconds
+
+
+def process_update(process, seq):
+  return RunnerCkpt(process_status=ProcessStatus(
+      seq=seq, process=process, state=ProcessState.RUNNING, pid=1000 + seq))
+
+
+class MuxerTestBase(unittest.TestCase):
+  def setUp(self):
+    self.root = self.enter(temporary_dir())
+    self.pathspec = TaskPath(root=self.root, task_id='hello_world')
+    safe_mkdir(self.pathspec.getpath('checkpoint_path'))
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def muxer(self, **kw):
+    muxer = ProcessMuxer(self.pathspec, **kw)
+    self.addCleanup(muxer.close)
+    return muxer
+
+  def checkpoint(self, process):
+    return self.pathspec.given(process=process).getpath('process_checkpoint')
+
+  def index(self, process):
+    return self.pathspec.given(process=process).getpath('process_checkpoint_index')
+
+  def write(self, process, seqs):
+    with open(self.checkpoint(process), 'ab') as fp:
+      writer = ThriftRecordWriter(fp)
+      for seq in seqs:
+        writer.write(process_update(process, seq))
+
+
+class TestProcessMuxerIndexes(MuxerTestBase):
+  def test_fast_forward(self):
+    self.write('hello', range(200))
+    self.write('world', range(1, 10))
+    muxer = self.muxer()
+    muxer.register('hello', watermark=149)
+    muxer.register('world')
+    updates = muxer.select()
+    assert [(u.process_status.process, u.process_status.seq) for u in updates] == (
+        [('hello', seq) for seq in range(150, 200)] + [('world', seq) for seq in range(1, 10)])
+    # Only a checkpoint fast forwarded past a watermark is indexed.
+    assert os.path.exists(self.index('hello'))
+    assert not os.path.exists(self.index('world'))
+
+    # A restarted runner fast forwards through the saved index.
+    self.write('hello', range(200, 210))
+    muxer = self.muxer()
+    muxer.register('hello', watermark=204)
+    assert [u.process_status.seq for u in muxer.select()] == list(range(205, 210))
+
+  def test_remove_indexes(self):
+    for process in ('hello', 'world'):
+      self.write(process, range(100))
+    muxer = self.muxer()
+    for process in ('hello', 'world'):
+      muxer.register(process, watermark=50)
+    muxer.select()
+    assert os.path.exists(self.index('hello')) and os.path.exists(self.index('world'))
+    muxer.remove_indexes()
+    assert sorted(os.listdir(self.pathspec.getpath('checkpoint_path'))) == [
+        'coordinator.hello', 'coordinator.world']
+    # Removing absent indexes is a no-op.
+    muxer.remove_indexes()
+
+
+@unittest.skipUnless(hasattr(os, 'pidfd_open'), 'pidfds are unavailable.')
+class TestProcessMuxerExits(MuxerTestBase):
+  def setUp(self):
+    super(TestProcessMuxerExits, self).setUp()
+    self.clock = FakeClock()
+
+  def spawn(self):
+    process = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(60)'])
+    self.addCleanup(process.wait)
+    self.addCleanup(process.kill)
+    return process
+
+  def test_wakes_on_exit(self):
+    muxer = self.muxer(clock=self.clock, enable_inotify=False)
+    hello, world = self.spawn(), self.spawn()
+    muxer.watch_exit('hello', hello.pid)
+    muxer.watch_exit('world', world.pid)
+    assert muxer.exited() == set()
+
+    hello.kill()
+    start = time.time()
+    assert muxer.wait(30) == 0
+    assert time.time() - start < 10
+    assert self.clock.slept == []
+    assert muxer.exited() == set(['hello'])
+    assert muxer.exited() == set()
+
+    # The exited coordinator is no longer watched; the remaining one still is.
+    world.kill()
+    muxer.wait(30)
+    assert muxer.exited() == set(['world'])
+
+  def test_already_exited(self):
+    muxer = self.muxer(clock=self.clock, enable_inotify=False)
+    process = self.spawn()
+    process.kill()
+    process.wait()
+    muxer.watch_exit('hello', process.pid)
+    # An exit noticed before wait() returns at once.
+    assert muxer.wait(30) == 0
+    assert muxer.exited() == set(['hello'])
+
+  def test_unwatch(self):
+    muxer = self.muxer(clock=self.clock, enable_inotify=False)
+    self.write('hello', range(1, 2))
+    muxer.register('hello')
+    muxer.watch_exit('hello', self.spawn().pid)
+    muxer.unregister('hello')
+    # With nothing left to watch, wait() sleeps on the clock.
+    assert muxer.wait(5) == 5
+    assert self.clock.slept == [5]
+    assert muxer.exited() == set()
+
+  def test_times_out(self):
+    clock = FakeClock()
+    clock.time = time.time
+    muxer = self.muxer(clock=clock, enable_inotify=False)
+    muxer.watch_exit('hello', self.spawn().pid)
+    waited = muxer.wait(0.2)
+    assert 0.2 <= waited < 5
+    assert clock.slept == []
+    assert muxer.exited() == set()
+
+
+class TestProcessMuxerPolling(MuxerTestBase):
+  def test_sleeps_on_clock(self):
+    clock = FakeClock()
+    muxer = self.muxer(clock=clock, enable_inotify=False)
+    assert not muxer.event_driven
+    assert muxer.wait(5) == 5
+    assert muxer.wait(0.5) == 0.5
+    assert clock.slept == [5, 0.5]
+    assert clock.time() == 1005.5
+
+
+@unittest.skipUnless(Inotify.is_supported(), 'inotify is unavailable.')
+class TestProcessMuxerInotify(MuxerTestBase):
+  def write_later(self, delay, process, seqs):
+    def write():
+      time.sleep(delay)
+      self.write(process, seqs)
+    thread = threading.Thread(target=write)
+    thread.start()
+    self.addCleanup(thread.join)
+
+  def test_wakes_on_coordinator_write(self):
+    self.write('hello', range(1, 3))
+    muxer = self.muxer()
+    muxer.register('hello')
+    assert [u.process_status.seq for u in muxer.select()] == [1, 2]
+    assert muxer.event_driven
+
+    self.write_later(0.2, 'hello', range(3, 4))
+    start = time.time()
+    muxer.wait(30)
+    assert time.time() - start < 10
+    assert [u.process_status.seq for u in muxer.select()] == [3]
+
+  def test_wakes_on_new_coordinator(self):
+    muxer = self.muxer()
+    muxer.register('hello')
+    assert muxer.select() == []
+    self.write_later(0.2, 'hello', range(1, 2))
+    start = time.time()
+    updates = []
+    # The creation of the checkpoint may wake the muxer before the record is written.
+    while not updates and time.time() - start < 10:
+      muxer.wait(30)
+      updates = muxer.select()
+    assert time.time() - start < 10
+    assert [u.process_status.seq for u in updates] == [1]
+
+  def test_pending_write_wakes_immediately(self):
+    muxer = self.muxer()
+    muxer.register('hello')
+    muxer.select()
+    # Written after select() but before wait().
+    self.write('hello', range(1, 2))
+    start = time.time()
+    muxer.wait(30)
+    assert time.time() - start < 1
+
+  def test_ignores_runner_checkpoint(self):
+    muxer = self.muxer()
+    muxer.register('hello')
+    muxer.select()
+    with open(self.pathspec.getpath('runner_checkpoint'), 'ab') as fp:
+      fp.write(b'runner')
+    waited = muxer.wait(0.3)
+    assert waited >= 0.3
+
+  def test_watches_checkpoint_directory_once_created(self):
+    os.rmdir(self.pathspec.getpath('checkpoint_path'))
+    muxer = self.muxer()
+    muxer.register('hello')
+    muxer.select()
+    assert not muxer.event_driven
+    safe_mkdir(self.pathspec.getpath('checkpoint_path'))
+    muxer.select()
+    assert muxer.event_driven
+
+
+class TestProcessMuxerFallback(MuxerTestBase):
+  def assert_polls(self, muxer):
+    clock = muxer._clock
+    muxer.register('hello')
+    muxer.select()
+    assert not muxer.event_driven
+    self.write('hello', range(1, 2))
+    # Without a watch, wait() sleeps on the clock rather than waking up on the write.
+    assert muxer.wait(5) == 5
+    assert clock.slept == [5]
+    assert [u.process_status.seq for u in muxer.select()] == [1]
+
+  def test_disabled(self):
+    self.assert_polls(self.muxer(clock=FakeClock(), enable_inotify=False))
+
+  def test_unsupported(self):
+    with mock.patch.object(Inotify, 'is_supported', return_value=False):
+      self.assert_polls(self.muxer(clock=FakeClock()))
+
+  def test_initialization_fails(self):
+    error = OSError(24, 'Too many open files')
+    with mock.patch.object(Inotify, '__init__', side_effect=error):
+      self.assert_polls(self.muxer(clock=FakeClock()))
+
+  @unittest.skipUnless(Inotify.is_supported(), 'inotify is unavailable.')
+  def test_watch_fails(self):
+    muxer = self.muxer(clock=FakeClock())
+    error = OSError(28, 'No space left on device')
+    with mock.patch.object(Inotify, 'add_watch', side_effect=error):
+      self.assert_polls(muxer)
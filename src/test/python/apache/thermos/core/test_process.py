@@ -0,0 +1,137 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import errno
+import json
+import os
+import unittest
+from unittest import mock
+
+import pytest
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import lock_file, safe_mkdir
+from twitter.common.recordio import ThriftRecordReader
+
+from apache.thermos.common.path import TaskPath
+from apache.thermos.core.process import ProcessBase, RealPlatform
+
+from gen.apache.thermos.ttypes import ProcessState, RunnerCkpt
+
+
+class RecordingProcess(ProcessBase):
+  """Records, from the co-ordinator, what it holds of the other processes of its launch."""
+
+  def __init__(self, name, pathspec, sandbox, platform=None):
+    super(RecordingProcess, self).__init__(name, 'true', 0, pathspec, sandbox,
+                                           platform=platform or RealPlatform())
+    self.pending = []
+    self.output = os.path.join(sandbox, name + '.json')
+
+  def execute(self):
+    with open(self.output, 'w') as fp:
+      json.dump(dict(seq=self._seq, pending=[
+          [process._ckpt is not None, process._handoff_reader is not None,
+           process._handoff_writer is not None] for process in self.pending]), fp)
+
+  def finish(self):
+    os._exit(0)
+
+
+def checkpoint_records(filename):
+  with open(filename, 'rb') as fp:
+    return list(ThriftRecordReader(fp, RunnerCkpt))
+
+
+class TestProcessFork(unittest.TestCase):
+  def setUp(self):
+    self.root = self.enter(temporary_dir())
+    self.sandbox = os.path.join(self.root, 'sandbox')
+    os.mkdir(self.sandbox)
+    self.pathspec = TaskPath(root=self.root, task_id='hello_world',
+                             log_dir=os.path.join(self.root, 'logs'))
+    safe_mkdir(self.pathspec.getpath('checkpoint_path'))
+    # The test runner must not become the parent of escaped co-ordinators.
+    self.enter(mock.patch('apache.thermos.core.process.setup_child_subreaping'))
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def processes(self, names, platform=None):
+    processes = []
+    for name in names:
+      process = RecordingProcess(name, self.pathspec.given(process=name, run=0), self.sandbox,
+                                 platform=platform)
+      process.prepare()
+      processes.append(process)
+    return processes
+
+  def assert_released(self, process):
+    assert process._ckpt is None
+    assert process._handoff_reader is None and process._handoff_writer is None
+    fp = lock_file(process.ckpt_file(), 'a+b')
+    assert fp not in (None, False)
+    fp.close()
+
+  def fork(self, process, pending):
+    parent = os.getpid()
+    try:
+      process.fork(pending=pending)
+    except BaseException:
+      if os.getpid() != parent:
+        os._exit(1)
+      raise
+    _, status = os.waitpid(process.pid(), 0)
+    assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 0
+    with open(process.output) as fp:
+      return json.load(fp)
+
+  def test_batch_handoff(self):
+    pending = self.processes(['hello', 'world', 'again'])
+    while pending:
+      process = pending.pop(0)
+      # Each prepared process holds its checkpoint lock and handoff pipe until it is forked.
+      for other in pending:
+        assert other._ckpt is not None and other._handoff_writer is not None
+      process.pending = list(pending)
+      output = self.fork(process, pending)
+      # The co-ordinator took control of its checkpoint after the FORKED record, and released
+      # what it inherited of the processes yet to be forked.
+      assert output == dict(seq=1, pending=[[False, False, False]] * len(pending))
+      self.assert_released(process)
+      records = checkpoint_records(process.ckpt_file())
+      assert [record.process_status.state for record in records] == [ProcessState.FORKED]
+      assert records[0].process_status.coordinator_pid == process.pid()
+
+  def test_failed_fork(self):
+    platform = mock.Mock(wraps=RealPlatform())
+    platform.fork.side_effect = OSError(errno.EAGAIN, 'Resource temporarily unavailable')
+    hello, world = self.processes(['hello', 'world'], platform=platform)
+    with pytest.raises(ProcessBase.ForkError):
+      hello.fork(pending=[world])
+    self.assert_released(hello)
+    assert checkpoint_records(hello.ckpt_file()) == []
+    # The rest of the batch is untouched.
+    assert world._ckpt is not None and world._handoff_writer is not None
+    world.abandon()
+    self.assert_released(world)
+
+  def test_fork_error_propagates(self):
+    platform = mock.Mock(wraps=RealPlatform())
+    platform.fork.side_effect = RuntimeError('Unexpected')
+    hello, = self.processes(['hello'], platform=platform)
+    with pytest.raises(RuntimeError):
+      hello.fork()
+    self.assert_released(hello)
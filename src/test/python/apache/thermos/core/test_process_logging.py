@@ -0,0 +1,268 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import errno
+import gzip
+import os
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pytest
+from twitter.common.contextutil import temporary_dir
+from twitter.common.quantity import Amount, Time
+
+from apache.thermos.common.compression import LogCodec
+from apache.thermos.core.process import PipedSubprocessExecutor, RotatingFileHandler
+
+# 256 distinct bytes, so that misplaced or reordered output is detected.
+PATTERN = bytes(bytearray(range(256)))
+
+
+def pattern(length):
+  return (PATTERN * (length // len(PATTERN) + 1))[:length]
+
+
+def read(filename):
+  with open(filename, 'rb') as fp:
+    return fp.read()
+
+
+def rotated(filename, max_backups):
+  """The contents of filename and its backups, oldest first."""
+  names = ['%s.%d' % (filename, index) for index in range(max_backups, 0, -1)] + [filename]
+  return [read(name) for name in names if os.path.exists(name)]
+
+
+def pipe_with(data):
+  r, w = os.pipe()
+  os.write(w, data)
+  os.close(w)
+  return r
+
+
+class TestRotatingFileHandler(unittest.TestCase):
+  def setUp(self):
+    self.td = self.enter(temporary_dir())
+    self.filename = os.path.join(self.td, 'stdout')
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def handler(self, max_bytes=10, max_backups=3, mode='wb'):
+    handler = RotatingFileHandler(self.filename, max_bytes, max_backups, mode=mode)
+    self.addCleanup(handler.close)
+    return handler
+
+  def test_write_splits_at_rollover(self):
+    handler = self.handler()
+    handler.write(pattern(25))
+    handler.flush()
+    data = pattern(25)
+    assert rotated(self.filename, 3) == [data[0:10], data[10:20], data[20:25]]
+
+    handler.write(pattern(5))
+    handler.flush()
+    # Exactly max_bytes: rolled over, leaving the current file empty.
+    assert rotated(self.filename, 3) == [data[0:10], data[10:20], data[20:25] + pattern(5), b'']
+
+  def test_backups_are_limited(self):
+    handler = self.handler(max_bytes=100, max_backups=2)
+    data = pattern(1050)
+    for offset in range(0, len(data), 7):
+      handler.write(data[offset:offset + 7])
+    handler.flush()
+    assert rotated(self.filename, 5) == [data[800:900], data[900:1000], data[1000:]]
+
+  def test_append_counts_existing_bytes(self):
+    with open(self.filename, 'wb') as fp:
+      fp.write(b'x' * 8)
+    handler = self.handler(mode='ab')
+    handler.write(b'abcd')
+    handler.flush()
+    assert rotated(self.filename, 3) == [b'x' * 8 + b'ab', b'cd']
+
+  def test_unlimited(self):
+    handler = self.handler(max_bytes=0, max_backups=0)
+    handler.write(pattern(1000))
+    handler.flush()
+    assert rotated(self.filename, 3) == [pattern(1000)]
+
+  def test_writes_are_buffered(self):
+    handler = self.handler(max_bytes=2 ** 20)
+    handler.write(b'hello')
+    assert read(self.filename) == b''
+    handler.flush()
+    assert read(self.filename) == b'hello'
+
+  def test_close_does_not_wait_for_compression(self):
+    released = threading.Event()
+    with mock.patch('apache.thermos.core.process.compress_file',
+                    side_effect=lambda filename, codec: released.wait(10)):
+      handler = RotatingFileHandler(self.filename, 10, 3, compression=LogCodec.GZIP)
+      self.addCleanup(handler.wait_for_compression)
+      self.addCleanup(released.set)
+      handler.write(pattern(15))
+      handler.close()
+      assert handler.closed
+      # The backup is still compressing in the background.
+      assert handler._compressor.is_alive()
+      released.set()
+      handler.wait_for_compression()
+      assert handler._compressor is None
+
+  def test_compressed_backups(self):
+    handler = RotatingFileHandler(self.filename, 10, 3, compression=LogCodec.GZIP)
+    handler.write(pattern(25))
+    handler.close()
+    handler.wait_for_compression()
+    assert not os.path.exists(self.filename + '.1')
+    with gzip.open(self.filename + '.1.gz') as fp:
+      assert fp.read() == pattern(20)[10:20]
+    with gzip.open(self.filename + '.2.gz') as fp:
+      assert fp.read() == pattern(10)
+    assert read(self.filename) == pattern(25)[20:]
+
+  @pytest.mark.skipif(not hasattr(os, 'splice'), reason='splice(2) is unavailable.')
+  def test_splice_from(self):
+    handler = self.handler()
+    handler.write(b'abc')
+    data = pattern(25)
+    fd = pipe_with(data)
+    self.addCleanup(os.close, fd)
+    moved = []
+    while True:
+      count = handler.splice_from(fd, 1024)
+      if count == 0:
+        break
+      moved.append(count)
+    # Buffered writes precede spliced output, and splices stop at the rollover size.
+    assert moved == [7, 10, 8]
+    assert rotated(self.filename, 3) == [b'abc' + data[0:7], data[7:17], data[17:25]]
+
+
+class RecordingHandler(object):
+  def __init__(self):
+    self.events = []
+
+  def write(self, b):
+    self.events.append(('write', time.time(), bytes(b)))
+
+  def flush(self):
+    self.events.append(('flush', time.time(), None))
+
+  def close(self):
+    self.events.append(('close', time.time(), None))
+
+  @property
+  def data(self):
+    return b''.join(data for event, _, data in self.events if event == 'write')
+
+
+class UnspliceableHandler(RecordingHandler):
+  def __init__(self):
+    super(UnspliceableHandler, self).__init__()
+    self.splices = 0
+
+  def splice_from(self, fd, count):
+    self.splices += 1
+    raise OSError(errno.EINVAL, 'Invalid argument')
+
+
+class TestPipedSubprocessExecutor(unittest.TestCase):
+  def setUp(self):
+    # Notice the exit of the process promptly once its pipes are closed.
+    poll_interval = mock.patch.object(
+        PipedSubprocessExecutor, 'POLL_INTERVAL', Amount(10, Time.MILLISECONDS))
+    poll_interval.start()
+    self.addCleanup(poll_interval.stop)
+
+  def run_process(self, script, stdout, stderr):
+    executor = PipedSubprocessExecutor(
+        [sys.executable, '-c', script], close_fds=True, cwd=None, env=None, pathspec=None,
+        stdout=stdout, stderr=stderr)
+    executor.start()
+    return executor.wait()
+
+  def write_script(self, stdout_bytes, stderr_bytes=0):
+    return ('import sys\n'
+            'data = bytes(bytearray(range(256))) * %d\n'
+            'sys.stdout.buffer.write(data[:%d])\n'
+            'sys.stdout.flush()\n'
+            'sys.stderr.buffer.write(data[:%d])\n' % (
+                (max(stdout_bytes, stderr_bytes) // 256 + 1), stdout_bytes, stderr_bytes))
+
+  def test_rotated_output(self):
+    for use_splice in (False, True):
+      if use_splice and not hasattr(os, 'splice'):
+        continue
+      with mock.patch.object(PipedSubprocessExecutor, 'USE_SPLICE', use_splice):
+        with temporary_dir() as td:
+          stdout = RotatingFileHandler(os.path.join(td, 'stdout'), 100000, 10)
+          stderr = RecordingHandler()
+          rc = self.run_process(self.write_script(350000, 5000), stdout, stderr)
+          assert rc == 0
+          files = rotated(os.path.join(td, 'stdout'), 10)
+          assert [len(data) for data in files] == [100000, 100000, 100000, 50000]
+          assert b''.join(files) == pattern(350000)
+          assert stderr.data == pattern(5000)
+          assert stdout.closed
+          # Output is flushed before the handlers are closed.
+          assert [event for event, _, _ in stderr.events[-2:]] == ['flush', 'close']
+
+  def test_splice_fallback(self):
+    stdout, stderr = UnspliceableHandler(), RecordingHandler()
+    with mock.patch.object(PipedSubprocessExecutor, 'USE_SPLICE', True):
+      assert self.run_process(self.write_script(300000), stdout, stderr) == 0
+    # The handler is asked to splice once, then copied to.
+    assert stdout.splices == 1
+    assert stdout.data == pattern(300000)
+
+  def test_flushes_pending_output(self):
+    stdout, stderr = RecordingHandler(), RecordingHandler()
+    with mock.patch.object(PipedSubprocessExecutor, 'FLUSH_BUFFER_SIZE', 1000):
+      assert self.run_process(self.write_script(10000), stdout, stderr) == 0
+    assert stdout.data == pattern(10000)
+    # Handlers are flushed as soon as FLUSH_BUFFER_SIZE bytes are pending, and before closing.
+    pending = 0
+    events = stdout.events
+    for index, (event, _, data) in enumerate(events):
+      if event == 'write':
+        pending += len(data)
+        if pending >= 1000:
+          assert events[index + 1][0] == 'flush'
+      elif event == 'flush':
+        pending = 0
+      else:
+        assert pending == 0
+    assert events[-1][0] == 'close'
+
+  def test_flushes_idle_output(self):
+    stdout, stderr = RecordingHandler(), RecordingHandler()
+    script = ('import sys, time\n'
+              'sys.stdout.write("first\\n"); sys.stdout.flush()\n'
+              'time.sleep(1)\n'
+              'sys.stdout.write("second\\n")\n')
+    assert self.run_process(script, stdout, stderr) == 0
+    assert stdout.data == b'first\nsecond\n'
+    writes = [(timestamp, data) for event, timestamp, data in stdout.events if event == 'write']
+    assert len(writes) == 2
+    # The first line is flushed within FLUSH_INTERVAL, not once the process writes again.
+    flushes = [timestamp for event, timestamp, _ in stdout.events if event == 'flush']
+    assert any(writes[0][0] <= timestamp < writes[1][0] for timestamp in flushes)
+    assert flushes[0] - writes[0][0] < 0.5
@@ -0,0 +1,279 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import errno
+import os
+import threading
+import time
+import unittest
+from unittest import mock
+
+import pytest
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import lock_file, safe_mkdir, safe_mkdir_for, touch
+from twitter.common.quantity import Time
+from twitter.common.recordio import ThriftRecordWriter
+
+from apache.thermos.common.inotify import Inotify
+from apache.thermos.common.procfs import ProcessTable
+from apache.thermos.config.schema import Process, Resources, Task
+from apache.thermos.core.helper import TaskRunnerHelper
+from apache.thermos.core.runner import TaskRunner
+
+from gen.apache.thermos.ttypes import ProcessState, ProcessStatus, RunnerCkpt
+
+
+class FakeClock(object):
+  def __init__(self, now=1000.0):
+    self.now = now
+
+  def time(self):
+    return self.now
+
+  def sleep(self, seconds):
+    self.now += seconds
+
+
+def make_task(max_concurrency=0, names=('hello', 'world'), **process_kw):
+  return Task(
+      name='hello_world',
+      processes=[Process(name=name, cmdline='echo %s' % name, **process_kw)
+                 for name in names],
+      resources=Resources(cpu=1.0, ram=1024, disk=1024),
+      max_concurrency=max_concurrency)
+
+
+class RunnerTestBase(unittest.TestCase):
+  def setUp(self):
+    self.root = self.enter(temporary_dir())
+    self.clock = FakeClock()
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def runner(self, task):
+    return TaskRunner(task, self.root, os.path.join(self.root, 'sandbox'), clock=self.clock,
+                      task_id='hello_world')
+
+  def forked(self, runner, process, fork_time):
+    runner._state.processes[process] = [ProcessStatus(
+        seq=1, process=process, state=ProcessState.FORKED, fork_time=fork_time)]
+    runner._regular_plan.set_running(process)
+
+
+class TestPlanWait(RunnerTestBase):
+  def test_runnable(self):
+    runner = self.runner(make_task())
+    assert runner._plan_wait(runner._regular_plan) == 0
+
+  def test_waiting(self):
+    runner = self.runner(make_task(min_duration=15, max_failures=3))
+    plan = runner._regular_plan
+    for process in ('hello', 'world'):
+      plan.set_running(process)
+      plan.add_failure(process, timestamp=self.clock.time() - 5)
+    # Both processes wait out the remainder of their min_duration.
+    assert runner._plan_wait(plan) == 10
+
+  def test_lost_deadline(self):
+    runner = self.runner(make_task(max_concurrency=1))
+    plan = runner._regular_plan
+    self.forked(runner, 'hello', fork_time=self.clock.time() - 10)
+    # 'world' is held back by max_concurrency, so only the LOST deadline of 'hello' counts.
+    assert plan.runnable_at(self.clock.time())
+    assert runner._plan_wait(plan) == TaskRunner.LOST_TIMEOUT.as_(Time.SECONDS) - 10
+
+    self.clock.sleep(runner._plan_wait(plan) - 0.5)
+    assert runner._plan_wait(plan) == 0.5
+    assert not runner.is_process_lost('hello')
+
+    # At the deadline the process is LOST, rather than the runner waiting 0s repeatedly.
+    self.clock.sleep(0.5)
+    assert runner._plan_wait(plan) == 0
+    assert runner.is_process_lost('hello')
+
+  def test_nothing_to_do(self):
+    runner = self.runner(make_task())
+    plan = runner._regular_plan
+    for process in ('hello', 'world'):
+      plan.set_running(process)
+      plan.add_success(process)
+    assert runner._plan_wait(plan) == plan.INFINITY
+
+
+class TestTouchCheckpoint(RunnerTestBase):
+  def setUp(self):
+    super(TestTouchCheckpoint, self).setUp()
+    self.runner = self.runner(make_task())
+    self.ckpt = self.runner._pathspec.getpath('runner_checkpoint')
+    safe_mkdir_for(self.ckpt)
+    touch(self.ckpt)
+
+  def touched(self):
+    """Whether the checkpoint was touched since the last call."""
+    touched = os.path.getmtime(self.ckpt) != 0
+    os.utime(self.ckpt, (0, 0))
+    return touched
+
+  def test_touches_idle_checkpoint(self):
+    interval = TaskRunner.CHECKPOINT_TOUCH_INTERVAL.as_(Time.SECONDS)
+    self.touched()
+    self.runner._touch_checkpoint()
+    assert self.touched()
+    self.clock.sleep(interval - 1)
+    self.runner._touch_checkpoint()
+    assert not self.touched()
+    self.clock.sleep(1)
+    self.runner._touch_checkpoint()
+    assert self.touched()
+
+  def test_writes_count_as_touches(self):
+    interval = TaskRunner.CHECKPOINT_TOUCH_INTERVAL.as_(Time.SECONDS)
+    self.runner._recovery = False
+    self.runner._ckpt = mock.Mock()
+    self.runner._touch_checkpoint()
+    self.touched()
+    self.clock.sleep(interval)
+    self.runner._ckpt_write(RunnerCkpt())
+    self.runner._touch_checkpoint()
+    assert not self.touched()
+    self.clock.sleep(interval)
+    self.runner._touch_checkpoint()
+    assert self.touched()
+
+
+class TestCollectUpdates(RunnerTestBase):
+  def setUp(self):
+    super(TestCollectUpdates, self).setUp()
+    self.runner = self.runner(make_task())
+    self.runner._plan = self.runner._regular_plan
+    self.forked(self.runner, 'hello', fork_time=self.clock.time())
+    self.runner._watcher.register('hello')
+    self.ckpt = self.runner._pathspec.given(process='hello').getpath('process_checkpoint')
+    safe_mkdir_for(self.ckpt)
+    touch(self.ckpt)
+
+  def write_running(self):
+    with open(self.ckpt, 'ab') as fp:
+      ThriftRecordWriter(fp).write(RunnerCkpt(process_status=ProcessStatus(
+          seq=2, process='hello', state=ProcessState.RUNNING, start_time=self.clock.time(),
+          pid=os.getpid())))
+
+  def assert_running(self, applied):
+    assert applied == 1
+    assert self.runner._current_process_run('hello').state == ProcessState.RUNNING
+
+  @unittest.skipUnless(Inotify.is_supported(), 'inotify is unavailable.')
+  def test_woken_by_coordinator_checkpoint(self):
+    def write():
+      time.sleep(0.2)
+      self.write_running()
+    thread = threading.Thread(target=write)
+    thread.start()
+    self.addCleanup(thread.join)
+    # The runner must wait on the checkpoint directory rather than sleep and poll.
+    self.clock.sleep = mock.Mock(side_effect=AssertionError('Runner slept.'))
+    start = time.time()
+    # The fake clock never advances, so only the write ends the collection.
+    self.assert_running(self.runner.collect_updates(timeout=30))
+    assert self.runner._watcher.event_driven
+    assert time.time() - start < 10
+
+  def test_polls_without_inotify(self):
+    self.runner._watcher.close()
+    sleep = self.clock.sleep
+
+    def sleep_then_write(seconds):
+      sleep(seconds)
+      self.write_running()
+    self.clock.sleep = sleep_then_write
+
+    start = self.clock.time()
+    self.assert_running(self.runner.collect_updates(timeout=30))
+    assert not self.runner._watcher.event_driven
+    # The update is picked up by the poll after one COORDINATOR_INTERVAL_SLEEP.
+    assert self.clock.time() - start == TaskRunner.COORDINATOR_INTERVAL_SLEEP.as_(Time.SECONDS)
+
+
+class TestLaunch(RunnerTestBase):
+  NAMES = ('hello', 'world', 'again')
+
+  def setUp(self):
+    super(TestLaunch, self).setUp()
+    self.runner = self.runner(make_task(names=self.NAMES))
+    self.runner._recovery = False
+    self.runner._ckpt = mock.Mock()
+    self.runner._plan = self.runner._regular_plan
+    self.runner._initialize_ckpt_header()
+    safe_mkdir(self.runner._pathspec.getpath('checkpoint_path'))
+    self.enter(mock.patch('apache.thermos.core.process.setup_child_subreaping'))
+
+    for process in self.NAMES:
+      self.runner._set_process_status(process, ProcessState.WAITING)
+    self.task_processes = [self.runner._task_processes[process] for process in self.NAMES]
+
+  def launch(self, *forks):
+    with mock.patch('os.fork', side_effect=forks):
+      return self.runner._launch(self.NAMES, self.clock.time())
+
+  def state(self, process):
+    return self.runner._current_process_run(process).state
+
+  def assert_released(self):
+    for tp in self.task_processes:
+      assert tp._ckpt is None
+      assert tp._handoff_reader is None and tp._handoff_writer is None
+      fp = lock_file(tp.ckpt_file(), 'a+b')
+      assert fp not in (None, False)
+      fp.close()
+
+  def test_launch(self):
+    launched = self.launch(1001, 1002, 1003)
+    assert [tp.name() for tp in launched] == list(self.NAMES)
+    assert [tp.pid() for tp in launched] == [1001, 1002, 1003]
+    self.assert_released()
+
+  def test_failed_fork(self):
+    launched = self.launch(1001, OSError(errno.EAGAIN, 'Resource temporarily unavailable'), 1003)
+    # Only the process that could not be forked fails; the rest of the batch is launched.
+    assert [tp.name() for tp in launched] == ['hello', 'again']
+    assert self.state('world') == ProcessState.FAILED
+    assert self.runner._plan.failed == set(['world'])
+    assert self.state('hello') == self.state('again') == ProcessState.WAITING
+    self.assert_released()
+
+  def test_process_table_refreshed(self):
+    self.enter(mock.patch.object(TaskRunnerHelper, 'process_table',
+                                 side_effect=ProcessTable.snapshot))
+    self.enter(mock.patch.object(TaskRunnerHelper, 'safe_signal'))
+    table = self.runner.process_table
+    assert self.runner.process_table is table
+    # The snapshot misses the coordinators forked since it was taken.
+    self.launch(1001, 1002, 1003)
+    assert self.runner.process_table is not table
+    table = self.runner.process_table
+    # And it lists the processes signalled since.
+    self.runner._terminate_plan(self.runner._regular_plan)
+    assert self.runner.process_table is not table
+    table = self.runner.process_table
+    self.runner._kill()
+    assert self.runner.process_table is not table
+
+  def test_abandon_on_error(self):
+    with pytest.raises(RuntimeError):
+      self.launch(1001, RuntimeError('Unexpected'))
+    # The processes not yet forked are abandoned rather than left holding their locks.
+    self.assert_released()
@@ -0,0 +1,140 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import unittest
+
+from twitter.common.contextutil import temporary_dir
+from twitter.common.dirutil import safe_mkdir
+from twitter.common.recordio import ThriftRecordWriter
+
+from apache.thermos.common.ckpt import CheckpointDispatcher
+from apache.thermos.common.path import TaskPath
+from apache.thermos.core.helper import TaskRunnerHelper
+from apache.thermos.monitoring.monitor import TaskMonitor
+
+from gen.apache.thermos.ttypes import (
+    ProcessState,
+    ProcessStatus,
+    RunnerCkpt,
+    RunnerHeader,
+    TaskState,
+    TaskStatus
+)
+
+TASK_ID = 'hello_world'
+
+
+def process_run(seq, pid, final_state):
+  """The updates of a run of 'hello' beginning at seq, ending in final_state."""
+  updates = [
+    ProcessStatus(seq=seq, process='hello', state=ProcessState.WAITING),
+    ProcessStatus(seq=seq + 1, process='hello', state=ProcessState.FORKED, fork_time=seq,
+                  coordinator_pid=pid - 1),
+    ProcessStatus(seq=seq + 2, process='hello', state=ProcessState.RUNNING, start_time=seq,
+                  pid=pid),
+  ]
+  if final_state != ProcessState.RUNNING:
+    updates.append(ProcessStatus(seq=seq + 3, process='hello', state=final_state,
+                                 stop_time=seq + 1, return_code=1))
+  return [RunnerCkpt(process_status=update) for update in updates]
+
+
+class TestTaskMonitorCompaction(unittest.TestCase):
+  def setUp(self):
+    self.root = self.enter(temporary_dir())
+    self.filename = TaskPath(root=self.root, task_id=TASK_ID).getpath('runner_checkpoint')
+    safe_mkdir(os.path.dirname(self.filename))
+    with open(self.filename, 'wb') as fp:
+      writer = ThriftRecordWriter(fp)
+      writer.write(RunnerCkpt(runner_header=RunnerHeader(
+          task_id=TASK_ID, launch_time_ms=1000, sandbox='/sandbox', hostname='localhost',
+          user='nobody')))
+      writer.write(RunnerCkpt(task_status=TaskStatus(
+          state=TaskState.ACTIVE, timestamp_ms=1000, runner_pid=10, runner_uid=0)))
+      for run in range(10):
+        for record in process_run(4 * run, 100 + run, ProcessState.FAILED):
+          writer.write(record)
+      for record in process_run(40, 200, ProcessState.RUNNING):
+        writer.write(record)
+    self.monitor = TaskMonitor(self.root, TASK_ID)
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def compact(self, truncate=True):
+    # As the runner does: compact the current state into a locked replacement stream.
+    snapshot = CheckpointDispatcher.compact(self.monitor.get_state(), truncate=truncate)
+    writer = TaskRunnerHelper.compact_checkpoint(self.filename, snapshot)
+    self.addCleanup(writer.close)
+    return writer
+
+  def assert_runs(self, state, last_pid, last_state):
+    runs = state.processes['hello']
+    assert len(runs) == 11
+    assert [run.state for run in runs[:-1]] == [ProcessState.FAILED] * 10
+    assert (runs[-1].pid, runs[-1].state) == (last_pid, last_state)
+
+  def test_replays_shorter_checkpoint(self):
+    self.assert_runs(self.monitor.get_state(), 200, ProcessState.RUNNING)
+    version, head = self.monitor.version, self.monitor.ckpt_head
+    assert head == os.path.getsize(self.filename)
+
+    self.compact()
+    assert os.path.getsize(self.filename) < head
+    assert self.monitor.refresh()
+    assert self.monitor.version > version
+    assert self.monitor.ckpt_head == os.path.getsize(self.filename)
+    state = self.monitor.get_state()
+    self.assert_runs(state, 200, ProcessState.RUNNING)
+    # Earlier runs are abbreviated in the compacted stream.
+    assert state.processes['hello'][0].pid is None
+    assert self.monitor.get_active_processes() == [(state.processes['hello'][-1], 10)]
+    assert not self.monitor.refresh()
+
+  def test_replays_longer_checkpoint(self):
+    self.monitor.refresh()
+    head = self.monitor.ckpt_head
+
+    # The replacement outgrows the stream it replaced before the monitor next looks at it, so
+    # only its inode tells them apart.
+    writer = self.compact(truncate=False)
+    writer.write(RunnerCkpt(process_status=ProcessStatus(
+        seq=43, process='hello', state=ProcessState.KILLED, stop_time=44.0, return_code=-9)))
+    for run in range(10):
+      for record in process_run(44 + 4 * run, 300 + run, ProcessState.FAILED):
+        writer.write(record)
+    assert os.path.getsize(self.filename) > head
+
+    assert self.monitor.refresh()
+    state = self.monitor.get_state()
+    runs = state.processes['hello']
+    assert len(runs) == 21
+    assert runs[10].state == ProcessState.KILLED
+    assert (runs[-1].pid, runs[-1].state) == (309, ProcessState.FAILED)
+    assert self.monitor.get_active_processes() == []
+    assert self.monitor.ckpt_head == os.path.getsize(self.filename)
+
+  def test_appends_after_replay(self):
+    self.monitor.refresh()
+    writer = self.compact()
+    assert self.monitor.refresh()
+    version = self.monitor.version
+    writer.write(RunnerCkpt(process_status=ProcessStatus(
+        seq=43, process='hello', state=ProcessState.FAILED, stop_time=44.0, return_code=1)))
+    assert self.monitor.refresh()
+    assert self.monitor.version == version + 1
+    self.assert_runs(self.monitor.get_state(), 200, ProcessState.FAILED)
@@ -0,0 +1,97 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+
+from apache.thermos.common.procfs import ProcessEntry, ProcessTable
+from apache.thermos.monitoring.process import ProcessSample
+from apache.thermos.monitoring.process_collector_procfs import ProcessTableTreeCollector
+
+
+def entry(pid, ppid, user=0.0, system=0.0, rss=0, create_time=1000.0):
+  return ProcessEntry(pid=pid, ppid=ppid, status='sleeping', user=user, system=system, nice=0,
+                      threads=1, create_time=create_time, vms=2 * rss, rss=rss)
+
+
+def table(timestamp, *entries):
+  return ProcessTable(dict((e.pid, e) for e in entries), timestamp=timestamp)
+
+
+class TestProcessTableTreeCollector(unittest.TestCase):
+  def test_aggregates_tree(self):
+    collector = ProcessTableTreeCollector(10)
+    collector.sample(table(
+        100.0,
+        entry(1, 0, user=50.0, rss=1000),
+        entry(10, 1, user=1.0, system=0.5, rss=100),
+        entry(11, 10, user=2.0, rss=200),
+        entry(12, 11, system=1.0, rss=300),
+        entry(13, 1, user=7.0, rss=400)))
+    value = collector.value
+    assert collector.procs == 3
+    assert value.user == 3.0
+    assert value.system == 1.5
+    assert value.rss == 600
+    assert value.vms == 1200
+    assert value.threads == 3
+    assert value.status == 'sleeping'
+    # There is no previous sample to calculate a rate against.
+    assert value.rate == 0.0
+
+  def test_rate_across_samples(self):
+    collector = ProcessTableTreeCollector(10)
+    collector.sample(table(100.0, entry(10, 1, user=1.0, system=1.0), entry(11, 10, user=1.0)))
+    collector.sample(table(
+        110.0,
+        entry(10, 1, user=3.0, system=2.0),
+        entry(11, 10, user=2.0),
+        entry(12, 10, user=1.0)))
+    # (3 + 2 + 2 + 1) - (1 + 1 + 1), where the new child 12 is compared against an empty sample.
+    assert collector.value.rate == 0.5
+    assert collector.procs == 3
+
+    # A child that exits takes its cpu time with it, and is not counted against the survivors.
+    collector.sample(table(120.0, entry(10, 1, user=4.0, system=2.0), entry(11, 10, user=3.0)))
+    assert collector.value.rate == 0.2
+    assert collector.procs == 2
+
+  def test_rate_unchanged_for_same_snapshot(self):
+    collector = ProcessTableTreeCollector(10)
+    first = table(100.0, entry(10, 1, user=1.0))
+    second = table(110.0, entry(10, 1, user=6.0))
+    collector.sample(first)
+    collector.sample(second)
+    assert collector.value.rate == 0.5
+    # e.g. sample_by_process() sampling the table already seen by the shared sampler.
+    collector.sample(second)
+    assert collector.value.rate == 0.5
+
+  def test_process_exits(self):
+    collector = ProcessTableTreeCollector(10)
+    collector.sample(table(100.0, entry(10, 1, user=1.0, rss=100)))
+    collector.sample(table(110.0, entry(20, 1, user=1.0, rss=100)))
+    assert collector.value == ProcessSample.empty()
+
+  def test_pid_reuse(self):
+    collector = ProcessTableTreeCollector(10)
+    collector.sample(table(100.0, entry(10, 1, user=1.0, rss=100, create_time=1000.0)))
+    collector.sample(table(110.0, entry(10, 1, user=5.0, rss=100, create_time=1000.0)))
+    assert collector.value.rate == 0.4
+
+    # The pid now belongs to an unrelated process, which must not be attributed to the task.
+    collector.sample(table(
+        120.0, entry(10, 1, user=9.0, rss=500, create_time=1115.0), entry(11, 10, rss=500)))
+    assert collector.value == ProcessSample.empty()
+    collector.sample(table(130.0, entry(10, 1, user=9.5, rss=500, create_time=1115.0)))
+    assert collector.value == ProcessSample.empty()
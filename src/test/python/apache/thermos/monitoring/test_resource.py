@@ -0,0 +1,303 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import threading
+import time
+import unittest
+from collections import namedtuple
+from unittest import mock
+
+from twitter.common.quantity import Amount, Time
+
+from apache.thermos.common.procfs import ProcessEntry, ProcessTable
+from apache.thermos.monitoring.disk import (
+  DuDiskCollector,
+  IncrementalDiskCollector,
+  MesosDiskCollector
+)
+from apache.thermos.monitoring.process import ProcessSample
+from apache.thermos.monitoring.resource import (
+  DiskCollectorProvider,
+  ResourceColumns,
+  ResourceHistory,
+  ResourceMonitorBase,
+  SharedResourceSampler,
+  SharedTaskResourceMonitor
+)
+
+ProcessStatus = namedtuple('ProcessStatus', 'process pid')
+
+
+def full_result(disk_usage=0, **processes):
+  """processes: process name => (ProcessSample, num_procs)"""
+  return ResourceMonitorBase.FullResourceResult(
+      dict((name, ResourceMonitorBase.ProcResourceResult(sample, num_procs))
+           for name, (sample, num_procs) in processes.items()),
+      disk_usage)
+
+
+def process_sample(rate=0.0, user=0.0, rss=0, nice=0, status='sleeping', threads=1):
+  return ProcessSample(rate=rate, user=user, system=0.0, rss=rss, vms=2 * rss, nice=nice,
+                       status=status, threads=threads)
+
+
+class TestResourceColumns(unittest.TestCase):
+  def test_wraparound(self):
+    columns = ResourceColumns(3)
+    assert len(columns) == 0
+    assert columns.oldest is None and columns.newest is None
+    for timestamp in range(1, 6):
+      columns.append(timestamp, full_result(timestamp * 10, p=(process_sample(rss=timestamp), 1)))
+    assert len(columns) == 3
+    assert (columns.oldest, columns.newest) == (3, 5)
+    assert [timestamp for timestamp, _ in columns] == [3, 4, 5]
+    assert [value.disk_usage for _, value in columns] == [30, 40, 50]
+    assert columns[0][1].proc_usage['p'].process_sample.rss == 3
+    assert columns[-1][1].proc_usage['p'].process_sample.rss == 5
+    with self.assertRaises(IndexError):
+      columns[3]
+
+  def test_eviction_of_absent_processes(self):
+    columns = ResourceColumns(2)
+    columns.append(1, full_result(a=(process_sample(rss=1), 1)))
+    columns.append(2, full_result(a=(process_sample(rss=2), 1), b=(process_sample(rss=2), 2)))
+    assert sorted(columns[0][1].proc_usage) == ['a']
+    assert sorted(columns[1][1].proc_usage) == ['a', 'b']
+    columns.append(3, full_result(b=(process_sample(rss=3), 3)))
+    assert sorted(columns._processes) == ['a', 'b']
+    columns.append(4, full_result(b=(process_sample(rss=4), 4)))
+    # 'a' is no longer part of any row, so its columns have been released.
+    assert sorted(columns._processes) == ['b']
+    assert [value.proc_usage['b'].num_procs for _, value in columns] == [3, 4]
+    columns.append(5, full_result())
+    columns.append(6, full_result())
+    assert columns._processes == {}
+    assert [value.proc_usage for _, value in columns] == [{}, {}]
+
+  def test_round_trip(self):
+    samples = [
+        process_sample(rate=0.25, user=1.5, rss=2 ** 40, nice=None, status=None, threads=7),
+        process_sample(nice=-5, status='zombie'),
+        process_sample(nice=19, status='sleeping'),
+        process_sample(nice=0, status='zombie'),
+    ]
+    columns = ResourceColumns(len(samples))
+    for timestamp, sample in enumerate(samples):
+      columns.append(timestamp + 0.5, full_result(2 ** 35, p=(sample, timestamp)))
+    for timestamp, sample in enumerate(samples):
+      assert columns[timestamp] == (timestamp + 0.5, full_result(2 ** 35, p=(sample, timestamp)))
+
+  def test_lookups(self):
+    columns = ResourceColumns(5)
+    for timestamp in (10, 20, 30, 40, 50):
+      columns.append(timestamp, full_result(timestamp))
+    assert columns.at_or_after(25)[0] == 30
+    assert columns.at_or_after(30)[0] == 30
+    assert columns.at_or_after(51) is None
+    assert columns.nearest(5)[0] == 10
+    assert columns.nearest(51)[0] == 50
+    assert [ts for ts, _ in columns.between(15, 40)] == [20, 30, 40]
+    assert [ts for ts, _ in columns.between(15, 40, before=40)] == [20, 30]
+    assert columns.between(60, 70) == []
+
+  def test_concurrent_reads(self):
+    columns = ResourceColumns(50)
+    done = threading.Event()
+    errors = []
+
+    def read():
+      while not done.is_set():
+        try:
+          rows = list(columns) + [columns.nearest(timestamp) for timestamp in range(0, 2000, 97)
+                                  if len(columns)]
+          for timestamp, value in rows:
+            # Every process in a row was written with the row's timestamp.
+            for result in value.proc_usage.values():
+              assert result.process_sample.rss == timestamp, (timestamp, value)
+        except Exception as e:
+          errors.append(e)
+          return
+
+    readers = [threading.Thread(target=read) for _ in range(2)]
+    for reader in readers:
+      reader.start()
+    try:
+      for timestamp in range(2000):
+        # Process names come and go so that columns are allocated and released as rows are added.
+        columns.append(timestamp, full_result(
+            **dict(('p%d' % (timestamp % n), (process_sample(rss=timestamp), 1)) for n in (3, 7))))
+    finally:
+      done.set()
+      for reader in readers:
+        reader.join()
+    assert errors == []
+
+
+class TestResourceHistory(unittest.TestCase):
+  def test_refuses_past_timestamps(self):
+    history = ResourceHistory(3, initialize=False)
+    history.add(10, full_result())
+    history.add(10, full_result())
+    with self.assertRaises(ValueError):
+      history.add(9, full_result())
+
+  def test_get_and_query(self):
+    history = ResourceHistory(5, initialize=False)
+    for timestamp in range(10, 101, 10):
+      history.add(timestamp, full_result(timestamp))
+    assert len(history) == 5
+    assert [ts for ts, _ in history] == [60, 70, 80, 90, 100]
+    assert history.get(0)[0] == 60
+    assert history.get(65)[0] == 70
+    assert history.get(1000)[0] == 100
+    assert [ts for ts, _ in history.query(65, 90)] == [70, 80, 90]
+    assert [ts for ts, _ in history.query(0, 1000)] == [60, 70, 80, 90, 100]
+    assert history.query(200, 300) == []
+
+  def test_rollups(self):
+    history = ResourceHistory(
+        5, initialize=False, rollup_interval=Amount(100, Time.SECONDS), rollup_maxlen=10)
+    for timestamp in range(0, 500, 10):
+      processes = {'a': (process_sample(rate=timestamp / 100.0, user=timestamp, rss=timestamp), 1)}
+      if timestamp % 20 == 0:
+        processes['b'] = (process_sample(rss=1000, threads=3), 2)
+      history.add(timestamp, full_result(timestamp, **processes))
+
+    # Raw samples cover [450, 490]; rollups of the complete intervals [0, 400) precede them.
+    assert [ts for ts, _ in history] == [450, 460, 470, 480, 490]
+
+    timestamp, value = history.get(50)
+    assert timestamp == 90
+    assert value.disk_usage == 45
+    a = value.proc_usage['a']
+    assert a.process_sample.rss == 45
+    assert a.process_sample.rate == 0.45
+    # Cumulative cpu time is taken from the latest sample in the interval.
+    assert a.process_sample.user == 90
+    b = value.proc_usage['b']
+    # 'b' is averaged only over the samples it was present in.
+    assert b.process_sample.rss == 1000
+    assert (b.process_sample.threads, b.num_procs) == (3, 2)
+
+    assert history.get(300)[0] == 390
+    assert history.get(300)[1].proc_usage['a'].process_sample.rss == 345
+    # Past the last rollup, but before the raw samples: the oldest raw sample is nearest.
+    assert history.get(420)[0] == 450
+    assert history.get(470)[0] == 470
+
+    assert [ts for ts, _ in history.query(0, 1000)] == [90, 190, 290, 390, 450, 460, 470, 480, 490]
+    assert [ts for ts, _ in history.query(150, 460)] == [190, 290, 390, 450, 460]
+    assert [ts for ts, _ in history.query(150, 300)] == [190, 290]
+
+
+class TestDiskCollectorProvider(unittest.TestCase):
+  def test_collector_class(self):
+    assert DiskCollectorProvider().disk_collector_class is DuDiskCollector
+    assert DiskCollectorProvider(
+        enable_incremental_disk_collector=True).disk_collector_class is IncrementalDiskCollector
+    assert DiskCollectorProvider(enable_mesos_disk_collector=True).disk_collector_class is (
+        MesosDiskCollector)
+    assert DiskCollectorProvider(
+        enable_mesos_disk_collector=True,
+        enable_incremental_disk_collector=True).disk_collector_class is MesosDiskCollector
+
+
+class FakeTaskMonitor(object):
+  def __init__(self, **processes):
+    self.processes = processes
+
+  def get_active_processes(self):
+    return [(ProcessStatus(name, pid), 1) for name, pid in sorted(self.processes.items())]
+
+  def get_sandbox(self):
+    return None
+
+
+def entry(pid, ppid, user=0.0, rss=0, create_time=1000.0):
+  return ProcessEntry(pid=pid, ppid=ppid, status='sleeping', user=user, system=0.0, nice=0,
+                      threads=1, create_time=create_time, vms=0, rss=rss)
+
+
+class TestSharedTaskResourceMonitor(unittest.TestCase):
+  def setUp(self):
+    # Samples older than the (initialized) resource history are refused.
+    self.now = time.time() + 100
+    self.sampler = SharedResourceSampler(Amount(10, Time.SECONDS))
+
+  def collect(self, *entries):
+    self.now += 10
+    table = ProcessTable(dict((e.pid, e) for e in entries), timestamp=self.now)
+    with mock.patch.object(ProcessTable, 'snapshot', return_value=table):
+      self.sampler.collect()
+    return self.now
+
+  def monitor(self, task_id, **processes):
+    return SharedTaskResourceMonitor(task_id, FakeTaskMonitor(**processes), self.sampler)
+
+  def test_collect(self):
+    monitor = self.monitor('task', hello=10, world=20)
+    monitor.start()
+    assert monitor.is_alive()
+    self.collect(entry(10, 1, user=1.0, rss=100), entry(11, 10, rss=100), entry(20, 1, rss=100))
+    timestamp = self.collect(
+        entry(10, 1, user=3.0, rss=100), entry(11, 10, user=2.0, rss=100), entry(20, 1, rss=100))
+    sample_timestamp, result = monitor.sample_at(timestamp)
+    assert sample_timestamp == timestamp
+    assert result.num_procs == 3
+    assert result.process_sample.rss == 300
+    assert result.process_sample.rate == 0.4
+    with mock.patch.object(time, 'time', return_value=timestamp):
+      assert monitor.sample_by_process('hello').rate == 0.4
+      assert monitor.sample_by_process('world').rate == 0.0
+    assert monitor.collection_cost.collections == 2
+
+  def test_pid_reuse(self):
+    monitor = self.monitor('task', hello=10)
+    monitor.start()
+    self.collect(entry(10, 1, user=1.0, rss=100))
+    self.collect(entry(10, 1, user=2.0, rss=100, create_time=1005.0))
+    _, result = monitor.sample_at(self.now)
+    assert result.process_sample.rss == 0
+    assert result.process_sample.rate == 0.0
+
+  def test_tasks_join_and_leave(self):
+    first = self.monitor('first', hello=10)
+    second = self.monitor('second', hello=20)
+    first.start()
+    self.collect(entry(10, 1, rss=100), entry(20, 1, rss=200))
+    assert first.collection_cost.collections == 1
+
+    second.start()
+    assert second.is_alive()
+    self.collect(entry(10, 1, rss=100), entry(20, 1, rss=200))
+    assert first.collection_cost.collections == 2
+    assert second.collection_cost.collections == 1
+    assert second.sample_at(self.now)[1].process_sample.rss == 200
+
+    first.kill()
+    assert not first.is_alive()
+    timestamp = self.collect(entry(10, 1, rss=100), entry(20, 1, rss=300))
+    assert first.collection_cost.collections == 2
+    assert first.sample_at(timestamp)[0] < timestamp
+    assert second.collection_cost.collections == 2
+    assert second.sample_at(timestamp)[1].process_sample.rss == 300
+
+  def test_failing_monitor_does_not_stop_others(self):
+    failing = self.monitor('failing', hello=10)
+    healthy = self.monitor('healthy', hello=20)
+    failing.start()
+    healthy.start()
+    with mock.patch.object(failing, '_collect_processes', side_effect=RuntimeError('boom')):
+      self.collect(entry(10, 1, rss=100), entry(20, 1, rss=200))
+    assert healthy.sample_at(self.now)[1].process_sample.rss == 200
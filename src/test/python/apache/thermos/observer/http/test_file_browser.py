@@ -0,0 +1,120 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import threading
+import time
+
+import pytest
+from twitter.common.contextutil import temporary_dir
+
+from apache.thermos.common.compression import LogCodec, compress_file
+from apache.thermos.observer.http.file_browser import (
+    RangeNotSatisfiable,
+    _parse_range,
+    _read_chunk,
+    _serve_raw
+)
+
+
+def test_parse_range():
+  assert _parse_range(None, 10) is None
+  assert _parse_range('bytes=0-3', 10) == (0, 3)
+  assert _parse_range('bytes=5-', 10) == (5, 9)
+  assert _parse_range('bytes=2-100', 10) == (2, 9)
+  assert _parse_range('bytes=-3', 10) == (7, 9)
+  assert _parse_range('bytes=-30', 10) == (0, 9)
+  # Multiple or malformed ranges are ignored.
+  assert _parse_range('bytes=1-2,4-5', 10) is None
+  assert _parse_range('bytes=a-b', 10) is None
+  assert _parse_range('items=0-3', 10) is None
+  for header in ('bytes=10-', 'bytes=5-3', 'bytes=-0'):
+    with pytest.raises(RangeNotSatisfiable):
+      _parse_range(header, 10)
+
+
+def test_serve_raw():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'stdout')
+    with open(filename, 'wb') as fp:
+      fp.write(b'0123456789')
+
+    response = _serve_raw(filename)
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == '10'
+    assert response.body.read() == b'0123456789'
+
+    response = _serve_raw(filename, 'bytes=2-4')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 2-4/10'
+    assert response.body.read(2) == b'23'
+    assert response.body.read() == b'4'
+    response.body.close()
+
+    response = _serve_raw(filename, 'bytes=20-')
+    assert response.status_code == 416
+    assert response.headers['Content-Range'] == 'bytes */10'
+
+
+def test_serve_raw_follow():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'stdout')
+    with open(filename, 'wb') as fp:
+      fp.write(b'0123456789')
+
+    response = _serve_raw(filename, None, follow=True, timeout=0.1)
+    assert response.status_code == 204
+
+    def append():
+      time.sleep(0.1)
+      with open(filename, 'ab') as fp:
+        fp.write(b'abc')
+
+    appender = threading.Thread(target=append)
+    appender.start()
+    response = _serve_raw(filename, 'bytes=10-', follow=True, timeout=10)
+    appender.join()
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 10-12/13'
+    assert response.body.read() == b'abc'
+    response.body.close()
+
+
+def test_serve_compressed():
+  with temporary_dir() as td:
+    filename = os.path.join(td, 'stdout.1')
+    with open(filename, 'wb') as fp:
+      fp.write(b'0123456789')
+    filename = compress_file(filename, LogCodec.GZIP)
+    assert filename.endswith('stdout.1.gz')
+    assert not os.path.exists(os.path.join(td, 'stdout.1'))
+
+    response = _serve_raw(filename)
+    assert response.status_code == 200
+    assert response.headers['Content-Length'] == '10'
+    assert not hasattr(response.body, 'fileno')
+    assert response.body.read() == b'0123456789'
+    response.body.close()
+
+    response = _serve_raw(filename, 'bytes=-3')
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == 'bytes 7-9/10'
+    assert response.body.read() == b'789'
+    response.body.close()
+
+    # Compressed segments never grow, so following one does not wait.
+    response = _serve_raw(filename, 'bytes=10-', follow=True, timeout=10)
+    assert response.status_code == 204
+
+    assert _read_chunk(filename, 2, 3) == dict(offset=2, length=3, data='234')
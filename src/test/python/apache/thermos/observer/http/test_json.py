@@ -0,0 +1,115 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import io
+import json
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+import bottle
+
+from apache.thermos.observer.http.json import TaskObserverJSONBindings
+
+
+def wsgi_request(app, path, method='GET', headers=None, body=b''):
+  """Issue a request against a WSGI app, returning (status code, headers, body).  Header names
+  are lowercased."""
+  environ = {}
+  setup_testing_defaults(environ)
+  path, _, query = path.partition('?')
+  environ.update(
+      PATH_INFO=path,
+      QUERY_STRING=query,
+      REQUEST_METHOD=method,
+      CONTENT_LENGTH=str(len(body)),
+      CONTENT_TYPE='application/x-www-form-urlencoded')
+  environ['wsgi.input'] = io.BytesIO(body)
+  for name, value in (headers or {}).items():
+    environ['HTTP_' + name.upper().replace('-', '_')] = value
+  response = []
+
+  def start_response(status, response_headers, exc_info=None):
+    response[:] = [int(status.split()[0]),
+                   dict((name.lower(), value) for name, value in response_headers)]
+
+  content = b''.join(app(environ, start_response))
+  return response[0], response[1], content
+
+
+class FakeObserver(object):
+  ETAG = '"0123abcd"'
+
+  def __init__(self):
+    self.calls = []
+
+  def task_ids(self, which):
+    return {'all': ['a', 'b'], 'active': ['a'], 'finished': ['b']}[which]
+
+  def task_rows(self, task_ids, fields=None, if_none_match=None):
+    self.calls.append((task_ids, fields, if_none_match))
+    if fields and 'bogus' in fields:
+      raise ValueError('Unknown task row fields: bogus')
+    if if_none_match == self.ETAG:
+      return self.ETAG, None
+    return self.ETAG, dict((task_id, {'task_id': task_id}) for task_id in task_ids)
+
+
+class TestTaskRowsEndpoint(unittest.TestCase):
+  def setUp(self):
+    self.observer = FakeObserver()
+    bindings = TaskObserverJSONBindings()
+    bindings._observer = self.observer
+    self.app = bottle.Bottle()
+    self.app.route('/j/task_rows', method=['GET', 'POST'],
+                   callback=bindings.handle_json_task_rows)
+
+  def request(self, *args, **kw):
+    return wsgi_request(self.app, *args, **kw)
+
+  def test_task_ids(self):
+    code, headers, body = self.request('/j/task_rows?task_id=a%2Cb,&fields=state,cpu')
+    assert code == 200
+    assert headers['etag'] == FakeObserver.ETAG
+    assert json.loads(body.decode('utf-8')) == {
+        'tasks': {'a': {'task_id': 'a'}, 'b': {'task_id': 'b'}}}
+    assert self.observer.calls == [(['a', 'b'], ['state', 'cpu'], None)]
+
+  def test_type(self):
+    self.request('/j/task_rows')
+    self.request('/j/task_rows?type=finished')
+    assert self.observer.calls == [(['a', 'b'], None, None), (['b'], None, None)]
+    code, _, _ = self.request('/j/task_rows?type=bogus')
+    assert code == 400
+
+  def test_post(self):
+    code, _, body = self.request('/j/task_rows', method='POST', body=b'task_id=b&fields=state')
+    assert code == 200
+    assert json.loads(body.decode('utf-8')) == {'tasks': {'b': {'task_id': 'b'}}}
+    assert self.observer.calls == [(['b'], ['state'], None)]
+
+  def test_unknown_field(self):
+    code, _, _ = self.request('/j/task_rows?fields=bogus')
+    assert code == 400
+
+  def test_not_modified(self):
+    code, headers, body = self.request(
+        '/j/task_rows?task_id=a', headers={'If-None-Match': FakeObserver.ETAG})
+    assert code == 304
+    assert headers['etag'] == FakeObserver.ETAG
+    assert body == b''
+    assert self.observer.calls == [(['a'], None, FakeObserver.ETAG)]
+
+    code, _, body = self.request('/j/task_rows?task_id=a', headers={'If-None-Match': '"stale"'})
+    assert code == 200
+    assert json.loads(body.decode('utf-8')) == {'tasks': {'a': {'task_id': 'a'}}}
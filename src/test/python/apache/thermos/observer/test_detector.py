@@ -0,0 +1,128 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from twitter.common.dirutil import safe_mkdir
+
+from apache.thermos.common.inotify import Inotify
+from apache.thermos.common.path import TaskPath
+from apache.thermos.monitoring.detector import FixedPathDetector
+from apache.thermos.observer.detector import InotifyObserverTaskDetector, ObserverTaskDetector
+
+
+class Recorder(object):
+  def __init__(self):
+    self.events = []
+
+  def on_active(self, root, task_id):
+    self.events.append(('active', task_id))
+
+  def on_finished(self, root, task_id):
+    self.events.append(('finished', task_id))
+
+  def on_removed(self, root, task_id):
+    self.events.append(('removed', task_id))
+
+
+class TestObserverTaskDetector(unittest.TestCase):
+  DETECTOR = ObserverTaskDetector
+
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+    self.recorder = Recorder()
+    self.detector = self.make_detector()
+
+  def tearDown(self):
+    self.detector.close()
+    shutil.rmtree(self.root)
+
+  def make_detector(self):
+    return self.DETECTOR(
+        FixedPathDetector(self.root),
+        self.recorder.on_active,
+        self.recorder.on_finished,
+        self.recorder.on_removed)
+
+  def task_path(self, task_id, state):
+    return TaskPath(root=self.root, task_id=task_id, state=state).getpath('task_path')
+
+  def start_task(self, task_id):
+    path = self.task_path(task_id, 'active')
+    safe_mkdir(os.path.dirname(path))
+    with open(path, 'w') as fp:
+      fp.write('{}')
+
+  def finish_task(self, task_id):
+    path = self.task_path(task_id, 'finished')
+    safe_mkdir(os.path.dirname(path))
+    os.rename(self.task_path(task_id, 'active'), path)
+
+  def remove_task(self, task_id):
+    os.unlink(self.task_path(task_id, 'finished'))
+
+  def refresh(self):
+    self.detector.refresh()
+    events, self.recorder.events = self.recorder.events, []
+    return events
+
+  def test_lifecycle(self):
+    assert self.refresh() == []
+
+    self.start_task('a')
+    assert self.refresh() == [('active', 'a')]
+    assert [task.task_id for task in self.detector.active_tasks] == ['a']
+    assert self.refresh() == []
+
+    self.finish_task('a')
+    assert self.refresh() == [('finished', 'a')]
+    assert self.detector.active_tasks == set()
+    assert [task.task_id for task in self.detector.finished_tasks] == ['a']
+
+    self.remove_task('a')
+    assert self.refresh() == [('removed', 'a')]
+    assert self.detector.finished_tasks == set()
+
+  def test_preexisting_finished_task(self):
+    self.start_task('a')
+    self.finish_task('a')
+    assert self.refresh() == [('active', 'a'), ('finished', 'a')]
+
+  def test_removed_active_task(self):
+    self.start_task('a')
+    assert self.refresh() == [('active', 'a')]
+    os.unlink(self.task_path('a', 'active'))
+    assert self.refresh() == [('finished', 'a'), ('removed', 'a')]
+
+
+@unittest.skipUnless(Inotify.is_supported(), 'inotify is not supported on this platform.')
+class TestInotifyObserverTaskDetector(TestObserverTaskDetector):
+  DETECTOR = InotifyObserverTaskDetector
+
+  def test_events_wake_wait(self):
+    self.refresh()
+    self.start_task('a')
+    self.detector.wait(5)
+    assert self.refresh() == [('active', 'a')]
+
+  def test_reconciliation_catches_missed_tasks(self):
+    self.refresh()
+    self.detector._unwatch_root(self.root)
+    self.start_task('a')
+    assert self.refresh() == []
+    self.detector._last_reconciliation = None
+    assert self.refresh() == [('active', 'a')]
@@ -0,0 +1,116 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from apache.thermos.observer.task_index import (
+    FinishedTaskIndex,
+    RootTaskIndex,
+    TaskListIndex,
+    TaskSummary
+)
+
+TASK = dict(
+    task_id='hello_world',
+    name='hello_world',
+    user='alice',
+    launch_timestamp=1500000000.0,
+    state='SUCCESS',
+    state_timestamp=1500000100.0,
+    ports={'http': 8080},
+    processes=dict(waiting=[], running=[], success=['hello', 'world'], failed=[], killed=[]),
+    resource_consumption={},
+)
+
+
+class TestFinishedTaskIndex(unittest.TestCase):
+  def setUp(self):
+    self.root = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.root)
+
+  def test_summary_from_task(self):
+    summary = TaskSummary.from_task(TASK)
+    assert 'resource_consumption' not in summary
+    assert summary['name'] == 'hello_world'
+    assert summary.process_counts['success'] == 2
+
+  def test_persistence(self):
+    index = FinishedTaskIndex()
+    assert index.get(self.root, 'hello_world') is None
+    index.put(self.root, 'hello_world', TaskSummary.from_task(TASK))
+    index.flush()
+    assert os.path.exists(os.path.join(self.root, RootTaskIndex.FILENAME))
+
+    reloaded = FinishedTaskIndex()
+    summary = reloaded.get(self.root, 'hello_world')
+    assert summary == TaskSummary.from_task(TASK)
+
+    reloaded.remove(self.root, 'hello_world')
+    assert not os.path.exists(os.path.join(self.root, RootTaskIndex.FILENAME))
+
+  def test_corrupt_index(self):
+    with open(os.path.join(self.root, RootTaskIndex.FILENAME), 'w') as fp:
+      fp.write('{not json')
+    assert FinishedTaskIndex().get(self.root, 'hello_world') is None
+
+  def test_unwritable_root(self):
+    index = RootTaskIndex(os.path.join(self.root, 'does_not_exist'))
+    index.put('hello_world', TaskSummary.from_task(TASK))
+    assert index.flush() is False
+    assert index.get('hello_world') is not None
+
+
+def test_task_list_ordering():
+  index = TaskListIndex()
+  index.add('a', 'active', 100)
+  index.add('b', 'finished', 300)
+  index.add('c', 'active', 200)
+  assert index.slice('all', 0, 10) == ['b', 'c', 'a']
+  assert index.slice('active', 0, 10) == ['c', 'a']
+  assert index.slice('finished', 0, 10) == ['b']
+  assert index.slice('all', 1, 1) == ['c']
+  assert index.count('all') == 3
+
+
+def test_task_list_transitions():
+  index = TaskListIndex()
+  index.add('a', 'active', 100)
+  index.add('b', 'active', None)
+  index.add('a', 'finished', 400)
+  assert index.slice('active', 0, 10) == ['b']
+  assert index.slice('finished', 0, 10) == ['a']
+  assert index.slice('all', 0, 10) == ['a', 'b']
+  index.remove('a')
+  index.remove('unknown')
+  assert 'a' not in index
+  assert 'b' in index
+  assert index.count('finished') == 0
+  assert index.count('all') == 1
+
+
+def test_task_list_copy():
+  index = TaskListIndex()
+  index.add('a', 'active', 100)
+  snapshot = index.copy()
+  index.add('a', 'finished', 200)
+  index.add('b', 'active', 300)
+  assert snapshot.slice('all', 0, 10) == ['a']
+  assert snapshot.slice('active', 0, 10) == ['a']
+  assert 'b' not in snapshot
+  assert index.slice('all', 0, 10) == ['b', 'a']
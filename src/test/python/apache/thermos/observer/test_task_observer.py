@@ -0,0 +1,240 @@
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import errno
+import unittest
+from unittest import mock
+
+from twitter.common.contextutil import temporary_dir
+
+from apache.thermos.common.inotify import Inotify
+from apache.thermos.monitoring.detector import FixedPathDetector
+from apache.thermos.monitoring.process import ProcessSample
+from apache.thermos.monitoring.resource import ResourceMonitorBase
+from apache.thermos.observer.detector import InotifyObserverTaskDetector
+from apache.thermos.observer.task_index import TaskSummary
+from apache.thermos.observer.task_observer import ObserverState, TaskObserver
+
+from gen.apache.thermos.ttypes import (
+    ProcessState,
+    ProcessStatus,
+    RunnerHeader,
+    RunnerState,
+    TaskState,
+    TaskStatus
+)
+
+
+class TestTaskObserverDetector(unittest.TestCase):
+  def make_observer(self, root, **kw):
+    return TaskObserver(
+        FixedPathDetector(root),
+        disable_task_resource_collection=True,
+        enable_inotify_detector=True,
+        **kw)
+
+  @unittest.skipUnless(Inotify.is_supported(), 'inotify is not supported on this platform.')
+  def test_inotify_detector(self):
+    with temporary_dir() as root:
+      observer = self.make_observer(root)
+      assert isinstance(observer._detector, InotifyObserverTaskDetector)
+      observer._detector.close()
+
+  def test_falls_back_to_polling(self):
+    failures = (
+        Inotify.Error('inotify is only available on Linux.'),
+        OSError(errno.EMFILE, 'inotify_init1 failed: Too many open files'),
+        OSError(errno.ENOSPC, 'inotify_init1 failed: No space left on device'))
+    for failure in failures:
+      with mock.patch.object(Inotify, 'is_supported', return_value=True):
+        with mock.patch.object(Inotify, '__init__', side_effect=failure):
+          with temporary_dir() as root:
+            observer = self.make_observer(root)
+            assert not isinstance(observer._detector, InotifyObserverTaskDetector)
+            observer._detector.refresh()
+
+
+class FakeTaskMonitor(object):
+  def __init__(self):
+    self.version = 0
+    self.ckpt_head = 0
+
+  def refresh(self):
+    pass
+
+
+class FakeResourceMonitor(object):
+  def __init__(self):
+    self.timestamp = 1.0
+
+  def sample(self):
+    return self.timestamp, ResourceMonitorBase.AggregateResourceResult(
+        2, ProcessSample.empty()._replace(rate=0.5, rss=100), 200)
+
+  def kill(self):
+    pass
+
+
+class FakeObservedTask(object):
+  def __init__(self, task_id):
+    self.task_id = task_id
+    self.mtime = 1000.0
+    self.task_monitor = FakeTaskMonitor()
+    self.resource_monitor = FakeResourceMonitor()
+
+
+def task_dict(task_id):
+  return dict((field, '%s.%s' % (task_id, field)) for field in TaskSummary.FIELDS)
+
+
+class TestTaskObserverRowCache(unittest.TestCase):
+  def setUp(self):
+    self.observer = TaskObserver(FixedPathDetector('/nonexistent'),
+                                 disable_task_resource_collection=True)
+    self.tasks = dict((task_id, FakeObservedTask(task_id)) for task_id in ('a', 'b'))
+    self.observer._state = ObserverState(active_tasks=dict(self.tasks))
+    self.task = mock.patch.object(self.observer, '_task', side_effect=task_dict).start()
+    self.addCleanup(mock.patch.stopall)
+
+  def test_cached_until_checkpoint_advances(self):
+    summary = self.observer._active_task_summary(self.tasks['a'])
+    assert summary['name'] == 'a.name'
+    assert self.observer._active_task_summary(self.tasks['a']) == summary
+    assert self.task.call_count == 1
+    self.tasks['a'].task_monitor.version += 1
+    assert self.observer._active_task_summary(self.tasks['a']) == summary
+    assert self.task.call_count == 2
+
+  def test_pruned_when_task_leaves(self):
+    self.observer._active_task_summary(self.tasks['a'])
+    self.observer._active_task_summary(self.tasks['b'])
+    self.observer._writable_state().active_tasks.pop('a')
+    self.observer._publish_state()
+    assert set(self.observer._row_cache) == set(['b'])
+
+    # A row built for a task that has since left is not cached again.
+    assert self.observer._active_task_summary(self.tasks['a'])['name'] == 'a.name'
+    assert set(self.observer._row_cache) == set(['b'])
+
+
+class TestTaskObserverTaskRows(unittest.TestCase):
+  def setUp(self):
+    self.observer = TaskObserver(FixedPathDetector('/nonexistent'),
+                                 disable_task_resource_collection=True)
+    self.active = FakeObservedTask('active')
+    self.finished = FakeObservedTask('finished')
+    self.observer._state = ObserverState(
+        active_tasks={'active': self.active}, finished_tasks={'finished': self.finished})
+    mock.patch.object(self.observer, '_task', side_effect=task_dict).start()
+    mock.patch.object(self.observer, '_finished_task_summary', side_effect=lambda observed_task:
+        TaskSummary.from_task(task_dict(observed_task.task_id))).start()
+    self.addCleanup(mock.patch.stopall)
+
+  def etag(self, task_ids=('active', 'finished'), fields=('state',)):
+    return self.observer.task_rows(task_ids, fields=fields)[0]
+
+  def test_rows(self):
+    _, rows = self.observer.task_rows(['active', 'finished', 'unknown'], fields=['state', 'rss'])
+    assert rows == {
+      'active': {'task_id': 'active', 'state': 'active.state', 'rss': 100},
+      'finished': {'task_id': 'finished', 'state': 'finished.state', 'rss': 0},
+    }
+    _, rows = self.observer.task_rows(['active'])
+    assert set(rows['active']) == set(('task_id',) + TaskObserver.DEFAULT_ROW_FIELDS)
+    assert rows['active']['role'] == 'active.user'
+    assert rows['active']['cpu'] == 0.5
+    assert rows['active']['disk'] == 200
+
+  def test_unknown_fields(self):
+    with self.assertRaises(ValueError):
+      self.observer.task_rows(['active'], fields=['state', 'bogus'])
+
+  def test_etag(self):
+    etag = self.etag()
+    assert etag.startswith('"') and etag.endswith('"')
+    assert self.etag() == etag
+    assert self.etag(fields=('state', 'name')) != etag
+    assert self.etag(task_ids=('active',)) != etag
+
+    self.active.task_monitor.ckpt_head += 100
+    changed = self.etag()
+    assert changed != etag
+    self.finished.mtime += 1
+    assert self.etag() not in (etag, changed)
+
+  def test_etag_tracks_resources_only_when_requested(self):
+    without_resources = self.etag()
+    with_resources = self.etag(fields=('state', 'cpu'))
+    self.active.resource_monitor.timestamp += 1
+    assert self.etag() == without_resources
+    assert self.etag(fields=('state', 'cpu')) != with_resources
+
+  def test_if_none_match(self):
+    etag = self.etag()
+    with mock.patch.object(self.observer, '_task_row') as task_row:
+      assert self.observer.task_rows(
+          ['active', 'finished'], fields=['state'], if_none_match=etag) == (etag, None)
+      assert self.observer.task_rows(
+          ['active', 'finished'], fields=['state'], if_none_match='"stale", %s' % etag) == (
+          etag, None)
+      assert task_row.call_count == 0
+
+    self.active.task_monitor.ckpt_head += 100
+    new_etag, rows = self.observer.task_rows(
+        ['active', 'finished'], fields=['state'], if_none_match=etag)
+    assert new_etag != etag
+    assert sorted(rows) == ['active', 'finished']
+
+
+class TestTaskObserverFinishedIndex(unittest.TestCase):
+  def setUp(self):
+    self.root = self.enter(temporary_dir())
+    self.observer = TaskObserver(FixedPathDetector(self.root),
+                                 disable_task_resource_collection=True)
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def active_task(self, task_id):
+    active_task = FakeObservedTask(task_id)
+    active_task.task = mock.Mock(**{'name.return_value.get.return_value': task_id})
+    active_task.state = RunnerState(
+        header=RunnerHeader(user='user', ports={}),
+        statuses=[TaskStatus(state=TaskState.ACTIVE, timestamp_ms=1000),
+                  TaskStatus(state=TaskState.SUCCESS, timestamp_ms=3000)],
+        processes={'hello': [ProcessStatus(state=ProcessState.SUCCESS)]})
+    return active_task
+
+  def on_finished(self, task_id):
+    self.observer._TaskObserver__on_finished(self.root, task_id)
+
+  def test_indexed_from_pending_state(self):
+    # The task became active earlier in the same refresh, so it is not published yet.
+    self.observer._writable_state().active_tasks['hello'] = self.active_task('hello')
+    self.on_finished('hello')
+    summary = self.observer._task_index.get(self.root, 'hello')
+    assert summary['name'] == 'hello'
+    assert summary['state'] == 'SUCCESS'
+    assert summary['state_timestamp'] == 3
+    assert summary['processes']['success'] == ['hello']
+    self.observer._publish_state()
+    assert 'hello' in self.observer.finished_tasks
+
+  def test_not_indexed_once_gone_from_pending_state(self):
+    self.observer._state = ObserverState(active_tasks={'hello': self.active_task('hello')})
+    self.observer._writable_state().active_tasks.pop('hello')
+    self.on_finished('hello')
+    assert self.observer._task_index.get(self.root, 'hello') is None
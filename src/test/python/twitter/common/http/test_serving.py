@@ -0,0 +1,243 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import gzip
+import io
+import json
+import threading
+import time
+import unittest
+from wsgiref.util import setup_testing_defaults
+
+import bottle
+
+from twitter.common.http.serving import CallbackPool, GzipPlugin, RequestMetrics, RequestTimeout
+
+
+def wsgi_request(app, path, headers=None):
+  """Issue a GET against a WSGI app, returning (status code, headers, body).  Header names are
+  lowercased."""
+  environ = {}
+  setup_testing_defaults(environ)
+  environ.update(PATH_INFO=path, REQUEST_METHOD='GET')
+  environ['wsgi.input'] = io.BytesIO()
+  for name, value in (headers or {}).items():
+    environ['HTTP_' + name.upper().replace('-', '_')] = value
+  response = []
+
+  def start_response(status, response_headers, exc_info=None):
+    response[:] = [int(status.split()[0]),
+                   dict((name.lower(), value) for name, value in response_headers)]
+
+  content = b''.join(app(environ, start_response))
+  return response[0], response[1], content
+
+
+class Background(threading.Thread):
+  """Issue a request on another thread."""
+
+  def __init__(self, app, path):
+    super(Background, self).__init__()
+    self.daemon = True
+    self._app = app
+    self._path = path
+    self.result = None
+    self.start()
+
+  def run(self):
+    self.result = wsgi_request(self._app, self._path)
+
+
+def wait_until(predicate, timeout=5):
+  deadline = time.time() + timeout
+  while not predicate():
+    assert time.time() < deadline, 'Timed out waiting for %s' % predicate
+    time.sleep(0.01)
+
+
+class TestRequestTimeout(unittest.TestCase):
+  def setUp(self):
+    self.release = threading.Event()
+    self.addCleanup(self.release.set)
+    self.app = bottle.Bottle()
+
+  def blocking(self):
+    self.release.wait(10)
+    return 'released'
+
+  def route(self, path, callback, plugin, **config):
+    self.app.route(path, callback=callback, apply=[plugin], **config)
+
+  def test_timeout(self):
+    plugin = RequestTimeout(0.1)
+    self.addCleanup(plugin.close)
+    self.route('/slow', self.blocking, plugin)
+    self.route('/slower', self.blocking, plugin, timeout=5)
+    start = time.time()
+    code, _, _ = wsgi_request(self.app, '/slow')
+    assert code == 503
+    assert time.time() - start < 5
+
+    # The route's own timeout overrides the default.
+    slower = Background(self.app, '/slower')
+    time.sleep(0.2)
+    self.release.set()
+    slower.join()
+    assert slower.result[0] == 200
+    assert slower.result[2] == b'released'
+
+  def test_disabled(self):
+    plugin = RequestTimeout(0)
+    self.addCleanup(plugin.close)
+    self.route('/thread', lambda: threading.current_thread().name, plugin)
+    assert wsgi_request(self.app, '/thread')[2] == threading.current_thread().name.encode('utf-8')
+
+  def test_busy(self):
+    plugin = RequestTimeout(5, threads=1, max_pending=1)
+    self.addCleanup(plugin.close)
+    self.route('/slow', self.blocking, plugin)
+    self.route('/fast', lambda: 'fast', plugin)
+
+    slow = Background(self.app, '/slow')
+    wait_until(lambda: plugin._pool.pending == 1)
+    code, _, body = wsgi_request(self.app, '/fast')
+    assert code == 503
+    assert b'Server is busy.' in body
+
+    self.release.set()
+    slow.join()
+    assert slow.result[0] == 200
+    wait_until(lambda: plugin._pool.pending == 0)
+    assert wsgi_request(self.app, '/fast')[:3:2] == (200, b'fast')
+
+  def test_pools(self):
+    long_polls = CallbackPool(1, max_pending=1)
+    plugin = RequestTimeout(5, threads=1, max_pending=1, pools={'long_poll': long_polls})
+    self.addCleanup(plugin.close)
+    self.route('/follow', self.blocking, plugin, pool='long_poll')
+    self.route('/vars', lambda: 'vars', plugin)
+    self.route('/unconfigured', lambda: 'unconfigured', plugin, pool='unconfigured')
+
+    follower = Background(self.app, '/follow')
+    wait_until(lambda: long_polls.pending == 1)
+    # Long-polls beyond the size of their pool are refused...
+    assert wsgi_request(self.app, '/follow')[0] == 503
+    # ...without taking threads from the other routes.
+    assert wsgi_request(self.app, '/vars')[:3:2] == (200, b'vars')
+    assert wsgi_request(self.app, '/unconfigured')[:3:2] == (200, b'unconfigured')
+
+    self.release.set()
+    follower.join()
+    assert follower.result[0] == 200
+
+  def test_response_copied(self):
+    plugin = RequestTimeout(5)
+    self.addCleanup(plugin.close)
+
+    def created():
+      assert bottle.request.query.get('name') is None
+      bottle.response.status = 201
+      bottle.response.content_type = 'text/plain'
+      bottle.response.set_header('ETag', '"abc"')
+      bottle.response.add_header('X-Many', '1')
+      bottle.response.add_header('X-Many', '2')
+      return 'created'
+
+    def not_found():
+      bottle.abort(404, 'No such thing.')
+
+    self.route('/created', created, plugin)
+    self.route('/missing', not_found, plugin)
+
+    code, headers, body = wsgi_request(self.app, '/created')
+    assert code == 201
+    assert body == b'created'
+    assert headers['content-type'] == 'text/plain'
+    assert headers['etag'] == '"abc"'
+
+    code, _, body = wsgi_request(self.app, '/missing')
+    assert code == 404
+    assert b'No such thing.' in body
+
+
+class TestGzipPlugin(unittest.TestCase):
+  def setUp(self):
+    self.app = bottle.Bottle()
+    plugin = GzipPlugin(min_length=100)
+    self.app.route('/small', callback=lambda: {'a': 1}, apply=[plugin])
+    self.app.route('/large', callback=lambda: {'a': 'x' * 1000}, apply=[plugin])
+    self.app.route('/text', callback=lambda: 'x' * 1000, apply=[plugin])
+
+  def test_gzip(self):
+    code, headers, body = wsgi_request(self.app, '/large', {'Accept-Encoding': 'deflate, gzip'})
+    assert code == 200
+    assert headers['content-encoding'] == 'gzip'
+    assert headers['content-type'] == 'application/json'
+    assert headers['vary'] == 'Accept-Encoding'
+    assert json.loads(gzip.decompress(body).decode('utf-8')) == {'a': 'x' * 1000}
+
+  def test_small(self):
+    _, headers, body = wsgi_request(self.app, '/small', {'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in headers
+    assert headers['content-type'] == 'application/json'
+    assert json.loads(body.decode('utf-8')) == {'a': 1}
+
+  def test_not_accepted(self):
+    _, headers, body = wsgi_request(self.app, '/large')
+    assert 'content-encoding' not in headers
+    assert json.loads(body.decode('utf-8')) == {'a': 'x' * 1000}
+
+  def test_not_json(self):
+    _, headers, body = wsgi_request(self.app, '/text', {'Accept-Encoding': 'gzip'})
+    assert 'content-encoding' not in headers
+    assert body == b'x' * 1000
+
+
+class FakeClock(object):
+  def __init__(self):
+    self.now = 0.0
+
+  def time(self):
+    return self.now
+
+
+class TestRequestMetrics(unittest.TestCase):
+  def test_metrics(self):
+    clock = FakeClock()
+    metrics = RequestMetrics(clock=clock)
+    app = bottle.Bottle()
+
+    def elapse(secs, code=None):
+      clock.now += secs
+      if code:
+        bottle.abort(code)
+      return 'ok'
+
+    app.route('/fast', callback=lambda: elapse(0.003), apply=[metrics])
+    app.route('/slow', callback=lambda: elapse(0.2), apply=[metrics])
+    app.route('/missing', callback=lambda: elapse(0.0005, 404), apply=[metrics])
+    app.route('/broken', callback=lambda: elapse(0.0005, 500), apply=[metrics])
+    for path in ('/fast', '/fast', '/slow', '/missing', '/broken'):
+      wsgi_request(app, path)
+
+    sample = metrics.metrics.sample()
+    assert sample['requests'] == 5
+    assert sample['errors'] == 1
+    assert abs(sample['total_latency_secs'] - 0.207) < 1e-9
+    assert sample['latency_ms_le_1'] == 2
+    assert sample['latency_ms_le_5'] == 4
+    assert sample['latency_ms_le_100'] == 4
+    assert sample['latency_ms_le_250'] == 5
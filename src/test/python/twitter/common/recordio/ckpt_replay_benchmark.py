@@ -0,0 +1,126 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+"""Measure RunnerCkpt checkpoint replay throughput for each checkpoint codec.
+
+  python ckpt_replay_benchmark.py [--records N] [--repeat N]
+
+A checkpoint resembling that of a long running task (a header followed by many process status
+transitions) is written once, then decoded record by record and replayed through a
+ThriftRecordReader with each codec.
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import thrift.TSerialization as TSerialization
+from twitter.common.recordio import RecordIO, ThriftRecordReader, ThriftRecordWriter
+from twitter.common.recordio.thrift_binary import StructDecoder
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
+
+from gen.apache.thermos.ttypes import (
+    ProcessState,
+    ProcessStatus,
+    RunnerCkpt,
+    RunnerHeader,
+    TaskState,
+    TaskStatus
+)
+
+PROCESS_STATES = (ProcessState.WAITING, ProcessState.FORKED, ProcessState.RUNNING,
+                  ProcessState.SUCCESS)
+
+
+def checkpoint_records(count):
+  yield RunnerCkpt(runner_header=RunnerHeader(
+      task_id='hello_world-1234567890-abcdef', launch_time_ms=int(time.time() * 1000),
+      sandbox='/var/lib/mesos/sandbox', log_dir='.logs', hostname='localhost', user='www-data',
+      uid=33, ports={'http': 8080, 'admin': 8081, 'health': 8082}))
+  yield RunnerCkpt(task_status=TaskStatus(
+      state=TaskState.ACTIVE, timestamp_ms=int(time.time() * 1000), runner_pid=1234,
+      runner_uid=33))
+  for seq in range(count):
+    yield RunnerCkpt(process_status=ProcessStatus(
+        seq=seq, process='process_%d' % (seq // len(PROCESS_STATES)),
+        state=PROCESS_STATES[seq % len(PROCESS_STATES)], coordinator_pid=2000 + seq,
+        fork_time=time.time(), start_time=time.time(), pid=3000 + seq, stop_time=time.time(),
+        return_code=0))
+
+
+class _DecoderCodec(ThriftRecordIO.ThriftCodec):
+  def __init__(self, thrift_base, decode):
+    super(_DecoderCodec, self).__init__(thrift_base, accelerated=False)
+    self.decode = decode
+
+
+def codecs():
+  yield 'TBinaryProtocol', lambda blob: TSerialization.deserialize(RunnerCkpt(), blob)
+  yield 'StructDecoder', StructDecoder.for_class(RunnerCkpt).decode
+  codec = ThriftRecordIO.ThriftCodec(RunnerCkpt)
+  yield 'ThriftCodec (default)', codec.decode
+
+
+def best_of(repeat, fn):
+  timings = []
+  for _ in range(repeat):
+    start = time.time()
+    fn()
+    timings.append(time.time() - start)
+  return min(timings)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument('--records', type=int, default=100000)
+  parser.add_argument('--repeat', type=int, default=3)
+  args = parser.parse_args()
+
+  records = list(checkpoint_records(args.records))
+  blobs = [TSerialization.serialize(record) for record in records]
+  fd, path = tempfile.mkstemp(prefix='runner_ckpt.')
+  try:
+    with os.fdopen(fd, 'wb') as fp:
+      writer = ThriftRecordWriter(fp)
+      for record in records:
+        writer.write(record)
+    print('%d records, %d bytes' % (len(records), os.path.getsize(path)))
+
+    for name, decode in codecs():
+      def decode_all():
+        for blob in blobs:
+          decode(blob)
+
+      def replay():
+        with open(path, 'rb') as fp:
+          for _ in RecordIO.Reader(fp, _DecoderCodec(RunnerCkpt, decode)):
+            pass
+
+      decode_time = best_of(args.repeat, decode_all)
+      replay_time = best_of(args.repeat, replay)
+      print('%-24s decode %9.0f records/s   replay %9.0f records/s' % (
+          name, len(blobs) / decode_time, len(blobs) / replay_time))
+
+    with open(path, 'rb') as fp:
+      replay_time = best_of(1, lambda: list(ThriftRecordReader(fp, RunnerCkpt)))
+    print('ThriftRecordReader replay: %.0f records/s' % (len(records) / replay_time))
+  finally:
+    os.unlink(path)
+
+
+if __name__ == '__main__':
+  main()
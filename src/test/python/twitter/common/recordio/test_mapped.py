@@ -0,0 +1,281 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import json
+import os
+import struct
+import unittest
+
+import pytest
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import MappedRecordReader, RecordIndex, RecordIO, RecordWriter
+from twitter.common.recordio.recordio import StringCodec
+
+
+def record(seq):
+  return 'record-%d' % seq
+
+
+def record_seq(value):
+  return int(value.split('-')[1])
+
+
+def write_records(filename, seqs, mode='wb'):
+  with open(filename, mode) as fp:
+    writer = RecordWriter(fp)
+    for seq in seqs:
+      writer.write(record(seq))
+
+
+def frame_offsets(filename):
+  """The offset of every record in filename, and the offset just past the last."""
+  offsets = [0]
+  with open(filename, 'rb') as fp:
+    data = fp.read()
+  while offsets[-1] < len(data):
+    length, = struct.unpack_from('>L', data, offsets[-1])
+    offsets.append(offsets[-1] + RecordIO.RECORD_HEADER_SIZE + length)
+  return offsets
+
+
+class MappedTestBase(unittest.TestCase):
+  def setUp(self):
+    self.td = self.enter(temporary_dir())
+    self.filename = os.path.join(self.td, 'records')
+
+  def enter(self, context):
+    value = context.__enter__()
+    self.addCleanup(context.__exit__, None, None, None)
+    return value
+
+  def reader(self, fp=None):
+    return self.enter(MappedRecordReader(fp or self.filename, StringCodec()))
+
+
+class TestMappedRecordReader(MappedTestBase):
+  def test_records(self):
+    write_records(self.filename, range(10))
+    offsets = frame_offsets(self.filename)
+    reader = self.reader()
+    assert list(reader) == [record(seq) for seq in range(10)]
+    assert [offset for offset, _ in reader.frames()] == offsets[:-1]
+    assert list(reader.records(offsets[7])) == [
+        (offsets[seq], record(seq)) for seq in range(7, 10)]
+    assert reader.end() == reader.size == os.path.getsize(self.filename)
+
+  def test_file_position_is_unused(self):
+    write_records(self.filename, range(3))
+    with open(self.filename, 'rb') as fp:
+      fp.seek(5)
+      assert list(self.reader(fp)) == [record(seq) for seq in range(3)]
+      assert fp.tell() == 5
+      assert not fp.closed
+
+  def test_truncated(self):
+    write_records(self.filename, range(3))
+    offsets = frame_offsets(self.filename)
+    complete = [record(seq) for seq in range(3)]
+    # A torn header, then a torn payload, of a fourth record.
+    for tail in (b'\x00\x00', struct.pack('>L', 100) + b'partial'):
+      with open(self.filename, 'rb+') as fp:
+        fp.truncate(offsets[-1])
+        fp.seek(0, os.SEEK_END)
+        fp.write(tail)
+      reader = self.reader()
+      with pytest.raises(RecordIO.PrematureEndOfStream):
+        list(reader)
+      strict = []
+      with pytest.raises(RecordIO.PrematureEndOfStream):
+        for _, value in reader.records():
+          strict.append(value)
+      assert strict == complete
+      assert [value for _, value in reader.records(strict=False)] == complete
+      assert reader.end() == offsets[-1]
+
+  def test_record_size_exceeded(self):
+    with open(self.filename, 'wb') as fp:
+      fp.write(struct.pack('>L', RecordIO.MAXIMUM_RECORD_SIZE + 1))
+    for strict in (True, False):
+      with pytest.raises(RecordIO.RecordSizeExceeded):
+        list(self.reader().frames(strict=strict))
+
+  def test_empty(self):
+    open(self.filename, 'wb').close()
+    reader = self.reader()
+    assert reader.size == 0
+    assert list(reader) == []
+    assert reader.end() == 0
+    assert reader.refresh() == 0
+
+  def test_growing(self):
+    open(self.filename, 'wb').close()
+    with open(self.filename, 'rb') as fp:
+      reader = self.reader(fp)
+      assert list(reader) == []
+      write_records(self.filename, range(3), mode='ab')
+      # Only the stream as of the last refresh is visible.
+      assert list(reader) == []
+      assert reader.refresh() == os.path.getsize(self.filename)
+      assert list(reader) == [record(seq) for seq in range(3)]
+      end = reader.end()
+      write_records(self.filename, range(3, 5), mode='ab')
+      reader.refresh()
+      assert [value for _, value in reader.records(end)] == [record(3), record(4)]
+
+  def test_refresh_with_outstanding_payloads(self):
+    write_records(self.filename, range(3))
+    reader = self.reader()
+    payloads = [payload for _, payload in reader.frames()]
+    write_records(self.filename, range(3, 4), mode='ab')
+    reader.refresh()
+    assert list(reader) == [record(seq) for seq in range(4)]
+    del payloads
+
+  def test_invalid_codec(self):
+    write_records(self.filename, range(1))
+    with pytest.raises(RecordIO.InvalidCodec):
+      MappedRecordReader(self.filename, object())
+
+
+class TestRecordIndex(MappedTestBase):
+  def index(self, stride=4):
+    return RecordIndex(stride=stride, key=record_seq)
+
+  def assert_lookups(self, index, seqs):
+    """Reading from the offset looked up for each key reaches its record within stride records,
+       without passing it."""
+    reader = self.reader()
+    for seq in seqs:
+      offset = index.lookup(seq)
+      values = [record_seq(value) for _, value in reader.records(offset)]
+      assert values.index(seq) <= 4, (seq, offset, values)
+      assert values[0] <= seq
+
+  def test_lookup(self):
+    write_records(self.filename, range(0, 40, 2))
+    offsets = frame_offsets(self.filename)
+    index = self.index()
+    assert index.update(self.reader()) == 20
+    assert (index.count, len(index), index.end) == (20, 5, offsets[-1])
+    # Records 0, 4, 8, 12 and 16 (keys 0, 8, 16, 24 and 32) are indexed.
+    assert index.lookup(0) == 0
+    assert index.lookup(8) == 0
+    assert index.lookup(9) == offsets[4]
+    assert index.lookup(17) == offsets[8]
+    assert index.lookup(100) == offsets[16]
+    self.assert_lookups(index, range(0, 40, 2))
+
+  def test_record_numbers(self):
+    write_records(self.filename, range(10))
+    offsets = frame_offsets(self.filename)
+    index = RecordIndex(stride=3)
+    index.update(self.reader())
+    assert [index.lookup(number) for number in range(10)] == (
+        [0] * 4 + [offsets[3]] * 3 + [offsets[6]] * 3)
+
+  def test_incremental_update(self):
+    write_records(self.filename, range(6))
+    index = self.index()
+    assert index.update(self.reader()) == 6
+    assert index.update(self.reader()) == 0
+    write_records(self.filename, range(6, 13), mode='ab')
+    assert index.update(self.reader()) == 7
+    rebuilt = self.index()
+    rebuilt.update(self.reader())
+    assert [index.lookup(seq) for seq in range(14)] == [rebuilt.lookup(seq) for seq in range(14)]
+
+  def test_torn_tail(self):
+    write_records(self.filename, range(5))
+    end = os.path.getsize(self.filename)
+    with open(self.filename, 'ab') as fp:
+      fp.write(struct.pack('>L', 20) + b'torn')
+    index = self.index()
+    assert index.update(self.reader()) == 5
+    assert index.end == end
+    # The torn record is indexed once it is complete.
+    with open(self.filename, 'rb+') as fp:
+      fp.truncate(end)
+    write_records(self.filename, range(5, 9), mode='ab')
+    assert index.update(self.reader()) == 4
+    self.assert_lookups(index, range(9))
+
+  def test_empty(self):
+    open(self.filename, 'wb').close()
+    index = self.index()
+    assert index.update(self.reader()) == 0
+    assert (index.count, len(index), index.end) == (0, 0, 0)
+    assert index.lookup(10) == 0
+
+  def test_decreasing_keys(self):
+    write_records(self.filename, [5, 6, 7, 8, 1])
+    with pytest.raises(ValueError):
+      RecordIndex(stride=4, key=record_seq).update(self.reader())
+    with pytest.raises(ValueError):
+      RecordIndex(stride=0)
+
+  def test_save_and_load(self):
+    write_records(self.filename, range(30))
+    index = self.index()
+    index.update(self.reader())
+    index_path = os.path.join(self.td, 'records.index')
+    index.save(index_path)
+    assert sorted(os.listdir(self.td)) == ['records', 'records.index']
+
+    loaded = RecordIndex.load(index_path, key=record_seq)
+    assert (loaded.count, len(loaded), loaded.end) == (index.count, len(index), index.end)
+    assert [loaded.lookup(seq) for seq in range(31)] == [index.lookup(seq) for seq in range(31)]
+    # A loaded index continues from where the saved one left off.
+    write_records(self.filename, range(30, 35), mode='ab')
+    assert loaded.update(self.reader()) == 5
+    self.assert_lookups(loaded, range(35))
+
+  def test_load_invalid(self):
+    index_path = os.path.join(self.td, 'records.index')
+    assert RecordIndex.load(index_path).count == 0
+    for content in ('not json', '[]', json.dumps(dict(version=1, stride=4)),
+                    json.dumps(dict(version=RecordIndex.VERSION, stride=4, count=1, end=10,
+                                    identity=None, keys=[0, 1], offsets=[0]))):
+      with open(index_path, 'w') as fp:
+        fp.write(content)
+      index = RecordIndex.load(index_path, key=record_seq)
+      assert (index.count, len(index), index.end) == (0, 0, 0)
+
+  def test_truncated_stream(self):
+    write_records(self.filename, range(20))
+    index = self.index()
+    index.update(self.reader())
+    write_records(self.filename, range(100, 106))
+    assert index.update(self.reader()) == 6
+    assert index.count == 6
+    assert index.lookup(103) == 0
+    self.assert_lookups(index, range(100, 106))
+
+  def test_replaced_stream(self):
+    write_records(self.filename, range(20))
+    index = self.index()
+    index.update(self.reader())
+    index_path = os.path.join(self.td, 'records.index')
+    index.save(index_path)
+
+    # The replacement outgrows the indexed stream, so only its identity tells them apart.
+    replacement = os.path.join(self.td, 'replacement')
+    write_records(replacement, range(1000, 1030))
+    assert os.path.getsize(replacement) > index.end
+    os.rename(replacement, self.filename)
+    for index in (index, RecordIndex.load(index_path, key=record_seq)):
+      assert index.update(self.reader()) == 30
+      assert index.count == 30
+      self.assert_lookups(index, range(1000, 1030))
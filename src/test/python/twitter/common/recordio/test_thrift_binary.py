@@ -0,0 +1,239 @@
+# ==================================================================================================
+# Copyright 2011 Twitter, Inc.
+# --------------------------------------------------------------------------------------------------
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this work except in compliance with the License.
+# You may obtain a copy of the License in the LICENSE file, or at:
+#
+#  http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ==================================================================================================
+
+import os
+import struct
+import unittest
+from unittest import mock
+
+import pytest
+import thrift.TSerialization as TSerialization
+from thrift.Thrift import TType
+from twitter.common.contextutil import temporary_dir
+from twitter.common.recordio import RecordIO, ThriftRecordReader, ThriftRecordWriter
+from twitter.common.recordio import thrift_recordio
+from twitter.common.recordio.thrift_binary import DecodeError, StructDecoder
+from twitter.common.recordio.thrift_recordio import ThriftRecordIO
+
+
+class Struct(object):
+  """A minimal stand-in for generated Thrift structs, serialized through their thrift_spec."""
+
+  thrift_spec = None
+
+  def __init__(self, **kw):
+    for field in self.thrift_spec:
+      if field is not None:
+        setattr(self, field[2], kw.pop(field[2], None))
+    assert not kw, kw
+
+  def read(self, iprot):
+    iprot.readStruct(self, self.thrift_spec)
+
+  def write(self, oprot):
+    oprot.writeStruct(self, self.thrift_spec)
+
+  def __eq__(self, other):
+    return type(self) == type(other) and self.__dict__ == other.__dict__
+
+  def __repr__(self):
+    return '%s(%r)' % (type(self).__name__, self.__dict__)
+
+
+class Inner(Struct):
+  thrift_spec = (
+    None,
+    (1, TType.I32, 'number', None, None),
+    (2, TType.STRING, 'name', 'UTF8', None),
+  )
+
+
+class Record(Struct):
+  thrift_spec = (
+    None,
+    (1, TType.BOOL, 'flag', None, None),
+    (2, TType.BYTE, 'tiny', None, None),
+    (3, TType.I16, 'small', None, None),
+    (4, TType.I32, 'medium', None, None),
+    (5, TType.I64, 'large', None, None),
+    (6, TType.DOUBLE, 'real', None, None),
+    (7, TType.STRING, 'text', 'UTF8', None),
+    (8, TType.STRING, 'blob', 'BINARY', None),
+    (9, TType.STRUCT, 'inner', [Inner, None], None),
+    (10, TType.MAP, 'ports', (TType.STRING, 'UTF8', TType.I32, None, False), None),
+    (11, TType.LIST, 'inners', (TType.STRUCT, [Inner, None], False), None),
+    (12, TType.SET, 'ids', (TType.I64, None, False), None),
+    (13, TType.MAP, 'nested', (TType.STRING, 'UTF8', TType.LIST, (TType.STRING, 'UTF8', False),
+                               False), None),
+  )
+
+Record.thrift_spec[9][3][1] = Inner.thrift_spec
+Record.thrift_spec[11][3][1][1] = Inner.thrift_spec
+
+
+class RecordV2(Struct):
+  """Record as written by a newer schema: fields 20-24 are unknown to Record, and field 4 has
+  changed type."""
+
+  thrift_spec = Record.thrift_spec[:4] + (
+    (4, TType.STRING, 'medium', 'UTF8', None),
+  ) + Record.thrift_spec[5:] + (None,) * 6 + (
+    (20, TType.STRING, 'added_text', 'UTF8', None),
+    (21, TType.STRUCT, 'added_inner', [Inner, Inner.thrift_spec], None),
+    (22, TType.MAP, 'added_map', (TType.I32, None, TType.LIST, (TType.DOUBLE, None, False), False),
+     None),
+    (23, TType.SET, 'added_set', (TType.STRING, 'UTF8', False), None),
+    (24, TType.LIST, 'added_list', (TType.MAP, (TType.BYTE, None, TType.BOOL, None, False), False),
+     None),
+  )
+
+
+class Unspecified(object):
+  pass
+
+
+def full_record():
+  return Record(
+      flag=True,
+      tiny=-7,
+      small=-1234,
+      medium=2 ** 31 - 1,
+      large=-2 ** 63,
+      real=3.25,
+      text=u'héllo',
+      blob=b'\x00\xff\x80',
+      inner=Inner(number=1, name=u'one'),
+      ports={u'http': 8080, u'admin': 8081},
+      inners=[Inner(number=2), Inner(name=u'three')],
+      ids=set([1, 2 ** 40]),
+      nested={u'a': [u'b', u'c'], u'd': []})
+
+
+def serialize(value):
+  return TSerialization.serialize(value)
+
+
+def deserialize(thrift_class, blob):
+  return TSerialization.deserialize(thrift_class(), blob)
+
+
+class TestStructDecoder(unittest.TestCase):
+  def decode(self, thrift_class, blob):
+    return StructDecoder.for_class(thrift_class).decode(blob)
+
+  def test_round_trip(self):
+    for record in (full_record(), Record(), Record(text=u'', blob=b'', ports={}, inners=[])):
+      blob = serialize(record)
+      assert self.decode(Record, blob) == record
+      assert self.decode(Record, blob) == deserialize(Record, blob)
+    # Buffers are accepted as well as bytes.
+    assert self.decode(Record, memoryview(serialize(full_record()))) == full_record()
+
+  def test_for_class(self):
+    assert StructDecoder.for_class(Record) is StructDecoder.for_class(Record)
+    assert StructDecoder.supports(Record)
+    assert not StructDecoder.supports(Unspecified)
+    with pytest.raises(ValueError):
+      StructDecoder(Unspecified)
+
+  def test_skips_unknown_fields(self):
+    newer = RecordV2(
+        flag=False,
+        medium=u'no longer an i32',
+        text=u'kept',
+        inner=Inner(number=5),
+        added_text=u'skipped',
+        added_inner=Inner(number=6, name=u'skipped'),
+        added_map={1: [1.0, 2.0], 2: []},
+        added_set=set([u'x', u'y']),
+        added_list=[{1: True, 2: False}, {}])
+    blob = serialize(newer)
+    decoded = self.decode(Record, blob)
+    assert decoded == deserialize(Record, blob)
+    assert decoded == Record(flag=False, text=u'kept', inner=Inner(number=5))
+
+  def test_truncated(self):
+    blob = serialize(full_record())
+    for length in range(len(blob)):
+      with pytest.raises(EOFError):
+        self.decode(Record, blob[:length])
+      with pytest.raises(EOFError):
+        deserialize(Record, blob[:length])
+
+  def test_corrupt(self):
+    # An unknown field of an unknown type.
+    with pytest.raises(DecodeError):
+      self.decode(Record, b'\x63\x00\x63\x00')
+    # Negative lengths, for known and unknown fields.  Skipping -7 bytes would return to the
+    # start of the field, and loop forever.
+    for field_id in (7, 20):
+      with pytest.raises(DecodeError):
+        self.decode(Record, struct.pack('>bhi', TType.STRING, field_id, -7) + b'\x00')
+    with pytest.raises(DecodeError):
+      self.decode(Record, struct.pack('>bhbi', TType.LIST, 11, TType.STRUCT, -1) + b'\x00')
+    # A container whose element types do not match the spec.
+    with pytest.raises(DecodeError):
+      self.decode(Record, struct.pack('>bhbi', TType.SET, 12, TType.STRING, 1) +
+                  struct.pack('>i', 1) + b'x\x00')
+    with pytest.raises(DecodeError):
+      self.decode(Record, struct.pack('>bhbbi', TType.MAP, 10, TType.STRING, TType.I64, 1) +
+                  struct.pack('>iq', 1, 1) + b'x\x00')
+
+
+class TestThriftCodec(unittest.TestCase):
+  def test_fallback(self):
+    with mock.patch.object(thrift_recordio, '_FASTBINARY', None):
+      codec = ThriftRecordIO.ThriftCodec(Record)
+    assert codec._decoder is StructDecoder.for_class(Record)
+    blob = codec.encode(full_record())
+    assert blob == serialize(full_record())
+    assert codec.decode(blob) == full_record()
+    with pytest.raises(RecordIO.PrematureEndOfStream):
+      codec.decode(blob[:-1])
+    # Corrupt frames raise a RecordIO error rather than the decoder's own.
+    with pytest.raises(ThriftRecordIO.ThriftDecodeException) as e:
+      codec.decode(b'\x63\x00\x63\x00')
+    assert isinstance(e.value, RecordIO.Error)
+
+  def test_unaccelerated(self):
+    codec = ThriftRecordIO.ThriftCodec(Record, accelerated=False)
+    assert codec._decoder is None and codec._protocol_factory is None
+    assert codec.decode(codec.encode(full_record())) == full_record()
+    with pytest.raises(RecordIO.PrematureEndOfStream):
+      codec.decode(codec.encode(full_record())[:-1])
+
+  @pytest.mark.skipif(thrift_recordio._FASTBINARY is None, reason='fastbinary is unavailable.')
+  def test_accelerated(self):
+    codec = ThriftRecordIO.ThriftCodec(Record)
+    assert codec._decoder is None and codec._protocol_factory is not None
+    assert codec.decode(serialize(full_record())) == full_record()
+
+  def test_unsupported_class(self):
+    with mock.patch.object(thrift_recordio, '_FASTBINARY', None):
+      codec = ThriftRecordIO.ThriftCodec(Unspecified)
+    assert codec._decoder is None
+
+  def test_record_io(self):
+    records = [full_record(), Record(), Record(medium=3)]
+    with mock.patch.object(thrift_recordio, '_FASTBINARY', None):
+      with temporary_dir() as td:
+        filename = os.path.join(td, 'records')
+        with open(filename, 'wb') as fp:
+          writer = ThriftRecordWriter(fp)
+          for record in records:
+            writer.write(record)
+        with open(filename, 'rb') as fp:
+          assert list(ThriftRecordReader(fp, Record)) == records